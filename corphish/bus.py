@@ -0,0 +1,215 @@
+"""Local change notification for processes sharing the Corphish database.
+
+The daemon serves a Unix-domain socket next to the database file. Clients
+such as ``corphish join`` connect to it and receive every new outgoing
+message the moment it is committed, and can send user input that is
+written to the database and wakes the processor immediately.
+
+Changes are detected with ``PRAGMA data_version`` on a single persistent
+connection, which only reads a counter and costs far less than re-running
+a query. The same watcher is used directly by clients when no daemon
+socket is available.
+
+The wire protocol is newline-delimited JSON:
+  - server to client: ``{"type": "outgoing", "id": 12, "text": "..."}``
+  - client to server: ``{"type": "incoming", "text": "..."}``
+"""
+
+import asyncio
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Optional
+
+import aiosqlite
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds between PRAGMA data_version checks
+_WATCH_INTERVAL = 0.1
+
+
+def get_socket_path(db_path: Optional[Path] = None) -> Path:
+    """Returns the path of the daemon's socket for a database.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The database path with a ``.sock`` suffix.
+    """
+    return (db_path or db.get_db_path()).with_suffix(".sock")
+
+
+class DataVersionWatcher:
+    """Detects commits made by other connections to the database.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+        interval: Seconds between data_version checks.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        interval: float = _WATCH_INTERVAL,
+    ) -> None:
+        self._path = db_path or db.get_db_path()
+        self._interval = interval
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._version: Optional[int] = None
+
+    async def _read_version(self) -> int:
+        cursor = await self._conn.execute("PRAGMA data_version")
+        row = await cursor.fetchone()
+        return row[0]
+
+    async def open(self) -> None:
+        """Opens the connection and records the current data version.
+
+        Changes committed after this call are reported by wait().
+        """
+        if self._conn is None:
+            self._conn = await aiosqlite.connect(self._path)
+            self._version = await self._read_version()
+
+    async def wait(self) -> None:
+        """Returns once another connection has committed a change."""
+        await self.open()
+        while True:
+            await asyncio.sleep(self._interval)
+            version = await self._read_version()
+            if version != self._version:
+                self._version = version
+                return
+
+    async def close(self) -> None:
+        """Closes the connection."""
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+async def connect(
+    db_path: Optional[Path] = None,
+) -> Optional[tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+    """Connects to the daemon's socket.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A (reader, writer) pair, or None if no daemon is listening.
+    """
+    try:
+        return await asyncio.open_unix_connection(str(get_socket_path(db_path)))
+    except OSError:
+        return None
+
+
+def encode(event: dict) -> bytes:
+    """Encodes an event as one line of JSON."""
+    return (json.dumps(event) + "\n").encode()
+
+
+class BusServer:
+    """Publishes new outgoing messages to connected clients.
+
+    Args:
+        db_path: Path to the database file.
+        socket_path: Socket to listen on. Defaults to get_socket_path().
+        insert_incoming_fn: Writes client input to the database.
+        get_latest_outgoing_id_fn: Returns the current max outgoing ID.
+        get_outgoing_after_fn: Returns outgoing messages after an ID.
+        watcher_factory: Callable(db_path) returning a DataVersionWatcher.
+    """
+
+    def __init__(
+        self,
+        *,
+        db_path: Optional[Path] = None,
+        socket_path: Optional[Path] = None,
+        insert_incoming_fn: Callable = db.insert_incoming_message,
+        get_latest_outgoing_id_fn: Callable = db.get_latest_outgoing_id,
+        get_outgoing_after_fn: Callable = db.get_outgoing_messages_after,
+        watcher_factory: Callable = DataVersionWatcher,
+    ) -> None:
+        self._db_path = db_path
+        self._socket_path = socket_path or get_socket_path(db_path)
+        self._insert_incoming = insert_incoming_fn
+        self._get_latest_outgoing_id = get_latest_outgoing_id_fn
+        self._get_outgoing_after = get_outgoing_after_fn
+        self._watcher_factory = watcher_factory
+        self._subscribers: set[asyncio.StreamWriter] = set()
+        # Set whenever the database changes or a client sends input
+        self.wake = asyncio.Event()
+
+    @property
+    def subscriber_count(self) -> int:
+        """Number of connected clients."""
+        return len(self._subscribers)
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self._subscribers.add(writer)
+        logger.info("[bus] Client connected (%d total)", len(self._subscribers))
+        try:
+            while line := await reader.readline():
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("[bus] Ignoring malformed event: %r", line[:80])
+                    continue
+                if event.get("type") == "incoming" and event.get("text"):
+                    await self._insert_incoming(
+                        text=event["text"],
+                        telegram_update_id=0,
+                        telegram_message_id=0,
+                        db_path=self._db_path,
+                    )
+                    self.wake.set()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._subscribers.discard(writer)
+            writer.close()
+            logger.info("[bus] Client disconnected (%d left)", len(self._subscribers))
+
+    async def publish(self, event: dict) -> None:
+        """Sends an event to every connected client, dropping dead ones."""
+        data = encode(event)
+        for writer in list(self._subscribers):
+            try:
+                writer.write(data)
+                await writer.drain()
+            except (ConnectionError, RuntimeError):
+                self._subscribers.discard(writer)
+                writer.close()
+
+    async def run(self) -> None:
+        """Serves the socket and publishes outgoing messages until cancelled."""
+        last_id = await self._get_latest_outgoing_id(db_path=self._db_path)
+        watcher = self._watcher_factory(self._db_path)
+        await watcher.open()
+        server = await asyncio.start_unix_server(
+            self._handle_client, path=str(self._socket_path)
+        )
+        logger.info("[bus] Listening on %s", self._socket_path)
+        try:
+            while True:
+                await watcher.wait()
+                self.wake.set()
+                for msg in await self._get_outgoing_after(last_id, db_path=self._db_path):
+                    await self.publish(
+                        {"type": "outgoing", "id": msg["id"], "text": msg["text"]}
+                    )
+                    last_id = msg["id"]
+        finally:
+            server.close()
+            for writer in list(self._subscribers):
+                writer.close()
+            await watcher.close()
+            self._socket_path.unlink(missing_ok=True)
@@ -0,0 +1,196 @@
+"""Recording of real Claude SDK message streams for offline replay.
+
+With ``capture = true`` in config.toml, the daemon's ClaudeClient records
+every SDK message yielded by ``query()`` to ``captures/capture.jsonl`` in
+the config directory, in the JSON lines format of fake_claude (one message
+per line with its offset from the start of the query). Offsets measure the
+SDK alone: time the caller spends handling a message before asking for the
+next one is subtracted, so a slow Telegram edit does not show up as model
+latency on replay.
+
+The file is rotated like a log once it exceeds ``capture_max_bytes``
+(``capture.jsonl.1`` is the most recent backup), keeping at most
+``capture_backups`` old files. Rotation only happens between queries, so
+a stream is never split across files.
+
+Captures hold the full text of replies and tool results, so files are
+created readable by the owner only. Replay them with
+``FakeClaudeBackend.from_capture(capture_files(path))`` or ``corphish
+loadtest --replay PATH``.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Optional, TextIO
+
+from . import config
+from .fake_claude import write_event
+
+logger = logging.getLogger(__name__)
+
+_CAPTURE_NAME = "capture.jsonl"
+
+# Size after which the capture file is rotated
+_MAX_BYTES = 16 * 1024 * 1024
+
+# Rotated capture files kept
+_BACKUPS = 3
+
+
+def get_capture_dir() -> Path:
+    """Returns the directory captures are written to."""
+    return config.get_config_dir() / "captures"
+
+
+def capture_files(path: Path) -> list[Path]:
+    """Lists the capture files at *path*, oldest first.
+
+    Args:
+        path: A capture file, or a directory holding a rotated capture.
+
+    Returns:
+        The files to replay, in capture order.
+    """
+    path = Path(path)
+    if not path.is_dir():
+        return [path]
+    backups = [p for p in path.glob(f"{_CAPTURE_NAME}.*") if p.suffix[1:].isdigit()]
+    backups.sort(key=lambda p: int(p.suffix[1:]), reverse=True)
+    current = path / _CAPTURE_NAME
+    return backups + ([current] if current.exists() else [])
+
+
+class CaptureRecorder:
+    """Records SDK message streams to a size-bounded, rotated file.
+
+    Args:
+        directory: Directory for the capture files. Defaults to
+            get_capture_dir().
+        max_bytes: Size after which the file is rotated.
+        backups: Number of rotated files to keep.
+        clock: Monotonic clock in seconds (injectable for testing).
+
+    Attributes:
+        streams: Number of queries recorded.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        *,
+        max_bytes: int = _MAX_BYTES,
+        backups: int = _BACKUPS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._dir = Path(directory) if directory else get_capture_dir()
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._clock = clock
+        self._file: Optional[TextIO] = None
+        self._size = 0
+        self._active = 0
+        self._last_stream = 0
+        self.streams = 0
+
+    @property
+    def path(self) -> Path:
+        """The file currently being written."""
+        return self._dir / _CAPTURE_NAME
+
+    def wrap(self, query_fn: Callable) -> Callable:
+        """Returns a query function that records what *query_fn* yields.
+
+        Args:
+            query_fn: A function with the signature of claude_agent_sdk.query.
+
+        Returns:
+            A function with the same signature yielding the same messages.
+        """
+
+        async def recording_query(*, prompt, options=None):
+            stream = self._begin()
+            start = self._clock()
+            # Time spent by the caller between messages, excluded from offsets
+            paused = 0.0
+            try:
+                async for message in query_fn(prompt=prompt, options=options):
+                    received = self._clock()
+                    self._write(stream, received - start - paused, message=message)
+                    yield message
+                    paused += self._clock() - received
+            except asyncio.CancelledError:
+                self._write(stream, self._clock() - start - paused, error="cancelled")
+                raise
+            except Exception as exc:
+                error = f"{type(exc).__name__}: {exc}"
+                self._write(stream, self._clock() - start - paused, error=error)
+                raise
+            finally:
+                self._active -= 1
+
+        return recording_query
+
+    def close(self) -> None:
+        """Closes the capture file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _begin(self) -> int:
+        try:
+            if self._file is None:
+                self._open()
+            elif self._size >= self._max_bytes and self._active == 0:
+                self._rotate()
+        except OSError:
+            logger.exception("[capture] Cannot open %s", self.path)
+        self._active += 1
+        self.streams += 1
+        # Millisecond timestamps keep stream numbers unique across restarts
+        self._last_stream = max(self._last_stream + 1, int(time.time() * 1000))
+        return self._last_stream
+
+    def _open(self) -> None:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._file = os.fdopen(fd, "a", encoding="utf-8")
+        self._size = self.path.stat().st_size
+        if self._size and self._size >= self._max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        self.close()
+        for index in range(self._backups, 0, -1):
+            source = self.path.with_name(
+                f"{_CAPTURE_NAME}.{index - 1}" if index > 1 else _CAPTURE_NAME
+            )
+            if source.exists():
+                os.replace(source, self.path.with_name(f"{_CAPTURE_NAME}.{index}"))
+        if self._backups <= 0:
+            self.path.unlink(missing_ok=True)
+        logger.info("[capture] Rotated %s", self.path)
+        self._open()
+
+    def _write(self, stream: int, offset: float, **event) -> None:
+        if self._file is None:
+            return
+        try:
+            write_event(self._file, stream, max(0.0, offset), **event)
+            self._file.flush()
+            self._size = os.fstat(self._file.fileno()).st_size
+        except (OSError, TypeError, ValueError):
+            # Recording must never break the conversation it records
+            logger.exception("[capture] Failed to record a message")
+
+
+def recorder_from_config() -> Optional[CaptureRecorder]:
+    """Returns a CaptureRecorder if capture is enabled in config, else None."""
+    if not config.get_capture():
+        return None
+    return CaptureRecorder(
+        max_bytes=config.get_capture_max_bytes(),
+        backups=config.get_capture_backups(),
+    )
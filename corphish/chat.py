@@ -1,8 +1,14 @@
 """Telegram bot operations."""
 
+import logging
 import os
+from typing import Optional
 
 from telegram import Bot, Message
+from telegram.constants import ChatAction, ParseMode
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
 
 
 def get_bot_token() -> str:
@@ -35,13 +41,17 @@ def build_bot(token: str) -> Bot:
     return Bot(token=token)
 
 
-async def send_message(bot: Bot, chat_id: int, text: str) -> Message:
+async def send_message(
+    bot: Bot, chat_id: int, text: str, html: Optional[str] = None
+) -> Message:
     """Sends a text message to a Telegram chat.
 
     Args:
         bot: The Telegram Bot instance.
         chat_id: The target chat ID.
         text: The message text to send.
+        html: The same message formatted as Telegram HTML. If Telegram
+            cannot parse it, the plain text is sent instead.
 
     Returns:
         The sent Message object.
@@ -51,4 +61,58 @@ async def send_message(bot: Bot, chat_id: int, text: str) -> Message:
     """
     if not text:
         raise ValueError("text must not be empty")
+    if html:
+        try:
+            return await bot.send_message(chat_id=chat_id, text=html, parse_mode=ParseMode.HTML)
+        except BadRequest as exc:
+            logger.warning("Telegram rejected formatted message, sending plain text: %s", exc)
     return await bot.send_message(chat_id=chat_id, text=text)
+
+
+async def edit_message(
+    bot: Bot, chat_id: int, message_id: int, text: str, html: Optional[str] = None
+) -> None:
+    """Replaces the text of a previously sent message.
+
+    Args:
+        bot: The Telegram Bot instance.
+        chat_id: The chat containing the message.
+        message_id: The Telegram message ID to edit.
+        text: The new message text.
+        html: The same text formatted as Telegram HTML. If Telegram cannot
+            parse it, the plain text is used instead.
+
+    Raises:
+        ValueError: If text is empty.
+    """
+    if not text:
+        raise ValueError("text must not be empty")
+    if html:
+        try:
+            await bot.edit_message_text(
+                text=html, chat_id=chat_id, message_id=message_id, parse_mode=ParseMode.HTML
+            )
+            return
+        except BadRequest as exc:
+            logger.warning("Telegram rejected formatted edit, using plain text: %s", exc)
+        try:
+            await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id)
+        except BadRequest as exc:
+            # The message already shows this plain text
+            if "not modified" not in str(exc).lower():
+                raise
+        return
+    await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id)
+
+
+async def send_typing(bot: Bot, chat_id: int) -> None:
+    """Shows the "typing..." indicator in a chat.
+
+    Telegram clears the indicator after about five seconds, or when the
+    bot sends a message, so it has to be repeated during long replies.
+
+    Args:
+        bot: The Telegram Bot instance.
+        chat_id: The target chat ID.
+    """
+    await bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
@@ -1,14 +1,21 @@
 """Claude Agent SDK adapter with tool support via claude_code preset."""
 
 import asyncio
+import contextlib
+import dataclasses
 import logging
+import time
+from collections import deque
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional
 
 from claude_agent_sdk import (
     AssistantMessage,
+    CLIConnectionError,
     ClaudeAgentOptions,
+    ResultError,
     ResultMessage,
+    StreamEvent,
     TextBlock,
     query,
 )
@@ -26,6 +33,186 @@ _DEFAULT_MODEL = MODEL_SONNET
 
 _DISALLOWED_TOOLS = ["EnterPlanMode", "ExitPlanMode", "AskUserQuestion"]
 
+# Model tried when a model's circuit is open
+_SMALLER_MODEL = {MODEL_OPUS: MODEL_SONNET, MODEL_SONNET: MODEL_HAIKU}
+
+# AssistantMessage errors and HTTP statuses that mean the API itself is
+# failing, as opposed to a problem with the request
+_API_FAILURE_ERRORS = {"rate_limit", "server_error"}
+_API_FAILURE_STATUSES = {429, 500, 502, 503, 504, 529}
+
+
+class ApiUnavailableError(RuntimeError):
+    """Raised when the Anthropic API is failing or every usable circuit is open.
+
+    Attributes:
+        retry_after: Seconds until a call is worth trying again.
+    """
+
+    def __init__(self, message: str, retry_after: float = 0.0) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Tracks API failures per model and fails fast while a model is down.
+
+    A model's circuit opens when at least *min_failures* of its last
+    *window* calls failed and they make up at least *failure_rate* of
+    them. While open, calls to the model are refused; after the cooldown
+    one probe call is let through (half-open). A successful probe closes
+    the circuit, a failed one reopens it with the cooldown doubled, up to
+    *max_cooldown*.
+
+    Only API failures count (see ClaudeClient); a request the API rejects
+    does not say anything about the API's health.
+
+    Args:
+        window: Number of recent calls per model the failure rate is
+            computed over.
+        min_failures: Failures needed before the circuit can open.
+        failure_rate: Fraction of failed calls that opens the circuit.
+        cooldown: Seconds before the first probe of an open circuit.
+        max_cooldown: Longest cooldown after repeated failed probes.
+        clock: Monotonic clock in seconds (injectable for testing).
+    """
+
+    def __init__(
+        self,
+        *,
+        window: int = 10,
+        min_failures: int = 3,
+        failure_rate: float = 0.5,
+        cooldown: float = 30.0,
+        max_cooldown: float = 600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._window = window
+        self._min_failures = min_failures
+        self._failure_rate = failure_rate
+        self._cooldown = cooldown
+        self._max_cooldown = max_cooldown
+        self._clock = clock
+        self._circuits: dict[str, dict] = {}
+
+    def _circuit(self, model: str) -> dict:
+        return self._circuits.setdefault(
+            model,
+            {
+                "state": "closed",
+                "outcomes": deque(maxlen=self._window),
+                "opened_at": 0.0,
+                "cooldown": self._cooldown,
+                "probing": False,
+            },
+        )
+
+    def state(self, model: str) -> str:
+        """Returns "closed", "open" or "half_open" for *model*."""
+        return self._circuit(model)["state"]
+
+    def retry_after(self, model: str) -> float:
+        """Returns seconds until *model* may be probed (0 if it may be called)."""
+        circuit = self._circuit(model)
+        if circuit["state"] != "open":
+            return 0.0
+        return max(0.0, circuit["opened_at"] + circuit["cooldown"] - self._clock())
+
+    def allow(self, model: str) -> bool:
+        """Returns whether a call to *model* may go ahead.
+
+        Claims the probe of an open circuit whose cooldown has passed, so
+        the caller must report the call's outcome.
+        """
+        circuit = self._circuit(model)
+        if circuit["state"] == "closed":
+            return True
+        if circuit["state"] == "open" and self.retry_after(model) == 0:
+            circuit["state"] = "half_open"
+        if circuit["state"] == "half_open" and not circuit["probing"]:
+            circuit["probing"] = True
+            logger.info("[breaker] Probing %s", model)
+            return True
+        return False
+
+    def record_success(self, model: str) -> None:
+        """Records a successful call, closing the circuit."""
+        circuit = self._circuit(model)
+        if circuit["state"] != "closed":
+            logger.info("[breaker] %s recovered, closing circuit", model)
+            circuit["outcomes"].clear()
+        circuit.update(state="closed", probing=False, cooldown=self._cooldown)
+        circuit["outcomes"].append(True)
+
+    def record_failure(self, model: str) -> None:
+        """Records an API failure, opening the circuit if needed."""
+        circuit = self._circuit(model)
+        now = self._clock()
+        if circuit["state"] == "half_open":
+            cooldown = min(circuit["cooldown"] * 2, self._max_cooldown)
+            circuit.update(state="open", opened_at=now, cooldown=cooldown, probing=False)
+            logger.warning("[breaker] Probe of %s failed, retrying in %.0fs", model, cooldown)
+            return
+        circuit["outcomes"].append(False)
+        failures = circuit["outcomes"].count(False)
+        if (
+            circuit["state"] == "closed"
+            and failures >= self._min_failures
+            and failures / len(circuit["outcomes"]) >= self._failure_rate
+        ):
+            circuit.update(state="open", opened_at=now, cooldown=self._cooldown)
+            logger.warning(
+                "[breaker] Opening circuit for %s after %d of %d calls failed",
+                model,
+                failures,
+                len(circuit["outcomes"]),
+            )
+
+    def release(self, model: str) -> None:
+        """Gives back a probe whose call ended without an outcome."""
+        circuit = self._circuit(model)
+        if circuit["state"] == "half_open":
+            # Open with the cooldown already over, so the next call probes
+            opened_at = self._clock() - circuit["cooldown"]
+            circuit.update(state="open", probing=False, opened_at=opened_at)
+
+    def snapshot(self) -> dict:
+        """Returns each model's circuit state, for the control socket."""
+        return {
+            model: {
+                "state": circuit["state"],
+                "recent_failures": circuit["outcomes"].count(False),
+                "recent_calls": len(circuit["outcomes"]),
+                "retry_after": round(self.retry_after(model), 1),
+            }
+            for model, circuit in self._circuits.items()
+        }
+
+
+def _api_failure(message) -> Optional[str]:
+    """Returns why an SDK message reports an API failure, or None."""
+    if isinstance(message, AssistantMessage) and message.error in _API_FAILURE_ERRORS:
+        return message.error
+    if (
+        isinstance(message, ResultMessage)
+        and message.is_error
+        and message.api_error_status in _API_FAILURE_STATUSES
+    ):
+        return f"HTTP {message.api_error_status}"
+    return None
+
+
+def _api_failure_from_exception(exc: Exception) -> Optional[str]:
+    """Returns why an SDK exception reports an API failure, or None."""
+    if isinstance(exc, CLIConnectionError):
+        return "connection failed"
+    if isinstance(exc, ResultError):
+        if exc.api_error_status in _API_FAILURE_STATUSES:
+            return f"HTTP {exc.api_error_status}"
+        if exc.terminal_reason == "api_error" and exc.api_error_status is None:
+            return "API error"
+    return None
+
 
 def _load_system_prompt() -> str:
     """Loads the system prompt from IDENTITY.md.
@@ -111,8 +298,16 @@ class ClaudeClient:
     when Claude calls a tool, the SDK executes it and feeds the result
     back until Claude produces a final text response.
 
-    An asyncio.Lock serialises calls so only one request is in flight at
-    a time (used to skip heartbeats while busy).
+    An asyncio.Lock serialises conversation calls so only one request is
+    in flight at a time. Heartbeats use separate options without
+    conversation continuation, so they run in their own lane, limited by
+    the heartbeat_lane semaphore, and never wait for the conversation.
+
+    Every call goes through a CircuitBreaker. API failures (rate limits,
+    overload, server errors, lost connections) are raised as
+    ApiUnavailableError; while a model's circuit is open its calls go to
+    the next smaller model instead, and fail fast with ApiUnavailableError
+    when no model is available.
 
     Args:
         model: The model name to use.
@@ -120,6 +315,10 @@ class ClaudeClient:
         options: Fully-constructed ClaudeAgentOptions (overrides model
             and system_prompt if provided).
         query_fn: The Agent SDK query function (injectable for testing).
+        recorder: A capture.CaptureRecorder recording every message stream
+            for offline replay, or None.
+        breaker: The CircuitBreaker to use. Defaults to a new one.
+        heartbeat_concurrency: Most heartbeat calls in flight at once.
     """
 
     def __init__(
@@ -129,17 +328,38 @@ class ClaudeClient:
         system_prompt: Optional[str] = None,
         options: Optional[ClaudeAgentOptions] = None,
         query_fn=None,
+        recorder=None,
+        breaker: Optional[CircuitBreaker] = None,
+        heartbeat_concurrency: int = 1,
     ) -> None:
         self._options = options or _build_options(
             model=model,
             system_prompt=system_prompt,
         )
         self._query = query_fn or query
+        if recorder is not None:
+            self._query = recorder.wrap(self._query)
+        self.breaker = breaker or CircuitBreaker()
         self.lock = asyncio.Lock()
+        self.heartbeat_lane = asyncio.Semaphore(heartbeat_concurrency)
+        # time.monotonic() of the last SDK message in each lane, for idle
+        # watchdogs; kept apart so a busy heartbeat does not hide a hung
+        # conversation call, or the other way round
+        self.last_activity = time.monotonic()
+        self.last_heartbeat_activity = self.last_activity
+        # Session ID the SDK last reported for the conversation, and one the
+        # next conversation call must resume instead of the latest session
+        self.session_id: Optional[str] = None
+        self._resume: Optional[str] = None
+
+    @property
+    def model(self) -> Optional[str]:
+        """Returns the default model for new turns."""
+        return self._options.model
 
     @property
     def busy(self) -> bool:
-        """Returns True if the lock is currently held."""
+        """Returns True if the conversation lock is currently held."""
         return self.lock.locked()
 
     def reset(self) -> None:
@@ -161,35 +381,218 @@ class ClaudeClient:
             model=model,
             system_prompt=custom_prompt,
         )
+        self.session_id = None
+        self._resume = None
+
+    def rewind(self, session_id: str) -> None:
+        """Makes the next conversation call resume *session_id*.
+
+        Used after a forked call whose reply was discarded, so that the
+        conversation carries on from the session as it was before the fork.
+
+        Args:
+            session_id: A session ID previously read from session_id.
+        """
+        self._resume = session_id
+
+    def _conversation_options(self, **changes) -> ClaudeAgentOptions:
+        """Returns the conversation options with *changes* applied."""
+        if self._resume is not None:
+            changes.update(continue_conversation=False, resume=self._resume)
+        if not changes:
+            return self._options
+        return dataclasses.replace(self._options, **changes)
+
+    def _record_session(self, message: ResultMessage) -> None:
+        """Remembers the session a finished conversation call ran in."""
+        self.session_id = message.session_id
+        self._resume = None
+
+    def _choose_model(self, model: str) -> str:
+        """Returns *model*, or the largest smaller model whose circuit allows a call.
+
+        Raises:
+            ApiUnavailableError: If no candidate model is available.
+        """
+        candidates = [model]
+        while candidates[-1] in _SMALLER_MODEL:
+            candidates.append(_SMALLER_MODEL[candidates[-1]])
+        for candidate in candidates:
+            if self.breaker.allow(candidate):
+                if candidate != model:
+                    logger.warning("[breaker] %s unavailable, falling back to %s", model, candidate)
+                return candidate
+        retry_after = min(self.breaker.retry_after(candidate) for candidate in candidates)
+        raise ApiUnavailableError(
+            f"Claude is unavailable (circuit open for {model})", retry_after=retry_after
+        )
 
-    async def stream(self, user_text: str):
+    def _touch(self, heartbeat: bool) -> None:
+        if heartbeat:
+            self.last_heartbeat_activity = time.monotonic()
+        else:
+            self.last_activity = time.monotonic()
+
+    async def _messages(
+        self, prompt: str, options: ClaudeAgentOptions, heartbeat: bool = False
+    ):
+        """Yields SDK messages, recording when each one arrives.
+
+        The call goes to a model chosen by the circuit breaker, and its
+        outcome is recorded there. Messages reporting an API failure are
+        not passed on; the failure is raised as ApiUnavailableError once
+        the SDK is done.
+
+        Callers wrap this in contextlib.aclosing, so when they stop early
+        or are cancelled the query generator is closed in the calling task
+        and the SDK shuts down its CLI subprocess, instead of leaving that
+        to garbage collection.
+        """
+        model = options.model or _DEFAULT_MODEL
+        chosen = self._choose_model(model)
+        if chosen != model:
+            options = dataclasses.replace(options, model=chosen)
+
+        self._touch(heartbeat)
+        messages = self._query(prompt=prompt, options=options)
+        failure = cause = None
+        finished = False
+        try:
+            try:
+                async for message in messages:
+                    self._touch(heartbeat)
+                    reason = _api_failure(message)
+                    if reason is not None:
+                        failure = failure or reason
+                        continue
+                    yield message
+            except Exception as exc:
+                reason = _api_failure_from_exception(exc)
+                if reason is None:
+                    raise
+                failure, cause = failure or reason, exc
+            finished = True
+        finally:
+            if not finished:
+                # Cancelled, stopped early or failed for a reason that says
+                # nothing about the API's health
+                self.breaker.release(chosen)
+            aclose = getattr(messages, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        if failure is not None:
+            self.breaker.record_failure(chosen)
+            raise ApiUnavailableError(
+                f"Claude API failure on {chosen}: {failure}",
+                retry_after=self.breaker.retry_after(chosen),
+            ) from cause
+        self.breaker.record_success(chosen)
+
+    async def stream(
+        self, user_text: str, model: Optional[str] = None, fork: bool = False
+    ):
         """Streams Claude's text response as chunks arrive.
 
         Yields text from each AssistantMessage as Claude produces it rather
-        than waiting for the complete response.  The inner query generator is
-        always fully consumed so that the SDK's cancel scope is torn down in
-        the originating task (same fix as send()).
+        than waiting for the complete response. Messages after the
+        ResultMessage are read and dropped. If the caller stops iterating
+        early or is cancelled, the query is closed through
+        contextlib.aclosing in the calling task rather than consumed (see
+        _messages()).
 
         Args:
             user_text: The message from the user.
+            model: Model ID to use for this turn only. The conversation is
+                continued as usual; the client's default model is unchanged.
+            fork: Run the turn in a fork of the session, leaving the
+                session itself untouched. If the reply is kept, the
+                conversation carries on from the fork; to drop it, pass
+                the session_id read before the call to rewind().
 
         Yields:
             Text chunks from Claude's AssistantMessage blocks.
         """
+        changes = {}
+        if model is not None and model != self._options.model:
+            changes["model"] = model
+        if fork:
+            changes["fork_session"] = True
+        options = self._conversation_options(**changes)
+
         done = False
-        async for message in self._query(prompt=user_text, options=self._options):
-            if done:
-                continue
-            if isinstance(message, ResultMessage):
-                done = True
-            elif isinstance(message, AssistantMessage):
-                parts = [
-                    block.text
-                    for block in message.content
-                    if isinstance(block, TextBlock)
-                ]
-                if parts:
-                    yield "\n".join(parts)
+        async with contextlib.aclosing(self._messages(user_text, options)) as messages:
+            async for message in messages:
+                if done:
+                    continue
+                if isinstance(message, ResultMessage):
+                    self._record_session(message)
+                    done = True
+                elif isinstance(message, AssistantMessage):
+                    parts = [
+                        block.text
+                        for block in message.content
+                        if isinstance(block, TextBlock)
+                    ]
+                    if parts:
+                        yield "\n".join(parts)
+
+    async def stream_partial(self, user_text: str, model: Optional[str] = None):
+        """Streams Claude's response token by token.
+
+        Enables the SDK's partial messages so text deltas are yielded as the
+        model produces them, followed by the complete text of each
+        AssistantMessage once it is finished. Like stream(), the query is
+        closed in the calling task when the caller stops early.
+
+        Args:
+            user_text: The message from the user.
+            model: Model ID to use for this turn only.
+
+        Yields:
+            ("delta", text) tuples for incremental text, ("break", "") when a
+            new text block starts within the same message, and
+            ("message", text) with the full text once an AssistantMessage
+            is complete.
+        """
+        changes = {"include_partial_messages": True}
+        if model is not None:
+            changes["model"] = model
+        options = self._conversation_options(**changes)
+
+        done = False
+        seen_text = False
+        async with contextlib.aclosing(self._messages(user_text, options)) as messages:
+            async for message in messages:
+                if done:
+                    continue
+                if isinstance(message, ResultMessage):
+                    self._record_session(message)
+                    done = True
+                elif isinstance(message, StreamEvent):
+                    if message.parent_tool_use_id is not None:
+                        continue
+                    event = message.event
+                    if (
+                        event.get("type") == "content_block_start"
+                        and event.get("content_block", {}).get("type") == "text"
+                        and seen_text
+                    ):
+                        yield "break", ""
+                    elif event.get("type") == "content_block_delta":
+                        delta = event.get("delta", {})
+                        if delta.get("type") == "text_delta" and delta.get("text"):
+                            seen_text = True
+                            yield "delta", delta["text"]
+                elif isinstance(message, AssistantMessage):
+                    seen_text = False
+                    parts = [
+                        block.text
+                        for block in message.content
+                        if isinstance(block, TextBlock)
+                    ]
+                    if parts:
+                        yield "message", "\n".join(parts)
 
     async def send(self, user_text: str) -> str:
         """Sends a user message and returns Claude's final text response.
@@ -209,23 +612,24 @@ class ClaudeClient:
         result_text = None
         done = False
 
-        async for message in self._query(
-            prompt=user_text, options=self._options
-        ):
-            if done:
-                continue
-            if isinstance(message, ResultMessage):
-                if message.result:
-                    result_text = message.result
-                done = True
-            elif isinstance(message, AssistantMessage):
-                parts = [
-                    block.text
-                    for block in message.content
-                    if isinstance(block, TextBlock)
-                ]
-                if parts:
-                    last_text = "\n".join(parts)
+        options = self._conversation_options()
+        async with contextlib.aclosing(self._messages(user_text, options)) as messages:
+            async for message in messages:
+                if done:
+                    continue
+                if isinstance(message, ResultMessage):
+                    if message.result:
+                        result_text = message.result
+                    self._record_session(message)
+                    done = True
+                elif isinstance(message, AssistantMessage):
+                    parts = [
+                        block.text
+                        for block in message.content
+                        if isinstance(block, TextBlock)
+                    ]
+                    if parts:
+                        last_text = "\n".join(parts)
 
         return result_text or last_text
 
@@ -250,21 +654,22 @@ class ClaudeClient:
         result_text = None
         done = False
 
-        async for message in self._query(prompt="", options=options):
-            if done:
-                continue
-            if isinstance(message, ResultMessage):
-                if message.result:
-                    result_text = message.result
-                done = True
-            elif isinstance(message, AssistantMessage):
-                parts = [
-                    block.text
-                    for block in message.content
-                    if isinstance(block, TextBlock)
-                ]
-                if parts:
-                    last_text = "\n".join(parts)
+        async with contextlib.aclosing(self._messages("", options, heartbeat=True)) as messages:
+            async for message in messages:
+                if done:
+                    continue
+                if isinstance(message, ResultMessage):
+                    if message.result:
+                        result_text = message.result
+                    done = True
+                elif isinstance(message, AssistantMessage):
+                    parts = [
+                        block.text
+                        for block in message.content
+                        if isinstance(block, TextBlock)
+                    ]
+                    if parts:
+                        last_text = "\n".join(parts)
 
         return result_text or last_text
 
@@ -297,20 +702,21 @@ class ClaudeClient:
         result_text = None
         done = False
 
-        async for message in self._query(prompt=user_text, options=one_off_options):
-            if done:
-                continue
-            if isinstance(message, ResultMessage):
-                if message.result:
-                    result_text = message.result
-                done = True
-            elif isinstance(message, AssistantMessage):
-                parts = [
-                    block.text
-                    for block in message.content
-                    if isinstance(block, TextBlock)
-                ]
-                if parts:
-                    last_text = "\n".join(parts)
+        async with contextlib.aclosing(self._messages(user_text, one_off_options)) as messages:
+            async for message in messages:
+                if done:
+                    continue
+                if isinstance(message, ResultMessage):
+                    if message.result:
+                        result_text = message.result
+                    done = True
+                elif isinstance(message, AssistantMessage):
+                    parts = [
+                        block.text
+                        for block in message.content
+                        if isinstance(block, TextBlock)
+                    ]
+                    if parts:
+                        last_text = "\n".join(parts)
 
         return result_text or last_text
@@ -2,20 +2,32 @@
 
 import argparse
 import asyncio
+import json
 import logging
 import os
 import sys
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, Optional, TextIO
 
-from . import config, db
+from . import bus, config, control, db, export, fake_claude, loadtest, reminders
 from .bootstrap import run_bootstrap
 from .chat import build_bot, get_bot_token, send_message
 from .claude_client import ClaudeClient
-from .daemon import run_daemon
+from .daemon import ROLES, run_daemon
+from .supervisor import run_supervisor
 
 logger = logging.getLogger(__name__)
 
+# `corphish ctl` actions and the control socket methods they call
+_CTL_METHODS = {
+    "status": "status",
+    "reset": "reset",
+    "pause-heartbeat": "pause_heartbeat",
+    "resume-heartbeat": "resume_heartbeat",
+    "metrics": "metrics",
+}
+
 
 def build_parser() -> argparse.ArgumentParser:
     """Builds the argparse parser for the corphish CLI.
@@ -29,7 +41,18 @@ def build_parser() -> argparse.ArgumentParser:
     )
     sub = parser.add_subparsers(dest="command")
 
-    sub.add_parser("run", help="Run the daemon loop (default)")
+    run_parser = sub.add_parser("run", help="Run the daemon loop (default)")
+    run_parser.add_argument(
+        "--role",
+        choices=("all",) + ROLES,
+        default="all",
+        help="Run only one loop in this process (default: all in one process)",
+    )
+    run_parser.add_argument(
+        "--supervise",
+        action="store_true",
+        help="Run each role in its own child process, restarting any that exit",
+    )
     sub.add_parser("bootstrap", help="Run first-time bootstrap setup")
 
     send_parser = sub.add_parser(
@@ -51,6 +74,117 @@ def build_parser() -> argparse.ArgumentParser:
         "join",
         help="Join the running conversation from the command line (Ctrl+C to detach)",
     )
+
+    ctl_parser = sub.add_parser(
+        "ctl", help="Query or control the running daemon over its control socket"
+    )
+    ctl_parser.add_argument(
+        "action",
+        choices=sorted(_CTL_METHODS),
+        help="status, reset, pause-heartbeat, resume-heartbeat or metrics",
+    )
+
+    search_parser = sub.add_parser(
+        "search", help="Full-text search over the conversation history"
+    )
+    search_parser.add_argument("query", nargs="+", help="Words to search for")
+    search_parser.add_argument(
+        "--limit", type=int, default=20, help="Maximum number of results (default 20)"
+    )
+    search_parser.add_argument(
+        "--since", help="Only messages on or after this ISO date, e.g. 2024-06-01"
+    )
+
+    export_parser = sub.add_parser(
+        "export", help="Export the message history as JSONL or Parquet"
+    )
+    export_parser.add_argument(
+        "-o", "--output", default="-", help="File to write (default: stdout)"
+    )
+    export_parser.add_argument(
+        "--format",
+        choices=export.FORMATS,
+        help="Output format (default: parquet for .parquet files, else jsonl)",
+    )
+    export_parser.add_argument(
+        "--since-id", type=int, default=0, help="Only messages with a larger ID"
+    )
+    export_parser.add_argument(
+        "--batch-size", type=int, default=1000, help="Rows read per query (default 1000)"
+    )
+
+    usage_parser = sub.add_parser(
+        "usage", help="Show model usage per hour or day (UTC buckets)"
+    )
+    usage_parser.add_argument(
+        "--by", choices=("hour", "day"), default="day", help="Bucket size (default day)"
+    )
+    usage_parser.add_argument(
+        "--since", help="Only buckets from this ISO date on, e.g. 2024-06-01"
+    )
+    usage_parser.add_argument("--until", help="Only buckets before this ISO date")
+
+    outbox_parser = sub.add_parser(
+        "outbox", help="List, retry or drop outgoing messages that were not sent"
+    )
+    outbox_parser.add_argument(
+        "action",
+        nargs="?",
+        choices=("list", "retry", "drop"),
+        default="list",
+        help="list (default), retry or drop",
+    )
+    outbox_parser.add_argument(
+        "ids", nargs="*", type=int, help="IDs of the messages to retry or drop"
+    )
+
+    sub.add_parser(
+        "dead-letters", help="List incoming messages that failed too often to process"
+    )
+
+    loadtest_parser = sub.add_parser(
+        "loadtest",
+        help="Load test the daemon offline against a local fake Telegram server",
+    )
+    loadtest_parser.add_argument(
+        "--rate", type=float, default=5.0, help="Messages per second (default 5)"
+    )
+    loadtest_parser.add_argument(
+        "--duration", type=float, default=10.0, help="Seconds to send for (default 10)"
+    )
+    loadtest_parser.add_argument(
+        "--profile",
+        choices=sorted(fake_claude.PROFILES),
+        default="instant",
+        help="Latency profile of the fake Claude backend (default instant)",
+    )
+    loadtest_parser.add_argument("--seed", type=int, help="Seed for reproducible runs")
+    loadtest_parser.add_argument(
+        "--replay",
+        type=Path,
+        help="Replay Claude streams from a capture file or directory instead of --profile",
+    )
+    loadtest_parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Replay speed multiplier; 0 replays without delays (default 1)",
+    )
+    loadtest_parser.add_argument(
+        "--send-rate-limit",
+        type=float,
+        help="Simulate Telegram flood control: sends per second before 429s",
+    )
+
+    remind_parser = sub.add_parser(
+        "remind",
+        help="Schedule a reminder (e.g. 'remind in 10m call mom', 'remind cancel 3')",
+    )
+    remind_parser.add_argument(
+        "spec",
+        nargs="+",
+        help="When and what, e.g. 'in 2h stretch' or 'at 14:30 standup', or 'cancel <id>'",
+    )
     return parser
 
 
@@ -199,12 +333,17 @@ async def cmd_join(
     get_outgoing_after_fn: Callable = db.get_outgoing_messages_after,
     insert_incoming_fn: Callable = db.insert_incoming_message,
     read_line_fn: Callable = _default_read_line,
-    poll_interval: float = 0.5,
+    poll_interval: float = 0.1,
+    connect_fn: Callable = bus.connect,
+    watcher_factory: Callable = bus.DataVersionWatcher,
 ) -> None:
     """Joins the running conversation from the command line.
 
-    Reads user input from stdin and writes it to the database so the daemon
-    picks it up. Polls for new outgoing messages and prints them to stdout.
+    Reads user input from stdin and prints outgoing messages as they are
+    created. When the daemon's socket is available, input is sent through
+    it (waking the processor at once) and outgoing messages are pushed
+    over it. Otherwise input is written to the database directly and new
+    outgoing messages are detected with a PRAGMA data_version watcher.
     Press Ctrl+C to detach; afterwards responses are delivered only to Telegram.
 
     Args:
@@ -214,16 +353,39 @@ async def cmd_join(
         get_outgoing_after_fn: Returns outgoing messages after a given ID.
         insert_incoming_fn: Inserts an incoming message into the database.
         read_line_fn: Callable that reads one line from input (injectable for tests).
-        poll_interval: Seconds between polls for new outgoing messages.
+        poll_interval: Seconds between data_version checks when the daemon
+            socket is unavailable.
+        connect_fn: Async callable(db_path) returning a (reader, writer)
+            pair for the daemon socket, or None.
+        watcher_factory: Callable(db_path, interval) returning a
+            DataVersionWatcher.
     """
     await init_db_fn(db_path)
     last_id = await get_latest_outgoing_id_fn(db_path=db_path)
+    connection = await connect_fn(db_path)
 
     print("Joined conversation. Type a message and press Enter to send.")
     print("Press Ctrl+C to detach.\n")
 
     loop = asyncio.get_running_loop()
 
+    async def _send(text: str) -> None:
+        nonlocal connection
+        if connection is not None:
+            _, writer = connection
+            try:
+                writer.write(bus.encode({"type": "incoming", "text": text}))
+                await writer.drain()
+                return
+            except (ConnectionError, RuntimeError):
+                connection = None
+        await insert_incoming_fn(
+            text=text,
+            telegram_update_id=0,
+            telegram_message_id=0,
+            db_path=db_path,
+        )
+
     async def _input_task() -> None:
         while True:
             line = await loop.run_in_executor(None, read_line_fn)
@@ -231,30 +393,365 @@ async def cmd_join(
                 return
             text = line.rstrip("\n")
             if text:
-                await insert_incoming_fn(
-                    text=text,
-                    telegram_update_id=0,
-                    telegram_message_id=0,
-                    db_path=db_path,
-                )
-
-    async def _output_task() -> None:
+                await _send(text)
+
+    async def _socket_output_task(reader: asyncio.StreamReader) -> None:
+        nonlocal connection, last_id
+        while line := await reader.readline():
+            event = json.loads(line)
+            if event.get("type") == "outgoing":
+                print(f"\nCorphish: {event['text']}\n")
+                last_id = event["id"]
+        # The daemon went away; keep following the database directly
+        connection = None
+        await _watch_output_task()
+
+    async def _watch_output_task() -> None:
         nonlocal last_id
-        while True:
-            msgs = await get_outgoing_after_fn(last_id, db_path=db_path)
-            for msg in msgs:
-                print(f"\nCorphish: {msg['text']}\n")
-                last_id = msg["id"]
-            await asyncio.sleep(poll_interval)
+        watcher = watcher_factory(db_path, poll_interval)
+        await watcher.open()
+        try:
+            while True:
+                msgs = await get_outgoing_after_fn(last_id, db_path=db_path)
+                for msg in msgs:
+                    print(f"\nCorphish: {msg['text']}\n")
+                    last_id = msg["id"]
+                await watcher.wait()
+        finally:
+            await watcher.close()
+
+    if connection is not None:
+        output = _socket_output_task(connection[0])
+    else:
+        output = _watch_output_task()
 
     try:
-        await asyncio.gather(_input_task(), _output_task())
+        await asyncio.gather(_input_task(), output)
     except (KeyboardInterrupt, asyncio.CancelledError):
         pass
+    finally:
+        if connection is not None:
+            connection[1].close()
 
     print("\nDetached. Responses will continue to be sent to Telegram.")
 
 
+async def cmd_remind(
+    spec: str,
+    *,
+    db_path: Optional[Path] = None,
+    init_db_fn: Callable = db.init_db,
+    insert_reminder_fn: Callable = db.insert_reminder,
+    cancel_reminder_fn: Callable = db.cancel_reminder,
+) -> str:
+    """Schedules or cancels a reminder for delivery by the running daemon.
+
+    The daemon picks up reminders created here on its next reload of the
+    reminders table (at most a minute later). A reminder cancelled here
+    is skipped when it falls due.
+
+    Args:
+        spec: The reminder specification (see reminders.parse_reminder),
+            or "cancel <id>".
+        db_path: Path to the database file. Defaults to get_db_path().
+        init_db_fn: Initializes the database schema.
+        insert_reminder_fn: Persists the reminder.
+        cancel_reminder_fn: Cancels a pending reminder.
+
+    Returns:
+        A confirmation message.
+
+    Raises:
+        SystemExit: If the specification cannot be parsed, or there is no
+            pending reminder to cancel.
+    """
+    try:
+        cancel_id = reminders.parse_cancel(spec)
+        if cancel_id is None:
+            due, text = reminders.parse_reminder(spec)
+    except ValueError as exc:
+        logger.error("%s", exc)
+        sys.exit(1)
+
+    await init_db_fn(db_path)
+    if cancel_id is not None:
+        if not await cancel_reminder_fn(cancel_id, db_path=db_path):
+            logger.error("No pending reminder %d", cancel_id)
+            sys.exit(1)
+        return f"Reminder {cancel_id} cancelled."
+    reminder_id = await insert_reminder_fn(text, due.isoformat(), db_path=db_path)
+    return f"Reminder {reminder_id} set for {due.astimezone():%Y-%m-%d %H:%M}: {text}"
+
+
+def _to_utc(value: Optional[str], option: str) -> Optional[str]:
+    """Converts an ISO date or timestamp option to a UTC timestamp.
+
+    Naive values are taken as local time.
+
+    Raises:
+        SystemExit: If *value* is not a valid ISO date.
+    """
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc).isoformat()
+    except ValueError:
+        logger.error("Invalid %s date: %s", option, value)
+        sys.exit(1)
+
+
+async def cmd_search(
+    query: str,
+    *,
+    limit: int = 20,
+    since: Optional[str] = None,
+    db_path: Optional[Path] = None,
+    init_db_fn: Callable = db.init_db,
+    search_fn: Callable = db.search_messages,
+) -> list[str]:
+    """Searches the conversation history.
+
+    Args:
+        query: Words to search for.
+        limit: Maximum number of results.
+        since: Optional ISO date or timestamp (naive values are local time).
+        db_path: Path to the database file. Defaults to get_db_path().
+        init_db_fn: Initializes the database schema.
+        search_fn: Runs the full-text search.
+
+    Returns:
+        One formatted line per result, best match first.
+
+    Raises:
+        SystemExit: If *since* is not a valid ISO date.
+    """
+    since_utc = _to_utc(since, "--since")
+
+    await init_db_fn(db_path)
+    results = await search_fn(query, limit=limit, since=since_utc, db_path=db_path)
+    lines = []
+    for result in results:
+        when = datetime.fromisoformat(result["created_at"]).astimezone()
+        who = "you" if result["direction"] == "incoming" else "corphish"
+        snippet = " ".join(result["snippet"].split())
+        lines.append(f"[{when:%Y-%m-%d %H:%M}] {who}: {snippet}")
+    return lines
+
+
+async def cmd_export(
+    output: str = "-",
+    *,
+    fmt: Optional[str] = None,
+    since_id: int = 0,
+    batch_size: int = 1000,
+    db_path: Optional[Path] = None,
+    init_db_fn: Callable = db.init_db,
+    export_jsonl_fn: Callable = export.export_jsonl,
+    export_parquet_fn: Callable = export.export_parquet,
+    stdout: Optional[TextIO] = None,
+) -> int:
+    """Exports the message history.
+
+    Args:
+        output: File to write, or "-" for stdout.
+        fmt: "jsonl" or "parquet". Defaults to parquet for a ``.parquet``
+            file and jsonl otherwise.
+        since_id: Only export messages with id strictly greater than this.
+        batch_size: Rows read per query.
+        db_path: Path to the database file. Defaults to get_db_path().
+        init_db_fn: Initializes the database schema.
+        export_jsonl_fn: Writes JSONL to a text stream.
+        export_parquet_fn: Writes a Parquet file.
+        stdout: Stream used for output "-". Defaults to sys.stdout.
+
+    Returns:
+        The number of messages exported.
+
+    Raises:
+        SystemExit: If Parquet is written to stdout or pyarrow is missing.
+    """
+    if fmt is None:
+        fmt = "parquet" if output.endswith(".parquet") else "jsonl"
+    options = {"since_id": since_id, "batch_size": batch_size, "db_path": db_path}
+
+    await init_db_fn(db_path)
+    if fmt == "parquet":
+        if output == "-":
+            logger.error("Parquet export needs an output file (-o history.parquet)")
+            sys.exit(1)
+        try:
+            return await export_parquet_fn(Path(output), **options)
+        except RuntimeError as exc:
+            logger.error("%s", exc)
+            sys.exit(1)
+
+    if output == "-":
+        return await export_jsonl_fn(stdout or sys.stdout, **options)
+    with open(output, "w", encoding="utf-8") as out:
+        return await export_jsonl_fn(out, **options)
+
+
+async def cmd_usage(
+    *,
+    by: str = "day",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    db_path: Optional[Path] = None,
+    init_db_fn: Callable = db.init_db,
+    get_usage_timeseries_fn: Callable = db.get_usage_timeseries,
+) -> list[str]:
+    """Reports model usage per hour or day.
+
+    Args:
+        by: Bucket size, "hour" or "day".
+        since: Optional ISO date or timestamp (naive values are local time).
+        until: Optional ISO date or timestamp; buckets before it are shown.
+        db_path: Path to the database file. Defaults to get_db_path().
+        init_db_fn: Initializes the database schema.
+        get_usage_timeseries_fn: Reads the usage rollups.
+
+    Returns:
+        One formatted line per bucket, model and source, followed by a
+        total per model.
+
+    Raises:
+        SystemExit: If *since* or *until* is not a valid ISO date.
+    """
+    since_utc = _to_utc(since, "--since")
+    until_utc = _to_utc(until, "--until")
+
+    await init_db_fn(db_path)
+    rows = await get_usage_timeseries_fn(by, since=since_utc, until=until_utc, db_path=db_path)
+    bucket_format = "%Y-%m-%d %H:00" if by == "hour" else "%Y-%m-%d"
+    lines = []
+    totals: dict[str, int] = {}
+    for row in rows:
+        bucket = datetime.fromisoformat(row["bucket"])
+        line = f"{bucket:{bucket_format}}  {row['model']:<28} {row['source']:<10} {row['count']:>6}"
+        extras = []
+        if row["escalated_count"]:
+            extras.append(f"{row['escalated_count']} escalated")
+        if row["cancelled_count"]:
+            extras.append(f"{row['cancelled_count']} cancelled")
+        if extras:
+            line += f"  ({', '.join(extras)})"
+        lines.append(line)
+        totals[row["model"]] = totals.get(row["model"], 0) + row["count"]
+    if totals:
+        lines.append("")
+        for model, count in sorted(totals.items(), key=lambda item: -item[1]):
+            lines.append(f"total  {model:<28} {count:>6}")
+    return lines
+
+
+async def cmd_outbox(
+    action: str = "list",
+    ids: Optional[list[int]] = None,
+    *,
+    db_path: Optional[Path] = None,
+    init_db_fn: Callable = db.init_db,
+    get_outbox_fn: Callable = db.get_outbox,
+    retry_fn: Callable = db.retry_outgoing_messages,
+    drop_fn: Callable = db.drop_outgoing_messages,
+) -> list[str]:
+    """Lists, retries or drops outgoing messages that were not sent.
+
+    Args:
+        action: "list", "retry" or "drop".
+        ids: IDs of the messages to retry or drop.
+        db_path: Path to the database file. Defaults to get_db_path().
+        init_db_fn: Initializes the database schema.
+        get_outbox_fn: Reads the unsent and failed outgoing messages.
+        retry_fn: Queues messages to be sent again.
+        drop_fn: Deletes messages so they are never sent.
+
+    Returns:
+        The lines to print.
+
+    Raises:
+        SystemExit: If retry or drop is given no IDs.
+    """
+    await init_db_fn(db_path)
+    if action == "list":
+        lines = []
+        for row in await get_outbox_fn(db_path=db_path):
+            if row["failed_at"]:
+                status = "failed"
+            elif row["next_attempt_at"]:
+                status = "retrying"
+            else:
+                status = "pending"
+            text = " ".join(row["text"].split())
+            line = f"{row['id']:>6}  {status:<8} {row['send_attempts']:>2} tries  {text[:60]}"
+            if row["last_error"]:
+                line += f"\n        {row['last_error']}"
+            lines.append(line)
+        return lines
+
+    if not ids:
+        logger.error("outbox %s needs at least one message ID", action)
+        sys.exit(1)
+    if action == "retry":
+        count = await retry_fn(ids, db_path=db_path)
+        return [f"Queued {count} message(s) for sending."]
+    count = await drop_fn(ids, db_path=db_path)
+    return [f"Dropped {count} message(s)."]
+
+
+async def cmd_dead_letters(
+    *,
+    db_path: Optional[Path] = None,
+    init_db_fn: Callable = db.init_db,
+    get_dead_letters_fn: Callable = db.get_dead_letter_messages,
+) -> list[str]:
+    """Lists incoming messages that were dead-lettered.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+        init_db_fn: Initializes the database schema.
+        get_dead_letters_fn: Reads the dead-lettered messages.
+
+    Returns:
+        The lines to print.
+    """
+    await init_db_fn(db_path)
+    lines = []
+    for row in await get_dead_letters_fn(db_path=db_path):
+        dead_at = datetime.fromisoformat(row["dead_lettered_at"]).astimezone()
+        text = " ".join(row["text"].split())
+        line = f"{row['id']:>6}  {dead_at:%Y-%m-%d %H:%M} {row['attempts']:>2} tries  {text[:60]}"
+        if row["last_error"]:
+            line += f"\n        {row['last_error']}"
+        lines.append(line)
+    return lines
+
+
+async def cmd_ctl(
+    action: str,
+    *,
+    db_path: Optional[Path] = None,
+    call_fn: Callable = control.call,
+) -> dict:
+    """Sends a command to the running daemon's control socket.
+
+    Args:
+        action: One of the `corphish ctl` actions.
+        db_path: Path to the database file. Defaults to get_db_path().
+        call_fn: Performs the JSON-RPC call.
+
+    Returns:
+        The daemon's result.
+
+    Raises:
+        SystemExit: If the daemon is not running or returns an error.
+    """
+    try:
+        return await call_fn(_CTL_METHODS[action], db_path=db_path)
+    except (ConnectionError, RuntimeError) as exc:
+        logger.error("%s", exc)
+        sys.exit(1)
+
+
 async def dispatch(args: argparse.Namespace) -> None:
     """Dispatches to the appropriate command handler.
 
@@ -278,9 +775,47 @@ async def dispatch(args: argparse.Namespace) -> None:
         await cmd_skip_updates()
     elif command == "join":
         await cmd_join()
+    elif command == "ctl":
+        print(json.dumps(await cmd_ctl(args.action), indent=2))
+    elif command == "search":
+        lines = await cmd_search(" ".join(args.query), limit=args.limit, since=args.since)
+        print("\n".join(lines) if lines else "No matches.")
+    elif command == "export":
+        count = await cmd_export(
+            args.output,
+            fmt=args.format,
+            since_id=args.since_id,
+            batch_size=args.batch_size,
+        )
+        print(f"Exported {count} messages.", file=sys.stderr)
+    elif command == "usage":
+        lines = await cmd_usage(by=args.by, since=args.since, until=args.until)
+        print("\n".join(lines) if lines else "No usage recorded.")
+    elif command == "outbox":
+        lines = await cmd_outbox(args.action, args.ids)
+        print("\n".join(lines) if lines else "Outbox is empty.")
+    elif command == "dead-letters":
+        lines = await cmd_dead_letters()
+        print("\n".join(lines) if lines else "No dead-lettered messages.")
+    elif command == "loadtest":
+        report = await loadtest.run_load_test(
+            rate=args.rate,
+            duration=args.duration,
+            send_rate_limit=args.send_rate_limit,
+            profile=args.profile,
+            seed=args.seed,
+            replay=args.replay,
+            speed=args.speed,
+        )
+        print(json.dumps(report, indent=2))
+    elif command == "remind":
+        print(await cmd_remind(" ".join(args.spec)))
     else:
         # Default: run daemon (auto-bootstrap on first run)
+        role = getattr(args, "role", "all")
         if config.is_first_run():
             await run_bootstrap()
+        elif getattr(args, "supervise", False):
+            await run_supervisor(ROLES if role == "all" else (role,))
         else:
-            await run_daemon()
+            await run_daemon(role=role)
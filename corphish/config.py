@@ -6,6 +6,7 @@ Handles XDG-compliant config paths, TOML read/write, and first-run detection.
 import os
 import tomllib
 from pathlib import Path
+from typing import Optional
 
 import tomli_w
 
@@ -152,3 +153,258 @@ def get_max_conversation_turns() -> int:
         The max_conversation_turns value from config, or 30 if not set.
     """
     return load_config().get("max_conversation_turns", _DEFAULT_MAX_CONVERSATION_TURNS)
+
+
+def get_heartbeat_adaptive() -> bool:
+    """Returns whether the heartbeat should adapt its schedule to activity.
+
+    Returns:
+        The heartbeat_adaptive value from config, or False if not set.
+    """
+    return bool(load_config().get("heartbeat_adaptive", False))
+
+
+def get_heartbeat_quiet_hours() -> Optional[tuple[int, int]]:
+    """Returns the local-time window during which heartbeats are suppressed.
+
+    The window is read from ``heartbeat_quiet_hours = [start, end]`` where
+    both values are hours in the range 0-23. A window may wrap midnight
+    (e.g. ``[23, 7]``).
+
+    Returns:
+        A (start_hour, end_hour) tuple, or None if not configured.
+    """
+    value = load_config().get("heartbeat_quiet_hours")
+    if not value or len(value) != 2:
+        return None
+    return int(value[0]), int(value[1])
+
+
+# Default heartbeat jitter: +/- 10% of the interval
+_DEFAULT_HEARTBEAT_JITTER = 0.1
+
+
+def get_heartbeat_jitter() -> float:
+    """Returns the fractional jitter applied to adaptive heartbeat intervals.
+
+    Returns:
+        The heartbeat_jitter value from config, or 0.1 if not set.
+    """
+    return float(load_config().get("heartbeat_jitter", _DEFAULT_HEARTBEAT_JITTER))
+
+
+def get_heartbeat_speculative() -> bool:
+    """Returns whether heartbeats start the Opus escalation speculatively.
+
+    When enabled, the heartbeat model and Opus are called in parallel and
+    the Opus call is cancelled if the cheaper answer is confident.
+
+    Returns:
+        The heartbeat_speculative value from config, or False if not set.
+    """
+    return bool(load_config().get("heartbeat_speculative", False))
+
+
+def get_model_routing() -> bool:
+    """Returns whether user messages are routed to a model per message.
+
+    When disabled, every message uses the client's default model (Sonnet).
+
+    Returns:
+        The model_routing value from config, or False if not set.
+    """
+    return bool(load_config().get("model_routing", False))
+
+
+def get_partial_streaming() -> bool:
+    """Returns whether replies are streamed token by token into Telegram.
+
+    Returns:
+        The partial_streaming value from config, or False if not set.
+    """
+    return bool(load_config().get("partial_streaming", False))
+
+
+def get_typing_indicator() -> bool:
+    """Returns whether the chat shows "typing..." while Claude works.
+
+    Returns:
+        The typing_indicator value from config, or True if not set.
+    """
+    return bool(load_config().get("typing_indicator", True))
+
+
+# Default minimum seconds between edits of a message being streamed
+_DEFAULT_STREAM_EDIT_INTERVAL = 1.0
+
+
+def get_stream_edit_interval() -> float:
+    """Returns the minimum seconds between edits of a streamed message.
+
+    Returns:
+        The stream_edit_interval value from config, or 1.0 if not set.
+    """
+    return float(load_config().get("stream_edit_interval", _DEFAULT_STREAM_EDIT_INTERVAL))
+
+
+# Default lease on a claimed incoming message, in seconds
+_DEFAULT_MESSAGE_LEASE = 300
+
+
+def get_message_lease_seconds() -> int:
+    """Returns how long a processor's claim on a message lasts unless renewed.
+
+    Returns:
+        The message_lease_seconds value from config, or 300 if not set.
+    """
+    return int(load_config().get("message_lease_seconds", _DEFAULT_MESSAGE_LEASE))
+
+
+# Default number of processing attempts before a message is dead-lettered
+_DEFAULT_MAX_MESSAGE_ATTEMPTS = 3
+
+
+def get_max_message_attempts() -> int:
+    """Returns the processing attempts after which a message is dead-lettered.
+
+    Returns:
+        The max_message_attempts value from config, or 3 if not set.
+    """
+    return int(load_config().get("max_message_attempts", _DEFAULT_MAX_MESSAGE_ATTEMPTS))
+
+
+# Default number of failed sends before an outgoing message is given up
+_DEFAULT_MAX_SEND_ATTEMPTS = 5
+
+
+def get_max_send_attempts() -> int:
+    """Returns the failed sends after which an outgoing message is given up.
+
+    Returns:
+        The max_send_attempts value from config, or 5 if not set.
+    """
+    return int(load_config().get("max_send_attempts", _DEFAULT_MAX_SEND_ATTEMPTS))
+
+
+def get_retrieval() -> bool:
+    """Returns whether relevant past exchanges are added to each prompt.
+
+    Returns:
+        The retrieval value from config, or False if not set.
+    """
+    return bool(load_config().get("retrieval", False))
+
+
+# Default number of past exchanges injected per message
+_DEFAULT_RETRIEVAL_TOP_K = 3
+
+
+def get_retrieval_top_k() -> int:
+    """Returns how many past exchanges retrieval may inject.
+
+    Returns:
+        The retrieval_top_k value from config, or 3 if not set.
+    """
+    return int(load_config().get("retrieval_top_k", _DEFAULT_RETRIEVAL_TOP_K))
+
+
+# Default approximate token budget for injected history
+_DEFAULT_RETRIEVAL_TOKEN_BUDGET = 800
+
+
+def get_retrieval_token_budget() -> int:
+    """Returns the approximate token budget for injected history.
+
+    Returns:
+        The retrieval_token_budget value from config, or 800 if not set.
+    """
+    return int(load_config().get("retrieval_token_budget", _DEFAULT_RETRIEVAL_TOKEN_BUDGET))
+
+
+# Default longest time one Claude call may run, in seconds
+_DEFAULT_CLAUDE_TIMEOUT = 30 * 60
+
+
+def get_claude_timeout() -> float:
+    """Returns the wall-clock limit for one Claude call, in seconds.
+
+    Returns:
+        The claude_timeout value from config, or 1800 if not set. 0
+        disables the limit.
+    """
+    return float(load_config().get("claude_timeout", _DEFAULT_CLAUDE_TIMEOUT))
+
+
+# Default longest gap between SDK messages, in seconds
+_DEFAULT_CLAUDE_IDLE_TIMEOUT = 10 * 60
+
+
+def get_claude_idle_timeout() -> float:
+    """Returns how long a Claude call may go without any progress, in seconds.
+
+    Returns:
+        The claude_idle_timeout value from config, or 600 if not set. 0
+        disables the limit.
+    """
+    return float(load_config().get("claude_idle_timeout", _DEFAULT_CLAUDE_IDLE_TIMEOUT))
+
+
+def get_capture() -> bool:
+    """Returns whether Claude SDK message streams are recorded.
+
+    Returns:
+        The capture value from config, or False if not set.
+    """
+    return bool(load_config().get("capture", False))
+
+
+# Default size at which the capture file is rotated (16 MiB)
+_DEFAULT_CAPTURE_MAX_BYTES = 16 * 1024 * 1024
+
+
+def get_capture_max_bytes() -> int:
+    """Returns the size in bytes at which the capture file is rotated.
+
+    Returns:
+        The capture_max_bytes value from config, or 16 MiB if not set.
+    """
+    return int(load_config().get("capture_max_bytes", _DEFAULT_CAPTURE_MAX_BYTES))
+
+
+# Default number of rotated capture files kept
+_DEFAULT_CAPTURE_BACKUPS = 3
+
+
+def get_capture_backups() -> int:
+    """Returns how many rotated capture files are kept.
+
+    Returns:
+        The capture_backups value from config, or 3 if not set.
+    """
+    return int(load_config().get("capture_backups", _DEFAULT_CAPTURE_BACKUPS))
+
+
+# Default largest media file downloaded (20 MiB, the Bot API download limit)
+_DEFAULT_MEDIA_MAX_BYTES = 20 * 1024 * 1024
+
+
+def get_media_max_bytes() -> int:
+    """Returns the size in bytes above which media files are not downloaded.
+
+    Returns:
+        The media_max_bytes value from config, or 20 MiB if not set.
+    """
+    return int(load_config().get("media_max_bytes", _DEFAULT_MEDIA_MAX_BYTES))
+
+
+# Default number of media downloads run at once
+_DEFAULT_MEDIA_CONCURRENCY = 2
+
+
+def get_media_concurrency() -> int:
+    """Returns how many media files are downloaded at once.
+
+    Returns:
+        The media_concurrency value from config, or 2 if not set.
+    """
+    return int(load_config().get("media_concurrency", _DEFAULT_MEDIA_CONCURRENCY))
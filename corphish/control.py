@@ -0,0 +1,307 @@
+"""Local JSON-RPC control plane for a running daemon.
+
+``run_daemon`` serves a Unix-domain socket next to the database
+(``corphish-control.sock``) that answers JSON-RPC 2.0 requests, one per
+line. Requests are handled from in-memory state and a single indexed
+query, never by waiting on ``ClaudeClient.lock``, so they return within
+milliseconds even while Claude is busy.
+
+Methods:
+  - ``status`` — queue depths, lock holder, current model, turn count
+  - ``reset`` — reset the Claude conversation (deferred until the lock is
+    free if a reply is in progress)
+  - ``pause_heartbeat`` / ``resume_heartbeat``
+  - ``metrics`` — counters, loop restarts and model usage summaries
+"""
+
+import asyncio
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# JSON-RPC 2.0 error codes
+_PARSE_ERROR = -32700
+_INVALID_REQUEST = -32600
+_METHOD_NOT_FOUND = -32601
+_INTERNAL_ERROR = -32603
+
+
+def get_control_socket_path(db_path: Optional[Path] = None) -> Path:
+    """Returns the path of the control socket for a database.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        ``<db name>-control.sock`` in the database directory.
+    """
+    path = db_path or db.get_db_path()
+    return path.with_name(f"{path.stem}-control.sock")
+
+
+class DaemonState:
+    """Live daemon state shared by the loops and the control server.
+
+    Attributes:
+        role: The role this process runs ("all" or one of daemon.ROLES).
+        started_at: POSIX time at which the daemon started.
+        turn_count: Claude turns since the last conversation reset.
+        current_model: Model of the conversation call in progress, if any.
+        lock_holder: Which loop holds the conversation lock ("processor"),
+            or None.
+        heartbeat_model: Model of the heartbeat call in progress, if any.
+        current_message_id: ID of the message being processed, if any.
+        heartbeat_paused: If True, the heartbeat runner skips its beats.
+        reset_requested: If True, the processor resets the conversation
+            before its next message.
+        restart_counts: Restarts per supervised loop.
+        counters: Monotonic event counters (messages processed, failures,
+            heartbeats fired/skipped).
+        timings: Latency statistics per operation, in milliseconds, as
+            dicts with keys count, total_ms, max_ms.
+    """
+
+    def __init__(self, role: str = "all") -> None:
+        self.role = role
+        self.started_at = time.time()
+        self.turn_count = 0
+        self.current_model: Optional[str] = None
+        self.lock_holder: Optional[str] = None
+        self.heartbeat_model: Optional[str] = None
+        self.current_message_id: Optional[int] = None
+        self.heartbeat_paused = False
+        self.reset_requested = False
+        self.restart_counts: dict[str, int] = {}
+        self.counters: dict[str, int] = {}
+        self.timings: dict[str, dict] = {}
+
+    def count(self, name: str) -> None:
+        """Increments a counter."""
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    def observe(self, name: str, milliseconds: float) -> None:
+        """Records one latency sample."""
+        timing = self.timings.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        timing["count"] += 1
+        timing["total_ms"] += milliseconds
+        timing["max_ms"] = max(timing["max_ms"], milliseconds)
+
+
+class ControlServer:
+    """Serves JSON-RPC control requests over a Unix-domain socket.
+
+    Args:
+        state: The daemon's live state.
+        claude: The ClaudeClient used by the processor, or None.
+        heartbeat: Whether the heartbeat runner runs in this process. A
+            heartbeat in another process (``--supervise``) has its own
+            state, so pausing it from here is refused rather than
+            silently ignored.
+        db_path: Path to the database file.
+        socket_path: Socket to listen on. Defaults to
+            get_control_socket_path().
+        get_queue_depths_fn: Returns queue depths from the database.
+        get_usage_summary_fn: Returns the model usage summary.
+        get_decision_summary_fn: Returns the heartbeat decision summary.
+    """
+
+    def __init__(
+        self,
+        state: DaemonState,
+        *,
+        claude: Any = None,
+        heartbeat: bool = True,
+        db_path: Optional[Path] = None,
+        socket_path: Optional[Path] = None,
+        get_queue_depths_fn: Callable = db.get_queue_depths,
+        get_usage_summary_fn: Callable = db.get_model_usage_summary,
+        get_decision_summary_fn: Callable = db.get_heartbeat_decision_summary,
+    ) -> None:
+        self._state = state
+        self._claude = claude
+        self._heartbeat = heartbeat
+        self._db_path = db_path
+        self._socket_path = socket_path or get_control_socket_path(db_path)
+        self._get_queue_depths = get_queue_depths_fn
+        self._get_usage_summary = get_usage_summary_fn
+        self._get_decision_summary = get_decision_summary_fn
+        self._methods: dict[str, Callable] = {
+            "status": self.status,
+            "reset": self.reset,
+            "pause_heartbeat": self.pause_heartbeat,
+            "resume_heartbeat": self.resume_heartbeat,
+            "metrics": self.metrics,
+        }
+
+    async def status(self) -> dict:
+        """Returns queue depths and what the daemon is doing right now."""
+        state = self._state
+        model = state.current_model
+        if model is None and self._claude is not None:
+            model = self._claude.model
+        return {
+            "role": state.role,
+            "uptime": round(time.time() - state.started_at, 1),
+            "queues": await self._get_queue_depths(db_path=self._db_path),
+            "busy": bool(self._claude is not None and self._claude.busy),
+            "lock_holder": state.lock_holder,
+            "current_message_id": state.current_message_id,
+            "current_model": model,
+            "heartbeat_model": state.heartbeat_model,
+            "turn_count": state.turn_count,
+            "heartbeat_paused": state.heartbeat_paused if self._heartbeat else None,
+        }
+
+    async def reset(self) -> dict:
+        """Resets the conversation now, or after the reply in progress."""
+        if self._claude is None:
+            raise RuntimeError("This daemon process does not run the processor")
+        if self._claude.busy:
+            self._state.reset_requested = True
+            return {"reset": "pending"}
+        self._claude.reset()
+        self._state.turn_count = 0
+        logger.info("[control] Reset conversation")
+        return {"reset": "done"}
+
+    async def pause_heartbeat(self) -> dict:
+        """Stops the heartbeat runner from firing until resumed."""
+        self._require_heartbeat()
+        self._state.heartbeat_paused = True
+        logger.info("[control] Heartbeat paused")
+        return {"heartbeat_paused": True}
+
+    async def resume_heartbeat(self) -> dict:
+        """Lets the heartbeat runner fire again."""
+        self._require_heartbeat()
+        self._state.heartbeat_paused = False
+        logger.info("[control] Heartbeat resumed")
+        return {"heartbeat_paused": False}
+
+    def _require_heartbeat(self) -> None:
+        if not self._heartbeat:
+            raise RuntimeError("This daemon process does not run the heartbeat")
+
+    async def metrics(self) -> dict:
+        """Returns in-process counters and usage summaries."""
+        return {
+            "counters": dict(self._state.counters),
+            "restarts": dict(self._state.restart_counts),
+            "timings": {
+                name: {**timing, "avg_ms": timing["total_ms"] / timing["count"]}
+                for name, timing in self._state.timings.items()
+            },
+            "model_usage": await self._get_usage_summary(db_path=self._db_path),
+            "heartbeat_decisions": await self._get_decision_summary(
+                db_path=self._db_path
+            ),
+            "circuits": self._claude.breaker.snapshot() if self._claude is not None else {},
+        }
+
+    async def handle(self, line: bytes) -> dict:
+        """Handles one JSON-RPC request line.
+
+        Args:
+            line: The raw request.
+
+        Returns:
+            The JSON-RPC response object.
+        """
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError:
+            return _error(None, _PARSE_ERROR, "Parse error")
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return _error(None, _INVALID_REQUEST, "Invalid request")
+
+        request_id = request.get("id")
+        method = self._methods.get(request["method"])
+        if method is None:
+            return _error(request_id, _METHOD_NOT_FOUND, f"Unknown method {request['method']!r}")
+        try:
+            result = await method()
+        except Exception as exc:
+            logger.exception("Control method %s failed", request["method"])
+            return _error(request_id, _INTERNAL_ERROR, str(exc))
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while line := await reader.readline():
+                response = await self.handle(line)
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def run(self) -> None:
+        """Serves the control socket until cancelled."""
+        server = await asyncio.start_unix_server(
+            self._handle_client, path=str(self._socket_path)
+        )
+        logger.info("[control] Listening on %s", self._socket_path)
+        try:
+            await asyncio.Event().wait()
+        finally:
+            server.close()
+            self._socket_path.unlink(missing_ok=True)
+
+
+def _error(request_id: Any, code: int, message: str) -> dict:
+    """Builds a JSON-RPC error response."""
+    return {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "error": {"code": code, "message": message},
+    }
+
+
+async def call(
+    method: str,
+    *,
+    db_path: Optional[Path] = None,
+    socket_path: Optional[Path] = None,
+) -> Any:
+    """Calls a control method on the running daemon.
+
+    Args:
+        method: The method name.
+        db_path: Path to the database file. Defaults to get_db_path().
+        socket_path: Socket to connect to. Defaults to
+            get_control_socket_path().
+
+    Returns:
+        The method's result.
+
+    Raises:
+        ConnectionError: If no daemon is listening.
+        RuntimeError: If the daemon returned an error.
+    """
+    path = socket_path or get_control_socket_path(db_path)
+    try:
+        reader, writer = await asyncio.open_unix_connection(str(path))
+    except OSError as exc:
+        raise ConnectionError(f"Daemon is not running (no socket at {path})") from exc
+    try:
+        request = {"jsonrpc": "2.0", "id": 1, "method": method}
+        writer.write((json.dumps(request) + "\n").encode())
+        await writer.drain()
+        line = await reader.readline()
+    finally:
+        writer.close()
+    if not line:
+        raise ConnectionError("Daemon closed the control connection")
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(response["error"]["message"])
+    return response["result"]
@@ -1,20 +1,104 @@
 """Daemon components: message consumer, processor, heartbeat, and integration via SQLite."""
 
 import asyncio
+import functools
 import logging
+import os
+import random
+import signal
+import socket
+import time
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Any, Awaitable, Callable, Optional
 
 from telegram import Bot
 
-from . import chat, config, db
-from .claude_client import ClaudeClient, MODEL_HAIKU, MODEL_OPUS, MODEL_SONNET
+from . import bus, capture, chat, config, control, db, formatting, media, reminders, retrieval, router
+from .writer import DbWriter
+from .claude_client import (
+    ApiUnavailableError,
+    ClaudeClient,
+    MODEL_HAIKU,
+    MODEL_OPUS,
+    MODEL_SONNET,
+)
 
 logger = logging.getLogger(__name__)
 
 _BACKOFF_BASE = 1
 _BACKOFF_MAX = 60
 
+# Adaptive heartbeat bounds, as multiples of the configured interval
+_HEARTBEAT_MIN_FACTOR = 0.5
+_HEARTBEAT_MAX_FACTOR = 8
+
+# Seconds for which a processor escalation counts towards routing decisions
+_ESCALATION_WINDOW = 30 * 60
+
+# Restart backoff for crashed loops; the failure streak resets once a loop
+# has stayed up for _RESTART_RESET_AFTER seconds
+_RESTART_BACKOFF_BASE = 1
+_RESTART_BACKOFF_MAX = 300
+_RESTART_RESET_AFTER = 600
+
+# Seconds to let the processor and heartbeat finish in-flight work on SIGTERM
+_DRAIN_TIMEOUT = 60
+
+# Bounds on the wait before retrying while Claude is unavailable
+_UNAVAILABLE_MIN_WAIT = 1
+_UNAVAILABLE_MAX_WAIT = 60
+
+# How often the watchdog checks an in-flight Claude call for timeouts and
+# /cancel, and how long a cancelled call gets to clean up before the
+# processor stops waiting for it
+_WATCHDOG_INTERVAL = 0.5
+_CANCEL_GRACE = 10
+
+# Seconds between typing indicators; Telegram shows each one for about 5s
+_TYPING_INTERVAL = 4
+
+# Seconds after which a heartbeat deferred or preempted by a user message
+# is tried again
+_HEARTBEAT_DEFER = 60
+
+_PREEMPTED = "preempted by a user message"
+
+# Sent when Claude fails after part of a reply went out, as the message is
+# not retried
+_FAILED_NOTICE = "The reply was cut short by an error. Send it again to retry."
+
+
+async def _sleep_or_stop(
+    seconds: float,
+    stop_event: Optional[asyncio.Event],
+    wake_event: Optional[asyncio.Event] = None,
+) -> bool:
+    """Sleeps for *seconds* or until *stop_event* or *wake_event* is set.
+
+    Args:
+        seconds: Maximum time to sleep.
+        stop_event: Event that cuts the sleep short, or None.
+        wake_event: Event signalling new work, or None. It is cleared
+            before returning.
+
+    Returns:
+        True if the stop event is set.
+    """
+    events = [event for event in (stop_event, wake_event) if event is not None]
+    if not events:
+        await asyncio.sleep(seconds)
+        return False
+    waiters = [asyncio.create_task(event.wait()) for event in events]
+    try:
+        await asyncio.wait(waiters, timeout=seconds, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+    if wake_event is not None:
+        wake_event.clear()
+    return stop_event is not None and stop_event.is_set()
+
 
 def _load_heartbeat_prompt() -> str:
     """Loads the heartbeat prompt from HEARTBEAT.md.
@@ -45,6 +129,29 @@ async def _poll_updates(bot: Bot, offset: int, timeout: int = 10):
     return await bot.get_updates(offset=offset, timeout=timeout)
 
 
+async def _download_media(
+    store: media.MediaStore, bot: Bot, attachment: dict
+) -> tuple[Optional[dict], Optional[str]]:
+    """Downloads one file into the media store.
+
+    Returns:
+        The stored file (see MediaStore.save) and None, or None and why
+        the file was not stored.
+    """
+    try:
+        file = await store.download(bot, attachment)
+    except media.MediaTooLargeError as exc:
+        logger.warning("[consumer] Skipped %s: %s", attachment["kind"], exc)
+        return None, str(exc)
+    except Exception:
+        logger.exception("[consumer] Failed to download %s", attachment["kind"])
+        return None, "the download failed"
+    logger.info(
+        "[consumer] Stored %s (%d bytes) at %s", attachment["kind"], file["size"], file["path"]
+    )
+    return file, None
+
+
 async def run_message_consumer(
     *,
     get_token_fn: Callable = chat.get_bot_token,
@@ -56,6 +163,9 @@ async def run_message_consumer(
     save_offset_fn: Callable = config.save_update_offset,
     db_path: Optional[Path] = None,
     insert_incoming_fn: Callable = db.insert_incoming_message,
+    media_store: Optional[media.MediaStore] = None,
+    insert_attachment_fn: Callable = db.insert_attachment,
+    get_stored_updates_fn: Callable = db.get_stored_update_ids,
 ) -> None:
     """Runs the message consumer loop.
 
@@ -63,6 +173,19 @@ async def run_message_consumer(
     This component is responsible only for ingestion — it does not process
     messages or interact with Claude.
 
+    Photos, documents, voice notes and other files are streamed into the
+    media store (see media.MediaStore), the files of one batch of updates
+    concurrently. Each file is recorded in the attachments table before
+    its message is inserted, so the processor never sees a message
+    without its files. The message text is its caption, or the kind of
+    file if it has none; a file that is too large or fails to download is
+    noted in the text instead. The update offset is saved after the whole
+    batch has been inserted, so nothing is lost if the consumer is stopped
+    mid-download. A batch polled again after such a stop skips the updates
+    already stored, and the database ignores a message or file stored
+    twice. If a message cannot be inserted the offset is not saved and the
+    batch is polled again.
+
     Args:
         get_token_fn: Returns the Telegram bot token.
         build_bot_fn: Builds a Bot from a token.
@@ -73,6 +196,11 @@ async def run_message_consumer(
         save_offset_fn: Persists the update offset.
         db_path: Path to the database file.
         insert_incoming_fn: Function to insert incoming messages to DB.
+        media_store: Store for downloaded files. Created from config on
+            first use if not given.
+        insert_attachment_fn: Function to record a downloaded file.
+        get_stored_updates_fn: Function returning which update IDs are
+            already stored.
     """
     token = get_token_fn()
     bot = build_bot_fn(token)
@@ -98,32 +226,349 @@ async def run_message_consumer(
                 logger.info("Backing off for %ds before next poll", poll_backoff)
                 await asyncio.sleep(poll_backoff)
 
+        batch_offset = offset
+        stored_ids: set = set()
+        if updates:
+            try:
+                stored_ids = await get_stored_updates_fn(
+                    [update.update_id for update in updates], db_path=db_path
+                )
+            except Exception:
+                logger.exception("Failed to look up stored updates")
+
+        # Messages from the chat in this batch, with the file each carries
+        accepted = []
         for update in updates:
             offset = update.update_id + 1
-            save_offset_fn(offset)
 
-            if not update.message or not update.message.text:
+            if update.update_id in stored_ids:
+                logger.info("[consumer] Skipping update %d, already stored", update.update_id)
+                continue
+            if not update.message or update.message.chat.id != chat_id:
                 continue
-            if update.message.chat.id != chat_id:
+            attachment = media.media_of(update.message)
+            if not update.message.text and attachment is None:
                 continue
+            accepted.append((update, attachment))
+
+        downloads = [attachment for _, attachment in accepted if attachment]
+        if downloads and media_store is None:
+            media_store = media.store_from_config()
+        stored = iter(
+            await asyncio.gather(
+                *(_download_media(media_store, bot, attachment) for attachment in downloads)
+            )
+        )
 
-            user_text = update.message.text
+        failed = False
+        for update, attachment in accepted:
+            message = update.message
+            user_text = message.text or message.caption or ""
+            if attachment:
+                kind = attachment["kind"]
+                user_text = user_text or f"[{kind}]"
+                file, problem = next(stored)
+                if file:
+                    try:
+                        await insert_attachment_fn(
+                            telegram_message_id=message.message_id,
+                            kind=kind,
+                            sha256=file["sha256"],
+                            path=file["path"],
+                            size=file["size"],
+                            mime_type=attachment["mime_type"],
+                            file_name=attachment["file_name"],
+                            db_path=db_path,
+                        )
+                    except Exception:
+                        logger.exception("Failed to insert attachment to database")
+                        problem = "it could not be recorded"
+                if problem:
+                    user_text += (
+                        f"\n\n[The {kind} sent with this message is unavailable: {problem}]"
+                    )
             logger.info("[consumer] Received message: %s", user_text[:50])
 
             try:
                 await insert_incoming_fn(
                     text=user_text,
                     telegram_update_id=update.update_id,
-                    telegram_message_id=update.message.message_id,
+                    telegram_message_id=message.message_id,
                     db_path=db_path,
                 )
             except Exception:
                 logger.exception("Failed to insert message to database")
+                # Poll the batch again; what was stored is skipped then
+                failed = True
+                offset = batch_offset
+                break
+
+        # Persisted only once the batch is stored: a consumer stopped
+        # during a download polls the same updates again on restart
+        if updates and not failed:
+            save_offset_fn(offset)
 
         if once:
             break
 
-        await asyncio.sleep(1)
+        # Long polling already waits for new updates; only pause when the
+        # poll returned nothing (e.g. after an error)
+        if not updates or failed:
+            await asyncio.sleep(1)
+
+
+async def _create_reminder(
+    spec: str,
+    *,
+    db_path: Optional[Path] = None,
+    insert_reminder_fn: Callable = db.insert_reminder,
+    schedule_reminder_fn: Optional[Callable] = None,
+) -> str:
+    """Parses and persists a reminder, returning a confirmation for the user.
+
+    Args:
+        spec: The reminder specification (see reminders.parse_reminder).
+        db_path: Path to the database file.
+        insert_reminder_fn: Function to persist the reminder.
+        schedule_reminder_fn: Callable(reminder_id, due_at) that hands the
+            reminder to the in-process scheduler, if one is running.
+
+    Returns:
+        A confirmation or error message to send back to the user.
+    """
+    try:
+        due, text = reminders.parse_reminder(spec)
+    except ValueError as exc:
+        return f"Could not set reminder: {exc}"
+
+    due_at = due.isoformat()
+    reminder_id = await insert_reminder_fn(text, due_at, db_path=db_path)
+    if schedule_reminder_fn is not None:
+        schedule_reminder_fn(reminder_id, due_at)
+    logger.info("[processor] Scheduled reminder %d for %s", reminder_id, due_at)
+    return f"Reminder {reminder_id} set for {due.astimezone():%Y-%m-%d %H:%M}: {text}"
+
+
+async def _cancel_reminder(
+    reminder_id: int,
+    *,
+    db_path: Optional[Path] = None,
+    cancel_reminder_fn: Callable = db.cancel_reminder,
+    unschedule_reminder_fn: Optional[Callable] = None,
+) -> str:
+    """Cancels a reminder, returning a confirmation for the user.
+
+    Args:
+        reminder_id: The database ID of the reminder.
+        db_path: Path to the database file.
+        cancel_reminder_fn: Function to mark the reminder cancelled.
+        unschedule_reminder_fn: Callable(reminder_id) that drops the
+            reminder from the in-process scheduler, if one is running.
+
+    Returns:
+        A confirmation or error message to send back to the user.
+    """
+    if not await cancel_reminder_fn(reminder_id, db_path=db_path):
+        return f"No pending reminder {reminder_id}."
+    if unschedule_reminder_fn is not None:
+        unschedule_reminder_fn(reminder_id)
+    logger.info("[processor] Cancelled reminder %d", reminder_id)
+    return f"Reminder {reminder_id} cancelled."
+
+
+async def _stream_routed(
+    client: ClaudeClient,
+    user_text: str,
+    model_id: str,
+    reason: str,
+    *,
+    deliver_fn: Callable,
+    stream_reply_fn: Callable,
+    log_usage_fn: Callable = db.log_model_usage,
+    db_path: Optional[Path] = None,
+) -> bool:
+    """Streams a reply on a routed model, escalating uncertain Haiku replies.
+
+    Haiku replies are buffered rather than delivered as they arrive, so
+    that a reply signalling uncertainty can be discarded and retried on
+    Sonnet. The Haiku turn runs in a fork of the session, and a discarded
+    one is rewound, so the retry continues the conversation without it.
+    Until the client knows its session (before the first reply after
+    start-up) Haiku is passed over for Sonnet. Replies from larger models
+    are streamed as usual. The caller must hold client.lock.
+
+    Each call is logged once it has finished, with the router's reason;
+    a discarded Haiku call is logged as cancelled, so it is not counted
+    as usage.
+
+    Args:
+        client: The ClaudeClient to stream from.
+        user_text: The message from the user.
+        model_id: The model ID chosen by the router.
+        reason: The router's reason label.
+        deliver_fn: Async callable(chunk) that stores and sends a chunk.
+        stream_reply_fn: Async callable(user_text, model) that streams and
+            delivers a complete reply.
+        log_usage_fn: Function to log model usage and routing decisions.
+        db_path: Path to the database file.
+
+    Returns:
+        True if the reply was escalated to a bigger model, False otherwise.
+    """
+    session_id = client.session_id
+    if model_id == MODEL_HAIKU and session_id is None:
+        # A discarded Haiku turn can only be rewound to a known session, so
+        # the first reply after start-up comes from Sonnet
+        model_id = MODEL_SONNET
+
+    if model_id != MODEL_HAIKU:
+        await stream_reply_fn(user_text, model_id)
+        await _log_usage_safely(
+            log_usage_fn, model=model_id, reason=reason, db_path=db_path
+        )
+        return False
+
+    chunks = [
+        chunk async for chunk in client.stream(user_text, model=model_id, fork=True)
+    ]
+    if not _needs_escalation("\n".join(chunks)):
+        for chunk in chunks:
+            await deliver_fn(chunk)
+        await _log_usage_safely(
+            log_usage_fn, model=model_id, reason=reason, db_path=db_path
+        )
+        return False
+
+    logger.info("[processor] Haiku reply signals uncertainty, retrying on Sonnet")
+    await _log_usage_safely(
+        log_usage_fn,
+        model=model_id,
+        outcome="cancelled",
+        reason=reason,
+        db_path=db_path,
+    )
+    client.rewind(session_id)
+    await stream_reply_fn(user_text, MODEL_SONNET)
+    await _log_usage_safely(
+        log_usage_fn,
+        model=MODEL_SONNET,
+        escalated=True,
+        reason="uncertain_response",
+        db_path=db_path,
+    )
+    return True
+
+
+async def _watch_call(
+    call: Awaitable,
+    *,
+    last_activity_fn: Callable[[], float],
+    timeout: float,
+    idle_timeout: float,
+    take_cancel_fn: Callable,
+    cancel_reason: str = "cancelled by /cancel",
+    interval: float = _WATCHDOG_INTERVAL,
+    grace: float = _CANCEL_GRACE,
+    name: str = "processor",
+) -> tuple[Any, Optional[str]]:
+    """Runs a Claude call under a watchdog.
+
+    The call is cancelled when it exceeds *timeout* in total, when no SDK
+    message has arrived for *idle_timeout* seconds, or when *take_cancel_fn*
+    reports a /cancel. Cancellation unwinds the SDK stream, which closes
+    its CLI subprocess; if that takes longer than *grace* the call is
+    abandoned so the caller can release the Claude lock regardless.
+    The heartbeat uses the same watchdog, with *take_cancel_fn* reporting
+    a waiting user message instead of a /cancel.
+
+    Args:
+        call: The coroutine making the call.
+        last_activity_fn: Returns the time.monotonic() of the latest SDK
+            message.
+        timeout: Wall-clock limit in seconds; 0 for none.
+        idle_timeout: Limit on the gap between SDK messages; 0 for none.
+        take_cancel_fn: Async callable returning a truthy value once the
+            user has asked to cancel.
+        cancel_reason: Reason returned when take_cancel_fn stopped the call.
+        interval: Seconds between checks.
+        grace: Seconds to wait for a cancelled call to finish.
+        name: Loop name used in log messages.
+
+    Returns:
+        (result, None) if the call completed, or (None, reason) if it was
+        stopped, with reason describing why.
+
+    Raises:
+        Exception: Whatever the call raised.
+    """
+    task = asyncio.ensure_future(call)
+    started = time.monotonic()
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=interval)
+            if done:
+                return task.result(), None
+            now = time.monotonic()
+            if timeout and now - started >= timeout:
+                reason = f"timeout: no reply within {timeout:g}s"
+            elif idle_timeout and now - last_activity_fn() >= idle_timeout:
+                reason = f"idle: no progress for {idle_timeout:g}s"
+            else:
+                try:
+                    cancelled = await take_cancel_fn()
+                except Exception:
+                    logger.exception("[%s] Failed to check for cancellation", name)
+                    cancelled = None
+                if not cancelled:
+                    continue
+                reason = cancel_reason
+
+            logger.warning("[%s] Stopping Claude call (%s)", name, reason)
+            task.cancel()
+            done, _ = await asyncio.wait({task}, timeout=grace)
+            if not done:
+                logger.error(
+                    "[%s] Claude call did not stop within %ss, abandoning it", name, grace
+                )
+            elif not task.cancelled() and task.exception() is not None:
+                logger.warning("Cancelled Claude call raised: %r", task.exception())
+            return None, reason
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+def _stopped_notice(reason: str) -> str:
+    """Returns the chat notice for a Claude call stopped by the watchdog."""
+    if reason.startswith("cancelled"):
+        return "Cancelled."
+    return f"Stopped the reply ({reason}). Send /reset if the conversation seems stuck."
+
+
+async def _record_error_safely(
+    record_error_fn: Callable,
+    message_id: int,
+    error: str,
+    db_path: Optional[Path] = None,
+) -> None:
+    """Records a message's last error, never letting a failure escape."""
+    try:
+        await record_error_fn(message_id, error[:500], db_path=db_path)
+    except Exception:
+        logger.exception("Failed to record error for message %d", message_id)
+
+
+async def _log_usage_safely(log_usage_fn: Callable, **kwargs) -> None:
+    """Logs processor model usage, never letting a logging failure escape.
+
+    Args:
+        log_usage_fn: Function to log model usage.
+        **kwargs: Arguments for log_usage_fn (source is set to "processor").
+    """
+    try:
+        await log_usage_fn(source="processor", **kwargs)
+    except Exception:
+        logger.exception("Failed to log model usage")
 
 
 async def run_message_processor(
@@ -135,17 +580,103 @@ async def run_message_processor(
     claude: Optional[ClaudeClient] = None,
     once: bool = False,
     db_path: Optional[Path] = None,
-    get_next_unprocessed_fn: Callable = db.get_next_unprocessed_message,
+    claim_next_fn: Callable = db.claim_next_message,
     mark_processed_fn: Callable = db.mark_message_processed,
+    release_fn: Callable = db.release_message,
+    extend_lease_fn: Callable = db.extend_message_lease,
     insert_outgoing_fn: Callable = db.insert_outgoing_message,
+    insert_sent_outgoing_fn: Callable = db.insert_sent_outgoing_message,
     get_unsent_outgoing_fn: Callable = db.get_unsent_outgoing_messages,
     mark_outgoing_sent_fn: Callable = db.mark_outgoing_message_sent,
     get_max_turns_fn: Callable = config.get_max_conversation_turns,
+    insert_reminder_fn: Callable = db.insert_reminder,
+    schedule_reminder_fn: Optional[Callable] = None,
+    cancel_reminder_fn: Callable = db.cancel_reminder,
+    unschedule_reminder_fn: Optional[Callable] = None,
+    get_routing_fn: Callable = config.get_model_routing,
+    log_usage_fn: Callable = db.log_model_usage,
+    edit_message_fn: Callable = chat.edit_message,
+    get_partial_streaming_fn: Callable = config.get_partial_streaming,
+    get_edit_interval_fn: Callable = config.get_stream_edit_interval,
+    worker_id: Optional[str] = None,
+    get_lease_seconds_fn: Callable = config.get_message_lease_seconds,
+    get_max_attempts_fn: Callable = config.get_max_message_attempts,
+    stop_event: Optional[asyncio.Event] = None,
+    wake_event: Optional[asyncio.Event] = None,
+    state: Optional[control.DaemonState] = None,
+    get_retrieval_fn: Callable = config.get_retrieval,
+    retriever: Optional[retrieval.Retriever] = None,
+    get_timeout_fn: Callable = config.get_claude_timeout,
+    get_idle_timeout_fn: Callable = config.get_claude_idle_timeout,
+    take_cancel_fn: Callable = db.take_cancel_request,
+    record_error_fn: Callable = db.record_message_error,
+    send_typing_fn: Callable = chat.send_typing,
+    get_typing_fn: Callable = config.get_typing_indicator,
+    typing_interval: float = _TYPING_INTERVAL,
+    get_parts_fn: Callable = db.get_outgoing_parts,
+    save_parts_fn: Callable = db.save_outgoing_parts,
+    mark_part_sent_fn: Callable = db.mark_outgoing_part_sent,
+    record_send_failure_fn: Callable = db.record_send_failure,
+    get_max_send_attempts_fn: Callable = config.get_max_send_attempts,
+    get_attachments_fn: Callable = db.get_attachments,
+    flush_writes_fn: Optional[Callable] = None,
 ) -> None:
     """Runs the message processor loop.
 
-    Polls the database for unprocessed messages, sends them to Claude,
+    Claims unprocessed messages from the database, sends them to Claude,
     writes responses to the database, and dispatches them via Telegram.
+    The /reset, /remind and /cancel commands are handled locally without
+    Claude.
+
+    Messages are claimed under a lease that is renewed while Claude is
+    working on them. A message is acknowledged (marked processed) only
+    after its reply has been stored; if Claude fails the claim is released
+    so the message is retried, and after the configured number of attempts
+    it is dead-lettered. A processor that crashes simply lets its lease
+    expire and another worker picks the message up.
+
+    When model routing is enabled, each message is classified locally and
+    sent to Haiku, Sonnet or Opus. Haiku replies are buffered and retried
+    on Sonnet if they signal uncertainty. Every routing decision is logged
+    to model_usage with its reason.
+
+    With retrieval enabled, past exchanges related to each message are
+    looked up in the local full-text index and prepended to the prompt, so
+    context from before the last conversation reset is not lost. Only
+    history from before the current session is searched.
+
+    With partial streaming enabled, replies are shown token by token: the
+    first text delta is sent immediately and the Telegram message is then
+    edited in place, at most once per edit interval, until it is complete.
+
+    While Claude is unavailable (see claude_client.CircuitBreaker) the
+    message is released without counting the attempt and the processor
+    backs off for as long as the breaker asks, so an API outage delays
+    messages instead of dead-lettering them.
+
+    Each Claude call runs under a watchdog (see _watch_call) that stops it
+    after a wall-clock timeout, after too long without any SDK message
+    (e.g. a hung tool call), or when a /cancel arrives behind it in the
+    queue, so the Claude lock is always released within a bounded time.
+    A stopped message is acknowledged with the reason in last_error.
+
+    Outgoing messages are rendered with formatting.render(): Markdown is
+    sent as Telegram HTML (falling back to plain text; a streamed reply
+    shows plain text until its final edit), and a reply too
+    long for one Telegram message is split into parts that are stored in
+    outgoing_parts, so a failed send resumes after the last part sent
+    instead of repeating the whole reply. Every failed send is counted and
+    retried with exponential backoff; after the configured number of
+    failures the message is marked failed and left for `corphish outbox`,
+    so one message Telegram always rejects cannot keep the loop busy.
+
+    Files that came with a message (see run_message_consumer) are listed
+    after its prompt with their paths in the media store, so Claude can
+    open them with its file tools.
+
+    From the moment a message is claimed until Claude has finished with
+    it, the chat shows "typing..." (refreshed every *typing_interval*
+    seconds), so long tool-using turns do not look like a dead bot.
 
     Args:
         get_token_fn: Returns the Telegram bot token.
@@ -155,25 +686,323 @@ async def run_message_processor(
         claude: A ClaudeClient instance.
         once: If True, process one message and return (for testing).
         db_path: Path to the database file.
-        get_next_unprocessed_fn: Function to get next unprocessed message.
-        mark_processed_fn: Function to mark message as processed.
+        claim_next_fn: Function to claim the next available message.
+        mark_processed_fn: Function to acknowledge a message as processed.
+        release_fn: Function to release a claim so the message is retried.
+        extend_lease_fn: Function to renew the lease on a claimed message.
         insert_outgoing_fn: Function to insert outgoing message.
+        insert_sent_outgoing_fn: Function to record a reply chunk that has
+            already been sent. A DbWriter's queues the row without waiting,
+            so it commits together with the message's acknowledgement.
         get_unsent_outgoing_fn: Function to get unsent outgoing messages.
         mark_outgoing_sent_fn: Function to mark outgoing message as sent.
         get_max_turns_fn: Function to get the max turns before auto-reset.
+        insert_reminder_fn: Function to persist a new reminder.
+        schedule_reminder_fn: Callable(reminder_id, due_at) that hands a new
+            reminder to the in-process scheduler, if one is running.
+        cancel_reminder_fn: Function to cancel a pending reminder.
+        unschedule_reminder_fn: Callable(reminder_id) that drops a
+            cancelled reminder from the in-process scheduler, if one is
+            running.
+        get_routing_fn: Function returning whether per-message model
+            routing is enabled.
+        log_usage_fn: Function to log model usage and routing decisions.
+        edit_message_fn: Edits a previously sent Telegram message.
+        get_partial_streaming_fn: Function returning whether replies are
+            streamed token by token.
+        get_edit_interval_fn: Function returning the minimum seconds
+            between edits of a streamed message.
+        worker_id: Identifier recorded on claimed messages. Defaults to
+            "<hostname>:<pid>".
+        get_lease_seconds_fn: Function returning the message lease length.
+        get_max_attempts_fn: Function returning the attempts after which a
+            message is dead-lettered.
+        stop_event: When set, the processor finishes the message in flight,
+            flushes unsent outgoing messages and returns without claiming
+            new work.
+        wake_event: When set, the processor checks for work immediately
+            instead of waiting out its one-second poll interval.
+        state: Live daemon state, updated for the control socket. A reset
+            requested through it is applied before the next message.
+        get_retrieval_fn: Function returning whether retrieval is enabled.
+        retriever: The Retriever to use. Created from config on first use
+            if not provided.
+        get_timeout_fn: Function returning the wall-clock limit of a Claude
+            call in seconds (0 for none).
+        get_idle_timeout_fn: Function returning the longest gap between SDK
+            messages in seconds (0 for none).
+        take_cancel_fn: Function acknowledging a /cancel queued after a
+            given message ID; returns its ID, or None.
+        record_error_fn: Function recording why a message failed.
+        send_typing_fn: Sends the typing indicator via Telegram.
+        get_typing_fn: Function returning whether the typing indicator is
+            shown.
+        typing_interval: Seconds between typing indicators.
+        get_parts_fn: Function returning the stored parts of an outgoing
+            message.
+        save_parts_fn: Function storing the parts of an outgoing message.
+        mark_part_sent_fn: Function marking one part as sent.
+        record_send_failure_fn: Function recording a failed send and
+            scheduling the retry; returns True once the message has failed
+            for good.
+        get_max_send_attempts_fn: Function returning the failed sends after
+            which an outgoing message is given up.
+        get_attachments_fn: Function returning the files stored for an
+            incoming message.
+        flush_writes_fn: Awaitable called before looking for unsent
+            outgoing messages, so writes queued without waiting (such as
+            marking a message sent) are visible to the query. Needed when
+            the write functions are a DbWriter's.
     """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
     token = get_token_fn()
     bot = build_bot_fn(token)
     cfg = load_config_fn()
     chat_id = cfg["chat_id"]
-    client = claude or ClaudeClient()
-    turn_count = 0
+    client = claude or ClaudeClient(recorder=capture.recorder_from_config())
+    state = state or control.DaemonState()
+    session_start_id: Optional[int] = None
+    escalation_times: list[float] = []
+    # Chunks of the current reply already stored for sending; once any are,
+    # a failed call is not retried, as that would repeat them
+    chunks_delivered = 0
+
+    async def send_part(text: str, html: Optional[str]):
+        if html is None:
+            return await send_message_fn(bot, chat_id, text)
+        return await send_message_fn(bot, chat_id, text, html=html)
+
+    async def edit_part(message_id: int, text: str, html: Optional[str]) -> None:
+        if html is None:
+            await edit_message_fn(bot, chat_id, message_id, text)
+        else:
+            await edit_message_fn(bot, chat_id, message_id, text, html=html)
+
+    async def send_outgoing(outgoing_id: int, text: str) -> None:
+        # A reply that needs several Telegram messages is split once and
+        # its parts stored, so a retry skips the parts already sent
+        rendered = formatting.render(text)
+        if len(rendered) <= 1:
+            sent_message = await send_part(text, rendered[0]["html"] if rendered else None)
+            await mark_outgoing_sent_fn(outgoing_id, sent_message.message_id, db_path=db_path)
+            return
+        parts = await get_parts_fn(outgoing_id, db_path=db_path)
+        if not parts:
+            parts = await save_parts_fn(outgoing_id, rendered, db_path=db_path)
+        for part in parts:
+            if part["telegram_message_id"] is None:
+                sent_message = await send_part(part["text"], part["html"])
+                part["telegram_message_id"] = sent_message.message_id
+                await mark_part_sent_fn(
+                    part["id"], sent_message.message_id, db_path=db_path
+                )
+        await mark_outgoing_sent_fn(
+            outgoing_id, parts[0]["telegram_message_id"], db_path=db_path
+        )
+
+    async def send_failed(outgoing_id: int, exc: Exception) -> None:
+        logger.warning(
+            "[processor] Failed to send outgoing message %d: %s", outgoing_id, exc
+        )
+        try:
+            failed = await record_send_failure_fn(
+                outgoing_id,
+                f"{type(exc).__name__}: {exc}"[:500],
+                get_max_send_attempts_fn(),
+                db_path=db_path,
+            )
+        except Exception:
+            logger.exception("Failed to record send failure for message %d", outgoing_id)
+            return
+        if failed:
+            state.count("outgoing_failed")
+            logger.error(
+                "[processor] Giving up on outgoing message %d; see `corphish outbox`",
+                outgoing_id,
+            )
+
+    async def deliver_chunk(chunk: str) -> None:
+        nonlocal chunks_delivered
+        logger.info("[assistant] %s", chunk[:50])
+        rendered = formatting.render(chunk)
+        if len(rendered) <= 1:
+            # Sent first and recorded after, so the record need not wait
+            # for a commit of its own; a chunk that fails to send is stored
+            # unsent and retried from the outbox
+            try:
+                sent_message = await send_part(
+                    chunk, rendered[0]["html"] if rendered else None
+                )
+            except Exception as exc:
+                error = exc
+            except asyncio.CancelledError:
+                logger.warning("send_message cancelled (SDK cleanup leak)")
+                error = None
+            else:
+                chunks_delivered += 1
+                try:
+                    await insert_sent_outgoing_fn(
+                        text=chunk,
+                        telegram_message_id=sent_message.message_id,
+                        db_path=db_path,
+                    )
+                except Exception:
+                    logger.exception("Failed to record sent chunk")
+                return
+            try:
+                outgoing_id = await insert_outgoing_fn(text=chunk, db_path=db_path)
+            except Exception:
+                logger.exception("Failed to insert outgoing chunk")
+                return
+            chunks_delivered += 1
+            if error is not None:
+                await send_failed(outgoing_id, error)
+            return
+        try:
+            outgoing_id = await insert_outgoing_fn(text=chunk, db_path=db_path)
+        except Exception:
+            logger.exception("Failed to insert outgoing chunk")
+            return
+        chunks_delivered += 1
+        try:
+            await send_outgoing(outgoing_id, chunk)
+        except Exception as exc:
+            await send_failed(outgoing_id, exc)
+        except asyncio.CancelledError:
+            logger.warning("send_message cancelled (SDK cleanup leak)")
+
+    async def finish_split(text: str, live_id: int) -> None:
+        rendered = formatting.render(text)
+        outgoing_id = await insert_outgoing_fn(text=text, db_path=db_path)
+        parts = await save_parts_fn(outgoing_id, rendered, db_path=db_path)
+        await edit_part(live_id, parts[0]["text"], parts[0]["html"])
+        await mark_part_sent_fn(parts[0]["id"], live_id, db_path=db_path)
+        await send_outgoing(outgoing_id, text)
+
+    async def stream_live(text: str, model: Optional[str]) -> None:
+        # Show the reply as it is generated by sending the first delta and
+        # editing that Telegram message at most once per edit interval.
+        # Each completed AssistantMessage is then stored as one outgoing row.
+        nonlocal chunks_delivered
+        edit_interval = get_edit_interval_fn()
+        live_text = ""
+        shown_text = ""
+        live_id = None
+        last_edit = 0.0
+
+        async for kind, part in client.stream_partial(text, model=model):
+            if kind == "message":
+                if live_id is None:
+                    await deliver_chunk(part)
+                elif len(part) > formatting.MAX_LENGTH:
+                    # Too long to finish in place: the live message becomes
+                    # the first part and the rest are sent after it
+                    try:
+                        await finish_split(part, live_id)
+                    except Exception:
+                        logger.exception("Failed to send split streamed message")
+                else:
+                    # The live message shows plain text; the final edit
+                    # applies the formatting
+                    rendered = formatting.render(part)
+                    html = rendered[0]["html"] if rendered else None
+                    if part != shown_text or html is not None:
+                        try:
+                            await edit_part(live_id, part, html)
+                        except Exception:
+                            logger.exception("Failed to finalise streamed message")
+                    try:
+                        await insert_sent_outgoing_fn(
+                            text=part, telegram_message_id=live_id, db_path=db_path
+                        )
+                    except Exception:
+                        logger.exception("Failed to record streamed message")
+                live_text, shown_text, live_id = "", "", None
+                continue
+
+            live_text += "\n" if kind == "break" else part
+            if not live_text.strip() or len(live_text) > formatting.MAX_LENGTH:
+                continue
+            now = time.monotonic()
+            try:
+                if live_id is None:
+                    sent_message = await send_message_fn(bot, chat_id, live_text)
+                    live_id = sent_message.message_id
+                    chunks_delivered += 1
+                elif now - last_edit >= edit_interval and live_text != shown_text:
+                    await edit_message_fn(bot, chat_id, live_id, live_text)
+                else:
+                    continue
+            except Exception:
+                logger.exception("Failed to update streamed message")
+                continue
+            shown_text = live_text
+            last_edit = now
+
+    async def hold_lease(message_id: int, lease_seconds: int) -> None:
+        # Renew the lease well before it expires for as long as Claude is
+        # working on the message, so slow replies are not reclaimed
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            try:
+                held = await extend_lease_fn(
+                    message_id, worker_id, lease_seconds, db_path=db_path
+                )
+            except Exception:
+                logger.exception("Failed to extend lease on message %d", message_id)
+                continue
+            if not held:
+                logger.warning(
+                    "[processor] Lost lease on message %d", message_id
+                )
+                return
+
+    async def keep_typing() -> None:
+        # Telegram drops the indicator after a few seconds, so repeat it
+        # until cancelled. Failures (e.g. flood control) back off
+        # exponentially so the indicator never competes with real sends.
+        failures = 0
+        while True:
+            try:
+                await send_typing_fn(bot, chat_id)
+                failures = 0
+            except Exception:
+                failures += 1
+                logger.debug("Failed to send typing indicator", exc_info=True)
+            await asyncio.sleep(min(typing_interval * 2**failures, _BACKOFF_MAX))
+
+    async def stream_reply(text: str, model: Optional[str] = None) -> None:
+        if get_partial_streaming_fn():
+            await stream_live(text, model)
+            return
+        stream = client.stream(text) if model is None else client.stream(text, model=model)
+        async for chunk in stream:
+            await deliver_chunk(chunk)
 
     logger.info("Message processor started")
 
     while True:
-        # Process incoming messages
-        message = await get_next_unprocessed_fn(db_path=db_path)
+        stopping = stop_event is not None and stop_event.is_set()
+        # Seconds to wait before the next claim while Claude is unavailable
+        unavailable_wait = None
+
+        # Claim the next incoming message
+        lease_seconds = get_lease_seconds_fn()
+        message = None
+        if not stopping:
+            message = await claim_next_fn(
+                worker_id,
+                lease_seconds,
+                get_max_attempts_fn(),
+                db_path=db_path,
+            )
+
+        if state.reset_requested:
+            async with client.lock:
+                client.reset()
+            state.turn_count = 0
+            state.reset_requested = False
+            logger.info("[processor] Applied reset requested via control socket")
 
         if message:
             user_text = message["text"]
@@ -183,8 +1012,11 @@ async def run_message_processor(
             if user_text.strip().startswith("/reset"):
                 async with client.lock:
                     client.reset()
+                # The next message starts a session, so retrieval covers
+                # everything before it again
+                state.turn_count = 0
                 logger.info("[system] Reset conversation")
-                await mark_processed_fn(message["id"], db_path=db_path)
+                await mark_processed_fn(message["id"], worker_id, db_path=db_path)
                 await insert_outgoing_fn(
                     text=(
                         "Context and conversation history have been reset. "
@@ -192,77 +1024,239 @@ async def run_message_processor(
                     ),
                     db_path=db_path,
                 )
+            elif user_text.strip().lower() == "/cancel":
+                # A /cancel that arrives during a reply is taken by the
+                # watchdog; one that gets here had nothing to cancel
+                await mark_processed_fn(message["id"], worker_id, db_path=db_path)
+                await insert_outgoing_fn(text="Nothing to cancel.", db_path=db_path)
+            elif user_text.strip().startswith("/remind"):
+                spec = user_text.strip()[len("/remind"):]
+                try:
+                    cancel_id = reminders.parse_cancel(spec)
+                except ValueError as exc:
+                    reply = f"Could not cancel reminder: {exc}"
+                else:
+                    if cancel_id is not None:
+                        reply = await _cancel_reminder(
+                            cancel_id,
+                            db_path=db_path,
+                            cancel_reminder_fn=cancel_reminder_fn,
+                            unschedule_reminder_fn=unschedule_reminder_fn,
+                        )
+                    else:
+                        reply = await _create_reminder(
+                            spec,
+                            db_path=db_path,
+                            insert_reminder_fn=insert_reminder_fn,
+                            schedule_reminder_fn=schedule_reminder_fn,
+                        )
+                await mark_processed_fn(message["id"], worker_id, db_path=db_path)
+                await insert_outgoing_fn(text=reply, db_path=db_path)
             else:
+                typing_task = (
+                    asyncio.create_task(keep_typing()) if get_typing_fn() else None
+                )
+                route = None
+                if get_routing_fn():
+                    escalation_times = [
+                        t for t in escalation_times
+                        if time.monotonic() - t < _ESCALATION_WINDOW
+                    ]
+                    model_name, reason = router.route_message(
+                        user_text, recent_escalations=len(escalation_times)
+                    )
+                    route = (_get_model_for_name(model_name), reason)
+                    logger.info(
+                        "[processor] Routed to %s (%s)", model_name, reason
+                    )
+                if state.turn_count == 0:
+                    session_start_id = message["id"]
+                prompt = user_text
+                if get_retrieval_fn():
+                    if retriever is None:
+                        retriever = retrieval.Retriever(
+                            db_path=db_path,
+                            top_k=config.get_retrieval_top_k(),
+                            token_budget=config.get_retrieval_token_budget(),
+                        )
+                    started = time.perf_counter()
+                    try:
+                        context = await retriever.context_for(
+                            user_text, before_id=session_start_id
+                        )
+                    except Exception:
+                        logger.exception("Retrieval failed, continuing without it")
+                        context = ""
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    state.observe("retrieval_ms", elapsed_ms)
+                    logger.info(
+                        "[processor] Retrieval added %.1fms (%d chars of context)",
+                        elapsed_ms,
+                        len(context),
+                    )
+                    prompt = retrieval.augment_prompt(user_text, context)
+                if message.get("telegram_message_id"):
+                    try:
+                        attachments = await get_attachments_fn(
+                            message["telegram_message_id"], db_path=db_path
+                        )
+                    except Exception:
+                        logger.exception("Failed to load attachments, continuing without them")
+                        attachments = []
+                    if attachments:
+                        prompt = media.describe_attachments(prompt, attachments)
+
+                lease_task = asyncio.create_task(
+                    hold_lease(message["id"], lease_seconds)
+                )
+                state.current_message_id = message["id"]
+                state.current_model = route[0] if route else client.model
+                message_id = message["id"]
+                chunks_delivered = 0
+
+                async def call_claude() -> bool:
+                    if route is None:
+                        await stream_reply(prompt)
+                        return False
+                    return await _stream_routed(
+                        client,
+                        prompt,
+                        *route,
+                        deliver_fn=deliver_chunk,
+                        stream_reply_fn=stream_reply,
+                        log_usage_fn=log_usage_fn,
+                        db_path=db_path,
+                    )
+
                 try:
                     async with client.lock:
-                        async for chunk in client.stream(user_text):
-                            logger.info("[assistant] %s", chunk[:50])
-                            try:
-                                outgoing_id = await insert_outgoing_fn(
-                                    text=chunk, db_path=db_path
-                                )
-                            except Exception:
-                                logger.exception("Failed to insert outgoing chunk")
-                                continue
-                            try:
-                                sent_message = await send_message_fn(
-                                    bot, chat_id, chunk
-                                )
-                                await mark_outgoing_sent_fn(
-                                    outgoing_id,
-                                    sent_message.message_id,
-                                    db_path=db_path,
-                                )
-                            except Exception:
-                                logger.exception(
-                                    "Failed to send chunk via Telegram"
-                                )
-                            except asyncio.CancelledError:
-                                logger.warning(
-                                    "send_message cancelled (SDK cleanup leak)"
-                                )
-                except Exception:
+                        state.lock_holder = "processor"
+                        escalated, stopped = await _watch_call(
+                            call_claude(),
+                            last_activity_fn=lambda: client.last_activity,
+                            timeout=get_timeout_fn(),
+                            idle_timeout=get_idle_timeout_fn(),
+                            take_cancel_fn=lambda: take_cancel_fn(
+                                message_id, db_path=db_path
+                            ),
+                        )
+                    if escalated:
+                        escalation_times.append(time.monotonic())
+                except ApiUnavailableError as exc:
+                    # The API is down, not the message: keep it queued
+                    # without using up an attempt, and wait before the next
+                    # claim instead of burning through the queue
+                    wait = min(
+                        max(exc.retry_after, _UNAVAILABLE_MIN_WAIT), _UNAVAILABLE_MAX_WAIT
+                    )
+                    logger.warning(
+                        "[processor] %s; message %d stays queued, retrying in %.0fs",
+                        exc,
+                        message_id,
+                        wait,
+                    )
+                    state.count("claude_unavailable")
+                    await _record_error_safely(
+                        record_error_fn, message_id, str(exc), db_path=db_path
+                    )
+                    await release_fn(
+                        message_id, worker_id, refund_attempt=True, db_path=db_path
+                    )
+                    unavailable_wait = wait
+                except Exception as exc:
                     logger.exception(
                         "Claude streaming failed for message: %s", user_text
                     )
-                    await mark_processed_fn(message["id"], db_path=db_path)
+                    state.count("messages_failed")
+                    await _record_error_safely(
+                        record_error_fn,
+                        message_id,
+                        f"{type(exc).__name__}: {exc}",
+                        db_path=db_path,
+                    )
+                    if chunks_delivered:
+                        # Part of the reply is already out, so a retry would
+                        # repeat it
+                        await mark_processed_fn(message_id, worker_id, db_path=db_path)
+                        await insert_outgoing_fn(text=_FAILED_NOTICE, db_path=db_path)
+                        continue
+                    # Leave the message queued for another attempt
+                    await release_fn(message_id, worker_id, db_path=db_path)
                     continue
                 except asyncio.CancelledError:
+                    # Chunks may already have been delivered, so retrying
+                    # would duplicate the reply
                     logger.warning(
                         "Claude streaming cancelled for message: %s", user_text
                     )
-                    await mark_processed_fn(message["id"], db_path=db_path)
+                    await mark_processed_fn(message["id"], worker_id, db_path=db_path)
                     continue
-
-                await mark_processed_fn(message["id"], db_path=db_path)
-
-                turn_count += 1
-                if turn_count >= get_max_turns_fn():
-                    async with client.lock:
-                        client.reset()
-                    turn_count = 0
-                    logger.info(
-                        "[processor] Auto-reset conversation after %d turns",
-                        get_max_turns_fn(),
-                    )
-
-        # Send any unsent outgoing messages
+                finally:
+                    lease_task.cancel()
+                    if typing_task is not None:
+                        typing_task.cancel()
+                    state.lock_holder = None
+                    state.current_message_id = None
+                    state.current_model = None
+
+                if unavailable_wait is None:
+                    if stopped is not None:
+                        # Part of the reply may already be out, so the message
+                        # is not retried
+                        cancelled = stopped.startswith("cancelled")
+                        state.count("claude_cancelled" if cancelled else "claude_timeouts")
+                        await _record_error_safely(
+                            record_error_fn, message_id, stopped, db_path=db_path
+                        )
+                        await mark_processed_fn(message_id, worker_id, db_path=db_path)
+                        await insert_outgoing_fn(
+                            text=_stopped_notice(stopped), db_path=db_path
+                        )
+                        continue
+
+                    await mark_processed_fn(message["id"], worker_id, db_path=db_path)
+                    state.count("messages_processed")
+
+                    state.turn_count += 1
+                    if state.turn_count >= get_max_turns_fn():
+                        async with client.lock:
+                            client.reset()
+                        state.turn_count = 0
+                        logger.info(
+                            "[processor] Auto-reset conversation after %d turns",
+                            get_max_turns_fn(),
+                        )
+
+        # Send any unsent outgoing messages. A message marked sent through
+        # the writer may not be committed yet and would be sent twice
+        if flush_writes_fn is not None:
+            await flush_writes_fn()
         outgoing = await get_unsent_outgoing_fn(db_path=db_path)
         for msg in outgoing:
             try:
-                sent_message = await send_message_fn(bot, chat_id, msg["text"])
-                await mark_outgoing_sent_fn(
-                    msg["id"], sent_message.message_id, db_path=db_path
-                )
-            except Exception:
-                logger.exception("Failed to send message via Telegram")
+                await send_outgoing(msg["id"], msg["text"])
+            except Exception as exc:
+                await send_failed(msg["id"], exc)
             except asyncio.CancelledError:
                 logger.warning("send_message cancelled (SDK cleanup leak)")
 
+        if stopping:
+            logger.info("[processor] Drained, stopping")
+            break
+
         if once:
             break
 
-        await asyncio.sleep(1)
+        if unavailable_wait is not None:
+            # The message was kept queued: wait before claiming it again
+            await _sleep_or_stop(unavailable_wait, stop_event)
+            continue
+
+        # More messages may be waiting; only sleep when the queue was empty
+        if message is not None:
+            continue
+
+        await _sleep_or_stop(1, stop_event, wake_event)
 
 
 def _is_trivial_response(response: str) -> bool:
@@ -352,6 +1346,215 @@ def _get_model_for_name(name: str) -> str:
     return mapping.get(name.lower(), MODEL_HAIKU)
 
 
+def _in_quiet_hours(quiet_hours: Optional[tuple[int, int]], now: datetime) -> bool:
+    """Determines if *now* falls inside the configured quiet hours.
+
+    Args:
+        quiet_hours: A (start_hour, end_hour) tuple, or None if disabled.
+            The window may wrap midnight (e.g. (23, 7)).
+        now: The current local time.
+
+    Returns:
+        True if heartbeats should be suppressed at *now*, False otherwise.
+    """
+    if not quiet_hours:
+        return False
+    start, end = quiet_hours
+    if start == end:
+        return False
+    if start < end:
+        return start <= now.hour < end
+    return now.hour >= start or now.hour < end
+
+
+def _is_open_ended(text: Optional[str]) -> bool:
+    """Determines if the last outgoing message left the conversation open.
+
+    Args:
+        text: The most recent outgoing message text.
+
+    Returns:
+        True if the assistant ended on a question, False otherwise.
+    """
+    return bool(text) and text.rstrip().endswith("?")
+
+
+def _apply_jitter(interval: float, jitter: float) -> float:
+    """Randomises an interval by up to +/- *jitter* of its length.
+
+    Args:
+        interval: The interval in seconds.
+        jitter: Fractional jitter (e.g. 0.1 for +/- 10%).
+
+    Returns:
+        The jittered interval in seconds, never negative.
+    """
+    if interval <= 0 or jitter <= 0:
+        return interval
+    return max(0.0, interval * (1 + random.uniform(-jitter, jitter)))
+
+
+def _plan_heartbeat(
+    base_interval: int,
+    activity: dict,
+    idle_streak: int,
+    follow_up: bool = False,
+) -> tuple[str, str, int]:
+    """Decides whether to fire a heartbeat and when to schedule the next one.
+
+    Quiet periods back off exponentially (up to _HEARTBEAT_MAX_FACTOR times
+    the base interval). Activity resets the schedule to the base interval,
+    and an exchange that ended on an open question shortens it so the
+    follow-up is timely. The follow-up beat fires even if the user has not
+    replied since.
+
+    Args:
+        base_interval: The configured heartbeat interval in seconds.
+        activity: Result of db.get_conversation_activity() since the last beat.
+        idle_streak: Number of consecutive idle beats, including this one
+            if there was no activity.
+        follow_up: Whether this is the beat scheduled after an open-ended
+            exchange.
+
+    Returns:
+        A (decision, reason, next_interval) tuple where decision is
+        "fire" or "skip".
+    """
+    if activity["incoming_count"] == 0:
+        if follow_up:
+            return "fire", "follow_up", base_interval
+        next_interval = min(
+            base_interval * 2 ** idle_streak,
+            base_interval * _HEARTBEAT_MAX_FACTOR,
+        )
+        return "skip", "no_activity", int(next_interval)
+    if _is_open_ended(activity["last_outgoing_text"]):
+        return "fire", "open_ended", int(base_interval * _HEARTBEAT_MIN_FACTOR)
+    return "fire", "activity", base_interval
+
+
+async def _sequential_heartbeat(
+    claude: ClaudeClient,
+    prompt: str,
+    model_id: str,
+    *,
+    log_usage_fn: Callable = db.log_model_usage,
+    db_path: Optional[Path] = None,
+) -> tuple[str, bool]:
+    """Runs a heartbeat on *model_id*, escalating to Opus only if needed.
+
+    Args:
+        claude: The ClaudeClient to call.
+        prompt: The heartbeat prompt.
+        model_id: The initial model ID.
+        log_usage_fn: Function to log model usage for cost tracking.
+        db_path: Path to the database file.
+
+    Returns:
+        A (response, escalated) tuple.
+    """
+    async with claude.heartbeat_lane:
+        response = await claude.send_heartbeat(prompt, model_id)
+
+    # Log initial model usage
+    await log_usage_fn(
+        model=model_id,
+        source="heartbeat",
+        escalated=False,
+        db_path=db_path,
+    )
+
+    # Check if response signals need for escalation
+    if not _needs_escalation(response) or model_id == MODEL_OPUS:
+        return response, False
+
+    logger.info("[heartbeat] Response signals uncertainty, escalating to Opus")
+    async with claude.heartbeat_lane:
+        response = await claude.send_heartbeat(prompt, MODEL_OPUS)
+
+    # Log escalated usage
+    await log_usage_fn(
+        model=MODEL_OPUS,
+        source="heartbeat",
+        escalated=True,
+        db_path=db_path,
+    )
+    return response, True
+
+
+async def _speculative_heartbeat(
+    claude: ClaudeClient,
+    prompt: str,
+    model_id: str,
+    *,
+    log_usage_fn: Callable = db.log_model_usage,
+    db_path: Optional[Path] = None,
+) -> tuple[str, bool]:
+    """Runs *model_id* and Opus in parallel, keeping Opus only if needed.
+
+    The Opus call is cancelled as soon as the cheap response is confident.
+    If the cheap call fails, the Opus response is used instead. Both calls
+    are logged; an abandoned Opus call is logged with outcome "cancelled"
+    and is not an escalation.
+
+    Args:
+        claude: The ClaudeClient to call.
+        prompt: The heartbeat prompt.
+        model_id: The cheap model ID.
+        log_usage_fn: Function to log model usage for cost tracking.
+        db_path: Path to the database file.
+
+    Returns:
+        A (response, escalated) tuple.
+    """
+    async with claude.heartbeat_lane:
+        cheap = asyncio.create_task(claude.send_heartbeat(prompt, model_id))
+        expensive = asyncio.create_task(claude.send_heartbeat(prompt, MODEL_OPUS))
+        try:
+            try:
+                cheap_response = await cheap
+            except Exception:
+                logger.exception(
+                    "[heartbeat] Cheap speculative call failed, waiting for Opus"
+                )
+                cheap_response = None
+            else:
+                await log_usage_fn(
+                    model=model_id,
+                    source="heartbeat",
+                    escalated=False,
+                    db_path=db_path,
+                )
+
+            if cheap_response is not None and not _needs_escalation(cheap_response):
+                expensive.cancel()
+                await asyncio.gather(expensive, return_exceptions=True)
+                logger.info("[heartbeat] Cheap response confident, cancelled Opus")
+                await log_usage_fn(
+                    model=MODEL_OPUS,
+                    source="heartbeat",
+                    outcome="cancelled",
+                    db_path=db_path,
+                )
+                return cheap_response, False
+
+            logger.info("[heartbeat] Using speculative Opus response")
+            response = await expensive
+        finally:
+            # Never leave a speculative call running if we exit early
+            for task in (cheap, expensive):
+                if not task.done():
+                    task.cancel()
+
+    await log_usage_fn(
+        model=MODEL_OPUS,
+        source="heartbeat",
+        escalated=True,
+        db_path=db_path,
+    )
+    return response, True
+
+
 async def run_heartbeat_runner(
     *,
     claude: ClaudeClient,
@@ -362,6 +1565,19 @@ async def run_heartbeat_runner(
     load_prompt_fn: Callable = _load_heartbeat_prompt,
     get_model_fn: Callable = config.get_heartbeat_model,
     log_usage_fn: Callable = db.log_model_usage,
+    get_adaptive_fn: Callable = config.get_heartbeat_adaptive,
+    get_quiet_hours_fn: Callable = config.get_heartbeat_quiet_hours,
+    get_jitter_fn: Callable = config.get_heartbeat_jitter,
+    get_activity_fn: Callable = db.get_conversation_activity,
+    log_decision_fn: Callable = db.log_heartbeat_decision,
+    now_fn: Callable = datetime.now,
+    get_speculative_fn: Callable = config.get_heartbeat_speculative,
+    has_waiting_fn: Callable = db.has_waiting_messages,
+    get_timeout_fn: Callable = config.get_claude_timeout,
+    get_idle_timeout_fn: Callable = config.get_claude_idle_timeout,
+    preempt_interval: float = _WATCHDOG_INTERVAL,
+    stop_event: Optional[asyncio.Event] = None,
+    state: Optional[control.DaemonState] = None,
 ) -> None:
     """Runs the heartbeat runner loop with dynamic model switching.
 
@@ -369,8 +1585,24 @@ async def run_heartbeat_runner(
     prompt to Claude. Uses Haiku by default for cost efficiency, escalating
     to Opus if the response signals uncertainty or need for deeper reasoning.
 
+    In adaptive mode the runner consults the messages table before each
+    beat: it skips the Claude call (and lengthens the next interval) when
+    nothing has happened since the last beat, shortens the interval after
+    an exchange that ended on an open question (firing the next beat even
+    without a reply), and stays silent during quiet hours. Every decision
+    is recorded via log_decision_fn. Only adaptive intervals are jittered.
+
+    In speculative mode the Opus escalation is started alongside the cheap
+    call and cancelled as soon as the cheap answer turns out to be
+    confident, trading some Opus cost for lower escalation latency.
+
+    Heartbeats run in their own lane (the client's heartbeat_lane) rather
+    than under the conversation lock, but user messages always come first:
+    a beat is deferred by _HEARTBEAT_DEFER seconds while a message is
+    waiting, and a beat in flight is cancelled as soon as one arrives.
+
     Args:
-        claude: A ClaudeClient instance (shared with processor for lock check).
+        claude: A ClaudeClient instance (shared with the processor).
         once: If True, fire once and return (for testing).
         db_path: Path to the database file.
         insert_outgoing_fn: Function to insert outgoing message.
@@ -378,58 +1610,146 @@ async def run_heartbeat_runner(
         load_prompt_fn: Function to load the heartbeat prompt.
         get_model_fn: Function to get the default heartbeat model name.
         log_usage_fn: Function to log model usage for cost tracking.
+        get_adaptive_fn: Function returning whether adaptive scheduling is on.
+        get_quiet_hours_fn: Function returning the (start, end) quiet hours.
+        get_jitter_fn: Function returning the fractional jitter applied to
+            adaptive intervals.
+        get_activity_fn: Function returning conversation activity since a
+            timestamp.
+        log_decision_fn: Function to record a heartbeat scheduling decision.
+        now_fn: Returns the current local time (injectable for testing).
+        get_speculative_fn: Function returning whether to escalate
+            speculatively.
+        has_waiting_fn: Function returning whether a user message is queued
+            or being processed, possibly by another process.
+        get_timeout_fn: Function returning the wall-clock limit on a beat.
+        get_idle_timeout_fn: Function returning the limit on the gap
+            between SDK messages.
+        preempt_interval: Seconds between checks for a waiting message
+            while a beat is in flight.
+        stop_event: When set, the runner returns instead of firing again. A
+            heartbeat already in flight is allowed to finish.
+        state: Live daemon state. Beats are skipped while it says the
+            heartbeat is paused.
     """
     prompt = load_prompt_fn()
+    state = state or control.DaemonState()
+
+    async def user_waiting() -> bool:
+        if claude.busy:
+            return True
+        try:
+            return await has_waiting_fn(db_path=db_path)
+        except Exception:
+            logger.exception("Failed to check for waiting messages")
+            return False
+
     logger.info("Heartbeat runner started")
 
+    next_interval: Optional[int] = None
+    idle_streak = 0
+    follow_up = False
+    last_beat = datetime.now(timezone.utc).isoformat()
+
     while True:
-        interval = get_interval_fn()
+        base_interval = get_interval_fn()
+        adaptive = get_adaptive_fn()
+        interval = next_interval if next_interval is not None else base_interval
+        if adaptive:
+            # A fixed schedule stays exact; only adaptive beats are jittered
+            interval = _apply_jitter(interval, get_jitter_fn())
         logger.debug("Heartbeat sleeping for %d seconds", interval)
-        await asyncio.sleep(interval)
+        if await _sleep_or_stop(interval, stop_event):
+            logger.info("[heartbeat] Stopping")
+            break
 
-        # Skip if Claude is busy processing a message
-        if claude.busy:
-            logger.info("[heartbeat] Skipping — Claude is busy")
+        if state.heartbeat_paused:
+            logger.info("[heartbeat] Paused, skipping")
+            state.count("heartbeats_paused")
+            if once:
+                break
+            continue
+
+        if not adaptive:
+            # A deferral shortens only the one interval after it
+            next_interval = None
+
+        if adaptive:
+            since = last_beat
+            last_beat = datetime.now(timezone.utc).isoformat()
+
+            if _in_quiet_hours(get_quiet_hours_fn(), now_fn()):
+                decision, reason, next_interval = "skip", "quiet_hours", base_interval
+            else:
+                activity = await get_activity_fn(since, db_path=db_path)
+                idle_streak = idle_streak + 1 if activity["incoming_count"] == 0 else 0
+                decision, reason, next_interval = _plan_heartbeat(
+                    base_interval, activity, idle_streak, follow_up=follow_up
+                )
+
+            if decision == "fire" and await user_waiting():
+                decision, reason = "skip", "busy"
+                next_interval = min(next_interval, _HEARTBEAT_DEFER)
+            follow_up = reason == "open_ended"
+
+            logger.info(
+                "[heartbeat] Decision: %s (%s), next in %ds",
+                decision,
+                reason,
+                next_interval,
+            )
+            try:
+                await log_decision_fn(
+                    decision, reason, next_interval, db_path=db_path
+                )
+            except Exception:
+                logger.exception("Failed to record heartbeat decision")
+
+            if decision == "skip":
+                if once:
+                    break
+                continue
+
+        # Defer while a user message is waiting
+        if await user_waiting():
+            logger.info("[heartbeat] Deferring — a user message is waiting")
+            state.count("heartbeats_skipped")
+            next_interval = min(base_interval, _HEARTBEAT_DEFER)
             if once:
                 break
             continue
 
         logger.info("[heartbeat] Firing heartbeat check-in")
+        state.count("heartbeats_fired")
 
         # Get configured default model (defaults to Haiku)
         model_name = get_model_fn()
         model_id = _get_model_for_name(model_name)
-        escalated = False
 
+        if model_id != MODEL_OPUS and get_speculative_fn():
+            beat = _speculative_heartbeat
+        else:
+            beat = _sequential_heartbeat
+
+        state.heartbeat_model = model_id
         try:
-            async with claude.lock:
-                response = await claude.send_heartbeat(prompt, model_id)
-
-            # Log initial model usage
-            await log_usage_fn(
-                model=model_id,
-                source="heartbeat",
-                escalated=False,
-                db_path=db_path,
+            result, stopped = await _watch_call(
+                beat(claude, prompt, model_id, log_usage_fn=log_usage_fn, db_path=db_path),
+                last_activity_fn=lambda: claude.last_heartbeat_activity,
+                timeout=get_timeout_fn(),
+                idle_timeout=get_idle_timeout_fn(),
+                take_cancel_fn=user_waiting,
+                cancel_reason=_PREEMPTED,
+                interval=preempt_interval,
+                name="heartbeat",
             )
-
-            # Check if response signals need for escalation
-            if _needs_escalation(response) and model_id != MODEL_OPUS:
-                logger.info(
-                    "[heartbeat] Response signals uncertainty, escalating to Opus"
-                )
-                async with claude.lock:
-                    response = await claude.send_heartbeat(prompt, MODEL_OPUS)
-
-                # Log escalated usage
-                await log_usage_fn(
-                    model=MODEL_OPUS,
-                    source="heartbeat",
-                    escalated=True,
-                    db_path=db_path,
-                )
-                escalated = True
-
+        except ApiUnavailableError as exc:
+            # Fails fast while the breaker is open; try again next beat
+            logger.warning("[heartbeat] Skipped: %s", exc)
+            state.count("heartbeats_unavailable")
+            if once:
+                break
+            continue
         except Exception:
             logger.exception("Heartbeat Claude call failed")
             if once:
@@ -440,6 +1760,32 @@ async def run_heartbeat_runner(
             if once:
                 break
             continue
+        finally:
+            state.heartbeat_model = None
+
+        if stopped is not None:
+            if stopped == _PREEMPTED:
+                state.count("heartbeats_preempted")
+                next_interval = min(base_interval, _HEARTBEAT_DEFER)
+                reason = "preempted"
+            else:
+                state.count("heartbeats_timeouts")
+                reason = stopped.partition(":")[0]
+            try:
+                await log_usage_fn(
+                    model=model_id,
+                    source="heartbeat",
+                    outcome="cancelled",
+                    reason=reason,
+                    db_path=db_path,
+                )
+            except Exception:
+                logger.exception("Failed to log model usage")
+            if once:
+                break
+            continue
+
+        response, escalated = result
 
         # Only surface non-trivial responses
         if _is_trivial_response(response):
@@ -457,6 +1803,86 @@ async def run_heartbeat_runner(
             break
 
 
+def _restart_delay(failures: int) -> float:
+    """Returns the exponential backoff before restarting a crashed loop.
+
+    Args:
+        failures: Consecutive failures so far, including the current one.
+
+    Returns:
+        Seconds to wait, doubling per failure up to _RESTART_BACKOFF_MAX.
+    """
+    return min(_RESTART_BACKOFF_BASE * 2 ** (failures - 1), _RESTART_BACKOFF_MAX)
+
+
+async def _supervise(
+    name: str,
+    factory: Callable,
+    *,
+    stop_event: asyncio.Event,
+    restart_counts: dict[str, int],
+    once: bool = False,
+) -> None:
+    """Runs one daemon loop, restarting only that loop if it crashes.
+
+    Args:
+        name: Loop name used for logging and restart_counts.
+        factory: Zero-argument callable returning a fresh loop coroutine.
+        stop_event: No restarts are attempted once this is set.
+        restart_counts: Dict updated with the number of restarts per loop.
+        once: If True, run the loop once and let exceptions propagate.
+    """
+    restart_counts.setdefault(name, 0)
+    failures = 0
+    while True:
+        started = time.monotonic()
+        try:
+            await factory()
+            return
+        except Exception:
+            if once:
+                raise
+            logger.exception("[daemon] %s loop crashed", name)
+
+        if stop_event.is_set():
+            return
+        if time.monotonic() - started >= _RESTART_RESET_AFTER:
+            failures = 0
+        failures += 1
+        delay = _restart_delay(failures)
+        restart_counts[name] += 1
+        logger.info(
+            "[daemon] Restarting %s in %ds (restart #%d)",
+            name,
+            delay,
+            restart_counts[name],
+        )
+        if await _sleep_or_stop(delay, stop_event):
+            return
+
+
+def _install_stop_handlers(stop_event: asyncio.Event) -> list[int]:
+    """Sets *stop_event* on SIGTERM and SIGINT.
+
+    Returns:
+        The signals for which a handler was installed.
+    """
+    loop = asyncio.get_running_loop()
+    installed = []
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Not supported on this platform or outside the main thread
+            continue
+        installed.append(sig)
+    return installed
+
+
+# Loops that can run as separate OS processes via ``corphish run --role``
+ROLES = ("consumer", "processor", "heartbeat")
+
+
 async def run_daemon(
     *,
     get_token_fn: Callable = chat.get_bot_token,
@@ -470,12 +1896,38 @@ async def run_daemon(
     save_offset_fn: Callable = config.save_update_offset,
     db_path: Optional[Path] = None,
     enable_heartbeat: bool = True,
+    enable_reminders: bool = True,
+    role: str = "all",
+    enable_bus: bool = True,
+    enable_control: bool = True,
+    stop_event: Optional[asyncio.Event] = None,
+    restart_counts: Optional[dict[str, int]] = None,
+    drain_timeout: float = _DRAIN_TIMEOUT,
+    enable_writer: bool = True,
 ) -> None:
     """Runs message consumer, processor, and heartbeat runner concurrently.
 
     This is the main entry point that starts the message consumer
     (polls Telegram), message processor (polls DB, processes via Claude),
-    and heartbeat runner (periodic check-ins) loops concurrently.
+    heartbeat runner (periodic check-ins) and reminder scheduler (delivers
+    due reminders without a model call) loops concurrently.
+
+    With a *role* other than "all" only that loop is run, so each can live
+    in its own OS process (see supervisor.run_supervisor). The reminder
+    scheduler runs alongside the processor. A heartbeat process gets its
+    own Claude session and learns that the processor is busy from the
+    message leases in the database.
+
+    Each loop is supervised on its own: if one crashes it alone is
+    restarted with exponential backoff. On SIGTERM (or when *stop_event* is
+    set) the daemon drains: the consumer and reminder scheduler stop at
+    once, while the processor finishes its in-flight reply and flushes
+    unsent outgoing messages and the heartbeat finishes any call in
+    progress, for up to *drain_timeout* seconds.
+
+    The loops' database writes go through one DbWriter, which commits
+    concurrent writes together (group commit) and is flushed after the
+    loops have stopped.
 
     Args:
         get_token_fn: Returns the Telegram bot token.
@@ -489,18 +1941,84 @@ async def run_daemon(
         save_offset_fn: Persists the update offset.
         db_path: Path to the database file.
         enable_heartbeat: If True, run the heartbeat runner (default True).
+        enable_reminders: If True, run the reminder scheduler (default True).
+        role: "all" (default) or one of ROLES.
+        enable_bus: If True, serve the change-notification socket (see
+            bus.BusServer) alongside the processor.
+        enable_control: If True, serve the JSON-RPC control socket (see
+            control.ControlServer) alongside the processor.
+        stop_event: Event that triggers a graceful drain. Defaults to a new
+            event set by SIGTERM/SIGINT.
+        restart_counts: Dict updated with per-loop restart counts.
+        drain_timeout: Seconds to wait for in-flight work when stopping.
+        enable_writer: If True (default), route the loops' writes through
+            a group-committing DbWriter instead of one transaction each.
+
+    Raises:
+        ValueError: If *role* is not recognised.
     """
+    if role != "all" and role not in ROLES:
+        raise ValueError(f"Unknown role {role!r}; expected 'all' or one of {ROLES}")
+
+    def wants(name: str) -> bool:
+        return role in ("all", name)
+
     # Initialize database
     await db.init_db(db_path)
 
-    # Create shared Claude client if not provided
-    client = claude or ClaudeClient()
+    # Create shared Claude client if not provided (the consumer needs none)
+    client = None
+    if wants("processor") or (wants("heartbeat") and enable_heartbeat):
+        client = claude or ClaudeClient(recorder=capture.recorder_from_config())
+
+    logger.info("Daemon started (role: %s)", role)
+
+    scheduler = None
+    if wants("processor") and enable_reminders:
+        scheduler = reminders.ReminderScheduler(db_path=db_path)
+
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        installed_signals = _install_stop_handlers(stop_event)
+    else:
+        installed_signals = []
+    # Writes shared by the loops: the db functions, or the group-committing
+    # writer's drop-in replacements
+    writer = DbWriter(db_path) if enable_writer else None
+    writes = db
+    if writer is not None:
+        await writer.start()
+        writes = writer
+
+    state = control.DaemonState(role)
+    if restart_counts is not None:
+        state.restart_counts = restart_counts
+    restart_counts = state.restart_counts
+
+    # The sockets only ever return when cancelled, so they are left out of
+    # once mode
+    bus_server = None
+    if wants("processor") and enable_bus and not once:
+        bus_server = bus.BusServer(
+            db_path=db_path, insert_incoming_fn=writes.insert_incoming_message
+        )
 
-    logger.info("Daemon started")
+    control_server = None
+    if wants("processor") and enable_control and not once:
+        control_server = control.ControlServer(
+            state,
+            claude=client,
+            heartbeat=wants("heartbeat") and enable_heartbeat,
+            db_path=db_path,
+        )
 
-    # Build list of tasks to run concurrently
-    tasks = [
-        run_message_consumer(
+    # Loops that can simply be cancelled on stop, and loops that drain
+    background: dict[str, Callable] = {}
+    draining: dict[str, Callable] = {}
+
+    if wants("consumer"):
+        background["consumer"] = functools.partial(
+            run_message_consumer,
             get_token_fn=get_token_fn,
             build_bot_fn=build_bot_fn,
             load_config_fn=load_config_fn,
@@ -509,8 +2027,13 @@ async def run_daemon(
             get_offset_fn=get_offset_fn,
             save_offset_fn=save_offset_fn,
             db_path=db_path,
-        ),
-        run_message_processor(
+            insert_incoming_fn=writes.insert_incoming_message,
+            insert_attachment_fn=writes.insert_attachment,
+        )
+
+    if wants("processor"):
+        draining["processor"] = functools.partial(
+            run_message_processor,
             get_token_fn=get_token_fn,
             build_bot_fn=build_bot_fn,
             load_config_fn=load_config_fn,
@@ -518,16 +2041,87 @@ async def run_daemon(
             claude=client,
             once=once,
             db_path=db_path,
-        ),
-    ]
+            schedule_reminder_fn=scheduler.add if scheduler else None,
+            unschedule_reminder_fn=scheduler.discard if scheduler else None,
+            mark_processed_fn=writes.mark_message_processed,
+            insert_outgoing_fn=writes.insert_outgoing_message,
+            insert_sent_outgoing_fn=writes.insert_sent_outgoing_message,
+            mark_outgoing_sent_fn=writes.mark_outgoing_message_sent,
+            log_usage_fn=writes.log_model_usage,
+            flush_writes_fn=writer.flush if writer else None,
+            stop_event=stop_event,
+            wake_event=bus_server.wake if bus_server else None,
+            state=state,
+        )
 
-    if enable_heartbeat:
-        tasks.append(
-            run_heartbeat_runner(
-                claude=client,
-                once=once,
-                db_path=db_path,
-            )
+    if scheduler is not None:
+        background["reminders"] = functools.partial(scheduler.run, once=once)
+
+    if bus_server is not None:
+        background["bus"] = bus_server.run
+
+    if control_server is not None:
+        background["control"] = control_server.run
+
+    if wants("heartbeat") and enable_heartbeat:
+        draining["heartbeat"] = functools.partial(
+            run_heartbeat_runner,
+            claude=client,
+            once=once,
+            db_path=db_path,
+            insert_outgoing_fn=writes.insert_outgoing_message,
+            log_usage_fn=writes.log_model_usage,
+            log_decision_fn=writes.log_heartbeat_decision,
+            stop_event=stop_event,
+            state=state,
         )
 
-    await asyncio.gather(*tasks)
+    def start(loops: dict[str, Callable]) -> list[asyncio.Task]:
+        return [
+            asyncio.create_task(
+                _supervise(
+                    name,
+                    factory,
+                    stop_event=stop_event,
+                    restart_counts=restart_counts,
+                    once=once,
+                )
+            )
+            for name, factory in loops.items()
+        ]
+
+    background_tasks = start(background)
+    draining_tasks = start(draining)
+    all_tasks = background_tasks + draining_tasks
+    stop_waiter = asyncio.create_task(stop_event.wait())
+
+    everything = asyncio.gather(*all_tasks)
+    # The loops are cancelled on stop; mark that outcome as retrieved
+    everything.add_done_callback(lambda f: f.cancelled() or f.exception())
+    try:
+        await asyncio.wait(
+            [everything, stop_waiter], return_when=asyncio.FIRST_COMPLETED
+        )
+        if everything.done():
+            # Loops only return on their own in once mode; surface errors
+            everything.result()
+            return
+
+        logger.info("Daemon stopping, draining in-flight work")
+        for task in background_tasks:
+            task.cancel()
+        if draining_tasks:
+            _, pending = await asyncio.wait(draining_tasks, timeout=drain_timeout)
+            if pending:
+                logger.warning("Drain timed out, cancelling %d loop(s)", len(pending))
+        logger.info("Daemon stopped")
+    finally:
+        stop_waiter.cancel()
+        for task in all_tasks:
+            task.cancel()
+        await asyncio.gather(*all_tasks, return_exceptions=True)
+        if writer is not None:
+            await writer.close()
+        loop = asyncio.get_running_loop()
+        for sig in installed_signals:
+            loop.remove_signal_handler(sig)
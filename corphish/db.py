@@ -7,9 +7,9 @@ for message persistence and retrieval.
 
 import asyncio
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 import aiosqlite
 
@@ -18,7 +18,20 @@ from . import config
 logger = logging.getLogger(__name__)
 
 # Schema version for migrations
-SCHEMA_VERSION = 2
+SCHEMA_VERSION = 16
+
+# Backoff before resending an outgoing message after a failed send, in
+# seconds: doubles from _SEND_RETRY_BASE after each failure up to
+# _SEND_RETRY_MAX
+_SEND_RETRY_BASE = 2
+_SEND_RETRY_MAX = 300
+
+# model_usage rollup tables per granularity, with the strftime format that
+# truncates a timestamp to the start of its (UTC) bucket
+_USAGE_ROLLUPS = {
+    "hour": ("model_usage_hourly", "%Y-%m-%dT%H:00:00+00:00"),
+    "day": ("model_usage_daily", "%Y-%m-%dT00:00:00+00:00"),
+}
 
 
 def get_db_path() -> Path:
@@ -42,6 +55,10 @@ async def init_db(db_path: Optional[Path] = None) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
 
     async with aiosqlite.connect(path) as db:
+        # WAL lets the consumer, processor and heartbeat processes read while
+        # another one writes; the setting is persistent for the file
+        await db.execute("PRAGMA journal_mode=WAL")
+
         # Create schema_version table
         await db.execute(
             """
@@ -94,317 +111,1993 @@ async def init_db(db_path: Optional[Path] = None) -> None:
             await db.commit()
             logger.info("Database schema version 1 applied")
 
-        if current_version < 2:
-            logger.info("Applying database schema version 2 (model usage tracking)")
+        if current_version < 2:
+            logger.info("Applying database schema version 2 (model usage tracking)")
+
+            # Create model_usage table for cost tracking
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS model_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    model TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    escalated BOOLEAN NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL
+                )
+                """
+            )
+
+            # Create index for querying usage by model and source
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_model_usage_model ON model_usage(model, created_at)"
+            )
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_model_usage_source ON model_usage(source, created_at)"
+            )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (2, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 2 applied")
+
+        if current_version < 3:
+            logger.info("Applying database schema version 3 (heartbeat decisions)")
+
+            # Record every heartbeat scheduling decision so skipped calls
+            # can be measured against fired ones
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS heartbeat_decisions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    decision TEXT NOT NULL CHECK(decision IN ('fire', 'skip')),
+                    reason TEXT NOT NULL,
+                    next_interval INTEGER NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+                """
+            )
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_heartbeat_decisions_created "
+                "ON heartbeat_decisions(created_at)"
+            )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (3, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 3 applied")
+
+        if current_version < 4:
+            logger.info("Applying database schema version 4 (reminders)")
+
+            # Create reminders table for scheduled, model-free deliveries
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS reminders (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    text TEXT NOT NULL,
+                    due_at TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    delivered_at TEXT,
+                    cancelled_at TEXT
+                )
+                """
+            )
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_reminders_pending "
+                "ON reminders(delivered_at, cancelled_at, due_at)"
+            )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (4, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 4 applied")
+
+        if current_version < 5:
+            logger.info("Applying database schema version 5 (model usage outcome)")
+
+            # Distinguish completed calls from speculative calls cancelled
+            # before they finished
+            await db.execute(
+                "ALTER TABLE model_usage "
+                "ADD COLUMN outcome TEXT NOT NULL DEFAULT 'completed'"
+            )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (5, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 5 applied")
+
+        if current_version < 6:
+            logger.info("Applying database schema version 6 (routing reasons)")
+
+            # Record why the router picked a model so the policy can be tuned
+            await db.execute("ALTER TABLE model_usage ADD COLUMN reason TEXT")
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (6, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 6 applied")
+
+        if current_version < 7:
+            logger.info("Applying database schema version 7 (message leases)")
+
+            # Lease-based claim/ack for incoming messages: a claimed row is
+            # invisible to other workers until its lease expires, attempts
+            # are counted, and rows that keep failing are dead-lettered
+            await db.execute("ALTER TABLE messages ADD COLUMN claimed_by TEXT")
+            await db.execute("ALTER TABLE messages ADD COLUMN lease_expires_at TEXT")
+            await db.execute(
+                "ALTER TABLE messages ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0"
+            )
+            await db.execute("ALTER TABLE messages ADD COLUMN dead_lettered_at TEXT")
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (7, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 7 applied")
+
+        if current_version < 8:
+            logger.info("Applying database schema version 8 (dead-letter index)")
+
+            # Lets the control socket count dead letters without a scan
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_dead_lettered "
+                "ON messages(dead_lettered_at) WHERE dead_lettered_at IS NOT NULL"
+            )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (8, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 8 applied")
+
+        if current_version < 9:
+            logger.info("Applying database schema version 9 (full-text search)")
+
+            # External-content FTS5 index over message text, kept in sync by
+            # triggers. Updates only touch the index when the text changes,
+            # so the frequent processed/sent flag updates stay cheap.
+            await db.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    text,
+                    content='messages',
+                    content_rowid='id',
+                    tokenize='porter unicode61'
+                )
+                """
+            )
+            await db.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS messages_fts_insert
+                AFTER INSERT ON messages BEGIN
+                    INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+                END
+                """
+            )
+            await db.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS messages_fts_delete
+                AFTER DELETE ON messages BEGIN
+                    INSERT INTO messages_fts(messages_fts, rowid, text)
+                    VALUES ('delete', old.id, old.text);
+                END
+                """
+            )
+            await db.execute(
+                """
+                CREATE TRIGGER IF NOT EXISTS messages_fts_update
+                AFTER UPDATE OF text ON messages BEGIN
+                    INSERT INTO messages_fts(messages_fts, rowid, text)
+                    VALUES ('delete', old.id, old.text);
+                    INSERT INTO messages_fts(rowid, text) VALUES (new.id, new.text);
+                END
+                """
+            )
+
+            # Backfill the index from existing history
+            await db.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (9, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 9 applied")
+
+        if current_version < 10:
+            logger.info("Applying database schema version 10 (model usage rollups)")
+
+            # Hourly and daily counts per model and source, maintained by a
+            # trigger on every model_usage insert so reports read a few
+            # rows per bucket instead of scanning the raw log
+            for table, bucket_format in _USAGE_ROLLUPS.values():
+                await db.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        bucket TEXT NOT NULL,
+                        model TEXT NOT NULL,
+                        source TEXT NOT NULL,
+                        count INTEGER NOT NULL DEFAULT 0,
+                        escalated_count INTEGER NOT NULL DEFAULT 0,
+                        cancelled_count INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (bucket, model, source)
+                    ) WITHOUT ROWID
+                    """
+                )
+                await db.execute(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS {table}_insert
+                    AFTER INSERT ON model_usage BEGIN
+                        INSERT INTO {table}
+                            (bucket, model, source, count, escalated_count, cancelled_count)
+                        VALUES (
+                            strftime('{bucket_format}', new.created_at),
+                            new.model,
+                            new.source,
+                            1,
+                            new.escalated,
+                            new.outcome = 'cancelled'
+                        )
+                        ON CONFLICT (bucket, model, source) DO UPDATE SET
+                            count = count + 1,
+                            escalated_count = escalated_count + excluded.escalated_count,
+                            cancelled_count = cancelled_count + excluded.cancelled_count;
+                    END
+                    """
+                )
+
+                # Backfill from existing usage
+                await db.execute(
+                    f"""
+                    INSERT OR REPLACE INTO {table}
+                        (bucket, model, source, count, escalated_count, cancelled_count)
+                    SELECT strftime('{bucket_format}', created_at), model, source,
+                           COUNT(*), SUM(escalated), SUM(outcome = 'cancelled')
+                    FROM model_usage
+                    GROUP BY 1, 2, 3
+                    """
+                )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (10, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 10 applied")
+
+        if current_version < 11:
+            logger.info("Applying database schema version 11 (message errors)")
+
+            # Why the last attempt at a message failed, timed out or was
+            # cancelled
+            await db.execute("ALTER TABLE messages ADD COLUMN last_error TEXT")
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (11, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 11 applied")
+
+        if current_version < 12:
+            logger.info("Applying database schema version 12 (outgoing parts)")
+
+            # The Telegram messages carrying an outgoing reply that is too
+            # long for one, rendered once and sent in order, so a retry
+            # resumes after the last part that went out
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outgoing_parts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    message_id INTEGER NOT NULL REFERENCES messages(id),
+                    part_index INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    html TEXT,
+                    telegram_message_id INTEGER,
+                    sent_at TEXT,
+                    UNIQUE (message_id, part_index)
+                )
+                """
+            )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (12, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 12 applied")
+
+        if current_version < 13:
+            logger.info("Applying database schema version 13 (outgoing send retries)")
+
+            # Failed sends of an outgoing message are counted and retried
+            # with backoff; one that keeps failing is marked failed and
+            # left in the outbox for `corphish outbox`
+            await db.execute(
+                "ALTER TABLE messages ADD COLUMN send_attempts INTEGER NOT NULL DEFAULT 0"
+            )
+            await db.execute("ALTER TABLE messages ADD COLUMN next_attempt_at TEXT")
+            await db.execute("ALTER TABLE messages ADD COLUMN failed_at TEXT")
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_failed "
+                "ON messages(failed_at) WHERE failed_at IS NOT NULL"
+            )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (13, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 13 applied")
+
+        if current_version < 14:
+            logger.info("Applying database schema version 14 (attachments)")
+
+            # Files sent with incoming messages, stored in the media
+            # directory by content hash. Rows are keyed by the Telegram
+            # message ID and written before the message itself, so a
+            # message is never processed without its files
+            await db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS attachments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    telegram_message_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mime_type TEXT,
+                    file_name TEXT,
+                    created_at TEXT NOT NULL
+                )
+                """
+            )
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_attachments_message "
+                "ON attachments(telegram_message_id)"
+            )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (14, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 14 applied")
+
+        if current_version < 15:
+            logger.info("Applying database schema version 15 (usage without cancelled calls)")
+
+            # Cancelled calls (abandoned speculative Opus calls, preempted
+            # or timed-out heartbeats) are counted only in cancelled_count,
+            # not as calls or escalations; the rollups are rebuilt so
+            # history is counted the same way
+            for table, bucket_format in _USAGE_ROLLUPS.values():
+                await db.execute(f"DROP TRIGGER IF EXISTS {table}_insert")
+                await db.execute(
+                    f"""
+                    CREATE TRIGGER {table}_insert
+                    AFTER INSERT ON model_usage BEGIN
+                        INSERT INTO {table}
+                            (bucket, model, source, count, escalated_count, cancelled_count)
+                        VALUES (
+                            strftime('{bucket_format}', new.created_at),
+                            new.model,
+                            new.source,
+                            new.outcome != 'cancelled',
+                            new.escalated AND new.outcome != 'cancelled',
+                            new.outcome = 'cancelled'
+                        )
+                        ON CONFLICT (bucket, model, source) DO UPDATE SET
+                            count = count + excluded.count,
+                            escalated_count = escalated_count + excluded.escalated_count,
+                            cancelled_count = cancelled_count + excluded.cancelled_count;
+                    END
+                    """
+                )
+                await db.execute(f"DELETE FROM {table}")
+                await db.execute(
+                    f"""
+                    INSERT INTO {table}
+                        (bucket, model, source, count, escalated_count, cancelled_count)
+                    SELECT strftime('{bucket_format}', created_at), model, source,
+                           SUM(outcome != 'cancelled'),
+                           SUM(escalated AND outcome != 'cancelled'),
+                           SUM(outcome = 'cancelled')
+                    FROM model_usage
+                    GROUP BY 1, 2, 3
+                    """
+                )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (15, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 15 applied")
+
+        if current_version < 16:
+            logger.info("Applying database schema version 16 (unique Telegram updates)")
+
+            # The consumer saves its update offset only after a batch is
+            # stored, so a batch interrupted by a restart is polled again;
+            # an update and its files are stored once however often they
+            # arrive. Earlier duplicates keep their row but lose the update
+            # ID, and duplicate attachment rows are dropped (the files are
+            # stored by content, so nothing on disk goes away).
+            await db.execute(
+                """
+                UPDATE messages SET telegram_update_id = NULL
+                WHERE direction = 'incoming' AND telegram_update_id > 0
+                  AND id NOT IN (
+                      SELECT MIN(id) FROM messages
+                      WHERE direction = 'incoming' AND telegram_update_id > 0
+                      GROUP BY telegram_update_id
+                  )
+                """
+            )
+            await db.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_update "
+                "ON messages(telegram_update_id) "
+                "WHERE direction = 'incoming' AND telegram_update_id > 0"
+            )
+            await db.execute(
+                """
+                DELETE FROM attachments
+                WHERE id NOT IN (
+                    SELECT MIN(id) FROM attachments GROUP BY telegram_message_id, sha256
+                )
+                """
+            )
+            await db.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_attachments_file "
+                "ON attachments(telegram_message_id, sha256)"
+            )
+
+            # Record schema version
+            await db.execute(
+                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
+                (16, datetime.now(timezone.utc).isoformat()),
+            )
+
+            await db.commit()
+            logger.info("Database schema version 16 applied")
+
+
+def insert_incoming_statement(
+    text: str,
+    telegram_update_id: int,
+    telegram_message_id: int,
+) -> tuple[str, tuple]:
+    """Returns the SQL and parameters that insert an incoming message.
+
+    An update that is already stored is ignored.
+    """
+    return (
+        """
+        INSERT OR IGNORE INTO messages (direction, telegram_update_id, telegram_message_id, text, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (
+            "incoming",
+            telegram_update_id,
+            telegram_message_id,
+            text,
+            datetime.now(timezone.utc).isoformat(),
+        ),
+    )
+
+
+async def insert_incoming_message(
+    text: str,
+    telegram_update_id: int,
+    telegram_message_id: int,
+    db_path: Optional[Path] = None,
+) -> int:
+    """Inserts an incoming message from Telegram into the database.
+
+    Args:
+        text: The message text.
+        telegram_update_id: The Telegram update ID.
+        telegram_message_id: The Telegram message ID.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The database ID of the inserted message, or None if the update
+        was already stored.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(
+            *insert_incoming_statement(text, telegram_update_id, telegram_message_id)
+        )
+        await db.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+
+
+async def get_stored_update_ids(
+    update_ids: list[int],
+    db_path: Optional[Path] = None,
+) -> set[int]:
+    """Returns which of the given Telegram update IDs are already stored.
+
+    Args:
+        update_ids: Telegram update IDs.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The subset of *update_ids* stored as incoming messages.
+    """
+    if not update_ids:
+        return set()
+    path = db_path or get_db_path()
+    placeholders = ", ".join("?" * len(update_ids))
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(
+            f"""
+            SELECT telegram_update_id FROM messages
+            WHERE direction = 'incoming' AND telegram_update_id IN ({placeholders})
+            """,
+            tuple(update_ids),
+        )
+        return {row[0] for row in await cursor.fetchall()}
+
+
+def insert_outgoing_statement(text: str) -> tuple[str, tuple]:
+    """Returns the SQL and parameters that insert an outgoing message."""
+    return (
+        """
+        INSERT INTO messages (direction, text, created_at)
+        VALUES (?, ?, ?)
+        """,
+        ("outgoing", text, datetime.now(timezone.utc).isoformat()),
+    )
+
+
+async def insert_outgoing_message(
+    text: str,
+    db_path: Optional[Path] = None,
+) -> int:
+    """Inserts an outgoing message (to be sent to Telegram) into the database.
+
+    Args:
+        text: The message text.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The database ID of the inserted message.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(*insert_outgoing_statement(text))
+        await db.commit()
+        return cursor.lastrowid
+
+
+def insert_sent_statement(text: str, telegram_message_id: int) -> tuple[str, tuple]:
+    """Returns the SQL and parameters that record an already sent outgoing message."""
+    now = datetime.now(timezone.utc).isoformat()
+    return (
+        """
+        INSERT INTO messages
+            (direction, text, telegram_message_id, processed, created_at, processed_at)
+        VALUES (?, ?, ?, 1, ?, ?)
+        """,
+        ("outgoing", text, telegram_message_id, now, now),
+    )
+
+
+async def insert_sent_outgoing_message(
+    text: str,
+    telegram_message_id: int,
+    db_path: Optional[Path] = None,
+) -> int:
+    """Records an outgoing message that has already been sent.
+
+    Args:
+        text: The message text.
+        telegram_message_id: The Telegram message ID it was sent as.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The database ID of the inserted message.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(*insert_sent_statement(text, telegram_message_id))
+        await db.commit()
+        return cursor.lastrowid
+
+
+def insert_attachment_statement(
+    telegram_message_id: int,
+    kind: str,
+    sha256: str,
+    path: str,
+    size: int,
+    mime_type: Optional[str] = None,
+    file_name: Optional[str] = None,
+) -> tuple[str, tuple]:
+    """Returns the SQL and parameters that record a message's stored file.
+
+    A file already recorded for the message is ignored.
+    """
+    return (
+        """
+        INSERT OR IGNORE INTO attachments
+            (telegram_message_id, kind, sha256, path, size, mime_type, file_name, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            telegram_message_id,
+            kind,
+            sha256,
+            path,
+            size,
+            mime_type,
+            file_name,
+            datetime.now(timezone.utc).isoformat(),
+        ),
+    )
+
+
+async def insert_attachment(
+    telegram_message_id: int,
+    kind: str,
+    sha256: str,
+    path: str,
+    size: int,
+    mime_type: Optional[str] = None,
+    file_name: Optional[str] = None,
+    db_path: Optional[Path] = None,
+) -> int:
+    """Records a file sent with an incoming message.
+
+    Args:
+        telegram_message_id: The Telegram message ID the file came with.
+        kind: The kind of file (photo, document, voice, ...).
+        sha256: Hex SHA-256 of the file's content.
+        path: Where the file is stored.
+        size: Size of the file in bytes.
+        mime_type: The MIME type Telegram reported, if any.
+        file_name: The original file name, if any.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The database ID of the attachment, or None if the file was already
+        recorded for the message.
+    """
+    db_file = db_path or get_db_path()
+    async with aiosqlite.connect(db_file) as db:
+        cursor = await db.execute(
+            *insert_attachment_statement(
+                telegram_message_id, kind, sha256, path, size, mime_type, file_name
+            )
+        )
+        await db.commit()
+        return cursor.lastrowid if cursor.rowcount else None
+
+
+async def get_attachments(
+    telegram_message_id: int,
+    db_path: Optional[Path] = None,
+) -> list[dict]:
+    """Returns the files sent with an incoming message, in order.
+
+    Args:
+        telegram_message_id: The Telegram message ID.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A list of dicts with keys: id, kind, sha256, path, size,
+        mime_type, file_name.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            SELECT id, kind, sha256, path, size, mime_type, file_name
+            FROM attachments
+            WHERE telegram_message_id = ?
+            ORDER BY id ASC
+            """,
+            (telegram_message_id,),
+        )
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+
+async def get_next_unprocessed_message(
+    db_path: Optional[Path] = None,
+) -> Optional[dict]:
+    """Retrieves the next unprocessed incoming message.
+
+    Returns the oldest unprocessed message by created_at.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A dict with keys: id, text, telegram_update_id, telegram_message_id, created_at
+        Returns None if no unprocessed messages exist.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            SELECT id, text, telegram_update_id, telegram_message_id, created_at
+            FROM messages
+            WHERE direction = 'incoming' AND processed = 0
+            ORDER BY created_at ASC
+            LIMIT 1
+            """
+        )
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+
+
+async def claim_next_message(
+    worker_id: str,
+    lease_seconds: int = 300,
+    max_attempts: int = 3,
+    db_path: Optional[Path] = None,
+) -> Optional[dict]:
+    """Atomically claims the oldest available incoming message.
+
+    A message is available if it is unprocessed and either unclaimed or its
+    lease has expired (e.g. because the worker holding it crashed). The
+    claim and the attempt counter increment happen in a single
+    ``UPDATE ... RETURNING`` statement, so concurrent workers never receive
+    the same row. Before claiming, messages that have used up
+    *max_attempts* are moved to the dead-letter state.
+
+    Args:
+        worker_id: Identifier of the claiming worker.
+        lease_seconds: How long the claim is valid unless extended.
+        max_attempts: Claims after which a message is dead-lettered.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A dict with keys: id, text, telegram_update_id, telegram_message_id,
+        created_at, attempts. Returns None if no message is available.
+    """
+    path = db_path or get_db_path()
+    now = datetime.now(timezone.utc)
+    now_iso = now.isoformat()
+    expires = (now + timedelta(seconds=lease_seconds)).isoformat()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            UPDATE messages
+            SET processed = 1, processed_at = ?, dead_lettered_at = ?,
+                claimed_by = NULL, lease_expires_at = NULL
+            WHERE direction = 'incoming' AND processed = 0 AND attempts >= ?
+              AND (lease_expires_at IS NULL OR lease_expires_at <= ?)
+            """,
+            (now_iso, now_iso, max_attempts, now_iso),
+        )
+        if cursor.rowcount:
+            logger.warning("Dead-lettered %d message(s)", cursor.rowcount)
+
+        cursor = await db.execute(
+            """
+            UPDATE messages
+            SET claimed_by = ?, lease_expires_at = ?, attempts = attempts + 1
+            WHERE id = (
+                SELECT id
+                FROM messages
+                WHERE direction = 'incoming' AND processed = 0
+                  AND (lease_expires_at IS NULL OR lease_expires_at <= ?)
+                ORDER BY created_at ASC, id ASC
+                LIMIT 1
+            )
+            RETURNING id, text, telegram_update_id, telegram_message_id,
+                      created_at, attempts
+            """,
+            (worker_id, expires, now_iso),
+        )
+        row = await cursor.fetchone()
+        result = dict(row) if row else None
+        await db.commit()
+        return result
+
+
+async def extend_message_lease(
+    message_id: int,
+    worker_id: str,
+    lease_seconds: int = 300,
+    db_path: Optional[Path] = None,
+) -> bool:
+    """Extends the lease on a claimed message.
+
+    Args:
+        message_id: The database ID of the message.
+        worker_id: The worker holding the claim.
+        lease_seconds: New lease duration from now.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        True if the lease was extended, False if *worker_id* no longer
+        holds the message.
+    """
+    path = db_path or get_db_path()
+    expires = (datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)).isoformat()
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(
+            """
+            UPDATE messages
+            SET lease_expires_at = ?
+            WHERE id = ? AND claimed_by = ? AND processed = 0
+            """,
+            (expires, message_id, worker_id),
+        )
+        await db.commit()
+        return cursor.rowcount > 0
+
+
+async def release_message(
+    message_id: int,
+    worker_id: str,
+    refund_attempt: bool = False,
+    db_path: Optional[Path] = None,
+) -> None:
+    """Releases a claimed message so it can be retried immediately.
+
+    The attempt counter is left as is unless *refund_attempt* is set; once
+    it reaches the maximum the next claim dead-letters the message.
+    Nothing happens unless *worker_id* still holds the claim.
+
+    Args:
+        message_id: The database ID of the message.
+        worker_id: The worker holding the claim.
+        refund_attempt: If True, the claim does not count as an attempt,
+            e.g. because Claude was unavailable rather than the message
+            failing.
+        db_path: Path to the database file. Defaults to get_db_path().
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        await db.execute(
+            """
+            UPDATE messages
+            SET claimed_by = NULL, lease_expires_at = NULL,
+                attempts = MAX(attempts - ?, 0)
+            WHERE id = ? AND claimed_by = ? AND processed = 0
+            """,
+            (int(refund_attempt), message_id, worker_id),
+        )
+        await db.commit()
+
+
+async def record_message_error(
+    message_id: int,
+    error: str,
+    db_path: Optional[Path] = None,
+) -> None:
+    """Records why the latest attempt at a message failed.
+
+    Args:
+        message_id: The database ID of the message.
+        error: Description of the failure, timeout or cancellation.
+        db_path: Path to the database file. Defaults to get_db_path().
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        await db.execute(
+            "UPDATE messages SET last_error = ? WHERE id = ?",
+            (error, message_id),
+        )
+        await db.commit()
+
+
+async def take_cancel_request(
+    after_id: int,
+    db_path: Optional[Path] = None,
+) -> Optional[int]:
+    """Acknowledges a pending /cancel sent after a given message.
+
+    Lets the processor notice /cancel while it is still busy with an
+    earlier message, without waiting for its turn in the queue.
+
+    Args:
+        after_id: ID of the message being processed; only later /cancel
+            messages count.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The ID of the /cancel message, now marked processed, or None if
+        there is none.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(
+            """
+            UPDATE messages
+            SET processed = 1, processed_at = ?, lease_expires_at = NULL
+            WHERE id = (
+                SELECT id
+                FROM messages
+                WHERE direction = 'incoming' AND processed = 0 AND id > ?
+                  AND lower(trim(text)) = '/cancel'
+                ORDER BY id ASC
+                LIMIT 1
+            )
+            RETURNING id
+            """,
+            (datetime.now(timezone.utc).isoformat(), after_id),
+        )
+        row = await cursor.fetchone()
+        await db.commit()
+        return row[0] if row else None
+
+
+async def has_waiting_messages(
+    db_path: Optional[Path] = None,
+) -> bool:
+    """Returns whether any incoming message is queued or being processed.
+
+    Lets the heartbeat give way to the user, including when the processor
+    runs in another process.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        True if an incoming message has not been processed yet.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(
+            """
+            SELECT 1
+            FROM messages
+            WHERE processed = 0 AND direction = 'incoming'
+            LIMIT 1
+            """
+        )
+        return await cursor.fetchone() is not None
+
+
+async def get_queue_depths(
+    db_path: Optional[Path] = None,
+) -> dict:
+    """Returns the number of messages in each queue state.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A dict with keys: incoming_pending, incoming_claimed,
+        outgoing_unsent, outgoing_failed, dead_lettered
+    """
+    path = db_path or get_db_path()
+    now = datetime.now(timezone.utc).isoformat()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        # Each query is served by an index, so this stays fast however
+        # long the history grows
+        cursor = await db.execute(
+            """
+            SELECT
+                COALESCE(SUM(direction = 'incoming'
+                    AND (lease_expires_at IS NULL OR lease_expires_at <= ?)), 0)
+                    AS incoming_pending,
+                COALESCE(SUM(direction = 'incoming' AND lease_expires_at > ?), 0)
+                    AS incoming_claimed,
+                COALESCE(SUM(direction = 'outgoing'), 0) AS outgoing_unsent
+            FROM messages
+            WHERE processed = 0
+            """,
+            (now, now),
+        )
+        depths = dict(await cursor.fetchone())
+        cursor = await db.execute(
+            "SELECT COUNT(*) FROM messages WHERE failed_at IS NOT NULL"
+        )
+        depths["outgoing_failed"] = (await cursor.fetchone())[0]
+        cursor = await db.execute(
+            "SELECT COUNT(*) FROM messages WHERE dead_lettered_at IS NOT NULL"
+        )
+        depths["dead_lettered"] = (await cursor.fetchone())[0]
+        return depths
+
+
+async def get_dead_letter_messages(
+    db_path: Optional[Path] = None,
+) -> list[dict]:
+    """Returns incoming messages that were dead-lettered.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A list of dicts with keys: id, text, attempts, created_at,
+        dead_lettered_at, last_error
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            SELECT id, text, attempts, created_at, dead_lettered_at, last_error
+            FROM messages
+            WHERE direction = 'incoming' AND dead_lettered_at IS NOT NULL
+            ORDER BY id ASC
+            """
+        )
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+
+def mark_processed_statement(message_id: int, worker_id: str) -> tuple[str, tuple]:
+    """Returns the SQL and parameters that mark a message processed.
+
+    The statement only matches while *worker_id* holds the claim.
+    """
+    return (
+        """
+        UPDATE messages
+        SET processed = 1, processed_at = ?, lease_expires_at = NULL
+        WHERE id = ? AND claimed_by = ?
+        """,
+        (datetime.now(timezone.utc).isoformat(), message_id, worker_id),
+    )
+
+
+async def mark_message_processed(
+    message_id: int,
+    worker_id: str,
+    db_path: Optional[Path] = None,
+) -> None:
+    """Marks a message as processed, acknowledging the claim on it.
+
+    Nothing happens unless *worker_id* still holds the claim: a worker
+    whose lease expired must not acknowledge a message another worker has
+    since claimed.
+
+    Args:
+        message_id: The database ID of the message.
+        worker_id: The worker holding the claim.
+        db_path: Path to the database file. Defaults to get_db_path().
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        await db.execute(*mark_processed_statement(message_id, worker_id))
+        await db.commit()
+
+
+async def get_unsent_outgoing_messages(
+    db_path: Optional[Path] = None,
+) -> list[dict]:
+    """Retrieves the outgoing messages that are due to be sent.
+
+    Returns messages ordered by created_at. Messages waiting out the
+    backoff after a failed send are left out until it has passed.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A list of dicts with keys: id, text, created_at
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            SELECT id, text, created_at
+            FROM messages
+            WHERE direction = 'outgoing' AND processed = 0
+              AND (next_attempt_at IS NULL OR next_attempt_at <= ?)
+            ORDER BY created_at ASC
+            """,
+            (datetime.now(timezone.utc).isoformat(),),
+        )
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+
+async def record_send_failure(
+    message_id: int,
+    error: str,
+    max_attempts: int = 5,
+    db_path: Optional[Path] = None,
+) -> bool:
+    """Records a failed attempt to send an outgoing message.
+
+    The next attempt is scheduled after an exponential backoff
+    (_SEND_RETRY_BASE seconds, doubling up to _SEND_RETRY_MAX). Once
+    *max_attempts* sends have failed the message is marked failed and no
+    longer retried.
+
+    Args:
+        message_id: The database ID of the outgoing message.
+        error: Why the send failed.
+        max_attempts: Failed sends after which the message is given up.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        True if the message has now failed for good.
+    """
+    path = db_path or get_db_path()
+    now = datetime.now(timezone.utc)
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(
+            "SELECT send_attempts FROM messages WHERE id = ?", (message_id,)
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            return False
+        attempts = row[0] + 1
+        failed = attempts >= max_attempts
+        delay = min(_SEND_RETRY_BASE * 2 ** (attempts - 1), _SEND_RETRY_MAX)
+        await db.execute(
+            """
+            UPDATE messages
+            SET send_attempts = ?, last_error = ?, next_attempt_at = ?,
+                processed = ?, failed_at = ?
+            WHERE id = ?
+            """,
+            (
+                attempts,
+                error,
+                None if failed else (now + timedelta(seconds=delay)).isoformat(),
+                int(failed),
+                now.isoformat() if failed else None,
+                message_id,
+            ),
+        )
+        await db.commit()
+        return failed
+
+
+async def get_outbox(
+    db_path: Optional[Path] = None,
+) -> list[dict]:
+    """Returns outgoing messages that are unsent or failed to send.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A list of dicts with keys: id, text, created_at, send_attempts,
+        next_attempt_at, failed_at, last_error, ordered by id.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            SELECT id, text, created_at, send_attempts, next_attempt_at,
+                   failed_at, last_error
+            FROM messages
+            WHERE direction = 'outgoing'
+              AND (processed = 0 OR failed_at IS NOT NULL)
+            ORDER BY id ASC
+            """
+        )
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+
+async def retry_outgoing_messages(
+    message_ids: list[int],
+    db_path: Optional[Path] = None,
+) -> int:
+    """Queues unsent or failed outgoing messages to be sent again now.
+
+    Args:
+        message_ids: Database IDs of the messages.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The number of messages queued.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.executemany(
+            """
+            UPDATE messages
+            SET processed = 0, processed_at = NULL, failed_at = NULL,
+                send_attempts = 0, next_attempt_at = NULL
+            WHERE id = ? AND direction = 'outgoing'
+              AND (processed = 0 OR failed_at IS NOT NULL)
+            """,
+            [(message_id,) for message_id in message_ids],
+        )
+        await db.commit()
+        return cursor.rowcount
+
+
+async def drop_outgoing_messages(
+    message_ids: list[int],
+    db_path: Optional[Path] = None,
+) -> int:
+    """Deletes unsent or failed outgoing messages so they are never sent.
+
+    Args:
+        message_ids: Database IDs of the messages.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The number of messages deleted.
+    """
+    path = db_path or get_db_path()
+    params = [(message_id,) for message_id in message_ids]
+    async with aiosqlite.connect(path) as db:
+        await db.executemany(
+            """
+            DELETE FROM outgoing_parts
+            WHERE message_id = (
+                SELECT id FROM messages
+                WHERE id = ? AND direction = 'outgoing'
+                  AND (processed = 0 OR failed_at IS NOT NULL)
+            )
+            """,
+            params,
+        )
+        cursor = await db.executemany(
+            """
+            DELETE FROM messages
+            WHERE id = ? AND direction = 'outgoing'
+              AND (processed = 0 OR failed_at IS NOT NULL)
+            """,
+            params,
+        )
+        await db.commit()
+        return cursor.rowcount
+
+
+async def get_latest_outgoing_id(
+    db_path: Optional[Path] = None,
+) -> int:
+    """Returns the ID of the most recent outgoing message, or 0 if none.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The maximum outgoing message ID, or 0 if the table is empty.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        cursor = await db.execute(
+            "SELECT MAX(id) FROM messages WHERE direction = 'outgoing'"
+        )
+        row = await cursor.fetchone()
+        return row[0] if row and row[0] is not None else 0
+
+
+async def get_outgoing_messages_after(
+    after_id: int,
+    db_path: Optional[Path] = None,
+) -> list[dict]:
+    """Returns outgoing messages with id > after_id, ordered by id.
+
+    Args:
+        after_id: Only return messages with id strictly greater than this.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A list of dicts with keys: id, text, created_at
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            SELECT id, text, created_at
+            FROM messages
+            WHERE direction = 'outgoing' AND id > ?
+            ORDER BY id ASC
+            """,
+            (after_id,),
+        )
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+
+async def iter_messages(
+    since_id: int = 0,
+    batch_size: int = 1000,
+    db_path: Optional[Path] = None,
+) -> AsyncIterator[dict]:
+    """Yields every message with id > since_id, ordered by id.
+
+    Rows are read in keyset-paginated batches (``WHERE id > last ORDER BY
+    id LIMIT batch_size``) on the primary key, so memory use is bounded by
+    the batch size however large the history is, and each batch costs the
+    same regardless of how far into the table it starts.
+
+    Args:
+        since_id: Only yield messages with id strictly greater than this.
+        batch_size: Number of rows fetched per query.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Yields:
+        Dicts with keys: id, direction, text, telegram_update_id,
+        telegram_message_id, created_at, processed_at
+    """
+    path = db_path or get_db_path()
+    last_id = since_id
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        while True:
+            cursor = await db.execute(
+                """
+                SELECT id, direction, text, telegram_update_id,
+                       telegram_message_id, created_at, processed_at
+                FROM messages
+                WHERE id > ?
+                ORDER BY id ASC
+                LIMIT ?
+                """,
+                (last_id, batch_size),
+            )
+            rows = await cursor.fetchall()
+            for row in rows:
+                yield dict(row)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1]["id"]
+
+
+def mark_sent_statement(message_id: int, telegram_message_id: int) -> tuple[str, tuple]:
+    """Returns the SQL and parameters that mark an outgoing message sent."""
+    return (
+        """
+        UPDATE messages
+        SET processed = 1, processed_at = ?, telegram_message_id = ?
+        WHERE id = ?
+        """,
+        (datetime.now(timezone.utc).isoformat(), telegram_message_id, message_id),
+    )
+
+
+async def mark_outgoing_message_sent(
+    message_id: int,
+    telegram_message_id: int,
+    db_path: Optional[Path] = None,
+) -> None:
+    """Marks an outgoing message as sent via Telegram.
+
+    Args:
+        message_id: The database ID of the message.
+        telegram_message_id: The Telegram message ID after sending.
+        db_path: Path to the database file. Defaults to get_db_path().
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        await db.execute(*mark_sent_statement(message_id, telegram_message_id))
+        await db.commit()
+
+
+async def get_outgoing_parts(
+    message_id: int,
+    db_path: Optional[Path] = None,
+) -> list[dict]:
+    """Returns the stored parts of an outgoing message, in order.
+
+    Args:
+        message_id: The database ID of the outgoing message.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A list of dicts with keys: id, part_index, text, html,
+        telegram_message_id. Empty if the message was never split.
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            """
+            SELECT id, part_index, text, html, telegram_message_id
+            FROM outgoing_parts
+            WHERE message_id = ?
+            ORDER BY part_index ASC
+            """,
+            (message_id,),
+        )
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+
+async def save_outgoing_parts(
+    message_id: int,
+    parts: list[dict],
+    db_path: Optional[Path] = None,
+) -> list[dict]:
+    """Stores the rendered parts of an outgoing message.
+
+    Parts already stored for the message are kept, so a message is only
+    ever split one way.
+
+    Args:
+        message_id: The database ID of the outgoing message.
+        parts: Dicts with keys text and html, as returned by
+            formatting.render().
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The stored parts (see get_outgoing_parts).
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        await db.executemany(
+            """
+            INSERT OR IGNORE INTO outgoing_parts (message_id, part_index, text, html)
+            VALUES (?, ?, ?, ?)
+            """,
+            [(message_id, index, part["text"], part["html"]) for index, part in enumerate(parts)],
+        )
+        await db.commit()
+    return await get_outgoing_parts(message_id, db_path=path)
+
 
-            # Create model_usage table for cost tracking
-            await db.execute(
-                """
-                CREATE TABLE IF NOT EXISTS model_usage (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    model TEXT NOT NULL,
-                    source TEXT NOT NULL,
-                    escalated BOOLEAN NOT NULL DEFAULT 0,
-                    created_at TEXT NOT NULL
-                )
-                """
-            )
+async def mark_outgoing_part_sent(
+    part_id: int,
+    telegram_message_id: int,
+    db_path: Optional[Path] = None,
+) -> None:
+    """Marks one part of an outgoing message as sent via Telegram.
 
-            # Create index for querying usage by model and source
-            await db.execute(
-                "CREATE INDEX IF NOT EXISTS idx_model_usage_model ON model_usage(model, created_at)"
-            )
-            await db.execute(
-                "CREATE INDEX IF NOT EXISTS idx_model_usage_source ON model_usage(source, created_at)"
-            )
+    Args:
+        part_id: The ID of the part.
+        telegram_message_id: The Telegram message ID after sending.
+        db_path: Path to the database file. Defaults to get_db_path().
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        await db.execute(
+            """
+            UPDATE outgoing_parts
+            SET telegram_message_id = ?, sent_at = ?
+            WHERE id = ?
+            """,
+            (telegram_message_id, datetime.now(timezone.utc).isoformat(), part_id),
+        )
+        await db.commit()
 
-            # Record schema version
-            await db.execute(
-                "INSERT INTO schema_version (version, applied_at) VALUES (?, ?)",
-                (2, datetime.now(timezone.utc).isoformat()),
-            )
 
-            await db.commit()
-            logger.info("Database schema version 2 applied")
+def log_usage_statement(
+    model: str,
+    source: str,
+    escalated: bool = False,
+    outcome: str = "completed",
+    reason: Optional[str] = None,
+) -> tuple[str, tuple]:
+    """Returns the SQL and parameters that log a model usage event."""
+    return (
+        """
+        INSERT INTO model_usage (model, source, escalated, outcome, reason, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        (
+            model,
+            source,
+            1 if escalated else 0,
+            outcome,
+            reason,
+            datetime.now(timezone.utc).isoformat(),
+        ),
+    )
 
 
-async def insert_incoming_message(
-    text: str,
-    telegram_update_id: int,
-    telegram_message_id: int,
+async def log_model_usage(
+    model: str,
+    source: str,
+    escalated: bool = False,
+    outcome: str = "completed",
+    reason: Optional[str] = None,
     db_path: Optional[Path] = None,
 ) -> int:
-    """Inserts an incoming message from Telegram into the database.
+    """Logs a model usage event for cost tracking.
 
     Args:
-        text: The message text.
-        telegram_update_id: The Telegram update ID.
-        telegram_message_id: The Telegram message ID.
+        model: The model ID used (e.g., "claude-haiku-4-5-20251001").
+        source: The component that used the model (e.g., "heartbeat", "processor").
+        escalated: Whether this was an escalation from a cheaper model.
+        outcome: How the call ended: "completed", or "cancelled" for a
+            call abandoned before it finished or whose reply was discarded.
+        reason: Why this model was chosen (e.g. a routing label).
         db_path: Path to the database file. Defaults to get_db_path().
 
     Returns:
-        The database ID of the inserted message.
+        The database ID of the inserted usage record.
     """
     path = db_path or get_db_path()
     async with aiosqlite.connect(path) as db:
         cursor = await db.execute(
-            """
-            INSERT INTO messages (direction, telegram_update_id, telegram_message_id, text, created_at)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            (
-                "incoming",
-                telegram_update_id,
-                telegram_message_id,
-                text,
-                datetime.now(timezone.utc).isoformat(),
-            ),
+            *log_usage_statement(model, source, escalated, outcome, reason)
         )
         await db.commit()
         return cursor.lastrowid
 
 
-async def insert_outgoing_message(
-    text: str,
+async def get_model_usage_summary(
     db_path: Optional[Path] = None,
-) -> int:
-    """Inserts an outgoing message (to be sent to Telegram) into the database.
+) -> list[dict]:
+    """Returns a summary of model usage grouped by model and source.
+
+    Reads the daily rollup, so the cost grows with the number of days of
+    history rather than the number of calls. Cancelled calls are left out
+    of both counts.
 
     Args:
-        text: The message text.
         db_path: Path to the database file. Defaults to get_db_path().
 
     Returns:
-        The database ID of the inserted message.
+        A list of dicts with keys: model, source, count, escalated_count
     """
     path = db_path or get_db_path()
     async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
-            INSERT INTO messages (direction, text, created_at)
-            VALUES (?, ?, ?)
-            """,
-            (
-                "outgoing",
-                text,
-                datetime.now(timezone.utc).isoformat(),
-            ),
+            SELECT model, source, SUM(count) as count,
+                   SUM(escalated_count) as escalated_count
+            FROM model_usage_daily
+            GROUP BY model, source
+            ORDER BY count DESC
+            """
         )
-        await db.commit()
-        return cursor.lastrowid
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
 
 
-async def get_next_unprocessed_message(
+async def get_usage_timeseries(
+    granularity: str = "day",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
     db_path: Optional[Path] = None,
-) -> Optional[dict]:
-    """Retrieves the next unprocessed incoming message.
+) -> list[dict]:
+    """Returns model usage counts per time bucket, model and source.
 
-    Returns the oldest unprocessed message by created_at.
+    Reads the rollup table for the granularity, which is kept up to date
+    by triggers, so only the requested buckets are touched.
 
     Args:
+        granularity: "hour" or "day". Buckets are UTC.
+        since: Optional ISO-8601 UTC timestamp; only buckets starting at or
+            after it are returned.
+        until: Optional ISO-8601 UTC timestamp; only buckets starting
+            before it are returned.
         db_path: Path to the database file. Defaults to get_db_path().
 
     Returns:
-        A dict with keys: id, text, telegram_update_id, telegram_message_id, created_at
-        Returns None if no unprocessed messages exist.
+        A list of dicts with keys: bucket (ISO-8601 start of the bucket),
+        model, source, count, escalated_count, cancelled_count — ordered
+        by bucket, then by count descending. count and escalated_count
+        leave out cancelled calls, which are counted in cancelled_count.
+
+    Raises:
+        ValueError: If granularity is not "hour" or "day".
     """
+    if granularity not in _USAGE_ROLLUPS:
+        raise ValueError(f"Unknown granularity {granularity!r}; use 'hour' or 'day'")
+    table, _ = _USAGE_ROLLUPS[granularity]
+
     path = db_path or get_db_path()
     async with aiosqlite.connect(path) as db:
         db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            f"""
+            SELECT bucket, model, source, count, escalated_count, cancelled_count
+            FROM {table}
+            WHERE bucket >= ? AND (? IS NULL OR bucket < ?)
+            ORDER BY bucket ASC, count DESC
+            """,
+            (since or "", until, until),
+        )
+        rows = await cursor.fetchall()
+        return [dict(row) for row in rows]
+
+
+async def get_conversation_activity(
+    since: str,
+    db_path: Optional[Path] = None,
+) -> dict:
+    """Summarises conversation activity since a point in time.
+
+    Args:
+        since: ISO-8601 timestamp; only messages created after it are counted.
+        db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        A dict with keys: incoming_count (incoming messages since *since*)
+        and last_outgoing_text (text of the most recent outgoing message,
+        or None if there is none).
+    """
+    path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
         cursor = await db.execute(
             """
-            SELECT id, text, telegram_update_id, telegram_message_id, created_at
+            SELECT COUNT(*)
             FROM messages
-            WHERE direction = 'incoming' AND processed = 0
-            ORDER BY created_at ASC
+            WHERE direction = 'incoming' AND created_at > ?
+            """,
+            (since,),
+        )
+        row = await cursor.fetchone()
+        incoming_count = row[0] if row else 0
+
+        cursor = await db.execute(
+            """
+            SELECT text
+            FROM messages
+            WHERE direction = 'outgoing'
+            ORDER BY id DESC
             LIMIT 1
             """
         )
         row = await cursor.fetchone()
-        return dict(row) if row else None
-
-
-async def mark_message_processed(
-    message_id: int,
+        return {
+            "incoming_count": incoming_count,
+            "last_outgoing_text": row[0] if row else None,
+        }
+
+
+def log_decision_statement(
+    decision: str,
+    reason: str,
+    next_interval: int,
+) -> tuple[str, tuple]:
+    """Returns the SQL and parameters that record a heartbeat decision."""
+    return (
+        """
+        INSERT INTO heartbeat_decisions (decision, reason, next_interval, created_at)
+        VALUES (?, ?, ?, ?)
+        """,
+        (decision, reason, next_interval, datetime.now(timezone.utc).isoformat()),
+    )
+
+
+async def log_heartbeat_decision(
+    decision: str,
+    reason: str,
+    next_interval: int,
     db_path: Optional[Path] = None,
-) -> None:
-    """Marks a message as processed.
+) -> int:
+    """Records a heartbeat scheduling decision.
 
     Args:
-        message_id: The database ID of the message.
+        decision: Either "fire" or "skip".
+        reason: Short machine-readable reason (e.g. "no_activity").
+        next_interval: Seconds until the next scheduled heartbeat.
         db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The database ID of the inserted decision record.
     """
     path = db_path or get_db_path()
     async with aiosqlite.connect(path) as db:
-        await db.execute(
-            """
-            UPDATE messages
-            SET processed = 1, processed_at = ?
-            WHERE id = ?
-            """,
-            (datetime.now(timezone.utc).isoformat(), message_id),
+        cursor = await db.execute(
+            *log_decision_statement(decision, reason, next_interval)
         )
         await db.commit()
+        return cursor.lastrowid
 
 
-async def get_unsent_outgoing_messages(
+async def get_heartbeat_decision_summary(
     db_path: Optional[Path] = None,
 ) -> list[dict]:
-    """Retrieves all outgoing messages that haven't been sent yet.
-
-    Returns messages ordered by created_at.
+    """Returns heartbeat decisions grouped by decision and reason.
 
     Args:
         db_path: Path to the database file. Defaults to get_db_path().
 
     Returns:
-        A list of dicts with keys: id, text, created_at
+        A list of dicts with keys: decision, reason, count
     """
     path = db_path or get_db_path()
     async with aiosqlite.connect(path) as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
-            SELECT id, text, created_at
-            FROM messages
-            WHERE direction = 'outgoing' AND processed = 0
-            ORDER BY created_at ASC
+            SELECT decision, reason, COUNT(*) as count
+            FROM heartbeat_decisions
+            GROUP BY decision, reason
+            ORDER BY count DESC
             """
         )
         rows = await cursor.fetchall()
         return [dict(row) for row in rows]
 
 
-async def get_latest_outgoing_id(
+async def insert_reminder(
+    text: str,
+    due_at: str,
     db_path: Optional[Path] = None,
 ) -> int:
-    """Returns the ID of the most recent outgoing message, or 0 if none.
+    """Schedules a reminder for delivery at *due_at*.
 
     Args:
+        text: The reminder text to send.
+        due_at: ISO-8601 UTC timestamp at which the reminder is due.
         db_path: Path to the database file. Defaults to get_db_path().
 
     Returns:
-        The maximum outgoing message ID, or 0 if the table is empty.
+        The database ID of the inserted reminder.
     """
     path = db_path or get_db_path()
     async with aiosqlite.connect(path) as db:
         cursor = await db.execute(
-            "SELECT MAX(id) FROM messages WHERE direction = 'outgoing'"
+            """
+            INSERT INTO reminders (text, due_at, created_at)
+            VALUES (?, ?, ?)
+            """,
+            (text, due_at, datetime.now(timezone.utc).isoformat()),
         )
-        row = await cursor.fetchone()
-        return row[0] if row and row[0] is not None else 0
+        await db.commit()
+        return cursor.lastrowid
 
 
-async def get_outgoing_messages_after(
-    after_id: int,
+async def get_pending_reminders(
     db_path: Optional[Path] = None,
 ) -> list[dict]:
-    """Returns outgoing messages with id > after_id, ordered by id.
+    """Returns reminders that have been neither delivered nor cancelled.
 
     Args:
-        after_id: Only return messages with id strictly greater than this.
         db_path: Path to the database file. Defaults to get_db_path().
 
     Returns:
-        A list of dicts with keys: id, text, created_at
+        A list of dicts with keys: id, text, due_at, ordered by due_at.
     """
     path = db_path or get_db_path()
     async with aiosqlite.connect(path) as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
-            SELECT id, text, created_at
-            FROM messages
-            WHERE direction = 'outgoing' AND id > ?
-            ORDER BY id ASC
-            """,
-            (after_id,),
+            SELECT id, text, due_at
+            FROM reminders
+            WHERE delivered_at IS NULL AND cancelled_at IS NULL
+            ORDER BY due_at ASC
+            """
         )
         rows = await cursor.fetchall()
         return [dict(row) for row in rows]
 
 
-async def mark_outgoing_message_sent(
-    message_id: int,
-    telegram_message_id: int,
+async def deliver_reminder(
+    reminder_id: int,
     db_path: Optional[Path] = None,
-) -> None:
-    """Marks an outgoing message as sent via Telegram.
+) -> Optional[int]:
+    """Atomically turns a pending reminder into an outgoing message.
+
+    The outgoing row is inserted and the reminder marked delivered in the
+    same transaction, so a crash can neither lose nor duplicate it.
 
     Args:
-        message_id: The database ID of the message.
-        telegram_message_id: The Telegram message ID after sending.
+        reminder_id: The database ID of the reminder.
         db_path: Path to the database file. Defaults to get_db_path().
+
+    Returns:
+        The database ID of the outgoing message, or None if the reminder
+        was already delivered, cancelled or does not exist.
     """
     path = db_path or get_db_path()
+    now = datetime.now(timezone.utc).isoformat()
     async with aiosqlite.connect(path) as db:
-        await db.execute(
+        cursor = await db.execute(
             """
-            UPDATE messages
-            SET processed = 1, processed_at = ?, telegram_message_id = ?
-            WHERE id = ?
+            UPDATE reminders
+            SET delivered_at = ?
+            WHERE id = ? AND delivered_at IS NULL AND cancelled_at IS NULL
+            RETURNING text
+            """,
+            (now, reminder_id),
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            await db.rollback()
+            return None
+        cursor = await db.execute(
+            """
+            INSERT INTO messages (direction, text, created_at)
+            VALUES (?, ?, ?)
             """,
-            (datetime.now(timezone.utc).isoformat(), telegram_message_id, message_id),
+            ("outgoing", row[0], now),
         )
         await db.commit()
+        return cursor.lastrowid
 
 
-async def log_model_usage(
-    model: str,
-    source: str,
-    escalated: bool = False,
+async def cancel_reminder(
+    reminder_id: int,
     db_path: Optional[Path] = None,
-) -> int:
-    """Logs a model usage event for cost tracking.
+) -> bool:
+    """Cancels a pending reminder.
 
     Args:
-        model: The model ID used (e.g., "claude-haiku-4-5-20251001").
-        source: The component that used the model (e.g., "heartbeat", "processor").
-        escalated: Whether this was an escalation from a cheaper model.
+        reminder_id: The database ID of the reminder.
         db_path: Path to the database file. Defaults to get_db_path().
 
     Returns:
-        The database ID of the inserted usage record.
+        True if a pending reminder was cancelled, False otherwise.
     """
     path = db_path or get_db_path()
     async with aiosqlite.connect(path) as db:
         cursor = await db.execute(
             """
-            INSERT INTO model_usage (model, source, escalated, created_at)
-            VALUES (?, ?, ?, ?)
+            UPDATE reminders
+            SET cancelled_at = ?
+            WHERE id = ? AND delivered_at IS NULL AND cancelled_at IS NULL
             """,
-            (
-                model,
-                source,
-                1 if escalated else 0,
-                datetime.now(timezone.utc).isoformat(),
-            ),
+            (datetime.now(timezone.utc).isoformat(), reminder_id),
         )
         await db.commit()
-        return cursor.lastrowid
+        return cursor.rowcount > 0
 
 
-async def get_model_usage_summary(
+def _fts_query(query: str, match_any: bool = False) -> str:
+    """Turns free text into an FTS5 query matching all of its words.
+
+    Each word is quoted so punctuation in user input (apostrophes, colons,
+    hyphens) cannot produce an FTS5 syntax error. A trailing ``*`` is kept
+    as a prefix match.
+
+    Args:
+        query: The user's search text.
+        match_any: If True, match any of the words instead of all of them.
+
+    Returns:
+        An FTS5 MATCH expression.
+    """
+    terms = []
+    for word in query.split():
+        prefix = word.endswith("*") and len(word) > 1
+        word = word.rstrip("*") if prefix else word
+        terms.append('"' + word.replace('"', '""') + '"' + ("*" if prefix else ""))
+    return (" OR " if match_any else " ").join(terms)
+
+
+async def get_exchange(
+    message_id: int,
     db_path: Optional[Path] = None,
 ) -> list[dict]:
-    """Returns a summary of model usage grouped by model and source.
+    """Returns the user message and reply that a message belongs to.
+
+    For an incoming message this is the message and the first outgoing
+    message after it; for an outgoing message, the incoming message before
+    it and the message itself.
 
     Args:
+        message_id: The database ID of either side of the exchange.
         db_path: Path to the database file. Defaults to get_db_path().
 
     Returns:
-        A list of dicts with keys: model, source, count, escalated_count
+        A list of up to two dicts with keys: id, direction, text,
+        created_at, in chronological order.
     """
     path = db_path or get_db_path()
+    async with aiosqlite.connect(path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute(
+            "SELECT id, direction, text, created_at FROM messages WHERE id = ?",
+            (message_id,),
+        )
+        row = await cursor.fetchone()
+        if row is None:
+            return []
+        if row["direction"] == "incoming":
+            cursor = await db.execute(
+                """
+                SELECT id, direction, text, created_at
+                FROM messages
+                WHERE direction = 'outgoing' AND id > ?
+                ORDER BY id ASC
+                LIMIT 1
+                """,
+                (message_id,),
+            )
+            other = await cursor.fetchone()
+            rows = [row, other]
+        else:
+            cursor = await db.execute(
+                """
+                SELECT id, direction, text, created_at
+                FROM messages
+                WHERE direction = 'incoming' AND id < ?
+                ORDER BY id DESC
+                LIMIT 1
+                """,
+                (message_id,),
+            )
+            other = await cursor.fetchone()
+            rows = [other, row]
+        return [dict(r) for r in rows if r is not None]
+
+
+async def search_messages(
+    query: str,
+    limit: int = 20,
+    since: Optional[str] = None,
+    db_path: Optional[Path] = None,
+    match_any: bool = False,
+    before_id: Optional[int] = None,
+) -> list[dict]:
+    """Searches conversation history with the full-text index.
+
+    Results are ranked by BM25 (best first) and include a snippet with the
+    matching words wrapped in ``[`` and ``]``.
+
+    Args:
+        query: Words to search for; all must match. A trailing ``*`` makes
+            a word a prefix match.
+        limit: Maximum number of results.
+        since: Optional ISO-8601 timestamp; older messages are excluded.
+        db_path: Path to the database file. Defaults to get_db_path().
+        match_any: If True, match messages containing any of the words.
+        before_id: If given, only messages with a smaller ID are searched.
+
+    Returns:
+        A list of dicts with keys: id, direction, text, created_at,
+        snippet, rank
+    """
+    match = _fts_query(query, match_any=match_any)
+    if not match:
+        return []
+    path = db_path or get_db_path()
     async with aiosqlite.connect(path) as db:
         db.row_factory = aiosqlite.Row
         cursor = await db.execute(
             """
-            SELECT model, source, COUNT(*) as count, SUM(escalated) as escalated_count
-            FROM model_usage
-            GROUP BY model, source
-            ORDER BY count DESC
-            """
+            SELECT m.id, m.direction, m.text, m.created_at,
+                   snippet(messages_fts, 0, '[', ']', '…', 16) AS snippet,
+                   bm25(messages_fts) AS rank
+            FROM messages_fts
+            JOIN messages m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH ?
+              AND (? IS NULL OR m.created_at >= ?)
+              AND (? IS NULL OR messages_fts.rowid < ?)
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (match, since, since, before_id, before_id, limit),
         )
         rows = await cursor.fetchall()
         return [dict(row) for row in rows]
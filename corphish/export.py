@@ -0,0 +1,112 @@
+"""Streaming export of the message history.
+
+``corphish export`` walks the messages table with db.iter_messages, which
+pages through it by primary key, and writes each row as it arrives, so a
+multi-gigabyte history is exported in constant memory.
+
+JSONL is always available. Parquet needs the optional ``pyarrow`` package
+(``pip install corphish[parquet]``); rows are written one row group per
+batch.
+"""
+
+import json
+import logging
+from pathlib import Path
+from typing import Callable, Optional, TextIO
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per query and written per Parquet row group
+_DEFAULT_BATCH_SIZE = 1000
+
+FORMATS = ("jsonl", "parquet")
+
+
+async def export_jsonl(
+    out: TextIO,
+    *,
+    since_id: int = 0,
+    batch_size: int = _DEFAULT_BATCH_SIZE,
+    db_path: Optional[Path] = None,
+    iter_messages_fn: Callable = db.iter_messages,
+) -> int:
+    """Writes messages as JSON lines.
+
+    Args:
+        out: Text stream to write to.
+        since_id: Only export messages with id strictly greater than this.
+        batch_size: Rows fetched per query.
+        db_path: Path to the database file. Defaults to get_db_path().
+        iter_messages_fn: Yields message rows (see db.iter_messages).
+
+    Returns:
+        The number of messages written.
+    """
+    count = 0
+    async for row in iter_messages_fn(since_id, batch_size, db_path=db_path):
+        out.write(json.dumps(row, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def _parquet_schema(pa):
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("direction", pa.string()),
+            ("text", pa.string()),
+            ("telegram_update_id", pa.int64()),
+            ("telegram_message_id", pa.int64()),
+            ("created_at", pa.string()),
+            ("processed_at", pa.string()),
+        ]
+    )
+
+
+async def export_parquet(
+    path: Path,
+    *,
+    since_id: int = 0,
+    batch_size: int = _DEFAULT_BATCH_SIZE,
+    db_path: Optional[Path] = None,
+    iter_messages_fn: Callable = db.iter_messages,
+) -> int:
+    """Writes messages to a Parquet file, one row group per batch.
+
+    Args:
+        path: File to write.
+        since_id: Only export messages with id strictly greater than this.
+        batch_size: Rows fetched per query and written per row group.
+        db_path: Path to the database file. Defaults to get_db_path().
+        iter_messages_fn: Yields message rows (see db.iter_messages).
+
+    Returns:
+        The number of messages written.
+
+    Raises:
+        RuntimeError: If pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError(
+            "Parquet export requires pyarrow (pip install corphish[parquet])"
+        ) from exc
+
+    schema = _parquet_schema(pa)
+    count = 0
+    batch: list[dict] = []
+    with pq.ParquetWriter(str(path), schema) as writer:
+        async for row in iter_messages_fn(since_id, batch_size, db_path=db_path):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch or count == 0:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
@@ -0,0 +1,357 @@
+"""Fake Agent SDK backend for offline benchmarks.
+
+FakeClaudeBackend.query has the signature of ``claude_agent_sdk.query``
+and can be passed to ``ClaudeClient(query_fn=...)``. It either replays
+recorded message streams with their original (optionally scaled) timing,
+or synthesises replies from a LatencyProfile: time to first chunk, gaps
+between chunks, tool-call pauses, failures and cancellations, all drawn
+from seeded log-normal distributions so runs are reproducible.
+
+Streams are stored as JSON lines, one SDK message per line::
+
+    {"stream": 3, "t": 1.284, "message": {"__type__": "AssistantMessage", ...}}
+
+where ``t`` is the offset in seconds from the start of the query. A query
+that ended in an exception has a final ``{"stream": 3, "t": 2.0, "error":
+"..."}`` line, replayed as FakeBackendError (or CancelledError for
+``"cancelled"``). SDK dataclasses are encoded generically by class name (encode_message /
+decode_message), so new message and block types survive a round trip.
+"""
+
+import asyncio
+import dataclasses
+import json
+import logging
+import random
+from pathlib import Path
+from typing import Any, Callable, Iterable, Optional, TextIO
+
+import claude_agent_sdk
+from claude_agent_sdk import (
+    AssistantMessage,
+    ResultMessage,
+    StreamEvent,
+    TextBlock,
+    ToolResultBlock,
+    ToolUseBlock,
+    UserMessage,
+)
+
+logger = logging.getLogger(__name__)
+
+_WORDS = (
+    "the quick brown fox jumps over a lazy dog while corphish keeps an eye "
+    "on the chat and answers every question with care"
+).split()
+
+
+# --- Message encoding ---
+
+
+def encode_message(value: Any) -> Any:
+    """Converts SDK messages (and their blocks) to JSON-compatible data.
+
+    Dataclasses become dicts tagged with ``__type__``; fields left at their
+    default value are omitted to keep captures small.
+    """
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        encoded = {"__type__": type(value).__name__}
+        for field in dataclasses.fields(value):
+            item = getattr(value, field.name)
+            if field.default is not dataclasses.MISSING and item == field.default:
+                continue
+            if field.default_factory is not dataclasses.MISSING and item == field.default_factory():
+                continue
+            encoded[field.name] = encode_message(item)
+        return encoded
+    if isinstance(value, (list, tuple)):
+        return [encode_message(item) for item in value]
+    if isinstance(value, dict):
+        return {key: encode_message(item) for key, item in value.items()}
+    return value
+
+
+def decode_message(data: Any) -> Any:
+    """Rebuilds SDK messages encoded by encode_message.
+
+    Returns None for a message whose type this SDK version does not have.
+    """
+    if isinstance(data, list):
+        return [decode_message(item) for item in data]
+    if not isinstance(data, dict):
+        return data
+    fields = {key: decode_message(item) for key, item in data.items() if key != "__type__"}
+    if "__type__" not in data:
+        return fields
+    cls = getattr(claude_agent_sdk, data["__type__"], None)
+    if cls is None or not dataclasses.is_dataclass(cls):
+        logger.debug("Skipping unknown SDK type %s", data["__type__"])
+        return None
+    return cls(**fields)
+
+
+def write_event(
+    out: TextIO,
+    stream: int,
+    offset: float,
+    message: Any = None,
+    *,
+    error: Optional[str] = None,
+) -> int:
+    """Writes one captured message, or the error ending a query, as a JSON line.
+
+    Args:
+        out: Text stream to write to.
+        stream: Number of the query the message belongs to.
+        offset: Seconds since the query started.
+        message: The SDK message.
+        error: Description of the exception that ended the query instead,
+            or ``"cancelled"``.
+
+    Returns:
+        The number of characters written.
+    """
+    event: dict[str, Any] = {"stream": stream, "t": round(offset, 4)}
+    if error is not None:
+        event["error"] = error
+    else:
+        event["message"] = encode_message(message)
+    line = json.dumps(event, ensure_ascii=False)
+    out.write(line + "\n")
+    return len(line) + 1
+
+
+def read_streams(paths: Iterable[Path]) -> list[list[tuple[float, Any]]]:
+    """Loads captured streams from JSON lines files.
+
+    Args:
+        paths: Files to read, oldest first.
+
+    Returns:
+        One list of (offset, message) pairs per query, in capture order.
+        A query that failed ends with an (offset, exception) pair.
+    """
+    streams: dict[tuple[int, int], list[tuple[float, Any]]] = {}
+    for file_index, path in enumerate(paths):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if "error" in event:
+                    message = _replay_error(event["error"])
+                else:
+                    message = decode_message(event["message"])
+                if message is not None:
+                    key = (file_index, event["stream"])
+                    streams.setdefault(key, []).append((event["t"], message))
+    return [streams[key] for key in sorted(streams)]
+
+
+def _replay_error(error: str) -> BaseException:
+    if error == "cancelled":
+        return asyncio.CancelledError()
+    return FakeBackendError(error)
+
+
+# --- Latency profiles ---
+
+
+class LatencyProfile:
+    """Describes how a synthetic Claude backend behaves.
+
+    Durations are medians in seconds; each sample is drawn from a
+    log-normal distribution with the given spread (sigma), which gives the
+    long tail real API latencies have.
+
+    Args:
+        first_chunk: Time to the first assistant message.
+        inter_chunk: Gap between assistant messages.
+        chunks: Assistant messages per reply.
+        words_per_chunk: Words in each assistant message.
+        token_gap: Fixed gap between streamed words when partial messages
+            are requested.
+        tool_call_rate: Probability that a chunk is preceded by a tool call.
+        tool_pause: Time the SDK spends running a tool.
+        failure_rate: Probability that a query raises an error part-way.
+        cancel_rate: Probability that a query is cancelled part-way.
+        spread: Sigma of the log-normal distributions (0 for fixed times).
+    """
+
+    def __init__(
+        self,
+        *,
+        first_chunk: float = 1.5,
+        inter_chunk: float = 0.5,
+        chunks: int = 2,
+        words_per_chunk: int = 30,
+        token_gap: float = 0.02,
+        tool_call_rate: float = 0.0,
+        tool_pause: float = 2.0,
+        failure_rate: float = 0.0,
+        cancel_rate: float = 0.0,
+        spread: float = 0.5,
+    ) -> None:
+        self.first_chunk = first_chunk
+        self.inter_chunk = inter_chunk
+        self.chunks = chunks
+        self.words_per_chunk = words_per_chunk
+        self.token_gap = token_gap
+        self.tool_call_rate = tool_call_rate
+        self.tool_pause = tool_pause
+        self.failure_rate = failure_rate
+        self.cancel_rate = cancel_rate
+        self.spread = spread
+
+
+PROFILES = {
+    "instant": LatencyProfile(first_chunk=0, inter_chunk=0, chunks=1, token_gap=0, spread=0),
+    "haiku": LatencyProfile(first_chunk=0.6, inter_chunk=0.2, chunks=1),
+    "sonnet": LatencyProfile(first_chunk=1.5, inter_chunk=0.5, chunks=2),
+    "opus": LatencyProfile(first_chunk=3.0, inter_chunk=1.0, chunks=3),
+    "tools": LatencyProfile(first_chunk=1.5, inter_chunk=0.5, chunks=3, tool_call_rate=0.5),
+    "flaky": LatencyProfile(
+        first_chunk=1.5, inter_chunk=0.5, chunks=2, failure_rate=0.1, cancel_rate=0.05
+    ),
+}
+
+
+class FakeBackendError(RuntimeError):
+    """Raised by a synthetic query that was chosen to fail."""
+
+
+class FakeClaudeBackend:
+    """Agent SDK stand-in producing synthetic or replayed message streams.
+
+    Args:
+        profile: A LatencyProfile or the name of one in PROFILES. Ignored
+            when replaying.
+        streams: Recorded streams (see read_streams) to replay in turn,
+            cycling when exhausted.
+        speed: Replay speed multiplier; 2.0 halves every delay, 0 replays
+            without waiting.
+        seed: Seed for the random number generator.
+        sleep_fn: Awaitable called with each delay in seconds.
+
+    Attributes:
+        calls: Number of queries started.
+        failures: Number of queries that raised FakeBackendError, whether
+            synthetic or replayed.
+        cancellations: Number of queries that raised CancelledError.
+    """
+
+    def __init__(
+        self,
+        profile: Any = "sonnet",
+        *,
+        streams: Optional[list[list[tuple[float, Any]]]] = None,
+        speed: float = 1.0,
+        seed: Optional[int] = None,
+        sleep_fn: Callable = asyncio.sleep,
+    ) -> None:
+        self._profile = PROFILES[profile] if isinstance(profile, str) else profile
+        self._streams = streams or []
+        self._speed = speed
+        self._random = random.Random(seed)
+        self._sleep = sleep_fn
+        self.calls = 0
+        self.failures = 0
+        self.cancellations = 0
+
+    @classmethod
+    def from_capture(
+        cls, paths: Iterable[Path], *, speed: float = 1.0, **kwargs: Any
+    ) -> "FakeClaudeBackend":
+        """Creates a backend replaying captured streams from files."""
+        return cls(streams=read_streams(paths), speed=speed, **kwargs)
+
+    def _sample(self, median: float) -> float:
+        if median <= 0:
+            return 0.0
+        if self._profile.spread <= 0:
+            return median
+        return self._random.lognormvariate(0, self._profile.spread) * median
+
+    def _text(self, words: int) -> str:
+        return " ".join(self._random.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+    async def query(self, *, prompt: str, options: Any = None):
+        """Yields SDK messages like claude_agent_sdk.query."""
+        self.calls += 1
+        if self._streams:
+            stream = self._streams[(self.calls - 1) % len(self._streams)]
+            async for message in self._replay(stream):
+                yield message
+        else:
+            partial = bool(getattr(options, "include_partial_messages", False))
+            model = getattr(options, "model", None) or "fake"
+            async for message in self._synthesise(model, partial):
+                yield message
+
+    async def _replay(self, stream: list[tuple[float, Any]]):
+        elapsed = 0.0
+        for offset, message in stream:
+            if self._speed > 0 and offset > elapsed:
+                await self._sleep((offset - elapsed) / self._speed)
+            elapsed = max(elapsed, offset)
+            if isinstance(message, asyncio.CancelledError):
+                self.cancellations += 1
+                raise asyncio.CancelledError()
+            if isinstance(message, FakeBackendError):
+                self.failures += 1
+                raise FakeBackendError(*message.args)
+            yield message
+
+    async def _synthesise(self, model: str, partial: bool):
+        profile = self._profile
+        fail_at = cancel_at = None
+        if self._random.random() < profile.failure_rate:
+            fail_at = self._random.randrange(profile.chunks)
+        elif self._random.random() < profile.cancel_rate:
+            cancel_at = self._random.randrange(profile.chunks)
+
+        for index in range(profile.chunks):
+            await self._sleep(self._sample(profile.first_chunk if index == 0 else profile.inter_chunk))
+            if index == fail_at:
+                self.failures += 1
+                raise FakeBackendError("Synthetic backend failure")
+            if index == cancel_at:
+                self.cancellations += 1
+                raise asyncio.CancelledError()
+
+            if self._random.random() < profile.tool_call_rate:
+                tool_id = f"tool-{self.calls}-{index}"
+                yield AssistantMessage(
+                    content=[ToolUseBlock(id=tool_id, name="Bash", input={"command": "true"})],
+                    model=model,
+                )
+                await self._sleep(self._sample(profile.tool_pause))
+                yield UserMessage(content=[ToolResultBlock(tool_use_id=tool_id, content="")])
+
+            text = self._text(profile.words_per_chunk)
+            if partial:
+                for i, event in enumerate(_text_events(text)):
+                    if i > 1 and profile.token_gap > 0:
+                        await self._sleep(profile.token_gap)
+                    yield StreamEvent(uuid="fake", session_id="fake", event=event)
+            yield AssistantMessage(content=[TextBlock(text=text)], model=model)
+
+        yield ResultMessage(
+            subtype="success",
+            duration_ms=0,
+            duration_api_ms=0,
+            is_error=False,
+            num_turns=1,
+            session_id="fake",
+        )
+
+
+def _text_events(text: str) -> list[dict]:
+    """Returns the partial-message events that stream *text* word by word."""
+    events = [{"type": "content_block_start", "content_block": {"type": "text"}}]
+    for word in text.split(" "):
+        events.append(
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": word + " "}}
+        )
+    events.append({"type": "content_block_stop"})
+    return events
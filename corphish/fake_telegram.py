@@ -0,0 +1,260 @@
+"""Local stand-in for the Telegram Bot API, for offline load testing.
+
+FakeTelegramServer speaks just enough HTTP/1.1 for python-telegram-bot's
+client: ``getMe``, ``getUpdates`` (with long polling), ``sendMessage``,
+``editMessageText`` and ``sendChatAction``. Incoming user messages are queued with
+push_message(); everything the bot sends is recorded with its arrival
+time. Telegram's flood control can be simulated with a per-second send
+limit, over which requests are answered with ``429 Too Many Requests``
+and a ``retry_after``, like the real API.
+
+Point a Bot at it with ``Bot(token, base_url=server.base_url)``.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Optional
+from urllib.parse import parse_qsl, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# The bot's own user, as returned by getMe
+_BOT_USER = {
+    "id": 1,
+    "is_bot": True,
+    "first_name": "Corphish",
+    "username": "corphish_fake_bot",
+}
+
+_STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests"}
+
+
+class FakeTelegramServer:
+    """Serves a minimal Bot API for one private chat on localhost.
+
+    Args:
+        chat_id: ID of the private chat users write from.
+        host: Interface to bind.
+        port: Port to bind; 0 picks a free one.
+        send_rate_limit: Most sendMessage/editMessageText calls accepted
+            per second; further calls get a 429. None disables the limit.
+        retry_after: Seconds reported in 429 responses.
+
+    Attributes:
+        sent: Messages sent by the bot, as dicts with keys message_id,
+            text and at (time.monotonic() of arrival).
+        edits: Edits made by the bot, with the same keys.
+        chat_actions: Number of chat actions (typing indicators) received.
+        rate_limited: Number of requests answered with 429.
+    """
+
+    def __init__(
+        self,
+        *,
+        chat_id: int = 1000,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        send_rate_limit: Optional[float] = None,
+        retry_after: int = 1,
+    ) -> None:
+        self.chat_id = chat_id
+        self._host = host
+        self._port = port
+        self._send_rate_limit = send_rate_limit
+        self._retry_after = retry_after
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._updates: list[dict] = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._new_update = asyncio.Event()
+        self._recent_sends: deque[float] = deque()
+        self._connections: dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self.sent: list[dict] = []
+        self.edits: list[dict] = []
+        self.chat_actions = 0
+        self.rate_limited = 0
+
+    @property
+    def base_url(self) -> str:
+        """Base URL to pass to telegram.Bot."""
+        return f"http://{self._host}:{self._port}/bot"
+
+    async def start(self) -> None:
+        """Starts listening."""
+        self._server = await asyncio.start_server(self._handle_client, self._host, self._port)
+        self._port = self._server.sockets[0].getsockname()[1]
+        logger.info("[fake-telegram] Listening on %s", self.base_url)
+
+    async def close(self) -> None:
+        """Stops listening and closes client connections."""
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        # Wake pending long polls so their handlers can finish
+        self._new_update.set()
+        for writer in self._connections.values():
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def push_message(self, text: str) -> dict:
+        """Queues a user message for getUpdates.
+
+        Args:
+            text: The message text.
+
+        Returns:
+            The queued update.
+        """
+        update = {
+            "update_id": self._next_update_id,
+            "message": {
+                "message_id": self._take_message_id(),
+                "date": int(time.time()),
+                "chat": {"id": self.chat_id, "type": "private"},
+                "from": {"id": self.chat_id, "is_bot": False, "first_name": "Load"},
+                "text": text,
+            },
+        }
+        self._next_update_id += 1
+        self._updates.append(update)
+        self._new_update.set()
+        return update
+
+    def _take_message_id(self) -> int:
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        return message_id
+
+    def _message(self, message_id: int, text: str) -> dict:
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": self.chat_id, "type": "private"},
+            "from": _BOT_USER,
+            "text": text,
+        }
+
+    def _over_rate_limit(self) -> bool:
+        if self._send_rate_limit is None:
+            return False
+        now = time.monotonic()
+        while self._recent_sends and now - self._recent_sends[0] >= 1.0:
+            self._recent_sends.popleft()
+        if len(self._recent_sends) >= self._send_rate_limit:
+            self.rate_limited += 1
+            return True
+        self._recent_sends.append(now)
+        return False
+
+    # --- Bot API methods ---
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+        if offset < 0:
+            self._updates = self._updates[offset:]
+        elif offset:
+            # Like Telegram, an offset confirms every earlier update
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates and timeout > 0:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    async def _send_message(self, params: dict) -> dict:
+        message = self._message(self._take_message_id(), params["text"])
+        self.sent.append(
+            {"message_id": message["message_id"], "text": params["text"], "at": time.monotonic()}
+        )
+        return message
+
+    async def _edit_message_text(self, params: dict) -> dict:
+        message_id = int(params["message_id"])
+        self.edits.append({"message_id": message_id, "text": params["text"], "at": time.monotonic()})
+        return self._message(message_id, params["text"])
+
+    async def _call(self, method: str, params: dict) -> tuple[int, dict]:
+        if method == "getMe":
+            return 200, {"ok": True, "result": _BOT_USER}
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": await self._get_updates(params)}
+        if method == "sendChatAction":
+            self.chat_actions += 1
+            return 200, {"ok": True, "result": True}
+        if method in ("sendMessage", "editMessageText"):
+            if self._over_rate_limit():
+                return 429, {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self._retry_after}",
+                    "parameters": {"retry_after": self._retry_after},
+                }
+            if not params.get("text"):
+                return 400, {
+                    "ok": False,
+                    "error_code": 400,
+                    "description": "Bad Request: message text is empty",
+                }
+            if method == "sendMessage":
+                return 200, {"ok": True, "result": await self._send_message(params)}
+            return 200, {"ok": True, "result": await self._edit_message_text(params)}
+        return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+
+    # --- HTTP ---
+
+    async def _handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        task = asyncio.current_task()
+        self._connections[task] = writer
+        try:
+            while request := await _read_request(reader):
+                path, headers, body = request
+                method = urlsplit(path).path.rsplit("/", 1)[-1]
+                status, payload = await self._call(method, _decode_params(headers, body))
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, 'Error')}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    "\r\n".encode()
+                    + data
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(task, None)
+            writer.close()
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[tuple[str, dict, bytes]]:
+    """Reads one HTTP/1.1 request, or returns None at end of stream."""
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    _, path, _ = request_line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return path, headers, body
+
+
+def _decode_params(headers: dict, body: bytes) -> dict:
+    """Decodes JSON or form-encoded Bot API parameters."""
+    if not body:
+        return {}
+    if headers.get("content-type", "").startswith("application/json"):
+        return json.loads(body)
+    return dict(parse_qsl(body.decode()))
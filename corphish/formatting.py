@@ -0,0 +1,200 @@
+"""Splitting and formatting of replies for Telegram.
+
+Telegram rejects messages longer than 4096 characters, and Claude writes
+Markdown, which Telegram shows literally unless it is converted. render()
+turns a reply into the list of Telegram messages that carry it:
+
+- The reply is split on paragraph boundaries, never inside a fenced code
+  block unless the block alone is too long, in which case it is split by
+  lines and each piece is fenced again. Overlong lines are split at a
+  space, or cut as a last resort.
+- Each part is converted to Telegram HTML: fenced code blocks, inline
+  code, ``**bold**`` and links are kept, everything else is escaped.
+  Parts without any formatting are sent as plain text, as is any part
+  whose HTML would exceed the limit.
+
+The plain text of every part is kept alongside its HTML so a part that
+Telegram refuses to parse can still be sent as-is.
+"""
+
+import html
+import re
+from typing import Optional
+
+# Longest text Telegram accepts in one message
+MAX_LENGTH = 4096
+
+_FENCE = "```"
+
+# A fenced code block with an optional language
+_CODE_BLOCK = re.compile(r"```([\w+-]*)\n(.*?)\n?```", re.DOTALL)
+
+# Inline code, bold and links, in order of precedence
+_INLINE = re.compile(
+    r"`([^`\n]+)`"
+    r"|\*\*([^*\n]+?)\*\*"
+    r"|\[([^\]\n]+)\]\((https?://[^)\s]+)\)"
+)
+
+
+def _blocks(text: str) -> list[str]:
+    """Splits text into paragraphs and whole fenced code blocks."""
+    blocks: list[str] = []
+    current: list[str] = []
+    in_fence = False
+    for line in text.splitlines():
+        if line.lstrip().startswith(_FENCE):
+            if not in_fence and current:
+                blocks.append("\n".join(current))
+                current = []
+            current.append(line)
+            if in_fence:
+                blocks.append("\n".join(current))
+                current = []
+            in_fence = not in_fence
+        elif not line.strip() and not in_fence:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+        else:
+            current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _cut(line: str, limit: int) -> list[str]:
+    """Splits one overlong line, preferably at a space."""
+    pieces = []
+    while len(line) > limit:
+        index = line.rfind(" ", 0, limit + 1)
+        if index <= 0:
+            index = limit
+        pieces.append(line[:index].rstrip())
+        line = line[index:].lstrip(" ")
+    if line:
+        pieces.append(line)
+    return pieces
+
+
+def _pack(lines: list[str], limit: int) -> list[str]:
+    """Joins lines into as few chunks of at most *limit* characters as possible."""
+    chunks: list[str] = []
+    current = ""
+    for line in lines:
+        for piece in _cut(line, limit) or [""]:
+            candidate = f"{current}\n{piece}" if current else piece
+            if current and len(candidate) > limit:
+                chunks.append(current)
+                current = piece
+            else:
+                current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _fit(block: str, limit: int) -> list[str]:
+    """Splits a block that is too long to fit in one message."""
+    if len(block) <= limit:
+        return [block]
+    lines = block.split("\n")
+    if lines[0].lstrip().startswith(_FENCE):
+        opener = lines[0]
+        body = lines[1:-1] if lines[-1].strip() == _FENCE else lines[1:]
+        budget = limit - len(opener) - len(_FENCE) - 2
+        if budget > 0:
+            return [f"{opener}\n{chunk}\n{_FENCE}" for chunk in _pack(body, budget)]
+    return _pack(lines, limit)
+
+
+def split_text(text: str, limit: int = MAX_LENGTH) -> list[str]:
+    """Splits text into parts of at most *limit* characters.
+
+    Text that fits is returned unchanged. Otherwise paragraphs are kept
+    together where possible and runs of blank lines between them collapse
+    to one.
+
+    Args:
+        text: The text to split.
+        limit: Longest part allowed.
+
+    Returns:
+        The parts, in order. Empty if *text* is blank.
+    """
+    if len(text) <= limit:
+        return [text] if text.strip() else []
+    parts: list[str] = []
+    current = ""
+    for block in _blocks(text):
+        for piece in _fit(block, limit):
+            candidate = f"{current}\n\n{piece}" if current else piece
+            if current and len(candidate) > limit:
+                parts.append(current)
+                current = piece
+            else:
+                current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _inline_html(text: str) -> str:
+    """Converts inline Markdown to Telegram HTML, escaping everything else."""
+    out = []
+    position = 0
+    for match in _INLINE.finditer(text):
+        out.append(html.escape(text[position:match.start()], quote=False))
+        code, bold, label, url = match.groups()
+        if code is not None:
+            out.append(f"<code>{html.escape(code, quote=False)}</code>")
+        elif bold is not None:
+            out.append(f"<b>{html.escape(bold, quote=False)}</b>")
+        else:
+            out.append(f'<a href="{html.escape(url)}">{html.escape(label, quote=False)}</a>')
+        position = match.end()
+    out.append(html.escape(text[position:], quote=False))
+    return "".join(out)
+
+
+def to_html(text: str) -> str:
+    """Converts Claude's Markdown to Telegram HTML.
+
+    Args:
+        text: Markdown text.
+
+    Returns:
+        The text with code blocks, inline code, bold and links as HTML
+        tags and everything else escaped.
+    """
+    out = []
+    position = 0
+    for match in _CODE_BLOCK.finditer(text):
+        out.append(_inline_html(text[position:match.start()]))
+        language, code = match.groups()
+        attribute = f' class="language-{language}"' if language else ""
+        out.append(f"<pre><code{attribute}>{html.escape(code, quote=False)}</code></pre>")
+        position = match.end()
+    out.append(_inline_html(text[position:]))
+    return "".join(out)
+
+
+def _part_html(text: str, limit: int) -> Optional[str]:
+    rendered = to_html(text)
+    if rendered == html.escape(text, quote=False) or len(rendered) > limit:
+        return None
+    return rendered
+
+
+def render(text: str, limit: int = MAX_LENGTH) -> list[dict]:
+    """Turns a reply into the Telegram messages that carry it.
+
+    Args:
+        text: The reply, in Markdown.
+        limit: Longest message allowed.
+
+    Returns:
+        One dict per message with keys text (plain text) and html (the
+        formatted version, or None to send the plain text).
+    """
+    return [{"text": part, "html": _part_html(part, limit)} for part in split_text(text, limit)]
@@ -0,0 +1,183 @@
+"""Offline load test of the whole daemon against a fake Telegram server.
+
+run_load_test() starts a FakeTelegramServer, runs run_daemon against it
+on a throwaway database, pushes user messages at a fixed rate and reports
+ingestion and delivery throughput and latency. Nothing leaves localhost:
+Telegram is the fake server and Claude is a FakeClaudeBackend with one
+of its latency profiles (instant replies by default), or replaying
+message streams recorded by the capture module.
+
+Latencies are measured per message from the moment it is queued on the
+fake server: ``ingest`` until the consumer has stored it, ``reply`` until
+the processor has delivered its reply and acknowledged it.
+"""
+
+import asyncio
+import logging
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import aiosqlite
+from telegram import Bot
+
+from .capture import capture_files
+from .claude_client import ClaudeClient
+from .daemon import run_daemon
+from .fake_claude import FakeClaudeBackend
+from .fake_telegram import FakeTelegramServer
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for the backlog to drain after the last message is sent
+_SETTLE_TIMEOUT = 30.0
+
+_FAKE_TOKEN = "123456:load-test"
+
+
+def _percentiles(samples: list[float]) -> dict:
+    """Returns p50/p95/max of *samples* in milliseconds."""
+    if not samples:
+        return {"p50_ms": None, "p95_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "p95_ms": round(p95 * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+async def _progress(db_path: Path) -> tuple[int, int]:
+    """Returns (incoming stored, incoming processed)."""
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(processed), 0) FROM messages "
+            "WHERE direction = 'incoming'"
+        )
+        return await cursor.fetchone()
+
+
+async def _latencies(db_path: Path, pushed_at: dict[int, float]) -> tuple[list, list]:
+    """Returns ingest and reply latencies in seconds from the database."""
+    ingest, reply = [], []
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute(
+            "SELECT telegram_message_id, created_at, processed_at FROM messages "
+            "WHERE direction = 'incoming'"
+        )
+        for message_id, created_at, processed_at in await cursor.fetchall():
+            start = pushed_at.get(message_id)
+            if start is None:
+                continue
+            ingest.append(datetime.fromisoformat(created_at).timestamp() - start)
+            if processed_at:
+                reply.append(datetime.fromisoformat(processed_at).timestamp() - start)
+    return ingest, reply
+
+
+async def run_load_test(
+    *,
+    rate: float = 5.0,
+    duration: float = 10.0,
+    send_rate_limit: Optional[float] = None,
+    profile: str = "instant",
+    seed: Optional[int] = None,
+    replay: Optional[Path] = None,
+    speed: float = 1.0,
+    claude: Optional[ClaudeClient] = None,
+    db_path: Optional[Path] = None,
+    settle_timeout: float = _SETTLE_TIMEOUT,
+) -> dict:
+    """Drives run_daemon end to end against a local fake Telegram server.
+
+    Args:
+        rate: User messages pushed per second.
+        duration: Seconds to keep pushing messages.
+        send_rate_limit: Simulated Telegram flood limit (sends per second);
+            None for no limit.
+        profile: Name of the fake_claude.PROFILES latency profile used
+            for Claude's replies.
+        seed: Seed for the fake backend, for reproducible runs.
+        replay: Capture file or directory whose recorded streams Claude
+            replays in turn; overrides *profile*.
+        speed: Replay speed multiplier (2.0 is twice as fast, 0 is
+            instant).
+        claude: Claude client for the processor; overrides *profile*.
+        db_path: Database to use. Defaults to a temporary one.
+        settle_timeout: Seconds to wait for the backlog to drain after the
+            last message has been pushed.
+
+    Returns:
+        A report dict with counts (pushed, ingested, processed, replies,
+        edits, chat_actions, rate_limited), throughput and latency percentiles.
+    """
+    if replay is not None:
+        backend = FakeClaudeBackend.from_capture(capture_files(replay), speed=speed)
+    else:
+        backend = FakeClaudeBackend(profile, seed=seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = db_path or Path(tmp) / "loadtest.db"
+        server = FakeTelegramServer(send_rate_limit=send_rate_limit)
+        await server.start()
+
+        offset = {"value": 0}
+        stop_event = asyncio.Event()
+        daemon = asyncio.create_task(
+            run_daemon(
+                get_token_fn=lambda: _FAKE_TOKEN,
+                build_bot_fn=lambda token: Bot(token, base_url=server.base_url),
+                load_config_fn=lambda: {"chat_id": server.chat_id},
+                claude=claude or ClaudeClient(query_fn=backend.query),
+                get_offset_fn=lambda: offset["value"],
+                save_offset_fn=lambda value: offset.update(value=value),
+                db_path=path,
+                enable_heartbeat=False,
+                enable_reminders=False,
+                enable_control=False,
+                stop_event=stop_event,
+            )
+        )
+
+        pushed_at: dict[int, float] = {}
+        count = max(1, int(rate * duration))
+        started = time.monotonic()
+        try:
+            for i in range(count):
+                await asyncio.sleep(max(0.0, started + i / rate - time.monotonic()))
+                update = server.push_message(f"load test message {i}")
+                pushed_at[update["message"]["message_id"]] = time.time()
+
+            deadline = time.monotonic() + settle_timeout
+            while time.monotonic() < deadline and not daemon.done():
+                _, processed = await _progress(path)
+                if processed >= count:
+                    break
+                await asyncio.sleep(0.1)
+            elapsed = time.monotonic() - started
+        finally:
+            stop_event.set()
+            await asyncio.wait_for(daemon, timeout=settle_timeout)
+            await server.close()
+
+        ingested, processed = await _progress(path)
+        ingest, reply = await _latencies(path, pushed_at)
+
+    return {
+        "pushed": count,
+        "ingested": ingested,
+        "processed": processed,
+        "replies": len(server.sent),
+        "edits": len(server.edits),
+        "chat_actions": server.chat_actions,
+        "rate_limited": server.rate_limited,
+        "claude_calls": backend.calls,
+        "claude_failures": backend.failures + backend.cancellations,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_per_s": round(processed / elapsed, 2) if elapsed else None,
+        "ingest_latency": _percentiles(ingest),
+        "reply_latency": _percentiles(reply),
+    }
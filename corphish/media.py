@@ -0,0 +1,243 @@
+"""Download of Telegram media into a content-addressed store.
+
+Photos, documents, voice notes and other files sent to the bot are
+streamed to disk in chunks (python-telegram-bot's own download helpers
+read the whole file into memory first) and stored under
+``media/<aa>/<sha256><suffix>`` in the config directory, named by the
+SHA-256 of their content, so a file sent twice is stored once. Files are
+readable by the owner only.
+
+Downloads are capped at ``media_max_bytes`` (checked against the size
+Telegram reports before downloading, and again while streaming) and at
+most ``media_concurrency`` run at once. The processor hands the stored
+paths to Claude, which can read them with its file tools.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the network and written to disk at a time
+_CHUNK_SIZE = 64 * 1024
+
+# Seconds to wait for Telegram's file server between chunks
+_READ_TIMEOUT = 60
+
+# Message attributes holding a downloadable file, besides photo
+_FILE_KINDS = ("document", "voice", "audio", "video", "video_note", "animation")
+
+# File suffixes kept on stored files
+_SUFFIX = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+
+class MediaTooLargeError(ValueError):
+    """Raised when a file is larger than the configured limit."""
+
+
+def _too_large(size: int, limit: int) -> str:
+    return f"file is over the {limit / 1024 / 1024:g} MB limit ({size / 1024 / 1024:.1f} MB)"
+
+
+def get_media_dir() -> Path:
+    """Returns the directory media files are stored in."""
+    return config.get_config_dir() / "media"
+
+
+def media_of(message) -> Optional[dict]:
+    """Returns the file attached to a Telegram message, if any.
+
+    Args:
+        message: A telegram.Message.
+
+    Returns:
+        A dict with keys kind, file_id, file_size, mime_type and
+        file_name, or None if the message carries no file. For photos the
+        largest size is chosen.
+    """
+    if message.photo:
+        photo = message.photo[-1]
+        return {
+            "kind": "photo",
+            "file_id": photo.file_id,
+            "file_size": photo.file_size,
+            "mime_type": "image/jpeg",
+            "file_name": None,
+        }
+    for kind in _FILE_KINDS:
+        item = getattr(message, kind, None)
+        if item is not None:
+            return {
+                "kind": kind,
+                "file_id": item.file_id,
+                "file_size": item.file_size,
+                "mime_type": getattr(item, "mime_type", None),
+                "file_name": getattr(item, "file_name", None),
+            }
+    return None
+
+
+def _suffix(*names: Optional[str]) -> str:
+    """Returns the first safe file suffix among *names*."""
+    for name in names:
+        if name:
+            suffix = Path(name).suffix.lower()
+            if _SUFFIX.match(suffix):
+                return suffix
+    return ""
+
+
+async def _fetch_chunks(location: str, chunk_size: int) -> AsyncIterator[bytes]:
+    """Yields the content of a Telegram file URL (or local path) in chunks."""
+    if not location.startswith(("http://", "https://")):
+        # A Bot API server in local mode hands out paths on its own disk
+        with open(location, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+        return
+    timeout = httpx.Timeout(_READ_TIMEOUT, connect=10)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        async with client.stream("GET", location) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+
+
+class MediaStore:
+    """Streams files into a content-addressed directory.
+
+    Args:
+        directory: Root of the store. Defaults to get_media_dir().
+        max_bytes: Largest file accepted.
+        concurrency: Most downloads running at once.
+        chunk_size: Bytes read and written at a time.
+        fetch_fn: Callable(location, chunk_size) returning an async
+            iterator over a file's content (injectable for testing).
+    """
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        *,
+        max_bytes: int = 20 * 1024 * 1024,
+        concurrency: int = 2,
+        chunk_size: int = _CHUNK_SIZE,
+        fetch_fn: Callable = _fetch_chunks,
+    ) -> None:
+        self._dir = Path(directory) if directory else get_media_dir()
+        self._max_bytes = max_bytes
+        self._chunk_size = chunk_size
+        self._fetch = fetch_fn
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    def path_for(self, sha256: str, suffix: str = "") -> Path:
+        """Returns where a file with the given hash is stored."""
+        return self._dir / sha256[:2] / f"{sha256}{suffix}"
+
+    async def download(self, bot, media: dict) -> dict:
+        """Downloads a Telegram file into the store.
+
+        Args:
+            bot: The telegram.Bot to resolve the file with.
+            media: A dict as returned by media_of().
+
+        Returns:
+            A dict with keys sha256, path and size.
+
+        Raises:
+            MediaTooLargeError: If the file exceeds the size limit.
+            telegram.error.TelegramError, httpx.HTTPError, OSError: If the
+                download failed.
+        """
+        if media["file_size"] and media["file_size"] > self._max_bytes:
+            raise MediaTooLargeError(_too_large(media["file_size"], self._max_bytes))
+        async with self._semaphore:
+            file = await bot.get_file(media["file_id"])
+            suffix = _suffix(media["file_name"], file.file_path)
+            return await self.save(self._fetch(file.file_path, self._chunk_size), suffix)
+
+    async def save(self, chunks: AsyncIterator[bytes], suffix: str = "") -> dict:
+        """Writes a stream of chunks into the store.
+
+        The content is hashed while it is written to a temporary file,
+        which is then moved to its content address, or discarded if the
+        store already holds the same content.
+
+        Args:
+            chunks: The file's content.
+            suffix: File suffix to keep, e.g. ".jpg".
+
+        Returns:
+            A dict with keys sha256, path and size.
+
+        Raises:
+            MediaTooLargeError: If the content exceeds the size limit.
+        """
+        self._dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp = tempfile.mkstemp(dir=self._dir, prefix=".download-")
+        try:
+            async with contextlib.aclosing(chunks):
+                with os.fdopen(fd, "wb") as out:
+                    async for chunk in chunks:
+                        size += len(chunk)
+                        if size > self._max_bytes:
+                            raise MediaTooLargeError(_too_large(size, self._max_bytes))
+                        digest.update(chunk)
+                        out.write(chunk)
+            sha256 = digest.hexdigest()
+            path = self.path_for(sha256, suffix)
+            if path.exists():
+                logger.debug("[media] Already stored: %s", path)
+                os.unlink(temp)
+            else:
+                path.parent.mkdir(exist_ok=True)
+                os.replace(temp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temp)
+            raise
+        return {"sha256": sha256, "path": str(path), "size": size}
+
+
+def describe_attachments(prompt: str, attachments: list[dict]) -> str:
+    """Appends the paths of a message's stored files to its prompt.
+
+    Args:
+        prompt: The prompt for Claude.
+        attachments: Rows as returned by db.get_attachments().
+
+    Returns:
+        The prompt followed by one line per file.
+    """
+    lines = []
+    for attachment in attachments:
+        details = [f"{-(-attachment['size'] // 1024)} KB"]
+        if attachment["mime_type"]:
+            details.insert(0, attachment["mime_type"])
+        if attachment["file_name"]:
+            details.insert(0, attachment["file_name"])
+        lines.append(f"- {attachment['kind']}: {attachment['path']} ({', '.join(details)})")
+    return (
+        f"{prompt}\n\n[Files sent with this message, saved on disk]\n" + "\n".join(lines)
+    )
+
+
+def store_from_config() -> MediaStore:
+    """Returns a MediaStore with the size and concurrency limits from config."""
+    return MediaStore(
+        max_bytes=config.get_media_max_bytes(),
+        concurrency=config.get_media_concurrency(),
+    )
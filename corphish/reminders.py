@@ -0,0 +1,276 @@
+"""Scheduled reminders delivered without a model call.
+
+Reminders are persisted in the ``reminders`` table and held in memory in a
+min-heap keyed by due time. The scheduler sleeps exactly until the next
+reminder is due (or until woken by a newly added one), then turns it into
+an outgoing message directly in the database. Pending reminders are
+reloaded from SQLite on start-up and periodically, so reminders created by
+other processes (e.g. ``corphish remind``) and reminders outstanding across
+a restart are both picked up. A reminder cancelled by another process stays
+in the heap until it is due, when delivery finds it no longer pending.
+"""
+
+import asyncio
+import heapq
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# Seconds between reloads of pending reminders from the database
+_RELOAD_INTERVAL = 60
+
+_DURATION_UNITS = {
+    "s": 1,
+    "sec": 1,
+    "secs": 1,
+    "second": 1,
+    "seconds": 1,
+    "m": 60,
+    "min": 60,
+    "mins": 60,
+    "minute": 60,
+    "minutes": 60,
+    "h": 3600,
+    "hr": 3600,
+    "hrs": 3600,
+    "hour": 3600,
+    "hours": 3600,
+    "d": 86400,
+    "day": 86400,
+    "days": 86400,
+    "w": 604800,
+    "week": 604800,
+    "weeks": 604800,
+}
+
+_DURATION_PART = re.compile(r"(\d+)\s*([a-z]+)")
+_DURATION = re.compile(
+    r"^(?:in\s+)?((?:\d+\s*[a-z]+\s*)+?)(?:\s+(.*))?$", re.IGNORECASE | re.DOTALL
+)
+_CLOCK_TIME = re.compile(r"^(?:at\s+)?(\d{1,2}):(\d{2})(?:\s+(.*))?$", re.IGNORECASE | re.DOTALL)
+
+
+def _parse_duration(spec: str) -> Optional[timedelta]:
+    """Parses a compound duration such as ``1h30m`` or ``2 days``.
+
+    Args:
+        spec: The duration text.
+
+    Returns:
+        The parsed timedelta, or None if any part has an unknown unit.
+    """
+    total = 0
+    for amount, unit in _DURATION_PART.findall(spec.lower()):
+        if unit not in _DURATION_UNITS:
+            return None
+        total += int(amount) * _DURATION_UNITS[unit]
+    return timedelta(seconds=total) if total else None
+
+
+def parse_reminder(spec: str, now: Optional[datetime] = None) -> tuple[datetime, str]:
+    """Parses a reminder specification into a due time and text.
+
+    Accepted forms:
+      - ``in 10m call mom`` / ``1h30m stretch`` — relative duration
+      - ``at 14:30 standup`` / ``14:30 standup`` — next occurrence of a
+        local clock time
+      - ``2024-06-01T09:00 renew passport`` — ISO-8601 timestamp (naive
+        timestamps are interpreted as local time)
+
+    Args:
+        spec: The reminder specification.
+        now: The current time (timezone-aware). Defaults to now.
+
+    Returns:
+        A (due_at, text) tuple where due_at is timezone-aware UTC.
+
+    Raises:
+        ValueError: If the time cannot be parsed or the text is empty.
+    """
+    now = now or datetime.now(timezone.utc)
+    spec = spec.strip()
+
+    due: Optional[datetime] = None
+    text = ""
+
+    match = _DURATION.match(spec)
+    if match:
+        delta = _parse_duration(match.group(1))
+        if delta is not None:
+            due = now + delta
+            text = match.group(2) or ""
+
+    if due is None:
+        match = _CLOCK_TIME.match(spec)
+        if match:
+            hour, minute = int(match.group(1)), int(match.group(2))
+            if hour > 23 or minute > 59:
+                raise ValueError(f"Invalid time of day: {hour:02d}:{minute:02d}")
+            local_now = now.astimezone()
+            due = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if due <= local_now:
+                due += timedelta(days=1)
+            text = match.group(3) or ""
+
+    if due is None:
+        head, _, rest = spec.partition(" ")
+        try:
+            due = datetime.fromisoformat(head)
+        except ValueError:
+            raise ValueError(
+                f"Could not parse reminder time from {spec!r}. "
+                "Use e.g. 'in 10m', 'at 14:30' or an ISO timestamp."
+            ) from None
+        if due.tzinfo is None:
+            due = due.astimezone()
+        text = rest
+
+    text = text.strip()
+    if not text:
+        raise ValueError("Reminder text must not be empty")
+    return due.astimezone(timezone.utc), text
+
+
+def parse_cancel(spec: str) -> Optional[int]:
+    """Parses a ``cancel <id>`` reminder specification.
+
+    Args:
+        spec: The reminder specification.
+
+    Returns:
+        The ID of the reminder to cancel, or None if *spec* does not start
+        with ``cancel``.
+
+    Raises:
+        ValueError: If *spec* starts with ``cancel`` but names no ID.
+    """
+    words = spec.split()
+    if not words or words[0].lower() != "cancel":
+        return None
+    if len(words) != 2 or not words[1].lstrip("#").isdigit():
+        raise ValueError("Use 'cancel <id>' with the ID given when the reminder was set")
+    return int(words[1].lstrip("#"))
+
+
+class ReminderScheduler:
+    """Delivers reminders at their due time from an in-memory min-heap.
+
+    Args:
+        db_path: Path to the database file.
+        get_pending_fn: Returns pending reminders from the database.
+        deliver_fn: Atomically converts a reminder into an outgoing message.
+        reload_interval: Seconds between reloads of pending reminders.
+        clock: Returns the current time as a POSIX timestamp.
+    """
+
+    def __init__(
+        self,
+        *,
+        db_path: Optional[Path] = None,
+        get_pending_fn: Callable = db.get_pending_reminders,
+        deliver_fn: Callable = db.deliver_reminder,
+        reload_interval: float = _RELOAD_INTERVAL,
+        clock: Callable[[], float] = lambda: datetime.now(timezone.utc).timestamp(),
+    ) -> None:
+        self._db_path = db_path
+        self._get_pending = get_pending_fn
+        self._deliver = deliver_fn
+        self._reload_interval = reload_interval
+        self._clock = clock
+        self._heap: list[tuple[float, int]] = []
+        self._scheduled: set[int] = set()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def add(self, reminder_id: int, due_at: str) -> None:
+        """Adds a reminder to the heap and wakes the scheduler.
+
+        Args:
+            reminder_id: The database ID of the reminder.
+            due_at: ISO-8601 timestamp at which the reminder is due.
+        """
+        if reminder_id in self._scheduled:
+            return
+        due = datetime.fromisoformat(due_at).timestamp()
+        heapq.heappush(self._heap, (due, reminder_id))
+        self._scheduled.add(reminder_id)
+        self._wakeup.set()
+
+    def discard(self, reminder_id: int) -> None:
+        """Removes a cancelled reminder from the heap, if it is there.
+
+        Args:
+            reminder_id: The database ID of the reminder.
+        """
+        if reminder_id not in self._scheduled:
+            return
+        self._heap = [entry for entry in self._heap if entry[1] != reminder_id]
+        heapq.heapify(self._heap)
+        self._scheduled.discard(reminder_id)
+
+    async def reload(self) -> None:
+        """Loads pending reminders from the database into the heap."""
+        for reminder in await self._get_pending(db_path=self._db_path):
+            self.add(reminder["id"], reminder["due_at"])
+
+    async def deliver_due(self) -> int:
+        """Delivers every reminder whose due time has passed.
+
+        Returns:
+            The number of reminders popped from the heap.
+        """
+        delivered = 0
+        now = self._clock()
+        while self._heap and self._heap[0][0] <= now:
+            _, reminder_id = heapq.heappop(self._heap)
+            self._scheduled.discard(reminder_id)
+            delivered += 1
+            try:
+                outgoing_id = await self._deliver(reminder_id, db_path=self._db_path)
+            except Exception:
+                logger.exception("Failed to deliver reminder %d", reminder_id)
+                continue
+            if outgoing_id is None:
+                logger.info("[reminders] Reminder %d no longer pending", reminder_id)
+            else:
+                logger.info("[reminders] Delivered reminder %d", reminder_id)
+        return delivered
+
+    async def run(self, *, once: bool = False) -> None:
+        """Runs the scheduler loop.
+
+        Args:
+            once: If True, deliver whatever is due and return (for testing).
+        """
+        logger.info("Reminder scheduler started")
+        last_reload = float("-inf")
+
+        while True:
+            if self._clock() - last_reload >= self._reload_interval:
+                try:
+                    await self.reload()
+                except Exception:
+                    logger.exception("Failed to reload reminders")
+                last_reload = self._clock()
+
+            await self.deliver_due()
+
+            if once:
+                break
+
+            timeout = self._reload_interval
+            if self._heap:
+                timeout = min(timeout, max(0.0, self._heap[0][0] - self._clock()))
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
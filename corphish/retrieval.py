@@ -0,0 +1,211 @@
+"""Local retrieval of relevant past exchanges for incoming messages.
+
+Conversations are reset every ``max_conversation_turns`` turns, after
+which Claude no longer remembers earlier context. Before each message is
+sent to Claude, the processor can look up related exchanges from the
+history with the FTS5 index (BM25 ranking, no network calls) and prepend
+the best ones to the prompt, within a token budget.
+"""
+
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# Default number of past exchanges to inject
+_DEFAULT_TOP_K = 3
+
+# Default token budget for injected history
+_DEFAULT_TOKEN_BUDGET = 800
+
+# Default number of cached retrieval results
+_DEFAULT_CACHE_SIZE = 128
+
+# Candidate messages fetched from the index before de-duplicating exchanges
+_CANDIDATE_FACTOR = 3
+
+# Most distinctive words kept from a message to build the query
+_MAX_QUERY_TERMS = 12
+
+# Rough characters-per-token ratio used to enforce the budget
+_CHARS_PER_TOKEN = 4
+
+_WORD = re.compile(r"[^\W_]{3,}", re.UNICODE)
+
+_STOPWORDS = frozenset(
+    """
+    about above after again against all also and any are aren because been
+    before being below between both but can cannot could did does doing down
+    during each few for from further had has have having her here hers him
+    his how into its itself just let like more most much must myself nor not
+    now off once only other our ours out over own same she should some such
+    than that the their theirs them then there these they this those through
+    too under until very was were what when where which while who whom why
+    will with would you your yours yourself please thanks thank okay yes
+    """.split()
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Returns a rough token count for *text*."""
+    return max(1, len(text) // _CHARS_PER_TOKEN)
+
+
+def extract_terms(text: str) -> list[str]:
+    """Picks the words of a message worth searching for.
+
+    Stopwords and words shorter than three characters are dropped, and of
+    the rest the longest (usually most distinctive) are kept.
+
+    Args:
+        text: The incoming message.
+
+    Returns:
+        Up to _MAX_QUERY_TERMS lower-cased, de-duplicated words.
+    """
+    seen = dict.fromkeys(
+        word for word in (w.lower() for w in _WORD.findall(text)) if word not in _STOPWORDS
+    )
+    return sorted(seen, key=len, reverse=True)[:_MAX_QUERY_TERMS]
+
+
+def _format_exchange(exchange: list[dict], max_chars: int) -> str:
+    """Formats one exchange as labelled lines, truncating long messages."""
+    lines = []
+    for message in exchange:
+        when = datetime.fromisoformat(message["created_at"]).astimezone()
+        who = "user" if message["direction"] == "incoming" else "assistant"
+        text = " ".join(message["text"].split())
+        if len(text) > max_chars:
+            text = text[: max_chars - 1].rstrip() + "…"
+        lines.append(f"[{when:%Y-%m-%d}] {who}: {text}")
+    return "\n".join(lines)
+
+
+class Retriever:
+    """Finds past exchanges related to a message and formats them as context.
+
+    Results are kept in an LRU cache keyed by the query terms and the
+    search horizon, so repeated or near-identical questions skip the
+    database entirely.
+
+    Args:
+        db_path: Path to the database file.
+        top_k: Maximum number of exchanges to return.
+        token_budget: Approximate token limit for the formatted context.
+        cache_size: Number of retrieval results to cache.
+        search_fn: Full-text search function (see db.search_messages).
+        get_exchange_fn: Returns the exchange a message belongs to.
+    """
+
+    def __init__(
+        self,
+        *,
+        db_path: Optional[Path] = None,
+        top_k: int = _DEFAULT_TOP_K,
+        token_budget: int = _DEFAULT_TOKEN_BUDGET,
+        cache_size: int = _DEFAULT_CACHE_SIZE,
+        search_fn: Callable = db.search_messages,
+        get_exchange_fn: Callable = db.get_exchange,
+    ) -> None:
+        self._db_path = db_path
+        self._top_k = top_k
+        self._token_budget = token_budget
+        self._cache_size = cache_size
+        self._search = search_fn
+        self._get_exchange = get_exchange_fn
+        self._cache: OrderedDict[tuple, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def context_for(self, text: str, before_id: Optional[int] = None) -> str:
+        """Returns formatted past exchanges relevant to *text*.
+
+        Args:
+            text: The incoming message.
+            before_id: Only messages with a smaller ID are considered, so
+                the current message and the live session are excluded.
+
+        Returns:
+            The formatted context, or an empty string if nothing relevant
+            was found.
+        """
+        terms = extract_terms(text)
+        if not terms:
+            return ""
+
+        key = (tuple(sorted(terms)), before_id)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return self._cache[key]
+        self.misses += 1
+
+        context = await self._build_context(terms, before_id)
+        self._cache[key] = context
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return context
+
+    async def _build_context(self, terms: list[str], before_id: Optional[int]) -> str:
+        candidates = await self._search(
+            " ".join(terms),
+            limit=self._top_k * _CANDIDATE_FACTOR,
+            db_path=self._db_path,
+            match_any=True,
+            before_id=before_id,
+        )
+
+        budget_chars = self._token_budget * _CHARS_PER_TOKEN
+        per_message_chars = max(80, budget_chars // (2 * self._top_k))
+        seen: set[int] = set()
+        blocks: list[str] = []
+        used = 0
+
+        for candidate in candidates:
+            if len(blocks) >= self._top_k:
+                break
+            if candidate["id"] in seen:
+                continue
+            exchange = await self._get_exchange(candidate["id"], db_path=self._db_path)
+            exchange = [m for m in exchange if before_id is None or m["id"] < before_id]
+            ids = {m["id"] for m in exchange}
+            if not exchange or ids & seen:
+                continue
+            seen |= ids
+
+            block = _format_exchange(exchange, per_message_chars)
+            if used + len(block) > budget_chars:
+                break
+            blocks.append(block)
+            used += len(block)
+
+        return "\n\n".join(blocks)
+
+
+def augment_prompt(text: str, context: str) -> str:
+    """Prepends retrieved history to a user message.
+
+    Args:
+        text: The user's message.
+        context: Formatted past exchanges from Retriever.context_for.
+
+    Returns:
+        The prompt to send to Claude.
+    """
+    if not context:
+        return text
+    return (
+        "<relevant_history>\n"
+        "Earlier exchanges that may be relevant. Use them only if they help; "
+        "do not mention this block.\n\n"
+        f"{context}\n"
+        "</relevant_history>\n\n"
+        f"{text}"
+    )
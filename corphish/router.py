@@ -0,0 +1,128 @@
+"""Cost/latency-aware model routing for incoming user messages.
+
+Classifies each message with cheap local features — length, slash
+commands, code, keywords and recent escalations — and picks the smallest
+model likely to answer it well. No network calls are made.
+"""
+
+import re
+
+# Short acknowledgements that never need more than the smallest model
+_ACKNOWLEDGEMENTS = {
+    "ok",
+    "okay",
+    "k",
+    "kk",
+    "thanks",
+    "thank you",
+    "thx",
+    "ty",
+    "cool",
+    "nice",
+    "great",
+    "got it",
+    "sounds good",
+    "perfect",
+    "yes",
+    "yep",
+    "no",
+    "nope",
+    "sure",
+    "lol",
+    "haha",
+    "good night",
+    "good morning",
+    "👍",
+    "🙏",
+}
+
+# Keywords suggesting deep reasoning that warrants Opus
+_COMPLEX_KEYWORDS = (
+    "analyze",
+    "analyse",
+    "architecture",
+    "design a",
+    "debug",
+    "prove",
+    "step by step",
+    "think hard",
+    "think carefully",
+    "trade-off",
+    "tradeoff",
+    "refactor",
+    "root cause",
+    "in depth",
+    "in-depth",
+)
+
+# Keywords suggesting tool use (files, shell, web) that Haiku handles poorly
+_TOOL_KEYWORDS = (
+    "file",
+    "run ",
+    "install",
+    "script",
+    "search",
+    "look up",
+    "download",
+    "directory",
+    "folder",
+    "bash",
+    "git ",
+    "code",
+)
+
+# Messages longer than this (in characters) are routed to Opus
+_LONG_MESSAGE = 1500
+
+# Messages no longer than this (in characters) may be routed to Haiku
+_SHORT_MESSAGE = 80
+
+# Escalations in the recent window after which routing is bumped one tier
+_ESCALATION_BUMP = 2
+
+_TIERS = ["haiku", "sonnet", "opus"]
+
+_WORD = re.compile(r"[\w']+|[^\w\s]")
+
+
+def _normalise(text: str) -> str:
+    """Lower-cases text and strips surrounding punctuation and whitespace."""
+    return text.lower().strip().strip(".!?,")
+
+
+def route_message(text: str, recent_escalations: int = 0) -> tuple[str, str]:
+    """Picks a model tier for a user message.
+
+    Args:
+        text: The incoming message text.
+        recent_escalations: Number of escalations in the recent window.
+            Frequent escalations bump the chosen tier by one.
+
+    Returns:
+        A (model_name, reason) tuple where model_name is "haiku",
+        "sonnet" or "opus" and reason is a short machine-readable label.
+    """
+    stripped = text.strip()
+    lowered = stripped.lower()
+
+    if _normalise(stripped) in _ACKNOWLEDGEMENTS:
+        return "haiku", "acknowledgement"
+
+    if len(stripped) > _LONG_MESSAGE:
+        tier, reason = "opus", "long_message"
+    elif any(keyword in lowered for keyword in _COMPLEX_KEYWORDS):
+        tier, reason = "opus", "complex_keywords"
+    elif stripped.startswith("/"):
+        tier, reason = "sonnet", "command"
+    elif "```" in stripped or any(keyword in lowered for keyword in _TOOL_KEYWORDS):
+        tier, reason = "sonnet", "tool_keywords"
+    elif len(stripped) <= _SHORT_MESSAGE and len(_WORD.findall(stripped)) <= 16:
+        tier, reason = "haiku", "short_message"
+    else:
+        tier, reason = "sonnet", "default"
+
+    if recent_escalations >= _ESCALATION_BUMP and tier != "opus":
+        tier = _TIERS[_TIERS.index(tier) + 1]
+        reason = f"{reason}+recent_escalations"
+
+    return tier, reason
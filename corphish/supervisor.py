@@ -0,0 +1,174 @@
+"""Runs the daemon's loops as independently restarted OS processes.
+
+``corphish run --supervise`` starts one child process per role (``corphish
+run --role consumer`` and so on). The children share nothing but the
+SQLite database, so a CPU spike in one no longer stalls the others and a
+crash in one only takes that role down until it is restarted.
+
+SIGTERM or SIGINT stops the supervisor: each child is sent SIGTERM so it
+can drain, and killed if it has not exited in time.
+"""
+
+import asyncio
+import logging
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from . import db
+from .daemon import (
+    _RESTART_RESET_AFTER,
+    ROLES,
+    _install_stop_handlers,
+    _restart_delay,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a child to exit after SIGTERM before killing it; longer
+# than the daemon's drain timeout so in-flight work can finish
+_TERMINATE_TIMEOUT = 70.0
+
+
+async def spawn_role(role: str) -> asyncio.subprocess.Process:
+    """Starts ``corphish run --role <role>`` as a child process.
+
+    Args:
+        role: One of daemon.ROLES.
+
+    Returns:
+        The started process.
+    """
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "corphish", "run", "--role", role
+    )
+
+
+async def _stop(process: asyncio.subprocess.Process) -> None:
+    """Terminates a child process, killing it if it does not exit in time."""
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), timeout=_TERMINATE_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+async def supervise_role(
+    role: str,
+    *,
+    spawn_fn: Callable = spawn_role,
+    restart_delay_fn: Callable = _restart_delay,
+    max_restarts: Optional[int] = None,
+) -> None:
+    """Keeps one role's child process running, restarting it when it exits.
+
+    Restarts back off exponentially while the child keeps exiting, and the
+    backoff resets once it has stayed up for a while. Cancelling this
+    coroutine terminates the child.
+
+    Args:
+        role: One of daemon.ROLES.
+        spawn_fn: Async callable(role) that starts the child process.
+        restart_delay_fn: Returns the seconds to wait before a restart,
+            given the consecutive exits so far.
+        max_restarts: Stop after this many restarts (None means never).
+    """
+    restarts = 0
+    failures = 0
+    while True:
+        started = time.monotonic()
+        process = await spawn_fn(role)
+        logger.info("[supervisor] Started %s (pid %s)", role, process.pid)
+        try:
+            code = await process.wait()
+        except asyncio.CancelledError:
+            await _stop(process)
+            raise
+        logger.warning("[supervisor] %s exited with code %s", role, code)
+
+        if max_restarts is not None and restarts >= max_restarts:
+            return
+        restarts += 1
+        if time.monotonic() - started >= _RESTART_RESET_AFTER:
+            failures = 0
+        failures += 1
+        delay = restart_delay_fn(failures)
+        logger.info("[supervisor] Restarting %s in %ds", role, delay)
+        await asyncio.sleep(delay)
+
+
+async def run_supervisor(
+    roles: Iterable[str] = ROLES,
+    *,
+    db_path: Optional[Path] = None,
+    init_db_fn: Callable = db.init_db,
+    spawn_fn: Callable = spawn_role,
+    restart_delay_fn: Callable = _restart_delay,
+    max_restarts: Optional[int] = None,
+    stop_event: Optional[asyncio.Event] = None,
+) -> None:
+    """Runs each role in its own supervised child process.
+
+    The database is initialised once up front so children do not race on
+    schema migrations.
+
+    Args:
+        roles: The roles to run.
+        db_path: Path to the database file.
+        init_db_fn: Initializes the database schema.
+        spawn_fn: Async callable(role) that starts a child process.
+        restart_delay_fn: Returns the seconds to wait before restarting a
+            child, given its consecutive exits so far.
+        max_restarts: Per-role restart limit (None means unlimited).
+        stop_event: Event that stops the children and returns. Defaults to
+            a new event set by SIGTERM/SIGINT.
+    """
+    await init_db_fn(db_path)
+    logger.info("Supervisor started")
+
+    if stop_event is None:
+        stop_event = asyncio.Event()
+        installed_signals = _install_stop_handlers(stop_event)
+    else:
+        installed_signals = []
+
+    tasks = [
+        asyncio.create_task(
+            supervise_role(
+                role,
+                spawn_fn=spawn_fn,
+                restart_delay_fn=restart_delay_fn,
+                max_restarts=max_restarts,
+            )
+        )
+        for role in roles
+    ]
+    stop_waiter = asyncio.create_task(stop_event.wait())
+
+    everything = asyncio.gather(*tasks)
+    # The roles are cancelled on stop; mark that outcome as retrieved
+    everything.add_done_callback(lambda f: f.cancelled() or f.exception())
+    try:
+        await asyncio.wait(
+            [everything, stop_waiter], return_when=asyncio.FIRST_COMPLETED
+        )
+        if everything.done():
+            # Roles only return on their own with a restart limit
+            everything.result()
+            return
+        logger.info("Supervisor stopping, terminating children")
+    finally:
+        stop_waiter.cancel()
+        # Cancelling a role terminates its child, killing it after
+        # _TERMINATE_TIMEOUT
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        loop = asyncio.get_running_loop()
+        for sig in installed_signals:
+            loop.remove_signal_handler(sig)
+    logger.info("Supervisor stopped")
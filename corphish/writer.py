@@ -0,0 +1,281 @@
+"""Single-writer database task with group commit.
+
+Every db write function opens its own connection and commits its own
+transaction, so each one pays for a WAL fsync. Inside the daemon the
+consumer, processor, heartbeat and bus all write through one DbWriter
+instead: writes are queued, and the writer runs everything queued within
+a few milliseconds (or up to a batch limit) in a single transaction, so
+concurrent writes share one commit.
+
+Writes whose result the caller needs (new row IDs, message
+acknowledgements) resolve only after their transaction has committed,
+exactly like the db functions. Bookkeeping writes (recording a reply
+already sent, marking a message sent, usage and heartbeat decision logs)
+return as soon as they are queued and are committed with the next batch;
+the queue is FIFO, so they are always durable before any later awaited
+write returns. A reply streamed to the chat is recorded this way, so its
+parts commit together with the acknowledgement of the message that
+produced them, and the acknowledgement is the one write awaited per
+message.
+"""
+
+import asyncio
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Any, Optional
+
+import aiosqlite
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+# Most writes committed in one transaction
+_MAX_BATCH = 64
+
+# Seconds to wait for more writes after the first one of a batch
+_MAX_DELAY = 0.005
+
+
+class DbWriter:
+    """Serialises database writes through one connection with group commit.
+
+    The insert/mark/log methods have the same signatures as the db
+    functions they replace, so they can be passed as the daemon loops'
+    ``*_fn`` dependencies. Their ``db_path`` argument is ignored: the
+    writer always writes to its own database.
+
+    Args:
+        db_path: Path to the database file. Defaults to get_db_path().
+        max_batch: Most writes committed in one transaction.
+        max_delay: Seconds to wait for more writes after the first one of
+            a batch before committing.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        *,
+        max_batch: int = _MAX_BATCH,
+        max_delay: float = _MAX_DELAY,
+    ) -> None:
+        self._path = db_path or db.get_db_path()
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+        # Number of transactions committed, for measuring the batching
+        self.commits = 0
+
+    async def start(self) -> None:
+        """Opens the connection and starts the writer task."""
+        if self._task is None:
+            # Autocommit mode, so transactions are managed explicitly
+            self._conn = await aiosqlite.connect(self._path, isolation_level=None)
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Commits everything queued, then stops the writer task."""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        await self._conn.close()
+        self._task = None
+        self._conn = None
+
+    def submit_nowait(self, sql: str, params: tuple = ()) -> asyncio.Future:
+        """Queues a statement without waiting for it.
+
+        Args:
+            sql: The statement.
+            params: Its parameters.
+
+        Returns:
+            A future resolved with the statement's lastrowid (None if it
+            changed no rows) once its transaction has committed. Errors
+            are logged.
+        """
+        future = self._enqueue(sql, params)
+        future.add_done_callback(_log_failure)
+        return future
+
+    async def submit(self, sql: str, params: tuple = ()) -> int:
+        """Runs a statement and waits until it has committed.
+
+        Args:
+            sql: The statement.
+            params: Its parameters.
+
+        Returns:
+            The statement's lastrowid, or None if it changed no rows.
+
+        Raises:
+            sqlite3.Error: If the statement or its commit failed.
+        """
+        return await asyncio.shield(self._enqueue(sql, params))
+
+    def _enqueue(self, sql: str, params: tuple) -> asyncio.Future:
+        if self._task is None:
+            raise RuntimeError("DbWriter is not running")
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((sql, params, future))
+        return future
+
+    async def flush(self) -> None:
+        """Waits until every write queued so far has committed."""
+        if self._task is not None:
+            await self.submit("SELECT 1")
+
+    async def _next_batch(self) -> list:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self._max_delay
+        while batch[-1] is not None and len(batch) < self._max_batch:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            writes = [item for item in batch if item is not None]
+            if writes:
+                await self._commit(writes)
+            if len(writes) < len(batch):
+                return
+
+    async def _commit(self, writes: list) -> None:
+        # Each statement runs in its own savepoint, so one failing write
+        # does not take the rest of the batch down with it
+        results: list[Any] = []
+        try:
+            await self._conn.execute("BEGIN IMMEDIATE")
+            for sql, params, _ in writes:
+                await self._conn.execute("SAVEPOINT write")
+                try:
+                    cursor = await self._conn.execute(sql, params)
+                    # An ignored insert leaves lastrowid at a previous row
+                    results.append(cursor.lastrowid if cursor.rowcount else None)
+                except sqlite3.Error as exc:
+                    await self._conn.execute("ROLLBACK TO write")
+                    results.append(exc)
+                await self._conn.execute("RELEASE write")
+            await self._conn.execute("COMMIT")
+            self.commits += 1
+        except sqlite3.Error as exc:
+            logger.exception("[writer] Commit of %d write(s) failed", len(writes))
+            try:
+                await self._conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            results = [exc] * len(writes)
+
+        for (_, _, future), result in zip(writes, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    # --- Drop-in replacements for the db write functions ---
+
+    async def insert_incoming_message(
+        self,
+        text: str,
+        telegram_update_id: int,
+        telegram_message_id: int,
+        db_path: Optional[Path] = None,
+    ) -> int:
+        """Inserts an incoming message (see db.insert_incoming_message)."""
+        return await self.submit(
+            *db.insert_incoming_statement(text, telegram_update_id, telegram_message_id)
+        )
+
+    async def insert_attachment(
+        self,
+        telegram_message_id: int,
+        kind: str,
+        sha256: str,
+        path: str,
+        size: int,
+        mime_type: Optional[str] = None,
+        file_name: Optional[str] = None,
+        db_path: Optional[Path] = None,
+    ) -> int:
+        """Records a message's stored file (see db.insert_attachment)."""
+        return await self.submit(
+            *db.insert_attachment_statement(
+                telegram_message_id, kind, sha256, path, size, mime_type, file_name
+            )
+        )
+
+    async def insert_outgoing_message(
+        self,
+        text: str,
+        db_path: Optional[Path] = None,
+    ) -> int:
+        """Inserts an outgoing message (see db.insert_outgoing_message)."""
+        return await self.submit(*db.insert_outgoing_statement(text))
+
+    async def insert_sent_outgoing_message(
+        self,
+        text: str,
+        telegram_message_id: int,
+        db_path: Optional[Path] = None,
+    ) -> None:
+        """Queues recording an outgoing message already sent; does not wait."""
+        self.submit_nowait(*db.insert_sent_statement(text, telegram_message_id))
+
+    async def mark_message_processed(
+        self,
+        message_id: int,
+        worker_id: str,
+        db_path: Optional[Path] = None,
+    ) -> None:
+        """Acknowledges a message (see db.mark_message_processed)."""
+        await self.submit(*db.mark_processed_statement(message_id, worker_id))
+
+    async def mark_outgoing_message_sent(
+        self,
+        message_id: int,
+        telegram_message_id: int,
+        db_path: Optional[Path] = None,
+    ) -> None:
+        """Queues marking an outgoing message sent; does not wait."""
+        self.submit_nowait(*db.mark_sent_statement(message_id, telegram_message_id))
+
+    async def log_model_usage(
+        self,
+        model: str,
+        source: str,
+        escalated: bool = False,
+        outcome: str = "completed",
+        reason: Optional[str] = None,
+        db_path: Optional[Path] = None,
+    ) -> None:
+        """Queues a model usage record; does not wait."""
+        self.submit_nowait(*db.log_usage_statement(model, source, escalated, outcome, reason))
+
+    async def log_heartbeat_decision(
+        self,
+        decision: str,
+        reason: str,
+        next_interval: int,
+        db_path: Optional[Path] = None,
+    ) -> None:
+        """Queues a heartbeat decision record; does not wait."""
+        self.submit_nowait(*db.log_decision_statement(decision, reason, next_interval))
+
+
+def _log_failure(future: asyncio.Future) -> None:
+    """Logs the error of a write nobody may be waiting for."""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("[writer] Write failed: %s", future.exception())
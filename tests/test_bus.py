@@ -0,0 +1,94 @@
+"""Tests for corphish.bus."""
+
+import asyncio
+import json
+
+import aiosqlite
+import pytest
+
+from corphish import bus
+from corphish.db import init_db, insert_incoming_message, insert_outgoing_message
+
+
+@pytest.fixture
+async def temp_db(tmp_path):
+    """Creates a temporary database for testing."""
+    db_path = tmp_path / "test.db"
+    await init_db(db_path)
+    return db_path
+
+
+def test_get_socket_path_sits_next_to_database(tmp_path):
+    assert bus.get_socket_path(tmp_path / "corphish.db") == tmp_path / "corphish.sock"
+
+
+async def test_watcher_detects_commit_from_other_connection(temp_db):
+    """wait() returns after another connection commits."""
+    watcher = bus.DataVersionWatcher(temp_db, interval=0.01)
+    await watcher.open()
+    try:
+        waiter = asyncio.create_task(watcher.wait())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+
+        await insert_outgoing_message("hi", db_path=temp_db)
+        await asyncio.wait_for(waiter, timeout=1)
+    finally:
+        await watcher.close()
+
+
+async def _start_server(temp_db):
+    server = bus.BusServer(
+        db_path=temp_db,
+        watcher_factory=lambda path: bus.DataVersionWatcher(path, interval=0.01),
+    )
+    task = asyncio.create_task(server.run())
+    for _ in range(100):
+        if bus.get_socket_path(temp_db).exists():
+            break
+        await asyncio.sleep(0.01)
+    return server, task
+
+
+async def test_server_pushes_new_outgoing_messages(temp_db):
+    """Connected clients receive outgoing messages as they are committed."""
+    await insert_outgoing_message("old", db_path=temp_db)
+    server, task = await _start_server(temp_db)
+    try:
+        reader, writer = await bus.connect(temp_db)
+        msg_id = await insert_outgoing_message("fresh", db_path=temp_db)
+
+        line = await asyncio.wait_for(reader.readline(), timeout=1)
+
+        assert json.loads(line) == {"type": "outgoing", "id": msg_id, "text": "fresh"}
+        writer.close()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert not bus.get_socket_path(temp_db).exists()
+
+
+async def test_server_inserts_client_input_and_wakes(temp_db):
+    """Incoming text from a client is stored and wakes the processor."""
+    server, task = await _start_server(temp_db)
+    try:
+        _, writer = await bus.connect(temp_db)
+        writer.write(bus.encode({"type": "incoming", "text": "from the cli"}))
+        await writer.drain()
+
+        await asyncio.wait_for(server.wake.wait(), timeout=1)
+        writer.close()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async with aiosqlite.connect(temp_db) as conn:
+        cursor = await conn.execute(
+            "SELECT text FROM messages WHERE direction = 'incoming'"
+        )
+        assert await cursor.fetchall() == [("from the cli",)]
+
+
+async def test_connect_returns_none_without_daemon(tmp_path):
+    assert await bus.connect(tmp_path / "test.db") is None
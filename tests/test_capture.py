@@ -0,0 +1,157 @@
+"""Tests for corphish.capture."""
+
+import asyncio
+import os
+import stat
+
+import pytest
+from claude_agent_sdk import AssistantMessage, ClaudeAgentOptions, ResultMessage, TextBlock
+
+from corphish import capture
+from corphish.capture import CaptureRecorder, capture_files
+from corphish.claude_client import ClaudeClient
+from corphish.fake_claude import FakeBackendError, FakeClaudeBackend, read_streams
+
+
+def _text(text):
+    return AssistantMessage(content=[TextBlock(text=text)], model="m")
+
+
+def _result():
+    return ResultMessage(
+        subtype="success",
+        duration_ms=0,
+        duration_api_ms=0,
+        is_error=False,
+        num_turns=1,
+        session_id="s",
+    )
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def _scripted_query(clock, steps, error=None):
+    """Yields (advance, message) steps, moving the clock before each one."""
+
+    async def query(*, prompt, options=None):
+        for advance, message in steps:
+            clock.now += advance
+            yield message
+        if error is not None:
+            raise error
+
+    return query
+
+
+async def _drain(query_fn, clock=None, pause=0.0):
+    messages = []
+    async for message in query_fn(prompt="hi", options=None):
+        messages.append(message)
+        if clock is not None:
+            clock.now += pause
+    return messages
+
+
+async def test_records_messages_with_sdk_offsets(tmp_path):
+    clock = _Clock()
+    recorder = CaptureRecorder(tmp_path, clock=clock)
+    query = recorder.wrap(_scripted_query(clock, [(1.5, _text("a")), (0.5, _result())]))
+
+    # The caller spends 3s on each message; that is not SDK latency
+    messages = await _drain(query, clock, pause=3.0)
+    recorder.close()
+
+    assert [type(m) for m in messages] == [AssistantMessage, ResultMessage]
+    [stream] = read_streams(capture_files(tmp_path))
+    assert [t for t, _ in stream] == [1.5, 2.0]
+    assert stream[0][1].content[0].text == "a"
+    assert stat.S_IMODE(os.stat(recorder.path).st_mode) == 0o600
+
+
+async def test_records_errors_and_cancellation(tmp_path):
+    clock = _Clock()
+    recorder = CaptureRecorder(tmp_path, clock=clock)
+
+    failing = recorder.wrap(_scripted_query(clock, [(1.0, _text("a"))], RuntimeError("boom")))
+    with pytest.raises(RuntimeError):
+        await _drain(failing)
+    cancelled = recorder.wrap(
+        _scripted_query(clock, [(1.0, _text("b"))], asyncio.CancelledError())
+    )
+    with pytest.raises(asyncio.CancelledError):
+        await _drain(cancelled)
+    recorder.close()
+
+    backend = FakeClaudeBackend.from_capture(capture_files(tmp_path), speed=0)
+    with pytest.raises(FakeBackendError, match="RuntimeError: boom"):
+        await _drain(backend.query)
+    with pytest.raises(asyncio.CancelledError):
+        await _drain(backend.query)
+    assert (backend.failures, backend.cancellations) == (1, 1)
+
+
+async def test_rotates_between_streams_and_keeps_backups(tmp_path):
+    recorder = CaptureRecorder(tmp_path, max_bytes=1, backups=2)
+    for text in ("one", "two", "three", "four"):
+        await _drain(recorder.wrap(_scripted_query(_Clock(), [(0, _text(text))])))
+    recorder.close()
+
+    files = capture_files(tmp_path)
+    assert [f.name for f in files] == ["capture.jsonl.2", "capture.jsonl.1", "capture.jsonl"]
+    streams = read_streams(files)
+    assert [s[0][1].content[0].text for s in streams] == ["two", "three", "four"]
+
+
+async def test_recording_failure_does_not_break_query(tmp_path):
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    recorder = CaptureRecorder(blocker / "captures")
+
+    messages = await _drain(recorder.wrap(_scripted_query(_Clock(), [(0, _text("a"))])))
+
+    assert len(messages) == 1
+
+
+async def test_client_replays_capture_with_scaled_timing(tmp_path):
+    clock = _Clock()
+    recorder = CaptureRecorder(tmp_path, clock=clock)
+    recording = ClaudeClient(
+        options=ClaudeAgentOptions(system_prompt="test"),
+        query_fn=_scripted_query(clock, [(2.0, _text("Recorded reply")), (0, _result())]),
+        recorder=recorder,
+    )
+    assert await recording.send("hi") == "Recorded reply"
+    recorder.close()
+
+    delays = []
+
+    async def sleep(seconds):
+        delays.append(seconds)
+
+    backend = FakeClaudeBackend.from_capture(capture_files(tmp_path), speed=4, sleep_fn=sleep)
+    replaying = ClaudeClient(
+        options=ClaudeAgentOptions(system_prompt="test"), query_fn=backend.query
+    )
+    assert await replaying.send("anything") == "Recorded reply"
+    assert delays == [0.5]
+
+
+def test_capture_files_accepts_a_single_file(tmp_path):
+    path = tmp_path / "one.jsonl"
+    assert capture_files(path) == [path]
+
+
+def test_recorder_from_config(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert capture.recorder_from_config() is None
+
+    (tmp_path / "corphish").mkdir()
+    (tmp_path / "corphish" / "config.toml").write_text("capture = true\ncapture_backups = 1\n")
+    recorder = capture.recorder_from_config()
+    assert recorder.path == tmp_path / "corphish" / "captures" / "capture.jsonl"
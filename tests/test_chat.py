@@ -3,8 +3,9 @@
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
+from telegram.error import BadRequest
 
-from corphish.chat import build_bot, get_bot_token, send_message
+from corphish.chat import build_bot, edit_message, get_bot_token, send_message, send_typing
 
 
 def test_get_bot_token_returns_token(monkeypatch):
@@ -40,6 +41,33 @@ async def test_send_message_calls_bot(monkeypatch):
     assert result is mock_bot.send_message.return_value
 
 
+async def test_send_typing_sends_chat_action():
+    mock_bot = MagicMock()
+    mock_bot.send_chat_action = AsyncMock()
+    await send_typing(mock_bot, chat_id=42)
+    mock_bot.send_chat_action.assert_awaited_once_with(chat_id=42, action="typing")
+
+
+async def test_send_message_sends_html():
+    mock_bot = MagicMock()
+    mock_bot.send_message = AsyncMock(return_value=MagicMock())
+    await send_message(mock_bot, chat_id=42, text="**hi**", html="<b>hi</b>")
+    mock_bot.send_message.assert_awaited_once_with(
+        chat_id=42, text="<b>hi</b>", parse_mode="HTML"
+    )
+
+
+async def test_send_message_falls_back_to_plain_text():
+    mock_bot = MagicMock()
+    plain_message = MagicMock()
+    mock_bot.send_message = AsyncMock(
+        side_effect=[BadRequest("Can't parse entities"), plain_message]
+    )
+    result = await send_message(mock_bot, chat_id=42, text="**hi**", html="<b>hi")
+    mock_bot.send_message.assert_awaited_with(chat_id=42, text="**hi**")
+    assert result is plain_message
+
+
 async def test_send_message_empty_text_raises():
     mock_bot = MagicMock()
     with pytest.raises(ValueError, match="text must not be empty"):
@@ -52,3 +80,48 @@ async def test_send_message_does_not_call_bot_on_empty_text():
     with pytest.raises(ValueError):
         await send_message(mock_bot, chat_id=42, text="")
     mock_bot.send_message.assert_not_awaited()
+
+
+async def test_edit_message_calls_bot():
+    mock_bot = MagicMock()
+    mock_bot.edit_message_text = AsyncMock()
+    await edit_message(mock_bot, chat_id=42, message_id=7, text="updated")
+    mock_bot.edit_message_text.assert_awaited_once_with(
+        text="updated", chat_id=42, message_id=7
+    )
+
+
+async def test_edit_message_sends_html():
+    mock_bot = MagicMock()
+    mock_bot.edit_message_text = AsyncMock()
+    await edit_message(mock_bot, chat_id=42, message_id=7, text="**hi**", html="<b>hi</b>")
+    mock_bot.edit_message_text.assert_awaited_once_with(
+        text="<b>hi</b>", chat_id=42, message_id=7, parse_mode="HTML"
+    )
+
+
+async def test_edit_message_falls_back_to_plain_text():
+    mock_bot = MagicMock()
+    mock_bot.edit_message_text = AsyncMock(
+        side_effect=[BadRequest("Can't parse entities"), None]
+    )
+    await edit_message(mock_bot, chat_id=42, message_id=7, text="**hi**", html="<b>hi")
+    mock_bot.edit_message_text.assert_awaited_with(text="**hi**", chat_id=42, message_id=7)
+
+
+async def test_edit_message_fallback_tolerates_unchanged_text():
+    """The plain text may already be what the message shows."""
+    mock_bot = MagicMock()
+    mock_bot.edit_message_text = AsyncMock(
+        side_effect=[BadRequest("Can't parse entities"), BadRequest("Message is not modified")]
+    )
+    await edit_message(mock_bot, chat_id=42, message_id=7, text="**hi**", html="<b>hi")
+    assert mock_bot.edit_message_text.await_count == 2
+
+
+async def test_edit_message_empty_text_raises():
+    mock_bot = MagicMock()
+    mock_bot.edit_message_text = AsyncMock()
+    with pytest.raises(ValueError, match="text must not be empty"):
+        await edit_message(mock_bot, chat_id=42, message_id=7, text="")
+    mock_bot.edit_message_text.assert_not_awaited()
@@ -6,6 +6,11 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from corphish.claude_client import (
+    MODEL_HAIKU,
+    MODEL_OPUS,
+    MODEL_SONNET,
+    ApiUnavailableError,
+    CircuitBreaker,
     ClaudeClient,
     _build_heartbeat_options,
     _build_options,
@@ -631,6 +636,154 @@ async def test_stream_exhausts_generator():
     assert consumed == ["AssistantMessage", "ResultMessage", "AssistantMessage"]
 
 
+async def test_stream_model_override_applies_to_one_turn():
+    """stream(model=...) uses the given model without changing the default."""
+    from claude_agent_sdk import ClaudeAgentOptions
+
+    seen_models = []
+
+    async def capturing_query(*, prompt, options):
+        seen_models.append(options.model)
+        return
+        yield
+
+    client = _make_client(
+        query_fn=capturing_query,
+        options=ClaudeAgentOptions(system_prompt="test", model="default-model"),
+    )
+    _ = [c async for c in client.stream("hi", model="other-model")]
+    _ = [c async for c in client.stream("hi")]
+
+    assert seen_models == ["other-model", "default-model"]
+
+
+async def test_stream_fork_can_be_rewound():
+    """A forked turn leaves the session alone and rewind() resumes it."""
+    from claude_agent_sdk import ClaudeAgentOptions, ResultMessage
+
+    seen = []
+    session_ids = iter(["main", "fork", "main", "main"])
+
+    async def capturing_query(*, prompt, options):
+        seen.append((options.continue_conversation, options.resume, options.fork_session))
+        yield ResultMessage(
+            subtype="success",
+            duration_ms=100,
+            duration_api_ms=80,
+            is_error=False,
+            num_turns=1,
+            session_id=next(session_ids),
+        )
+
+    client = _make_client(
+        query_fn=capturing_query,
+        options=ClaudeAgentOptions(system_prompt="test", continue_conversation=True),
+    )
+    _ = [c async for c in client.stream("first")]
+    assert client.session_id == "main"
+
+    _ = [c async for c in client.stream("maybe", fork=True)]
+    assert client.session_id == "fork"
+
+    client.rewind("main")
+    _ = [c async for c in client.stream("retry")]
+    _ = [c async for c in client.stream("next")]
+
+    assert seen == [
+        (True, None, False),
+        (True, None, True),
+        (False, "main", False),
+        (True, None, False),
+    ]
+    assert client.session_id == "main"
+
+
+# ---------------------------------------------------------------------------
+# stream_partial() tests
+# ---------------------------------------------------------------------------
+
+
+def _stream_event(event, parent_tool_use_id=None):
+    from claude_agent_sdk import StreamEvent
+
+    return StreamEvent(
+        uuid="u", session_id="s1", event=event, parent_tool_use_id=parent_tool_use_id
+    )
+
+
+def _text_delta(text, **kwargs):
+    return _stream_event(
+        {"type": "content_block_delta", "index": 0,
+         "delta": {"type": "text_delta", "text": text}},
+        **kwargs,
+    )
+
+
+async def test_stream_partial_yields_deltas_then_message():
+    """stream_partial() yields text deltas followed by the full message."""
+    from claude_agent_sdk import AssistantMessage, ResultMessage, TextBlock
+
+    messages = [
+        _stream_event({"type": "content_block_start", "index": 0,
+                       "content_block": {"type": "text", "text": ""}}),
+        _text_delta("Hel"),
+        _text_delta("lo"),
+        AssistantMessage(content=[TextBlock(text="Hello")], model="test"),
+        ResultMessage(
+            subtype="success",
+            duration_ms=100,
+            duration_api_ms=80,
+            is_error=False,
+            num_turns=1,
+            session_id="s1",
+        ),
+    ]
+    client = _make_client(query_fn=_make_query_fn(messages))
+    events = [e async for e in client.stream_partial("hi")]
+    assert events == [("delta", "Hel"), ("delta", "lo"), ("message", "Hello")]
+
+
+async def test_stream_partial_enables_partial_messages():
+    """stream_partial() requests partial messages from the SDK."""
+    seen = []
+
+    async def capturing_query(*, prompt, options):
+        seen.append((options.include_partial_messages, options.model))
+        return
+        yield
+
+    client = _make_client(query_fn=capturing_query)
+    _ = [e async for e in client.stream_partial("hi", model="m")]
+    assert seen == [(True, "m")]
+    assert client._options.include_partial_messages is False
+
+
+async def test_stream_partial_ignores_subagent_and_tool_deltas():
+    """Deltas from sub-agents and non-text deltas are not yielded."""
+    messages = [
+        _text_delta("sub", parent_tool_use_id="tool_1"),
+        _stream_event({"type": "content_block_delta", "index": 0,
+                       "delta": {"type": "input_json_delta", "partial_json": "{"}}),
+        _text_delta("main"),
+    ]
+    client = _make_client(query_fn=_make_query_fn(messages))
+    events = [e async for e in client.stream_partial("hi")]
+    assert events == [("delta", "main")]
+
+
+async def test_stream_partial_marks_new_text_blocks():
+    """A second text block in the same message yields a break."""
+    messages = [
+        _text_delta("one"),
+        _stream_event({"type": "content_block_start", "index": 1,
+                       "content_block": {"type": "text", "text": ""}}),
+        _text_delta("two"),
+    ]
+    client = _make_client(query_fn=_make_query_fn(messages))
+    events = [e async for e in client.stream_partial("hi")]
+    assert events == [("delta", "one"), ("break", ""), ("delta", "two")]
+
+
 # ---------------------------------------------------------------------------
 # reset() tests
 # ---------------------------------------------------------------------------
@@ -791,3 +944,177 @@ async def test_send_heartbeat_does_not_affect_main_conversation():
 
     assert client._options is original_opts
     assert client._options.continue_conversation is True
+
+
+async def test_stream_records_activity_and_closes_query_early():
+    """Stopping a stream early closes the SDK query in the same task."""
+    from claude_agent_sdk import AssistantMessage, TextBlock
+
+    closed = []
+
+    async def query_fn(*, prompt, options):
+        try:
+            yield AssistantMessage(content=[TextBlock(text="one")], model="test")
+            yield AssistantMessage(content=[TextBlock(text="two")], model="test")
+        finally:
+            closed.append(True)
+
+    client = _make_client(query_fn=query_fn)
+    before = client.last_activity
+    stream = client.stream("hi")
+
+    assert await stream.__anext__() == "one"
+    assert client.last_activity >= before
+    await stream.aclose()
+
+    assert closed == [True]
+
+
+async def test_heartbeat_activity_is_tracked_apart_from_conversation():
+    """A heartbeat's progress does not count as conversation activity."""
+    from claude_agent_sdk import AssistantMessage, TextBlock
+
+    async def query_fn(*, prompt, options):
+        yield AssistantMessage(content=[TextBlock(text="ok")], model="test")
+
+    client = _make_client(query_fn=query_fn)
+    client.last_activity = client.last_heartbeat_activity = 0.0
+
+    await client.send_heartbeat("beat", "claude-haiku")
+    assert client.last_activity == 0.0
+    assert client.last_heartbeat_activity > 0.0
+
+    client.last_heartbeat_activity = 0.0
+    assert [chunk async for chunk in client.stream("hi")] == ["ok"]
+    assert client.last_activity > 0.0
+    assert client.last_heartbeat_activity == 0.0
+
+
+# ---------------------------------------------------------------------------
+# Circuit breaker tests
+# ---------------------------------------------------------------------------
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_on_failure_rate_and_probes_after_cooldown():
+    clock = _Clock()
+    breaker = CircuitBreaker(min_failures=3, failure_rate=0.5, cooldown=30, clock=clock)
+    breaker.record_success("m")
+    for _ in range(2):
+        breaker.record_failure("m")
+    assert breaker.state("m") == "closed"
+
+    breaker.record_failure("m")
+    assert breaker.state("m") == "open"
+    assert not breaker.allow("m")
+    assert breaker.retry_after("m") == 30
+
+    clock.now += 30
+    assert breaker.allow("m")
+    assert breaker.state("m") == "half_open"
+    assert not breaker.allow("m")  # only one probe at a time
+
+    breaker.record_success("m")
+    assert breaker.state("m") == "closed"
+    assert breaker.allow("m")
+
+
+def test_breaker_backs_off_after_failed_probes():
+    clock = _Clock()
+    breaker = CircuitBreaker(min_failures=1, cooldown=10, max_cooldown=25, clock=clock)
+    breaker.record_failure("m")
+
+    for expected in (20, 25, 25):
+        clock.now += breaker.retry_after("m")
+        assert breaker.allow("m")
+        breaker.record_failure("m")
+        assert breaker.retry_after("m") == expected
+
+
+def test_breaker_release_returns_probe():
+    clock = _Clock()
+    breaker = CircuitBreaker(min_failures=1, cooldown=10, clock=clock)
+    breaker.record_failure("m")
+    clock.now += 10
+    assert breaker.allow("m")
+
+    breaker.release("m")
+
+    assert breaker.allow("m")
+
+
+def _api_error_result(status=529):
+    from claude_agent_sdk import ResultMessage
+
+    return ResultMessage(
+        subtype="success",
+        duration_ms=0,
+        duration_api_ms=0,
+        is_error=True,
+        num_turns=1,
+        session_id="s1",
+        result="API Error: overloaded",
+        api_error_status=status,
+    )
+
+
+async def test_api_failure_raises_and_is_not_delivered():
+    from claude_agent_sdk import AssistantMessage, TextBlock
+
+    messages = [
+        AssistantMessage(
+            content=[TextBlock(text="API Error: 529 overloaded")], model="m", error="server_error"
+        ),
+        _api_error_result(),
+    ]
+    breaker = CircuitBreaker(min_failures=1)
+    client = _make_client(query_fn=_make_query_fn(messages), breaker=breaker)
+
+    chunks = []
+    with pytest.raises(ApiUnavailableError, match="server_error"):
+        async for chunk in client.stream("hi", model=MODEL_SONNET):
+            chunks.append(chunk)
+
+    assert chunks == []
+    assert breaker.state(MODEL_SONNET) == "open"
+
+
+async def test_request_errors_do_not_trip_breaker():
+    breaker = CircuitBreaker(min_failures=1)
+    messages = [_api_error_result(status=400)]
+    client = _make_client(query_fn=_make_query_fn(messages), breaker=breaker)
+
+    await client.send("hi")
+
+    assert breaker.state(MODEL_SONNET) == "closed"
+
+
+async def test_open_circuit_falls_back_to_smaller_model():
+    clock = _Clock()
+    breaker = CircuitBreaker(min_failures=1, cooldown=30, clock=clock)
+    breaker.record_failure(MODEL_OPUS)
+    breaker.record_failure(MODEL_SONNET)
+    models = []
+
+    async def query_fn(*, prompt, options):
+        models.append(options.model)
+        return
+        yield
+
+    client = _make_client(query_fn=query_fn, breaker=breaker)
+    await client.send_with_model("hi", MODEL_OPUS)
+    assert models == [MODEL_HAIKU]
+
+    breaker.record_failure(MODEL_HAIKU)
+    clock.now += 10
+    with pytest.raises(ApiUnavailableError) as excinfo:
+        await client.send_with_model("hi", MODEL_OPUS)
+    assert excinfo.value.retry_after == 20
+    assert models == [MODEL_HAIKU]
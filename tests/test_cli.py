@@ -8,11 +8,18 @@ import pytest
 
 from corphish.cli import (
     build_parser,
+    cmd_ctl,
+    cmd_dead_letters,
+    cmd_export,
     cmd_join,
+    cmd_outbox,
+    cmd_remind,
+    cmd_search,
     cmd_run_once,
     cmd_send,
     cmd_skip_updates,
     cmd_status,
+    cmd_usage,
     dispatch,
 )
 
@@ -25,6 +32,18 @@ class TestBuildParser:
         parser = build_parser()
         args = parser.parse_args(["run"])
         assert args.command == "run"
+        assert args.role == "all"
+        assert args.supervise is False
+
+    def test_run_command_role(self):
+        parser = build_parser()
+        args = parser.parse_args(["run", "--role", "consumer"])
+        assert args.role == "consumer"
+
+    def test_run_command_rejects_unknown_role(self):
+        parser = build_parser()
+        with pytest.raises(SystemExit):
+            parser.parse_args(["run", "--role", "janitor"])
 
     def test_bootstrap_command(self):
         parser = build_parser()
@@ -295,6 +314,36 @@ class TestDispatch:
             mock_daemon.assert_awaited_once()
             mock_boot.assert_not_awaited()
 
+    async def test_dispatch_run_role(self):
+        parser = build_parser()
+        args = parser.parse_args(["run", "--role", "heartbeat"])
+
+        with (
+            patch("corphish.cli.config") as mock_config,
+            patch("corphish.cli.run_daemon", new_callable=AsyncMock) as mock_daemon,
+        ):
+            mock_config.is_first_run.return_value = False
+            await dispatch(args)
+            mock_daemon.assert_awaited_once_with(role="heartbeat")
+
+    async def test_dispatch_run_supervise(self):
+        parser = build_parser()
+        args = parser.parse_args(["run", "--supervise"])
+
+        with (
+            patch("corphish.cli.config") as mock_config,
+            patch("corphish.cli.run_daemon", new_callable=AsyncMock) as mock_daemon,
+            patch(
+                "corphish.cli.run_supervisor", new_callable=AsyncMock
+            ) as mock_supervisor,
+        ):
+            mock_config.is_first_run.return_value = False
+            await dispatch(args)
+            mock_supervisor.assert_awaited_once_with(
+                ("consumer", "processor", "heartbeat")
+            )
+            mock_daemon.assert_not_awaited()
+
     async def test_dispatch_default_no_command(self):
         parser = build_parser()
         args = parser.parse_args([])
@@ -409,6 +458,26 @@ class TestCmdSkipUpdates:
 # --- cmd_join tests ---
 
 
+class _FakeWatcher:
+    """Stands in for bus.DataVersionWatcher; every wait sees a change."""
+
+    instances = []
+
+    def __init__(self, db_path, interval):
+        self.waits = 0
+        self.closed = False
+        _FakeWatcher.instances.append(self)
+
+    async def open(self):
+        pass
+
+    async def wait(self):
+        self.waits += 1
+
+    async def close(self):
+        self.closed = True
+
+
 class TestCmdJoin:
     async def test_join_inserts_user_input(self):
         """cmd_join inserts lines from stdin as incoming messages."""
@@ -423,6 +492,8 @@ class TestCmdJoin:
             insert_incoming_fn=insert_fn,
             read_line_fn=lambda: next(lines),
             poll_interval=0,
+            connect_fn=AsyncMock(return_value=None),
+            watcher_factory=_FakeWatcher,
         )
 
         insert_fn.assert_awaited_once_with(
@@ -445,6 +516,8 @@ class TestCmdJoin:
             insert_incoming_fn=insert_fn,
             read_line_fn=lambda: next(lines),
             poll_interval=0,
+            connect_fn=AsyncMock(return_value=None),
+            watcher_factory=_FakeWatcher,
         )
 
         insert_fn.assert_not_awaited()
@@ -468,6 +541,8 @@ class TestCmdJoin:
             insert_incoming_fn=AsyncMock(),
             read_line_fn=lambda: "",
             poll_interval=0,
+            connect_fn=AsyncMock(return_value=None),
+            watcher_factory=_FakeWatcher,
         )
 
         captured = capsys.readouterr()
@@ -494,6 +569,8 @@ class TestCmdJoin:
             insert_incoming_fn=AsyncMock(),
             read_line_fn=lambda: "",
             poll_interval=0,
+            connect_fn=AsyncMock(return_value=None),
+            watcher_factory=_FakeWatcher,
         )
 
         assert poll_calls[0] == 3
@@ -511,7 +588,457 @@ class TestCmdJoin:
             insert_incoming_fn=AsyncMock(),
             read_line_fn=lambda: "",
             poll_interval=0,
+            connect_fn=AsyncMock(return_value=None),
+            watcher_factory=_FakeWatcher,
         )
 
         init_fn.assert_awaited_once_with(None)
 
+
+    async def test_join_uses_daemon_socket(self, capsys):
+        """cmd_join sends input over the socket and prints pushed messages."""
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'{"type": "outgoing", "id": 7, "text": "Pushed reply"}\n')
+        writer = MagicMock()
+        # The daemon goes away once it has received the input
+        writer.drain = AsyncMock(side_effect=lambda: reader.feed_eof())
+        insert_fn = AsyncMock()
+        lines = iter(["hello\n", ""])
+        after_ids = []
+
+        async def fake_get_outgoing(after_id, db_path):
+            after_ids.append(after_id)
+            raise asyncio.CancelledError()
+
+        await cmd_join(
+            db_path=None,
+            init_db_fn=AsyncMock(),
+            get_latest_outgoing_id_fn=AsyncMock(return_value=3),
+            get_outgoing_after_fn=fake_get_outgoing,
+            insert_incoming_fn=insert_fn,
+            read_line_fn=lambda: next(lines),
+            connect_fn=AsyncMock(return_value=(reader, writer)),
+            watcher_factory=_FakeWatcher,
+        )
+
+        assert "Pushed reply" in capsys.readouterr().out
+        writer.write.assert_called_once_with(b'{"type": "incoming", "text": "hello"}\n')
+        insert_fn.assert_not_awaited()
+        # After the daemon closed the socket, cmd_join followed the database
+        assert after_ids == [7]
+
+
+# --- cmd_search tests ---
+
+
+class TestCmdSearch:
+    def test_search_parser(self):
+        parser = build_parser()
+        args = parser.parse_args(["search", "capital", "france", "--limit", "5"])
+        assert args.command == "search"
+        assert args.query == ["capital", "france"]
+        assert args.limit == 5
+        assert args.since is None
+
+    async def test_search_formats_results(self):
+        search_fn = AsyncMock(
+            return_value=[
+                {
+                    "id": 1,
+                    "direction": "outgoing",
+                    "created_at": "2024-06-01T09:00:00+00:00",
+                    "snippet": "[Paris] is the\ncapital",
+                    "rank": -1.5,
+                }
+            ]
+        )
+
+        lines = await cmd_search("paris", init_db_fn=AsyncMock(), search_fn=search_fn)
+
+        assert len(lines) == 1
+        assert lines[0].endswith("corphish: [Paris] is the capital")
+
+    async def test_search_converts_since_to_utc(self):
+        search_fn = AsyncMock(return_value=[])
+
+        await cmd_search(
+            "x",
+            since="2024-06-01T00:00:00+02:00",
+            limit=3,
+            init_db_fn=AsyncMock(),
+            search_fn=search_fn,
+        )
+
+        search_fn.assert_awaited_once_with(
+            "x", limit=3, since="2024-05-31T22:00:00+00:00", db_path=None
+        )
+
+    async def test_search_rejects_bad_since(self):
+        with pytest.raises(SystemExit):
+            await cmd_search("x", since="last tuesday", init_db_fn=AsyncMock())
+
+
+# --- cmd_export tests ---
+
+
+class TestCmdExport:
+    def test_export_parser_defaults(self):
+        parser = build_parser()
+        args = parser.parse_args(["export"])
+        assert args.command == "export"
+        assert args.output == "-"
+        assert args.format is None
+        assert args.since_id == 0
+        assert args.batch_size == 1000
+
+    async def test_export_jsonl_to_stdout(self):
+        out = MagicMock()
+        export_jsonl = AsyncMock(return_value=4)
+
+        count = await cmd_export(
+            since_id=7,
+            init_db_fn=AsyncMock(),
+            export_jsonl_fn=export_jsonl,
+            stdout=out,
+        )
+
+        assert count == 4
+        export_jsonl.assert_awaited_once_with(out, since_id=7, batch_size=1000, db_path=None)
+
+    async def test_export_infers_parquet_from_suffix(self, tmp_path):
+        export_parquet = AsyncMock(return_value=2)
+        target = tmp_path / "history.parquet"
+
+        count = await cmd_export(
+            str(target), init_db_fn=AsyncMock(), export_parquet_fn=export_parquet
+        )
+
+        assert count == 2
+        export_parquet.assert_awaited_once_with(
+            target, since_id=0, batch_size=1000, db_path=None
+        )
+
+    async def test_export_parquet_requires_file(self):
+        with pytest.raises(SystemExit):
+            await cmd_export(fmt="parquet", init_db_fn=AsyncMock())
+
+    async def test_export_parquet_without_pyarrow_exits(self, tmp_path):
+        export_parquet = AsyncMock(side_effect=RuntimeError("needs pyarrow"))
+        with pytest.raises(SystemExit):
+            await cmd_export(
+                str(tmp_path / "h.parquet"),
+                init_db_fn=AsyncMock(),
+                export_parquet_fn=export_parquet,
+            )
+
+
+# --- cmd_usage tests ---
+
+
+class TestCmdUsage:
+    def test_usage_parser(self):
+        parser = build_parser()
+        args = parser.parse_args(["usage", "--by", "hour", "--since", "2024-06-01"])
+        assert args.command == "usage"
+        assert args.by == "hour"
+        assert args.since == "2024-06-01"
+        assert args.until is None
+
+    async def test_usage_formats_buckets_and_totals(self):
+        timeseries = AsyncMock(
+            return_value=[
+                {
+                    "bucket": "2024-06-01T00:00:00+00:00",
+                    "model": "claude-haiku",
+                    "source": "heartbeat",
+                    "count": 10,
+                    "escalated_count": 2,
+                    "cancelled_count": 0,
+                },
+                {
+                    "bucket": "2024-06-02T00:00:00+00:00",
+                    "model": "claude-haiku",
+                    "source": "processor",
+                    "count": 5,
+                    "escalated_count": 0,
+                    "cancelled_count": 0,
+                },
+            ]
+        )
+
+        lines = await cmd_usage(init_db_fn=AsyncMock(), get_usage_timeseries_fn=timeseries)
+
+        assert lines[0].startswith("2024-06-01  claude-haiku")
+        assert lines[0].endswith("10  (2 escalated)")
+        assert lines[1].startswith("2024-06-02")
+        assert lines[-1].split() == ["total", "claude-haiku", "15"]
+
+    async def test_usage_converts_range_to_utc(self):
+        timeseries = AsyncMock(return_value=[])
+
+        lines = await cmd_usage(
+            by="hour",
+            since="2024-06-01T00:00:00+02:00",
+            until="2024-06-02T00:00:00+00:00",
+            init_db_fn=AsyncMock(),
+            get_usage_timeseries_fn=timeseries,
+        )
+
+        assert lines == []
+        timeseries.assert_awaited_once_with(
+            "hour",
+            since="2024-05-31T22:00:00+00:00",
+            until="2024-06-02T00:00:00+00:00",
+            db_path=None,
+        )
+
+    async def test_usage_rejects_bad_until(self):
+        with pytest.raises(SystemExit):
+            await cmd_usage(until="soon", init_db_fn=AsyncMock())
+
+
+# --- cmd_outbox tests ---
+
+
+class TestCmdOutbox:
+    def test_outbox_parser(self):
+        parser = build_parser()
+        assert parser.parse_args(["outbox"]).action == "list"
+        args = parser.parse_args(["outbox", "retry", "3", "4"])
+        assert args.action == "retry"
+        assert args.ids == [3, 4]
+
+    async def test_outbox_lists_states(self):
+        rows = [
+            {
+                "id": 3,
+                "text": "too\nlong",
+                "send_attempts": 5,
+                "next_attempt_at": None,
+                "failed_at": "2024-06-01T00:00:00+00:00",
+                "last_error": "BadRequest: Message is too long",
+            },
+            {
+                "id": 4,
+                "text": "hello",
+                "send_attempts": 1,
+                "next_attempt_at": "2024-06-01T00:00:02+00:00",
+                "failed_at": None,
+                "last_error": "NetworkError: timed out",
+            },
+            {
+                "id": 5,
+                "text": "queued",
+                "send_attempts": 0,
+                "next_attempt_at": None,
+                "failed_at": None,
+                "last_error": None,
+            },
+        ]
+
+        lines = await cmd_outbox(init_db_fn=AsyncMock(), get_outbox_fn=AsyncMock(return_value=rows))
+
+        assert lines[0].split()[:5] == ["3", "failed", "5", "tries", "too"]
+        assert lines[0].endswith("BadRequest: Message is too long")
+        assert lines[1].split()[1] == "retrying"
+        assert lines[2].split() == ["5", "pending", "0", "tries", "queued"]
+
+    async def test_outbox_retry_and_drop(self):
+        retry = AsyncMock(return_value=2)
+        drop = AsyncMock(return_value=1)
+
+        assert await cmd_outbox(
+            "retry", [3, 4], init_db_fn=AsyncMock(), retry_fn=retry
+        ) == ["Queued 2 message(s) for sending."]
+        assert await cmd_outbox("drop", [5], init_db_fn=AsyncMock(), drop_fn=drop) == [
+            "Dropped 1 message(s)."
+        ]
+        retry.assert_awaited_once_with([3, 4], db_path=None)
+        drop.assert_awaited_once_with([5], db_path=None)
+
+    async def test_outbox_retry_needs_ids(self):
+        with pytest.raises(SystemExit):
+            await cmd_outbox("retry", [], init_db_fn=AsyncMock())
+
+
+# --- cmd_dead_letters tests ---
+
+
+class TestCmdDeadLetters:
+    def test_dead_letters_parser(self):
+        assert build_parser().parse_args(["dead-letters"]).command == "dead-letters"
+
+    async def test_dead_letters_lists_messages(self):
+        rows = [
+            {
+                "id": 7,
+                "text": "do the\nthing",
+                "attempts": 3,
+                "created_at": "2024-06-01T00:00:00+00:00",
+                "dead_lettered_at": "2024-06-01T00:10:00+00:00",
+                "last_error": "timed out after 600s",
+            },
+            {
+                "id": 9,
+                "text": "other",
+                "attempts": 3,
+                "created_at": "2024-06-01T01:00:00+00:00",
+                "dead_lettered_at": "2024-06-01T01:10:00+00:00",
+                "last_error": None,
+            },
+        ]
+
+        lines = await cmd_dead_letters(
+            init_db_fn=AsyncMock(), get_dead_letters_fn=AsyncMock(return_value=rows)
+        )
+
+        assert len(lines) == 2
+        first, error = lines[0].split("\n")
+        assert first.split()[0] == "7"
+        assert first.endswith("3 tries  do the thing")
+        assert error.strip() == "timed out after 600s"
+        assert lines[1].endswith("3 tries  other")
+
+
+# --- loadtest tests ---
+
+
+class TestLoadtest:
+    def test_loadtest_parser(self):
+        parser = build_parser()
+        args = parser.parse_args(["loadtest", "--rate", "20", "--send-rate-limit", "30"])
+        assert args.command == "loadtest"
+        assert args.rate == 20
+        assert args.duration == 10
+        assert args.send_rate_limit == 30
+
+    def test_loadtest_parser_replay(self):
+        args = build_parser().parse_args(["loadtest", "--replay", "caps", "--speed", "4"])
+        assert args.replay == Path("caps")
+        assert args.speed == 4
+
+    async def test_dispatch_loadtest_prints_report(self, capsys):
+        args = build_parser().parse_args(["loadtest", "--duration", "1"])
+        run = AsyncMock(return_value={"processed": 5})
+
+        with patch("corphish.cli.loadtest.run_load_test", run):
+            await dispatch(args)
+
+        run.assert_awaited_once_with(
+            rate=5.0,
+            duration=1.0,
+            send_rate_limit=None,
+            profile="instant",
+            seed=None,
+            replay=None,
+            speed=1.0,
+        )
+        assert '"processed": 5' in capsys.readouterr().out
+
+
+# --- cmd_ctl tests ---
+
+
+class TestCmdCtl:
+    def test_ctl_parser(self):
+        parser = build_parser()
+        args = parser.parse_args(["ctl", "pause-heartbeat"])
+        assert args.command == "ctl"
+        assert args.action == "pause-heartbeat"
+
+    async def test_ctl_maps_action_to_method(self):
+        call_fn = AsyncMock(return_value={"heartbeat_paused": True})
+
+        result = await cmd_ctl("pause-heartbeat", call_fn=call_fn)
+
+        assert result == {"heartbeat_paused": True}
+        call_fn.assert_awaited_once_with("pause_heartbeat", db_path=None)
+
+    async def test_ctl_exits_when_daemon_not_running(self):
+        call_fn = AsyncMock(side_effect=ConnectionError("Daemon is not running"))
+
+        with pytest.raises(SystemExit):
+            await cmd_ctl("status", call_fn=call_fn)
+
+    async def test_dispatch_ctl_prints_json(self, capsys):
+        parser = build_parser()
+        args = parser.parse_args(["ctl", "status"])
+
+        with patch(
+            "corphish.cli.cmd_ctl", new=AsyncMock(return_value={"turn_count": 2})
+        ):
+            await dispatch(args)
+
+        assert '"turn_count": 2' in capsys.readouterr().out
+
+
+# --- cmd_remind tests ---
+
+
+class TestCmdRemind:
+    def test_remind_command(self):
+        parser = build_parser()
+        args = parser.parse_args(["remind", "in", "10m", "call", "mom"])
+        assert args.command == "remind"
+        assert args.spec == ["in", "10m", "call", "mom"]
+
+    async def test_remind_inserts_reminder(self):
+        insert_fn = AsyncMock(return_value=3)
+
+        result = await cmd_remind(
+            "in 10m call mom",
+            init_db_fn=AsyncMock(),
+            insert_reminder_fn=insert_fn,
+        )
+
+        assert insert_fn.call_args.args[0] == "call mom"
+        assert result.startswith("Reminder 3 set for")
+
+    async def test_remind_cancels_reminder(self):
+        insert_fn = AsyncMock()
+        cancel_fn = AsyncMock(return_value=True)
+
+        result = await cmd_remind(
+            "cancel 3",
+            init_db_fn=AsyncMock(),
+            insert_reminder_fn=insert_fn,
+            cancel_reminder_fn=cancel_fn,
+        )
+
+        assert result == "Reminder 3 cancelled."
+        cancel_fn.assert_awaited_once_with(3, db_path=None)
+        insert_fn.assert_not_awaited()
+
+    async def test_remind_cancel_exits_when_not_pending(self):
+        with pytest.raises(SystemExit) as exc_info:
+            await cmd_remind(
+                "cancel 3",
+                init_db_fn=AsyncMock(),
+                cancel_reminder_fn=AsyncMock(return_value=False),
+            )
+
+        assert exc_info.value.code == 1
+
+    async def test_remind_exits_on_bad_spec(self):
+        insert_fn = AsyncMock()
+
+        with pytest.raises(SystemExit) as exc_info:
+            await cmd_remind(
+                "someday maybe",
+                init_db_fn=AsyncMock(),
+                insert_reminder_fn=insert_fn,
+            )
+
+        assert exc_info.value.code == 1
+        insert_fn.assert_not_awaited()
+
+    async def test_dispatch_remind(self, capsys):
+        parser = build_parser()
+        args = parser.parse_args(["remind", "in", "1h", "stretch"])
+
+        with patch("corphish.cli.cmd_remind", new_callable=AsyncMock) as mock_remind:
+            mock_remind.return_value = "Reminder 1 set"
+            await dispatch(args)
+            mock_remind.assert_awaited_once_with("in 1h stretch")
+
+        assert "Reminder 1 set" in capsys.readouterr().out
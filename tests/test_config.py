@@ -167,3 +167,91 @@ def test_save_heartbeat_model_overwrites_previous(tmp_path, monkeypatch):
     config.save_heartbeat_model("haiku")
     config.save_heartbeat_model("opus")
     assert config.get_heartbeat_model() == "opus"
+
+
+# --- Adaptive heartbeat tests ---
+
+
+def test_get_heartbeat_adaptive_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_heartbeat_adaptive() is False
+
+
+def test_get_heartbeat_adaptive_enabled(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    config.save_config({"heartbeat_adaptive": True})
+    assert config.get_heartbeat_adaptive() is True
+
+
+def test_get_heartbeat_quiet_hours_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_heartbeat_quiet_hours() is None
+
+
+def test_get_heartbeat_quiet_hours_configured(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    config.save_config({"heartbeat_quiet_hours": [23, 7]})
+    assert config.get_heartbeat_quiet_hours() == (23, 7)
+
+
+def test_get_heartbeat_jitter_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_heartbeat_jitter() == 0.1
+
+
+def test_get_heartbeat_speculative_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_heartbeat_speculative() is False
+
+
+def test_get_model_routing_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_model_routing() is False
+
+
+def test_get_partial_streaming_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_partial_streaming() is False
+    assert config.get_stream_edit_interval() == 1.0
+
+
+def test_get_typing_indicator_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_typing_indicator() is True
+
+
+def test_get_message_lease_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_message_lease_seconds() == 300
+    assert config.get_max_message_attempts() == 3
+
+
+def test_get_max_send_attempts_default(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_max_send_attempts() == 5
+
+
+def test_get_retrieval_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_retrieval() is False
+    assert config.get_retrieval_top_k() == 3
+    assert config.get_retrieval_token_budget() == 800
+
+
+def test_get_capture_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_capture() is False
+    assert config.get_capture_max_bytes() == 16 * 1024 * 1024
+    assert config.get_capture_backups() == 3
+
+
+def test_get_media_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_media_max_bytes() == 20 * 1024 * 1024
+    assert config.get_media_concurrency() == 2
+
+
+def test_get_claude_timeouts_defaults(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert config.get_claude_timeout() == 1800
+    assert config.get_claude_idle_timeout() == 600
@@ -0,0 +1,171 @@
+"""Tests for corphish.control."""
+
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from corphish import control
+from corphish.control import ControlServer, DaemonState
+
+
+def _make_server(busy=False, heartbeat=True):
+    claude = MagicMock()
+    claude.busy = busy
+    claude.model = "claude-sonnet"
+    claude.breaker.snapshot.return_value = {}
+    state = DaemonState("all")
+    server = ControlServer(
+        state,
+        claude=claude,
+        heartbeat=heartbeat,
+        get_queue_depths_fn=AsyncMock(
+            return_value={
+                "incoming_pending": 2,
+                "incoming_claimed": 1,
+                "outgoing_unsent": 0,
+                "dead_lettered": 0,
+            }
+        ),
+        get_usage_summary_fn=AsyncMock(return_value=[{"model": "m", "count": 3}]),
+        get_decision_summary_fn=AsyncMock(return_value=[]),
+    )
+    return server, state, claude
+
+
+async def _request(server, method, request_id=1):
+    line = json.dumps({"jsonrpc": "2.0", "id": request_id, "method": method})
+    return await server.handle(line.encode())
+
+
+async def test_status_reports_live_state():
+    server, state, _ = _make_server(busy=True)
+    state.lock_holder = "processor"
+    state.current_message_id = 7
+    state.current_model = "claude-opus"
+    state.turn_count = 4
+
+    response = await _request(server, "status")
+
+    result = response["result"]
+    assert response["id"] == 1
+    assert result["queues"]["incoming_pending"] == 2
+    assert result["busy"] is True
+    assert result["lock_holder"] == "processor"
+    assert result["current_message_id"] == 7
+    assert result["current_model"] == "claude-opus"
+    assert result["turn_count"] == 4
+
+
+async def test_status_falls_back_to_client_model_when_idle():
+    server, _, _ = _make_server()
+
+    response = await _request(server, "status")
+
+    assert response["result"]["current_model"] == "claude-sonnet"
+
+
+async def test_reset_when_idle_resets_immediately():
+    server, state, claude = _make_server()
+    state.turn_count = 5
+
+    response = await _request(server, "reset")
+
+    assert response["result"] == {"reset": "done"}
+    claude.reset.assert_called_once()
+    assert state.turn_count == 0
+
+
+async def test_reset_while_busy_is_deferred():
+    server, state, claude = _make_server(busy=True)
+
+    response = await _request(server, "reset")
+
+    assert response["result"] == {"reset": "pending"}
+    claude.reset.assert_not_called()
+    assert state.reset_requested is True
+
+
+async def test_pause_and_resume_heartbeat():
+    server, state, _ = _make_server()
+
+    await _request(server, "pause_heartbeat")
+    assert state.heartbeat_paused is True
+
+    await _request(server, "resume_heartbeat")
+    assert state.heartbeat_paused is False
+
+
+async def test_pause_heartbeat_refused_without_heartbeat():
+    """A process whose heartbeat runs elsewhere cannot pause it."""
+    server, state, _ = _make_server(heartbeat=False)
+
+    response = await _request(server, "pause_heartbeat")
+
+    assert "does not run the heartbeat" in response["error"]["message"]
+    assert state.heartbeat_paused is False
+    status = await _request(server, "status")
+    assert status["result"]["heartbeat_paused"] is None
+
+
+async def test_metrics_includes_counters_and_usage():
+    server, state, _ = _make_server()
+    state.count("messages_processed")
+    state.count("messages_processed")
+    state.restart_counts["consumer"] = 1
+
+    response = await _request(server, "metrics")
+
+    result = response["result"]
+    assert result["counters"] == {"messages_processed": 2}
+    assert result["restarts"] == {"consumer": 1}
+    assert result["model_usage"] == [{"model": "m", "count": 3}]
+    assert result["circuits"] == {}
+
+
+async def test_unknown_method_returns_error():
+    server, _, _ = _make_server()
+
+    response = await _request(server, "explode", request_id=9)
+
+    assert response["id"] == 9
+    assert response["error"]["code"] == -32601
+
+
+async def test_malformed_request_returns_parse_error():
+    server, _, _ = _make_server()
+
+    response = await server.handle(b"not json")
+
+    assert response["error"]["code"] == -32700
+
+
+async def test_call_round_trip_over_socket(tmp_path):
+    """control.call() talks to a running ControlServer."""
+    server, _, _ = _make_server(busy=True)
+    socket_path = tmp_path / "ctl.sock"
+    server._socket_path = socket_path
+    task = asyncio.create_task(server.run())
+    for _ in range(100):
+        if socket_path.exists():
+            break
+        await asyncio.sleep(0.01)
+
+    try:
+        started = time.monotonic()
+        result = await control.call("status", socket_path=socket_path)
+        elapsed = time.monotonic() - started
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    assert result["busy"] is True
+    assert elapsed < 0.5
+    assert not socket_path.exists()
+
+
+async def test_call_raises_when_daemon_not_running(tmp_path):
+    with pytest.raises(ConnectionError):
+        await control.call("status", socket_path=tmp_path / "missing.sock")
@@ -2,29 +2,52 @@
 
 import asyncio
 import logging
+import time
+from datetime import datetime
 from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
+import aiosqlite
 import pytest
 
 from corphish.daemon import (
+    _FAILED_NOTICE,
+    _apply_jitter,
     _get_model_for_name,
+    _in_quiet_hours,
     _is_trivial_response,
     _needs_escalation,
+    _plan_heartbeat,
+    _restart_delay,
+    _sleep_or_stop,
+    _supervise,
+    _watch_call,
     run_daemon,
     run_heartbeat_runner,
     run_message_consumer,
     run_message_processor,
 )
-from corphish.claude_client import MODEL_HAIKU, MODEL_OPUS, MODEL_SONNET
+from corphish import db
+from corphish.claude_client import MODEL_HAIKU, MODEL_OPUS, MODEL_SONNET, ApiUnavailableError
+from corphish.control import DaemonState
+from corphish.media import MediaStore
+from corphish.writer import DbWriter
 
 
-def _make_update(update_id, chat_id, text):
-    """Creates a mock Telegram Update object."""
+def _make_update(update_id, chat_id, text, caption=None, photo=(), **files):
+    """Creates a mock Telegram Update object.
+
+    Keyword arguments name the message's file attributes (document,
+    voice, ...); the others are left empty as in a text message.
+    """
     update = MagicMock()
     update.update_id = update_id
     update.message = MagicMock()
     update.message.text = text
+    update.message.caption = caption
+    update.message.photo = photo
+    for kind in ("document", "voice", "audio", "video", "video_note", "animation"):
+        setattr(update.message, kind, files.get(kind))
     update.message.message_id = update_id * 10  # Simple mapping for testing
     update.message.chat = MagicMock()
     update.message.chat.id = chat_id
@@ -44,6 +67,7 @@ def _make_consumer_deps(chat_id=42, updates=None, initial_offset=0):
         "get_offset_fn": MagicMock(return_value=initial_offset),
         "save_offset_fn": MagicMock(),
         "insert_incoming_fn": AsyncMock(return_value=1),
+        "get_stored_updates_fn": AsyncMock(return_value=set()),
         "_bot": mock_bot,
     }
 
@@ -74,6 +98,7 @@ def _make_processor_deps(chat_id=42):
     mock_claude = MagicMock()
     mock_claude.lock = __import__("asyncio").Lock()
     mock_claude.stream = _make_stream_fn("claude says hi")
+    mock_claude.last_activity = time.monotonic()
 
     mock_sent_message = MagicMock()
     mock_sent_message.message_id = 999
@@ -85,12 +110,30 @@ def _make_processor_deps(chat_id=42):
         "send_message_fn": AsyncMock(return_value=mock_sent_message),
         "claude": mock_claude,
         "once": True,
-        "get_next_unprocessed_fn": AsyncMock(return_value=None),
+        "claim_next_fn": AsyncMock(return_value=None),
+        "release_fn": AsyncMock(),
+        "extend_lease_fn": AsyncMock(return_value=True),
+        "get_lease_seconds_fn": MagicMock(return_value=300),
+        "get_max_attempts_fn": MagicMock(return_value=3),
+        "worker_id": "test-worker",
         "mark_processed_fn": AsyncMock(),
         "insert_outgoing_fn": AsyncMock(return_value=1),
+        "insert_sent_outgoing_fn": AsyncMock(return_value=1),
         "get_unsent_outgoing_fn": AsyncMock(return_value=[]),
         "mark_outgoing_sent_fn": AsyncMock(),
         "get_max_turns_fn": MagicMock(return_value=30),
+        "get_routing_fn": MagicMock(return_value=False),
+        "log_usage_fn": AsyncMock(return_value=1),
+        "get_partial_streaming_fn": MagicMock(return_value=False),
+        "get_retrieval_fn": MagicMock(return_value=False),
+        "get_timeout_fn": MagicMock(return_value=0),
+        "get_idle_timeout_fn": MagicMock(return_value=0),
+        "take_cancel_fn": AsyncMock(return_value=None),
+        "record_error_fn": AsyncMock(),
+        "send_typing_fn": AsyncMock(),
+        "record_send_failure_fn": AsyncMock(return_value=False),
+        "get_max_send_attempts_fn": MagicMock(return_value=5),
+        "get_attachments_fn": AsyncMock(return_value=[]),
         "_bot": mock_bot,
     }
 
@@ -124,13 +167,8 @@ async def test_consumer_ignores_other_chat_ids():
 
 
 async def test_consumer_ignores_updates_without_text():
-    """Consumer should ignore updates without text."""
-    update = MagicMock()
-    update.update_id = 1
-    update.message = MagicMock()
-    update.message.text = None
-    update.message.chat = MagicMock()
-    update.message.chat.id = 42
+    """Consumer should ignore updates without text or a file."""
+    update = _make_update(1, 42, None)
     deps = _make_consumer_deps(chat_id=42, updates=[update])
 
     await run_message_consumer(**{k: v for k, v in deps.items() if k != "_bot"})
@@ -138,6 +176,210 @@ async def test_consumer_ignores_updates_without_text():
     deps["insert_incoming_fn"].assert_not_awaited()
 
 
+def _media_store(tmp_path, content=b"file content", **kwargs):
+    """Returns a MediaStore in tmp_path whose downloads yield *content*."""
+
+    async def fetch(location, chunk_size):
+        yield content
+
+    return MediaStore(tmp_path / "media", fetch_fn=fetch, **kwargs)
+
+
+def _file(file_id="f1", file_size=12, mime_type=None, file_name=None):
+    return MagicMock(
+        file_id=file_id, file_size=file_size, mime_type=mime_type, file_name=file_name
+    )
+
+
+async def test_consumer_stores_photo_before_inserting_message(tmp_path):
+    """A photo is downloaded and recorded before its message is inserted."""
+    calls = []
+    update = _make_update(
+        1, 42, None, caption="what is this?", photo=(_file("small"), _file("big"))
+    )
+    deps = _make_consumer_deps(chat_id=42, updates=[update])
+    deps["_bot"].get_file = AsyncMock(return_value=MagicMock(file_path="photos/file_1.jpg"))
+    deps["insert_incoming_fn"] = AsyncMock(side_effect=lambda **kw: calls.append("message"))
+    insert_attachment = AsyncMock(side_effect=lambda **kw: calls.append("attachment"))
+
+    await run_message_consumer(
+        media_store=_media_store(tmp_path),
+        insert_attachment_fn=insert_attachment,
+        **{k: v for k, v in deps.items() if k != "_bot"},
+    )
+
+    deps["_bot"].get_file.assert_awaited_once_with("big")
+    assert calls == ["attachment", "message"]
+    attachment = insert_attachment.await_args.kwargs
+    assert attachment["telegram_message_id"] == 10
+    assert attachment["kind"] == "photo"
+    assert attachment["size"] == 12
+    assert attachment["path"].endswith(".jpg")
+    assert Path(attachment["path"]).read_bytes() == b"file content"
+    assert deps["insert_incoming_fn"].await_args.kwargs["text"] == "what is this?"
+
+
+async def test_consumer_names_file_without_caption(tmp_path):
+    """A file sent without a caption is inserted as its kind."""
+    update = _make_update(1, 42, None, voice=_file(mime_type="audio/ogg"))
+    deps = _make_consumer_deps(chat_id=42, updates=[update])
+    deps["_bot"].get_file = AsyncMock(return_value=MagicMock(file_path="voice/file_2.oga"))
+
+    await run_message_consumer(
+        media_store=_media_store(tmp_path),
+        insert_attachment_fn=AsyncMock(),
+        **{k: v for k, v in deps.items() if k != "_bot"},
+    )
+
+    assert deps["insert_incoming_fn"].await_args.kwargs["text"] == "[voice]"
+
+
+async def test_consumer_notes_file_over_size_limit(tmp_path):
+    """A file over the limit is not downloaded; the message says so."""
+    update = _make_update(1, 42, None, caption="report", document=_file(file_size=2048))
+    deps = _make_consumer_deps(chat_id=42, updates=[update])
+    deps["_bot"].get_file = AsyncMock()
+    insert_attachment = AsyncMock()
+
+    await run_message_consumer(
+        media_store=_media_store(tmp_path, max_bytes=1024),
+        insert_attachment_fn=insert_attachment,
+        **{k: v for k, v in deps.items() if k != "_bot"},
+    )
+
+    deps["_bot"].get_file.assert_not_awaited()
+    insert_attachment.assert_not_awaited()
+    text = deps["insert_incoming_fn"].await_args.kwargs["text"]
+    assert text.startswith("report")
+    assert "document sent with this message is unavailable" in text
+
+
+async def test_consumer_notes_failed_download(tmp_path):
+    """A failed download still inserts the message, with a note."""
+    ok = _make_update(1, 42, None, document=_file("a", file_name="a.pdf"))
+    broken = _make_update(2, 42, "see this", document=_file("b"))
+    deps = _make_consumer_deps(chat_id=42, updates=[ok, broken])
+    deps["_bot"].get_file = AsyncMock(
+        side_effect=[MagicMock(file_path="documents/a.pdf"), RuntimeError("network")]
+    )
+    insert_attachment = AsyncMock()
+
+    await run_message_consumer(
+        media_store=_media_store(tmp_path),
+        insert_attachment_fn=insert_attachment,
+        **{k: v for k, v in deps.items() if k != "_bot"},
+    )
+
+    assert insert_attachment.await_count == 1
+    assert insert_attachment.await_args.kwargs["file_name"] == "a.pdf"
+    texts = [c.kwargs["text"] for c in deps["insert_incoming_fn"].await_args_list]
+    assert texts[0] == "[document]"
+    assert texts[1] == (
+        "see this\n\n[The document sent with this message is unavailable: the download failed]"
+    )
+
+
+async def test_consumer_saves_offset_only_after_batch_is_stored(tmp_path):
+    """A consumer cancelled mid-download has not advanced the offset."""
+    started = asyncio.Event()
+
+    async def fetch(location, chunk_size):
+        started.set()
+        await asyncio.Event().wait()
+        yield b""
+
+    text = _make_update(1, 42, "hello")
+    photo = _make_update(2, 42, None, photo=(_file("p"),))
+    deps = _make_consumer_deps(chat_id=42, updates=[text, photo])
+    deps["_bot"].get_file = AsyncMock(return_value=MagicMock(file_path="photos/file_1.jpg"))
+
+    task = asyncio.create_task(
+        run_message_consumer(
+            media_store=MediaStore(tmp_path / "media", fetch_fn=fetch),
+            insert_attachment_fn=AsyncMock(),
+            **{k: v for k, v in deps.items() if k != "_bot"},
+        )
+    )
+    await asyncio.wait_for(started.wait(), 1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    deps["save_offset_fn"].assert_not_called()
+    deps["insert_incoming_fn"].assert_not_awaited()
+    assert list((tmp_path / "media").iterdir()) == []
+
+
+async def test_consumer_restarted_mid_batch_stores_each_update_once(tmp_path):
+    """Updates polled again after a restart are not stored twice."""
+    db_path = tmp_path / "test.db"
+    await db.init_db(db_path)
+
+    async def fetch(location, chunk_size):
+        yield b"jpeg"
+
+    text = _make_update(1, 42, "hello")
+    photo = _make_update(2, 42, None, photo=(_file("p"),))
+    deps = _make_consumer_deps(chat_id=42, updates=[text, photo])
+    deps["_bot"].get_file = AsyncMock(return_value=MagicMock(file_path="photos/file_1.jpg"))
+    deps["insert_incoming_fn"] = db.insert_incoming_message
+    deps["get_stored_updates_fn"] = db.get_stored_update_ids
+    killed = []
+
+    async def insert_attachment(**kwargs):
+        await db.insert_attachment(**kwargs)
+        if not killed:
+            # The daemon dies after recording the file, before its message
+            killed.append(True)
+            raise asyncio.CancelledError
+
+    def run():
+        return run_message_consumer(
+            db_path=db_path,
+            media_store=MediaStore(tmp_path / "media", fetch_fn=fetch),
+            insert_attachment_fn=insert_attachment,
+            **{k: v for k, v in deps.items() if k != "_bot"},
+        )
+
+    with pytest.raises(asyncio.CancelledError):
+        await run()
+    deps["save_offset_fn"].assert_not_called()
+
+    # On restart the same batch is polled again
+    await run()
+
+    deps["save_offset_fn"].assert_called_once_with(3)
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute(
+            "SELECT telegram_update_id, text FROM messages ORDER BY id"
+        )
+        assert await cursor.fetchall() == [(1, "hello"), (2, "[photo]")]
+    assert len(await db.get_attachments(20, db_path=db_path)) == 1
+
+
+async def test_consumer_does_not_save_offset_when_insert_fails():
+    """A message that could not be stored is polled again."""
+    deps = _make_consumer_deps(
+        chat_id=42, updates=[_make_update(1, 42, "a"), _make_update(2, 42, "b")]
+    )
+    deps["insert_incoming_fn"] = AsyncMock(side_effect=[1, RuntimeError("disk full")])
+
+    await run_message_consumer(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["save_offset_fn"].assert_not_called()
+
+
+async def test_consumer_saves_offset_after_inserting_batch():
+    """The offset after the last update is saved once the batch is stored."""
+    deps = _make_consumer_deps(
+        chat_id=42, updates=[_make_update(1, 42, "a"), _make_update(2, 999, "other chat")]
+    )
+
+    await run_message_consumer(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["save_offset_fn"].assert_called_once_with(3)
+
+
 # --- Message Processor Tests ---
 
 
@@ -151,16 +393,16 @@ async def test_processor_processes_message_with_claude():
         "created_at": "2024-01-01T00:00:00Z",
     }
     deps = _make_processor_deps(chat_id=42)
-    deps["get_next_unprocessed_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
 
     await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
 
-    deps["mark_processed_fn"].assert_awaited_once_with(1, db_path=None)
-    deps["insert_outgoing_fn"].assert_awaited_once_with(
-        text="claude says hi", db_path=None
-    )
+    deps["mark_processed_fn"].assert_awaited_once_with(1, "test-worker", db_path=None)
     deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "claude says hi")
-    deps["mark_outgoing_sent_fn"].assert_awaited_once_with(1, 999, db_path=None)
+    deps["insert_sent_outgoing_fn"].assert_awaited_once_with(
+        text="claude says hi", telegram_message_id=999, db_path=None
+    )
+    deps["insert_outgoing_fn"].assert_not_awaited()
 
 
 async def test_processor_streams_multiple_chunks():
@@ -174,14 +416,36 @@ async def test_processor_streams_multiple_chunks():
     }
     deps = _make_processor_deps(chat_id=42)
     deps["claude"].stream = _make_stream_fn("chunk one", "chunk two")
-    deps["insert_outgoing_fn"] = AsyncMock(side_effect=[1, 2])
-    deps["get_next_unprocessed_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
 
     await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
 
-    assert deps["insert_outgoing_fn"].await_count == 2
     assert deps["send_message_fn"].await_count == 2
-    assert deps["mark_outgoing_sent_fn"].await_count == 2
+    texts = [c.kwargs["text"] for c in deps["insert_sent_outgoing_fn"].call_args_list]
+    assert texts == ["chunk one", "chunk two"]
+
+
+async def test_processor_stores_chunk_that_fails_to_send():
+    """A chunk Telegram rejects is stored unsent so the outbox retries it."""
+    message = {
+        "id": 1,
+        "text": "hello",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["send_message_fn"] = AsyncMock(side_effect=RuntimeError("flood"))
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["insert_outgoing_fn"].assert_awaited_once_with(
+        text="claude says hi", db_path=None
+    )
+    deps["insert_sent_outgoing_fn"].assert_not_awaited()
+    assert deps["record_send_failure_fn"].await_args.args[0] == 1
+    deps["mark_processed_fn"].assert_awaited_once_with(1, "test-worker", db_path=None)
 
 
 async def test_processor_sends_outgoing_messages():
@@ -196,6 +460,89 @@ async def test_processor_sends_outgoing_messages():
     deps["mark_outgoing_sent_fn"].assert_awaited_once_with(1, 999, db_path=None)
 
 
+async def test_processor_splits_long_outgoing_message():
+    """A reply over Telegram's limit goes out as several stored parts."""
+    text = "\n\n".join(f"Paragraph {i} " + "x" * 3000 for i in range(4))
+    deps = _make_processor_deps(chat_id=42)
+    deps["get_unsent_outgoing_fn"] = AsyncMock(return_value=[{"id": 7, "text": text}])
+    deps["send_message_fn"] = AsyncMock(
+        side_effect=[MagicMock(message_id=100 + i) for i in range(4)]
+    )
+    saved = {}
+
+    async def save_parts(message_id, parts, db_path=None):
+        saved["parts"] = parts
+        return [
+            {"id": i, "telegram_message_id": None, **part} for i, part in enumerate(parts)
+        ]
+
+    deps["get_parts_fn"] = AsyncMock(return_value=[])
+    deps["save_parts_fn"] = save_parts
+    deps["mark_part_sent_fn"] = AsyncMock()
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    sent = [c.args[2] for c in deps["send_message_fn"].await_args_list]
+    assert sent == [part["text"] for part in saved["parts"]]
+    assert len(sent) == 4
+    assert all(len(part) <= 4096 for part in sent)
+    assert deps["mark_part_sent_fn"].await_count == 4
+    deps["mark_outgoing_sent_fn"].assert_awaited_once_with(7, 100, db_path=None)
+
+
+async def test_processor_resumes_partly_sent_message():
+    """Parts sent before a failure are not sent again."""
+    text = "a" * 3000 + "\n\n" + "b" * 3000
+    deps = _make_processor_deps(chat_id=42)
+    deps["get_unsent_outgoing_fn"] = AsyncMock(return_value=[{"id": 7, "text": text}])
+    deps["get_parts_fn"] = AsyncMock(
+        return_value=[
+            {"id": 1, "part_index": 0, "text": "a" * 3000, "html": None, "telegram_message_id": 50},
+            {"id": 2, "part_index": 1, "text": "b" * 3000, "html": None, "telegram_message_id": None},
+        ]
+    )
+    deps["save_parts_fn"] = AsyncMock()
+    deps["mark_part_sent_fn"] = AsyncMock()
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "b" * 3000)
+    deps["save_parts_fn"].assert_not_awaited()
+    deps["mark_part_sent_fn"].assert_awaited_once_with(2, 999, db_path=None)
+    deps["mark_outgoing_sent_fn"].assert_awaited_once_with(7, 50, db_path=None)
+
+
+async def test_processor_records_failed_sends():
+    """A failed send is recorded with its error so it is retried with backoff."""
+    deps = _make_processor_deps(chat_id=42)
+    deps["get_unsent_outgoing_fn"] = AsyncMock(return_value=[{"id": 1, "text": "hi"}])
+    deps["send_message_fn"] = AsyncMock(side_effect=RuntimeError("Bad Request"))
+    deps["record_send_failure_fn"] = AsyncMock(return_value=True)
+    state = DaemonState()
+
+    await run_message_processor(state=state, **{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["record_send_failure_fn"].assert_awaited_once_with(
+        1, "RuntimeError: Bad Request", 5, db_path=None
+    )
+    deps["mark_outgoing_sent_fn"].assert_not_awaited()
+    assert state.counters["outgoing_failed"] == 1
+
+
+async def test_processor_sends_formatted_outgoing_message():
+    """Markdown replies are sent with their HTML rendering."""
+    deps = _make_processor_deps(chat_id=42)
+    deps["get_unsent_outgoing_fn"] = AsyncMock(
+        return_value=[{"id": 1, "text": "Run `ls`"}]
+    )
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["send_message_fn"].assert_awaited_once_with(
+        deps["_bot"], 42, "Run `ls`", html="Run <code>ls</code>"
+    )
+
+
 async def test_processor_handles_reset_command():
     """/reset command should reset Claude and send confirmation."""
     message = {
@@ -207,7 +554,7 @@ async def test_processor_handles_reset_command():
     }
     deps = _make_processor_deps(chat_id=42)
     # Return message once, then None to avoid infinite loop
-    deps["get_next_unprocessed_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
     deps["claude"].reset = MagicMock()
 
     await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
@@ -220,152 +567,567 @@ async def test_processor_handles_reset_command():
     assert "reset" in call_args.kwargs["text"].lower()
 
 
-async def test_processor_continues_after_claude_failure():
-    """Processor should mark message as processed even if Claude streaming fails."""
+async def test_processor_handles_remind_command():
+    """/remind should persist a reminder without calling Claude."""
     message = {
         "id": 1,
-        "text": "boom",
+        "text": "/remind in 10m call mom",
         "telegram_update_id": 1,
         "telegram_message_id": 10,
         "created_at": "2024-01-01T00:00:00Z",
     }
     deps = _make_processor_deps(chat_id=42)
-    deps["get_next_unprocessed_fn"] = AsyncMock(side_effect=[message, None])
-    deps["claude"].stream = _make_failing_stream_fn(RuntimeError("API down"))
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = MagicMock()
+    deps["insert_reminder_fn"] = AsyncMock(return_value=7)
+    deps["schedule_reminder_fn"] = MagicMock()
 
     await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
 
-    deps["mark_processed_fn"].assert_awaited_once_with(1, db_path=None)
-    deps["insert_outgoing_fn"].assert_not_awaited()
-
+    deps["claude"].stream.assert_not_called()
+    text, due_at = deps["insert_reminder_fn"].call_args.args
+    assert text == "call mom"
+    deps["schedule_reminder_fn"].assert_called_once_with(7, due_at)
+    deps["mark_processed_fn"].assert_awaited_once_with(1, "test-worker", db_path=None)
+    reply = deps["insert_outgoing_fn"].call_args.kwargs["text"]
+    assert reply.startswith("Reminder 7 set for")
 
-async def test_processor_auto_resets_after_max_turns():
-    """Processor should reset the conversation after max_turns messages."""
-    def make_message(i):
-        return {"id": i, "text": f"msg {i}", "telegram_update_id": i,
-                "telegram_message_id": i * 10, "created_at": "2024-01-01T00:00:00Z"}
 
-    messages = [make_message(i) for i in range(1, 4)]  # 3 messages
+async def test_processor_handles_remind_cancel_command():
+    """/remind cancel <id> cancels the reminder and drops it from the scheduler."""
+    message = {
+        "id": 1,
+        "text": "/remind cancel 7",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
     deps = _make_processor_deps(chat_id=42)
-    deps["get_max_turns_fn"] = MagicMock(return_value=3)
-    deps["get_next_unprocessed_fn"] = AsyncMock(side_effect=messages + [None])
-    deps["once"] = False  # need the loop to run 4 times
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["insert_reminder_fn"] = AsyncMock()
+    deps["cancel_reminder_fn"] = AsyncMock(return_value=True)
+    deps["unschedule_reminder_fn"] = MagicMock()
 
-    # Patch asyncio.sleep so the loop doesn't actually wait
-    with patch("corphish.daemon.asyncio.sleep", new=AsyncMock(side_effect=[None, None, None, StopAsyncIteration()])):
-        try:
-            await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
-        except StopAsyncIteration:
-            pass
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
 
-    deps["claude"].reset.assert_called_once()
+    deps["insert_reminder_fn"].assert_not_awaited()
+    deps["cancel_reminder_fn"].assert_awaited_once_with(7, db_path=None)
+    deps["unschedule_reminder_fn"].assert_called_once_with(7)
+    reply = deps["insert_outgoing_fn"].call_args.kwargs["text"]
+    assert reply == "Reminder 7 cancelled."
 
 
-async def test_processor_does_not_reset_before_max_turns():
-    """Processor should not reset before max_turns messages are processed."""
-    message = {"id": 1, "text": "hello", "telegram_update_id": 1,
-               "telegram_message_id": 10, "created_at": "2024-01-01T00:00:00Z"}
+async def test_processor_reports_unknown_reminder_on_cancel():
+    """Cancelling a reminder that is not pending leaves the scheduler alone."""
+    message = {
+        "id": 1,
+        "text": "/remind cancel 7",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
     deps = _make_processor_deps(chat_id=42)
-    deps["get_max_turns_fn"] = MagicMock(return_value=30)
-    deps["get_next_unprocessed_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["cancel_reminder_fn"] = AsyncMock(return_value=False)
+    deps["unschedule_reminder_fn"] = MagicMock()
 
     await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
 
-    deps["claude"].reset.assert_not_called()
-
+    deps["unschedule_reminder_fn"].assert_not_called()
+    reply = deps["insert_outgoing_fn"].call_args.kwargs["text"]
+    assert reply == "No pending reminder 7."
 
-async def test_processor_reset_resets_turn_counter():
-    """After auto-reset, turn counter should restart from zero."""
-    def make_message(i):
-        return {"id": i, "text": f"msg {i}", "telegram_update_id": i,
-                "telegram_message_id": i * 10, "created_at": "2024-01-01T00:00:00Z"}
 
-    # 5 messages with max_turns=3: should reset once after turn 3, not again
-    messages = [make_message(i) for i in range(1, 6)]
+async def test_processor_reports_invalid_remind_command():
+    """An unparseable /remind replies with an error and stores nothing."""
+    message = {
+        "id": 1,
+        "text": "/remind sometime",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
     deps = _make_processor_deps(chat_id=42)
-    deps["get_max_turns_fn"] = MagicMock(return_value=3)
-    deps["get_next_unprocessed_fn"] = AsyncMock(side_effect=messages + [None])
-    deps["once"] = False
-
-    with patch("corphish.daemon.asyncio.sleep", new=AsyncMock(side_effect=[None, None, None, None, None, StopAsyncIteration()])):
-        try:
-            await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
-        except StopAsyncIteration:
-            pass
-
-    # Should reset exactly once (after 3 turns; the next 2 turns don't trigger another)
-    assert deps["claude"].reset.call_count == 1
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["insert_reminder_fn"] = AsyncMock()
 
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
 
-# --- Integration Tests ---
+    deps["insert_reminder_fn"].assert_not_awaited()
+    reply = deps["insert_outgoing_fn"].call_args.kwargs["text"]
+    assert reply.startswith("Could not set reminder")
 
 
-async def test_daemon_initializes_database(tmp_path):
-    """run_daemon should initialize the database."""
-    db_path = tmp_path / "test.db"
+async def test_processor_continues_after_claude_failure():
+    """Processor should release the claim, not ack, if Claude streaming fails."""
+    message = {
+        "id": 1,
+        "text": "boom",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = _make_failing_stream_fn(RuntimeError("API down"))
 
-    # Mock all components to return immediately
-    with patch("corphish.daemon.run_message_consumer", new=AsyncMock()):
-        with patch("corphish.daemon.run_message_processor", new=AsyncMock()):
-            with patch("corphish.daemon.run_heartbeat_runner", new=AsyncMock()):
-                await run_daemon(
-                    get_token_fn=MagicMock(return_value="tok"),
-                    build_bot_fn=MagicMock(return_value=MagicMock()),
-                    load_config_fn=MagicMock(return_value={"chat_id": 42}),
-                    send_message_fn=AsyncMock(),
-                    poll_fn=AsyncMock(return_value=[]),
-                    once=True,
-                    get_offset_fn=MagicMock(return_value=0),
-                    save_offset_fn=MagicMock(),
-                    db_path=db_path,
-                )
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
 
-    # Database file should exist
-    assert db_path.exists()
+    deps["release_fn"].assert_awaited_once_with(1, "test-worker", db_path=None)
+    deps["mark_processed_fn"].assert_not_awaited()
+    deps["insert_outgoing_fn"].assert_not_awaited()
+    deps["record_error_fn"].assert_awaited_once_with(1, "RuntimeError: API down", db_path=None)
 
 
-async def test_daemon_runs_consumer_and_processor_concurrently():
-    """run_daemon should start both consumer and processor."""
-    consumer_called = False
-    processor_called = False
+async def test_processor_does_not_retry_partly_delivered_reply():
+    """A failure after a chunk went out acks the message instead of retrying it."""
+    message = {
+        "id": 1,
+        "text": "boom",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
 
-    async def mock_consumer(**kwargs):
-        nonlocal consumer_called
-        consumer_called = True
+    async def _gen(text):
+        yield "first part"
+        raise RuntimeError("API down")
 
-    async def mock_processor(**kwargs):
-        nonlocal processor_called
-        processor_called = True
+    deps["claude"].stream = _gen
 
-    with patch("corphish.daemon.run_message_consumer", new=mock_consumer):
-        with patch("corphish.daemon.run_message_processor", new=mock_processor):
-            with patch("corphish.daemon.run_heartbeat_runner", new=AsyncMock()):
-                await run_daemon(
-                    get_token_fn=MagicMock(return_value="tok"),
-                    build_bot_fn=MagicMock(return_value=MagicMock()),
-                    load_config_fn=MagicMock(return_value={"chat_id": 42}),
-                    send_message_fn=AsyncMock(),
-                    poll_fn=AsyncMock(return_value=[]),
-                    once=True,
-                    get_offset_fn=MagicMock(return_value=0),
-                    save_offset_fn=MagicMock(),
-                )
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
 
-    assert consumer_called
-    assert processor_called
+    deps["release_fn"].assert_not_awaited()
+    deps["mark_processed_fn"].assert_awaited_once_with(1, "test-worker", db_path=None)
+    deps["insert_sent_outgoing_fn"].assert_awaited_once_with(
+        text="first part", telegram_message_id=999, db_path=None
+    )
+    deps["insert_outgoing_fn"].assert_awaited_once_with(
+        text=_FAILED_NOTICE, db_path=None
+    )
+    deps["record_error_fn"].assert_awaited_once_with(1, "RuntimeError: API down", db_path=None)
 
 
-# --- Trivial Response Detection Tests ---
+async def test_processor_claims_with_worker_lease_and_attempts():
+    """Processor should claim messages under its worker ID and lease config."""
+    deps = _make_processor_deps(chat_id=42)
+    deps["get_lease_seconds_fn"] = MagicMock(return_value=120)
+    deps["get_max_attempts_fn"] = MagicMock(return_value=5)
 
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
 
-def test_is_trivial_response_empty():
-    """Empty responses are trivial."""
-    assert _is_trivial_response("") is True
-    assert _is_trivial_response("   ") is True
-    assert _is_trivial_response(None) is True
+    deps["claim_next_fn"].assert_awaited_once_with(
+        "test-worker", 120, 5, db_path=None
+    )
 
 
-def test_is_trivial_response_silence_patterns():
+async def test_processor_extends_lease_during_slow_reply():
+    """Processor should renew its lease while Claude is still streaming."""
+    message = {
+        "id": 7,
+        "text": "take your time",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+
+    async def slow_stream(user_text, model=None):
+        await asyncio.sleep(0.05)
+        yield "done"
+
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["get_lease_seconds_fn"] = MagicMock(return_value=0.03)
+    deps["claude"].stream = slow_stream
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["extend_lease_fn"].assert_awaited_with(7, "test-worker", 0.03, db_path=None)
+    deps["mark_processed_fn"].assert_awaited_once_with(7, "test-worker", db_path=None)
+
+
+def _hung_stream(started=None):
+    """Returns a stream function that yields one chunk, then hangs."""
+
+    async def _gen(user_text, model=None):
+        yield "partial"
+        if started is not None:
+            started.set()
+        await asyncio.Event().wait()
+
+    return _gen
+
+
+async def test_watch_call_returns_result():
+    async def call():
+        return 42
+
+    result = await _watch_call(
+        call(),
+        last_activity_fn=lambda: 0,
+        timeout=0,
+        idle_timeout=0,
+        take_cancel_fn=AsyncMock(return_value=None),
+        interval=0.01,
+    )
+
+    assert result == (42, None)
+
+
+async def test_watch_call_stops_on_timeouts_and_cancel():
+    cases = [
+        ({"timeout": 0.03, "idle_timeout": 0}, None, "timeout: no reply within 0.03s"),
+        ({"timeout": 0, "idle_timeout": 0.03}, None, "idle: no progress for 0.03s"),
+        ({"timeout": 0, "idle_timeout": 0}, 5, "cancelled by /cancel"),
+    ]
+    for limits, cancel_id, expected in cases:
+        cleaned_up = asyncio.Event()
+
+        async def call():
+            try:
+                await asyncio.Event().wait()
+            finally:
+                cleaned_up.set()
+
+        last_activity = time.monotonic()
+        result = await _watch_call(
+            call(),
+            last_activity_fn=lambda: last_activity,
+            take_cancel_fn=AsyncMock(return_value=cancel_id),
+            interval=0.01,
+            **limits,
+        )
+
+        assert result == (None, expected)
+        assert cleaned_up.is_set()
+
+
+async def test_watch_call_abandons_call_that_ignores_cancellation():
+    release = asyncio.Event()
+
+    async def stubborn():
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            await release.wait()
+
+    result = await _watch_call(
+        stubborn(),
+        last_activity_fn=time.monotonic,
+        timeout=0.02,
+        idle_timeout=0,
+        take_cancel_fn=AsyncMock(return_value=None),
+        interval=0.01,
+        grace=0.02,
+    )
+
+    assert result == (None, "timeout: no reply within 0.02s")
+    release.set()
+    await asyncio.sleep(0)
+
+
+async def test_processor_stops_hung_call_and_records_timeout():
+    """A hung reply is stopped, acknowledged and its lock released."""
+    message = {
+        "id": 9,
+        "text": "run forever",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    state = DaemonState()
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = _hung_stream()
+    deps["get_timeout_fn"] = MagicMock(return_value=0.01)
+
+    await run_message_processor(
+        **{k: v for k, v in deps.items() if k != "_bot"}, state=state
+    )
+
+    assert not deps["claude"].lock.locked()
+    deps["record_error_fn"].assert_awaited_once_with(
+        9, "timeout: no reply within 0.01s", db_path=None
+    )
+    deps["mark_processed_fn"].assert_awaited_once_with(9, "test-worker", db_path=None)
+    deps["release_fn"].assert_not_awaited()
+    deps["insert_sent_outgoing_fn"].assert_awaited_once_with(
+        text="partial", telegram_message_id=999, db_path=None
+    )
+    notice = deps["insert_outgoing_fn"].await_args.kwargs["text"]
+    assert notice.startswith("Stopped the reply (timeout")
+    assert state.counters["claude_timeouts"] == 1
+
+
+async def test_processor_cancel_interrupts_reply_in_progress():
+    """A /cancel queued behind the current message stops its reply."""
+    message = {
+        "id": 3,
+        "text": "long task",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = _hung_stream()
+    deps["take_cancel_fn"] = AsyncMock(return_value=4)
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["take_cancel_fn"].assert_awaited_with(3, db_path=None)
+    deps["record_error_fn"].assert_awaited_once_with(3, "cancelled by /cancel", db_path=None)
+    assert deps["insert_outgoing_fn"].call_args.kwargs["text"] == "Cancelled."
+
+
+async def test_processor_keeps_message_queued_while_claude_unavailable():
+    """An API outage releases the message without using up an attempt."""
+    message = {
+        "id": 8,
+        "text": "hello",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    state = DaemonState()
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(return_value=message)
+    deps["claude"].stream = _make_failing_stream_fn(
+        ApiUnavailableError("Claude is unavailable", retry_after=30)
+    )
+
+    await asyncio.wait_for(
+        run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"}, state=state),
+        1,
+    )
+
+    # With once set, a single attempt ends the run after sending what is due
+    deps["claim_next_fn"].assert_awaited_once()
+    deps["get_unsent_outgoing_fn"].assert_awaited_once()
+    deps["release_fn"].assert_awaited_once_with(
+        8, "test-worker", refund_attempt=True, db_path=None
+    )
+    deps["record_error_fn"].assert_awaited_once_with(8, "Claude is unavailable", db_path=None)
+    deps["mark_processed_fn"].assert_not_awaited()
+    deps["insert_outgoing_fn"].assert_not_awaited()
+    assert state.counters["claude_unavailable"] == 1
+
+
+async def test_processor_backs_off_while_claude_unavailable():
+    message = {
+        "id": 8,
+        "text": "hello",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    stop_event = asyncio.Event()
+    deps = _make_processor_deps(chat_id=42)
+    deps["once"] = False
+    deps["claim_next_fn"] = AsyncMock(return_value=message)
+    deps["claude"].stream = _make_failing_stream_fn(
+        ApiUnavailableError("Claude is unavailable", retry_after=30)
+    )
+
+    task = asyncio.create_task(
+        run_message_processor(
+            **{k: v for k, v in deps.items() if k != "_bot"}, stop_event=stop_event
+        )
+    )
+    await asyncio.sleep(0.1)
+    stop_event.set()
+    await asyncio.wait_for(task, 1)
+
+    # One attempt, then waiting for the breaker instead of spinning
+    assert deps["claim_next_fn"].await_count == 1
+
+
+async def test_processor_cancel_with_nothing_running():
+    message = {
+        "id": 5,
+        "text": "/cancel",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = MagicMock()
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["claude"].stream.assert_not_called()
+    deps["mark_processed_fn"].assert_awaited_once_with(5, "test-worker", db_path=None)
+    assert deps["insert_outgoing_fn"].call_args.kwargs["text"] == "Nothing to cancel."
+
+
+async def test_processor_auto_resets_after_max_turns():
+    """Processor should reset the conversation after max_turns messages."""
+    def make_message(i):
+        return {"id": i, "text": f"msg {i}", "telegram_update_id": i,
+                "telegram_message_id": i * 10, "created_at": "2024-01-01T00:00:00Z"}
+
+    messages = [make_message(i) for i in range(1, 4)]  # 3 messages
+    deps = _make_processor_deps(chat_id=42)
+    deps["get_max_turns_fn"] = MagicMock(return_value=3)
+    deps["claim_next_fn"] = AsyncMock(side_effect=messages + [None])
+    deps["once"] = False  # need the loop to run 4 times
+
+    # Patch asyncio.sleep so the loop doesn't actually wait
+    with patch("corphish.daemon.asyncio.sleep", new=AsyncMock(side_effect=[None, None, None, StopAsyncIteration()])):
+        try:
+            await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+        except StopAsyncIteration:
+            pass
+
+    deps["claude"].reset.assert_called_once()
+
+
+async def test_processor_does_not_reset_before_max_turns():
+    """Processor should not reset before max_turns messages are processed."""
+    message = {"id": 1, "text": "hello", "telegram_update_id": 1,
+               "telegram_message_id": 10, "created_at": "2024-01-01T00:00:00Z"}
+    deps = _make_processor_deps(chat_id=42)
+    deps["get_max_turns_fn"] = MagicMock(return_value=30)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["claude"].reset.assert_not_called()
+
+
+async def test_processor_reset_resets_turn_counter():
+    """After auto-reset, turn counter should restart from zero."""
+    def make_message(i):
+        return {"id": i, "text": f"msg {i}", "telegram_update_id": i,
+                "telegram_message_id": i * 10, "created_at": "2024-01-01T00:00:00Z"}
+
+    # 5 messages with max_turns=3: should reset once after turn 3, not again
+    messages = [make_message(i) for i in range(1, 6)]
+    deps = _make_processor_deps(chat_id=42)
+    deps["get_max_turns_fn"] = MagicMock(return_value=3)
+    deps["claim_next_fn"] = AsyncMock(side_effect=messages + [None])
+    deps["once"] = False
+
+    with patch("corphish.daemon.asyncio.sleep", new=AsyncMock(side_effect=[None, None, None, None, None, StopAsyncIteration()])):
+        try:
+            await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+        except StopAsyncIteration:
+            pass
+
+    # Should reset exactly once (after 3 turns; the next 2 turns don't trigger another)
+    assert deps["claude"].reset.call_count == 1
+
+
+# --- Integration Tests ---
+
+
+async def test_daemon_initializes_database(tmp_path):
+    """run_daemon should initialize the database."""
+    db_path = tmp_path / "test.db"
+
+    # Mock all components to return immediately
+    with patch("corphish.daemon.run_message_consumer", new=AsyncMock()):
+        with patch("corphish.daemon.run_message_processor", new=AsyncMock()):
+            with patch("corphish.daemon.run_heartbeat_runner", new=AsyncMock()):
+                await run_daemon(
+                    get_token_fn=MagicMock(return_value="tok"),
+                    build_bot_fn=MagicMock(return_value=MagicMock()),
+                    load_config_fn=MagicMock(return_value={"chat_id": 42}),
+                    send_message_fn=AsyncMock(),
+                    poll_fn=AsyncMock(return_value=[]),
+                    once=True,
+                    get_offset_fn=MagicMock(return_value=0),
+                    save_offset_fn=MagicMock(),
+                    db_path=db_path,
+                )
+
+    # Database file should exist
+    assert db_path.exists()
+
+
+async def test_daemon_runs_consumer_and_processor_concurrently():
+    """run_daemon should start both consumer and processor."""
+    consumer_called = False
+    processor_called = False
+
+    async def mock_consumer(**kwargs):
+        nonlocal consumer_called
+        consumer_called = True
+
+    async def mock_processor(**kwargs):
+        nonlocal processor_called
+        processor_called = True
+
+    with patch("corphish.daemon.run_message_consumer", new=mock_consumer):
+        with patch("corphish.daemon.run_message_processor", new=mock_processor):
+            with patch("corphish.daemon.run_heartbeat_runner", new=AsyncMock()):
+                await run_daemon(
+                    get_token_fn=MagicMock(return_value="tok"),
+                    build_bot_fn=MagicMock(return_value=MagicMock()),
+                    load_config_fn=MagicMock(return_value={"chat_id": 42}),
+                    send_message_fn=AsyncMock(),
+                    poll_fn=AsyncMock(return_value=[]),
+                    once=True,
+                    get_offset_fn=MagicMock(return_value=0),
+                    save_offset_fn=MagicMock(),
+                )
+
+    assert consumer_called
+    assert processor_called
+
+
+@pytest.mark.parametrize(
+    "role, expected",
+    [
+        ("consumer", {"consumer"}),
+        ("processor", {"processor"}),
+        ("heartbeat", {"heartbeat"}),
+        ("all", {"consumer", "processor", "heartbeat"}),
+    ],
+)
+async def test_daemon_role_runs_only_selected_loop(tmp_path, role, expected):
+    """run_daemon(role=...) should start only the loops for that role."""
+    started = set()
+
+    def recorder(name):
+        async def loop(**kwargs):
+            started.add(name)
+        return loop
+
+    with patch("corphish.daemon.run_message_consumer", new=recorder("consumer")):
+        with patch("corphish.daemon.run_message_processor", new=recorder("processor")):
+            with patch("corphish.daemon.run_heartbeat_runner", new=recorder("heartbeat")):
+                await run_daemon(
+                    claude=MagicMock(),
+                    once=True,
+                    db_path=tmp_path / "test.db",
+                    enable_reminders=False,
+                    role=role,
+                )
+
+    assert started == expected
+
+
+async def test_daemon_rejects_unknown_role(tmp_path):
+    """run_daemon should reject roles it does not know."""
+    with pytest.raises(ValueError, match="Unknown role"):
+        await run_daemon(db_path=tmp_path / "test.db", role="janitor")
+
+
+# --- Trivial Response Detection Tests ---
+
+
+def test_is_trivial_response_empty():
+    """Empty responses are trivial."""
+    assert _is_trivial_response("") is True
+    assert _is_trivial_response("   ") is True
+    assert _is_trivial_response(None) is True
+
+
+def test_is_trivial_response_silence_patterns():
     """Responses indicating silence should be trivial."""
     assert _is_trivial_response("No message needed.") is True
     assert _is_trivial_response("Nothing to say right now.") is True
@@ -390,7 +1152,9 @@ def _make_heartbeat_deps():
     """Returns a dict of mock dependencies for run_heartbeat_runner."""
     mock_claude = MagicMock()
     mock_claude.lock = asyncio.Lock()
+    mock_claude.heartbeat_lane = asyncio.Semaphore(1)
     mock_claude.busy = False
+    mock_claude.last_heartbeat_activity = time.monotonic()
     mock_claude.send_heartbeat = AsyncMock(return_value="meaningful response")
 
     return {
@@ -401,6 +1165,12 @@ def _make_heartbeat_deps():
         "load_prompt_fn": MagicMock(return_value="Heartbeat prompt"),
         "get_model_fn": MagicMock(return_value="haiku"),
         "log_usage_fn": AsyncMock(return_value=1),
+        "get_adaptive_fn": MagicMock(return_value=False),
+        "get_jitter_fn": MagicMock(return_value=0.0),
+        "get_speculative_fn": MagicMock(return_value=False),
+        "has_waiting_fn": AsyncMock(return_value=False),
+        "get_timeout_fn": MagicMock(return_value=0),
+        "get_idle_timeout_fn": MagicMock(return_value=0),
     }
 
 
@@ -450,38 +1220,99 @@ async def test_heartbeat_skips_when_claude_busy():
     deps["insert_outgoing_fn"].assert_not_awaited()
 
 
-async def test_heartbeat_continues_after_claude_failure():
-    """Heartbeat should handle Claude failures gracefully."""
+async def test_heartbeat_defers_while_user_message_waits():
+    """A queued user message defers the heartbeat."""
     deps = _make_heartbeat_deps()
-    deps["claude"].send_heartbeat = AsyncMock(side_effect=RuntimeError("API down"))
+    deps["has_waiting_fn"] = AsyncMock(return_value=True)
+    state = DaemonState()
 
-    # Should not raise
-    await run_heartbeat_runner(**deps)
+    await run_heartbeat_runner(state=state, **deps)
 
-    deps["claude"].send_heartbeat.assert_awaited_once()
-    deps["insert_outgoing_fn"].assert_not_awaited()
+    deps["claude"].send_heartbeat.assert_not_awaited()
+    assert state.counters["heartbeats_skipped"] == 1
 
 
-async def test_heartbeat_uses_configurable_interval():
-    """Heartbeat should use interval from config."""
+async def test_heartbeat_preempted_by_user_message():
+    """A user message arriving mid-beat cancels the heartbeat call."""
     deps = _make_heartbeat_deps()
-    # Use 0 for testing, just verify the function is called
-    deps["get_interval_fn"] = MagicMock(return_value=0)
-
-    await run_heartbeat_runner(**deps)
-
-    deps["get_interval_fn"].assert_called()
+    cancelled = asyncio.Event()
 
+    async def send_heartbeat(prompt, model):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
 
-async def test_daemon_includes_heartbeat_runner():
-    """run_daemon should start heartbeat runner when enabled."""
-    consumer_called = False
-    processor_called = False
-    heartbeat_called = False
+    deps["claude"].send_heartbeat = send_heartbeat
+    deps["has_waiting_fn"] = AsyncMock(side_effect=[False, False, True])
+    deps["preempt_interval"] = 0.01
+    state = DaemonState()
 
-    async def mock_consumer(**kwargs):
-        nonlocal consumer_called
-        consumer_called = True
+    await run_heartbeat_runner(state=state, **deps)
+
+    assert cancelled.is_set()
+    assert state.counters["heartbeats_preempted"] == 1
+    assert state.heartbeat_model is None
+    deps["insert_outgoing_fn"].assert_not_awaited()
+    deps["log_usage_fn"].assert_awaited_once_with(
+        model=MODEL_HAIKU,
+        source="heartbeat",
+        outcome="cancelled",
+        reason="preempted",
+        db_path=None,
+    )
+
+
+async def test_heartbeat_does_not_take_conversation_lock():
+    """A heartbeat runs in its own lane, leaving the conversation lock free."""
+    deps = _make_heartbeat_deps()
+    seen = {}
+
+    async def send_heartbeat(prompt, model):
+        seen["conversation_locked"] = deps["claude"].lock.locked()
+        seen["lane_locked"] = deps["claude"].heartbeat_lane.locked()
+        return "Your meeting is at 3pm."
+
+    deps["claude"].send_heartbeat = send_heartbeat
+
+    await run_heartbeat_runner(**deps)
+
+    assert seen == {"conversation_locked": False, "lane_locked": True}
+
+
+async def test_heartbeat_continues_after_claude_failure():
+    """Heartbeat should handle Claude failures gracefully."""
+    deps = _make_heartbeat_deps()
+    deps["claude"].send_heartbeat = AsyncMock(side_effect=RuntimeError("API down"))
+
+    # Should not raise
+    await run_heartbeat_runner(**deps)
+
+    deps["claude"].send_heartbeat.assert_awaited_once()
+    deps["insert_outgoing_fn"].assert_not_awaited()
+
+
+async def test_heartbeat_uses_configurable_interval():
+    """Heartbeat should use interval from config."""
+    deps = _make_heartbeat_deps()
+    # Use 0 for testing, just verify the function is called
+    deps["get_interval_fn"] = MagicMock(return_value=0)
+
+    await run_heartbeat_runner(**deps)
+
+    deps["get_interval_fn"].assert_called()
+
+
+async def test_daemon_includes_heartbeat_runner():
+    """run_daemon should start heartbeat runner when enabled."""
+    consumer_called = False
+    processor_called = False
+    heartbeat_called = False
+
+    async def mock_consumer(**kwargs):
+        nonlocal consumer_called
+        consumer_called = True
 
     async def mock_processor(**kwargs):
         nonlocal processor_called
@@ -602,7 +1433,9 @@ def _make_dynamic_heartbeat_deps():
     """Returns a dict of mock dependencies for heartbeat with dynamic model switching."""
     mock_claude = MagicMock()
     mock_claude.lock = asyncio.Lock()
+    mock_claude.heartbeat_lane = asyncio.Semaphore(1)
     mock_claude.busy = False
+    mock_claude.last_heartbeat_activity = time.monotonic()
     mock_claude.send_heartbeat = AsyncMock(return_value="meaningful response")
 
     return {
@@ -613,6 +1446,12 @@ def _make_dynamic_heartbeat_deps():
         "load_prompt_fn": MagicMock(return_value="Heartbeat prompt"),
         "get_model_fn": MagicMock(return_value="haiku"),  # Default to Haiku
         "log_usage_fn": AsyncMock(return_value=1),
+        "get_adaptive_fn": MagicMock(return_value=False),
+        "get_jitter_fn": MagicMock(return_value=0.0),
+        "get_speculative_fn": MagicMock(return_value=False),
+        "has_waiting_fn": AsyncMock(return_value=False),
+        "get_timeout_fn": MagicMock(return_value=0),
+        "get_idle_timeout_fn": MagicMock(return_value=0),
     }
 
 
@@ -713,3 +1552,1121 @@ async def test_heartbeat_sends_escalated_response():
         text="Here is your detailed answer.", db_path=None
     )
 
+
+
+# --- Adaptive Heartbeat Scheduling Tests ---
+
+
+def _make_adaptive_heartbeat_deps(activity):
+    """Returns heartbeat deps with adaptive scheduling enabled."""
+    deps = _make_heartbeat_deps()
+    deps["get_interval_fn"] = MagicMock(return_value=0)
+    deps["get_adaptive_fn"] = MagicMock(return_value=True)
+    deps["get_quiet_hours_fn"] = MagicMock(return_value=None)
+    deps["get_activity_fn"] = AsyncMock(return_value=activity)
+    deps["log_decision_fn"] = AsyncMock(return_value=1)
+    deps["now_fn"] = MagicMock(return_value=datetime(2024, 1, 1, 12, 0))
+    return deps
+
+
+def test_in_quiet_hours_same_day_window():
+    """Quiet hours within a single day are respected."""
+    assert _in_quiet_hours((9, 17), datetime(2024, 1, 1, 12, 0)) is True
+    assert _in_quiet_hours((9, 17), datetime(2024, 1, 1, 17, 0)) is False
+
+
+def test_in_quiet_hours_wraps_midnight():
+    """Quiet hours may wrap around midnight."""
+    assert _in_quiet_hours((23, 7), datetime(2024, 1, 1, 23, 30)) is True
+    assert _in_quiet_hours((23, 7), datetime(2024, 1, 1, 3, 0)) is True
+    assert _in_quiet_hours((23, 7), datetime(2024, 1, 1, 12, 0)) is False
+
+
+def test_in_quiet_hours_disabled():
+    """No quiet hours configured means never quiet."""
+    assert _in_quiet_hours(None, datetime(2024, 1, 1, 3, 0)) is False
+
+
+def test_apply_jitter_stays_within_bounds():
+    """Jittered intervals stay within +/- jitter of the base."""
+    for _ in range(100):
+        value = _apply_jitter(100, 0.1)
+        assert 90 <= value <= 110
+
+
+def test_apply_jitter_zero_interval():
+    """A zero interval is never jittered."""
+    assert _apply_jitter(0, 0.5) == 0
+
+
+def test_plan_heartbeat_skips_and_backs_off_when_idle():
+    """Idle periods skip the call and lengthen the next interval."""
+    activity = {"incoming_count": 0, "last_outgoing_text": "Done."}
+    assert _plan_heartbeat(100, activity, 1) == ("skip", "no_activity", 200)
+    assert _plan_heartbeat(100, activity, 2) == ("skip", "no_activity", 400)
+    assert _plan_heartbeat(100, activity, 10) == ("skip", "no_activity", 800)
+
+
+def test_plan_heartbeat_shortens_after_open_question():
+    """An exchange ending on a question shortens the next interval."""
+    activity = {"incoming_count": 2, "last_outgoing_text": "Want me to check?"}
+    assert _plan_heartbeat(100, activity, 0) == ("fire", "open_ended", 50)
+
+
+def test_plan_heartbeat_fires_on_activity():
+    """Ordinary activity fires at the base interval."""
+    activity = {"incoming_count": 1, "last_outgoing_text": "Done."}
+    assert _plan_heartbeat(100, activity, 0) == ("fire", "activity", 100)
+
+
+def test_plan_heartbeat_fires_follow_up_without_activity():
+    """The beat after an open question fires even if nobody has replied."""
+    activity = {"incoming_count": 0, "last_outgoing_text": "Want me to check?"}
+    assert _plan_heartbeat(100, activity, 1, follow_up=True) == (
+        "fire",
+        "follow_up",
+        100,
+    )
+
+
+async def test_adaptive_heartbeat_follows_up_on_open_question():
+    """An open-ended exchange is followed up at the shortened interval."""
+    deps = _make_adaptive_heartbeat_deps(None)
+    deps["once"] = False
+    deps["get_interval_fn"] = MagicMock(return_value=100)
+    deps["get_activity_fn"] = AsyncMock(
+        side_effect=[
+            {"incoming_count": 1, "last_outgoing_text": "Want me to check?"},
+            {"incoming_count": 0, "last_outgoing_text": "Want me to check?"},
+        ]
+    )
+    sleep = AsyncMock(side_effect=[False, False, True])
+
+    with patch("corphish.daemon._sleep_or_stop", sleep):
+        await run_heartbeat_runner(**deps)
+
+    assert deps["claude"].send_heartbeat.await_count == 2
+    reasons = [call.args[1] for call in deps["log_decision_fn"].await_args_list]
+    assert reasons == ["open_ended", "follow_up"]
+
+
+async def test_heartbeat_jitter_only_applies_in_adaptive_mode():
+    """A fixed heartbeat schedule is not jittered."""
+    deps = _make_heartbeat_deps()
+    deps["get_interval_fn"] = MagicMock(return_value=100)
+    deps["get_jitter_fn"] = MagicMock(return_value=0.5)
+    sleep = AsyncMock(return_value=True)
+
+    with patch("corphish.daemon._sleep_or_stop", sleep):
+        await run_heartbeat_runner(**deps)
+
+    assert sleep.await_args.args[0] == 100
+    deps["get_jitter_fn"].assert_not_called()
+
+
+async def test_adaptive_heartbeat_skips_without_activity():
+    """Adaptive heartbeat skips the Claude call when nothing happened."""
+    deps = _make_adaptive_heartbeat_deps(
+        {"incoming_count": 0, "last_outgoing_text": None}
+    )
+
+    await run_heartbeat_runner(**deps)
+
+    deps["claude"].send_heartbeat.assert_not_awaited()
+    deps["log_decision_fn"].assert_awaited_once_with(
+        "skip", "no_activity", 0, db_path=None
+    )
+
+
+async def test_adaptive_heartbeat_fires_on_activity():
+    """Adaptive heartbeat fires and records the decision after activity."""
+    deps = _make_adaptive_heartbeat_deps(
+        {"incoming_count": 3, "last_outgoing_text": "Sure."}
+    )
+
+    await run_heartbeat_runner(**deps)
+
+    deps["claude"].send_heartbeat.assert_awaited_once()
+    deps["log_decision_fn"].assert_awaited_once_with(
+        "fire", "activity", 0, db_path=None
+    )
+
+
+async def test_adaptive_heartbeat_respects_quiet_hours():
+    """Adaptive heartbeat stays silent during quiet hours."""
+    deps = _make_adaptive_heartbeat_deps(
+        {"incoming_count": 3, "last_outgoing_text": "Sure."}
+    )
+    deps["get_quiet_hours_fn"] = MagicMock(return_value=(9, 17))
+
+    await run_heartbeat_runner(**deps)
+
+    deps["claude"].send_heartbeat.assert_not_awaited()
+    deps["get_activity_fn"].assert_not_awaited()
+    deps["log_decision_fn"].assert_awaited_once_with(
+        "skip", "quiet_hours", 0, db_path=None
+    )
+
+
+async def test_adaptive_heartbeat_records_busy_skip():
+    """Adaptive heartbeat records a skip when Claude is busy."""
+    deps = _make_adaptive_heartbeat_deps(
+        {"incoming_count": 3, "last_outgoing_text": "Sure."}
+    )
+    deps["claude"].busy = True
+
+    await run_heartbeat_runner(**deps)
+
+    deps["claude"].send_heartbeat.assert_not_awaited()
+    deps["log_decision_fn"].assert_awaited_once_with(
+        "skip", "busy", 0, db_path=None
+    )
+
+
+async def test_fixed_heartbeat_does_not_record_decisions():
+    """Non-adaptive heartbeat neither queries activity nor records decisions."""
+    deps = _make_heartbeat_deps()
+    deps["get_activity_fn"] = AsyncMock()
+    deps["log_decision_fn"] = AsyncMock()
+
+    await run_heartbeat_runner(**deps)
+
+    deps["claude"].send_heartbeat.assert_awaited_once()
+    deps["get_activity_fn"].assert_not_awaited()
+    deps["log_decision_fn"].assert_not_awaited()
+
+
+# --- Speculative Heartbeat Escalation Tests ---
+
+
+def _make_speculative_heartbeat_deps(responses):
+    """Returns heartbeat deps in speculative mode.
+
+    *responses* maps model ID to either a response string or an exception.
+    The Opus call blocks until released so cancellation can be observed.
+    """
+    deps = _make_heartbeat_deps()
+    deps["get_speculative_fn"] = MagicMock(return_value=True)
+    started = []
+    cancelled = []
+    opus_release = asyncio.Event()
+
+    async def send_heartbeat(prompt, model):
+        started.append(model)
+        try:
+            if model == MODEL_OPUS:
+                await opus_release.wait()
+            else:
+                await asyncio.sleep(0)
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        result = responses[model]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    deps["claude"].send_heartbeat = send_heartbeat
+    return deps, started, cancelled, opus_release
+
+
+async def test_speculative_heartbeat_starts_both_models():
+    """Speculative mode starts the cheap and Opus calls together."""
+    deps, started, cancelled, _ = _make_speculative_heartbeat_deps(
+        {MODEL_HAIKU: "Your meeting is at 3pm.", MODEL_OPUS: "unused"}
+    )
+
+    await run_heartbeat_runner(**deps)
+
+    assert sorted(started) == sorted([MODEL_HAIKU, MODEL_OPUS])
+
+
+async def test_speculative_heartbeat_cancels_opus_when_confident():
+    """A confident cheap answer cancels Opus and logs it as cancelled."""
+    deps, _, cancelled, _ = _make_speculative_heartbeat_deps(
+        {MODEL_HAIKU: "Your meeting is at 3pm.", MODEL_OPUS: "unused"}
+    )
+
+    await run_heartbeat_runner(**deps)
+
+    assert cancelled == [MODEL_OPUS]
+    deps["insert_outgoing_fn"].assert_awaited_once_with(
+        text="Your meeting is at 3pm.", db_path=None
+    )
+    calls = [c.kwargs for c in deps["log_usage_fn"].await_args_list]
+    assert calls == [
+        {"model": MODEL_HAIKU, "source": "heartbeat", "escalated": False, "db_path": None},
+        {
+            "model": MODEL_OPUS,
+            "source": "heartbeat",
+            "outcome": "cancelled",
+            "db_path": None,
+        },
+    ]
+
+
+async def test_speculative_heartbeat_uses_opus_when_uncertain():
+    """An uncertain cheap answer waits for and sends the Opus response."""
+    deps, _, cancelled, opus_release = _make_speculative_heartbeat_deps(
+        {MODEL_HAIKU: "I'm not sure about this.", MODEL_OPUS: "Detailed answer."}
+    )
+    opus_release.set()
+
+    await run_heartbeat_runner(**deps)
+
+    assert cancelled == []
+    deps["insert_outgoing_fn"].assert_awaited_once_with(
+        text="Detailed answer.", db_path=None
+    )
+    assert deps["log_usage_fn"].await_args_list[-1].kwargs == {
+        "model": MODEL_OPUS,
+        "source": "heartbeat",
+        "escalated": True,
+        "db_path": None,
+    }
+
+
+async def test_speculative_heartbeat_falls_back_to_opus_on_cheap_failure():
+    """If the cheap call fails, the speculative Opus response is used."""
+    deps, _, _, opus_release = _make_speculative_heartbeat_deps(
+        {MODEL_HAIKU: RuntimeError("overloaded"), MODEL_OPUS: "Opus answer."}
+    )
+    opus_release.set()
+
+    await run_heartbeat_runner(**deps)
+
+    deps["insert_outgoing_fn"].assert_awaited_once_with(
+        text="Opus answer.", db_path=None
+    )
+
+
+async def test_speculative_heartbeat_not_used_for_opus():
+    """Speculation is pointless when the configured model is already Opus."""
+    deps = _make_heartbeat_deps()
+    deps["get_speculative_fn"] = MagicMock(return_value=True)
+    deps["get_model_fn"] = MagicMock(return_value="opus")
+
+    await run_heartbeat_runner(**deps)
+
+    deps["claude"].send_heartbeat.assert_awaited_once_with(
+        "Heartbeat prompt", MODEL_OPUS
+    )
+
+
+# --- Message Routing Tests ---
+
+
+def _make_routed_stream_fn(replies):
+    """Returns a stream fn replying per model and recording the models used."""
+    models = []
+
+    async def _gen(text, model=None, fork=False):
+        models.append(model)
+        for chunk in replies[model]:
+            yield chunk
+
+    return _gen, models
+
+
+def _make_routing_deps(text, replies):
+    message = {
+        "id": 1,
+        "text": text,
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["get_routing_fn"] = MagicMock(return_value=True)
+    stream, models = _make_routed_stream_fn(replies)
+    deps["claude"].stream = stream
+    deps["claude"].session_id = "session-1"
+    return deps, models
+
+
+async def test_processor_routes_acknowledgement_to_haiku():
+    """A trivial message is answered by Haiku and the decision is logged."""
+    deps, models = _make_routing_deps("thanks", {MODEL_HAIKU: ["You're welcome!"]})
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    assert models == [MODEL_HAIKU]
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "You're welcome!")
+    deps["log_usage_fn"].assert_awaited_once_with(
+        source="processor", model=MODEL_HAIKU, reason="acknowledgement", db_path=None
+    )
+
+
+async def test_processor_routes_complex_message_to_opus():
+    """A complex message is streamed from Opus."""
+    deps, models = _make_routing_deps(
+        "Help me debug this crash", {MODEL_OPUS: ["part one", "part two"]}
+    )
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    assert models == [MODEL_OPUS]
+    assert deps["send_message_fn"].await_count == 2
+
+
+async def test_processor_escalates_uncertain_haiku_reply():
+    """An uncertain Haiku reply is discarded and retried on Sonnet."""
+    deps, models = _make_routing_deps(
+        "thanks",
+        {MODEL_HAIKU: ["I'm not sure about this."], MODEL_SONNET: ["Sonnet answer"]},
+    )
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    assert models == [MODEL_HAIKU, MODEL_SONNET]
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "Sonnet answer")
+    deps["claude"].rewind.assert_called_once_with("session-1")
+    assert [c.kwargs for c in deps["log_usage_fn"].await_args_list] == [
+        {
+            "source": "processor",
+            "model": MODEL_HAIKU,
+            "outcome": "cancelled",
+            "reason": "acknowledgement",
+            "db_path": None,
+        },
+        {
+            "source": "processor",
+            "model": MODEL_SONNET,
+            "escalated": True,
+            "reason": "uncertain_response",
+            "db_path": None,
+        },
+    ]
+
+
+async def test_processor_haiku_turn_is_forked_and_rewound_before_retry():
+    """The retry resumes the session as it was before the Haiku turn."""
+    deps, _ = _make_routing_deps("thanks", {})
+    calls = []
+
+    async def stream(text, model=None, fork=False):
+        calls.append(("stream", model, fork))
+        yield "I'm not sure about this." if model == MODEL_HAIKU else "Sonnet answer"
+
+    deps["claude"].stream = stream
+    deps["claude"].rewind = MagicMock(side_effect=lambda sid: calls.append(("rewind", sid)))
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    assert calls == [
+        ("stream", MODEL_HAIKU, True),
+        ("rewind", "session-1"),
+        ("stream", MODEL_SONNET, False),
+    ]
+
+
+async def test_processor_skips_haiku_until_session_is_known():
+    """Without a session to rewind to, Haiku messages go to Sonnet."""
+    deps, models = _make_routing_deps("thanks", {MODEL_SONNET: ["Sonnet answer"]})
+    deps["claude"].session_id = None
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    assert models == [MODEL_SONNET]
+    deps["log_usage_fn"].assert_awaited_once_with(
+        source="processor", model=MODEL_SONNET, reason="acknowledgement", db_path=None
+    )
+
+
+async def test_processor_without_routing_uses_default_model():
+    """With routing disabled the client default model is used."""
+    message = {
+        "id": 1,
+        "text": "thanks",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["log_usage_fn"].assert_not_awaited()
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "claude says hi")
+
+
+async def test_processor_does_not_resend_message_marked_sent_by_writer(tmp_path):
+    """A send marked through the writer is flushed before the unsent query."""
+    db_path = tmp_path / "test.db"
+    await db.init_db(db_path)
+    await db.insert_outgoing_message("hello", db_path=db_path)
+    # A long batch window keeps the mark uncommitted unless it is flushed
+    writer = DbWriter(db_path, max_delay=0.5)
+    await writer.start()
+    stop_event = asyncio.Event()
+    wake_event = asyncio.Event()
+
+    async def send(bot, chat_id, text):
+        # New work arrives right after the send, cutting the sleep short
+        wake_event.set()
+        asyncio.get_running_loop().call_later(0.2, stop_event.set)
+        return MagicMock(message_id=999)
+
+    deps = _make_processor_deps(chat_id=42)
+    deps.update(
+        once=False,
+        db_path=db_path,
+        claim_next_fn=AsyncMock(return_value=None),
+        send_message_fn=AsyncMock(side_effect=send),
+        get_unsent_outgoing_fn=db.get_unsent_outgoing_messages,
+        mark_outgoing_sent_fn=writer.mark_outgoing_message_sent,
+        flush_writes_fn=writer.flush,
+    )
+    try:
+        await run_message_processor(
+            stop_event=stop_event,
+            wake_event=wake_event,
+            **{k: v for k, v in deps.items() if k != "_bot"},
+        )
+    finally:
+        await writer.close()
+
+    deps["send_message_fn"].assert_awaited_once()
+    assert await db.get_unsent_outgoing_messages(db_path=db_path) == []
+
+
+# --- Partial Streaming Tests ---
+
+
+def _make_partial_stream_fn(*events):
+    """Returns a stream_partial fn yielding the given (kind, text) events."""
+
+    async def _gen(text, model=None):
+        for event in events:
+            yield event
+
+    return _gen
+
+
+def _make_partial_deps(*events, edit_interval=0.0):
+    message = {
+        "id": 1,
+        "text": "hello",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["get_partial_streaming_fn"] = MagicMock(return_value=True)
+    deps["get_edit_interval_fn"] = MagicMock(return_value=edit_interval)
+    deps["edit_message_fn"] = AsyncMock()
+    deps["claude"].stream_partial = _make_partial_stream_fn(*events)
+    return deps
+
+
+async def test_processor_partial_streaming_sends_then_edits():
+    """The first delta is sent immediately and later deltas edit it."""
+    deps = _make_partial_deps(
+        ("delta", "Hel"), ("delta", "lo"), ("message", "Hello")
+    )
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "Hel")
+    deps["edit_message_fn"].assert_awaited_once_with(deps["_bot"], 42, 999, "Hello")
+    deps["insert_sent_outgoing_fn"].assert_awaited_once_with(
+        text="Hello", telegram_message_id=999, db_path=None
+    )
+
+
+async def test_processor_partial_streaming_failure_after_send_is_not_retried():
+    """A live message already shown is not repeated by a retry."""
+    deps = _make_partial_deps()
+
+    async def _gen(text, model=None):
+        yield ("delta", "Hel")
+        raise RuntimeError("API down")
+
+    deps["claude"].stream_partial = _gen
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "Hel")
+    deps["release_fn"].assert_not_awaited()
+    deps["mark_processed_fn"].assert_awaited_once_with(1, "test-worker", db_path=None)
+
+
+async def test_processor_partial_streaming_bounds_edit_rate():
+    """Edits within the edit interval are coalesced into the final edit."""
+    deps = _make_partial_deps(
+        ("delta", "a"), ("delta", "b"), ("delta", "c"), ("message", "abc"),
+        edit_interval=60.0,
+    )
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "a")
+    deps["edit_message_fn"].assert_awaited_once_with(deps["_bot"], 42, 999, "abc")
+
+
+async def test_processor_partial_streaming_final_edit_is_formatted():
+    """The final edit of a streamed reply carries its HTML rendering."""
+    deps = _make_partial_deps(("delta", "Use **bold**"), ("message", "Use **bold**"))
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "Use **bold**")
+    deps["edit_message_fn"].assert_awaited_once_with(
+        deps["_bot"], 42, 999, "Use **bold**", html="Use <b>bold</b>"
+    )
+
+
+async def test_processor_partial_streaming_split_keeps_formatting():
+    """A streamed reply over the limit is finished as formatted parts."""
+    reply = "**Plan** " + "x" * 3000 + "\n\n" + "y" * 3000
+    deps = _make_partial_deps(("delta", "**Plan**"), ("message", reply))
+    stored = []
+
+    async def save_parts(message_id, parts, db_path=None):
+        stored[:] = [
+            {"id": i, "telegram_message_id": None, **part} for i, part in enumerate(parts)
+        ]
+        return stored
+
+    async def mark_part_sent(part_id, telegram_message_id, db_path=None):
+        stored[part_id]["telegram_message_id"] = telegram_message_id
+
+    deps["get_parts_fn"] = AsyncMock(side_effect=lambda *a, **kw: stored)
+    deps["save_parts_fn"] = save_parts
+    deps["mark_part_sent_fn"] = mark_part_sent
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    edit = deps["edit_message_fn"].await_args
+    assert edit.args[2:] == (999, stored[0]["text"])
+    assert edit.kwargs["html"].startswith("<b>Plan</b>")
+    sent = [c.args[2] for c in deps["send_message_fn"].await_args_list]
+    assert sent == ["**Plan**", "y" * 3000]
+
+
+async def test_processor_partial_streaming_without_deltas_sends_message():
+    """A message with no preceding deltas is delivered normally."""
+    deps = _make_partial_deps(("message", "Whole reply"))
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "Whole reply")
+    deps["edit_message_fn"].assert_not_awaited()
+
+
+async def test_processor_partial_streaming_starts_new_message_per_block():
+    """Each completed assistant message gets its own Telegram message."""
+    deps = _make_partial_deps(
+        ("delta", "one"), ("message", "one"), ("delta", "two"), ("message", "two")
+    )
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    assert deps["send_message_fn"].await_count == 2
+    deps["edit_message_fn"].assert_not_awaited()
+    assert deps["insert_sent_outgoing_fn"].await_count == 2
+
+
+# --- Loop Supervision and Drain Tests ---
+
+
+def test_restart_delay_doubles_and_caps():
+    """Restart backoff doubles per consecutive failure up to the cap."""
+    assert _restart_delay(1) == 1
+    assert _restart_delay(2) == 2
+    assert _restart_delay(4) == 8
+    assert _restart_delay(20) == 300
+
+
+async def test_supervise_restarts_crashed_loop(monkeypatch):
+    """A crashing loop is restarted and its restarts are counted."""
+    monkeypatch.setattr("corphish.daemon._RESTART_BACKOFF_BASE", 0)
+    factory = AsyncMock(side_effect=[RuntimeError("disk full"), OSError("again"), None])
+    counts = {}
+
+    await _supervise("consumer", factory, stop_event=asyncio.Event(), restart_counts=counts)
+
+    assert factory.await_count == 3
+    assert counts == {"consumer": 2}
+
+
+async def test_supervise_does_not_restart_after_stop(monkeypatch):
+    """No restart is attempted once a stop has been requested."""
+    monkeypatch.setattr("corphish.daemon._RESTART_BACKOFF_BASE", 0)
+    stop_event = asyncio.Event()
+    stop_event.set()
+    factory = AsyncMock(side_effect=RuntimeError("boom"))
+
+    await _supervise("processor", factory, stop_event=stop_event, restart_counts={})
+
+    factory.assert_awaited_once()
+
+
+async def test_supervise_once_propagates_errors():
+    """In once mode, loop errors propagate instead of being retried."""
+    factory = AsyncMock(side_effect=RuntimeError("boom"))
+
+    with pytest.raises(RuntimeError):
+        await _supervise(
+            "heartbeat", factory, stop_event=asyncio.Event(), restart_counts={}, once=True
+        )
+
+
+async def test_daemon_restarts_only_crashed_loop(tmp_path, monkeypatch):
+    """A consumer crash restarts the consumer without touching the processor."""
+    monkeypatch.setattr("corphish.daemon._RESTART_BACKOFF_BASE", 0)
+    stop_event = asyncio.Event()
+    consumer_runs = 0
+    processor_runs = 0
+
+    async def crashing_consumer(**kwargs):
+        nonlocal consumer_runs
+        consumer_runs += 1
+        if consumer_runs == 1:
+            raise OSError("No space left on device")
+        stop_event.set()
+        await asyncio.Event().wait()
+
+    async def processor(**kwargs):
+        nonlocal processor_runs
+        processor_runs += 1
+        await kwargs["stop_event"].wait()
+
+    counts = {}
+    with patch("corphish.daemon.run_message_consumer", new=crashing_consumer):
+        with patch("corphish.daemon.run_message_processor", new=processor):
+            await run_daemon(
+                claude=MagicMock(),
+                db_path=tmp_path / "test.db",
+                enable_heartbeat=False,
+                enable_reminders=False,
+                enable_bus=False,
+                enable_control=False,
+                stop_event=stop_event,
+                restart_counts=counts,
+            )
+
+    assert consumer_runs == 2
+    assert processor_runs == 1
+    assert counts == {"consumer": 1, "processor": 0}
+
+
+async def test_daemon_drains_processor_and_cancels_consumer(tmp_path):
+    """On stop, the processor finishes its work while the consumer is cancelled."""
+    stop_event = asyncio.Event()
+    consumer_cancelled = False
+    processor_drained = False
+
+    async def consumer(**kwargs):
+        nonlocal consumer_cancelled
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            consumer_cancelled = True
+            raise
+
+    async def processor(**kwargs):
+        nonlocal processor_drained
+        await kwargs["stop_event"].wait()
+        await asyncio.sleep(0.01)  # finishing the in-flight reply
+        processor_drained = True
+
+    with patch("corphish.daemon.run_message_consumer", new=consumer):
+        with patch("corphish.daemon.run_message_processor", new=processor):
+            asyncio.get_running_loop().call_later(0.01, stop_event.set)
+            await run_daemon(
+                claude=MagicMock(),
+                db_path=tmp_path / "test.db",
+                enable_heartbeat=False,
+                enable_reminders=False,
+                enable_bus=False,
+                enable_control=False,
+                stop_event=stop_event,
+            )
+
+    assert consumer_cancelled
+    assert processor_drained
+
+
+async def test_processor_stop_flushes_outgoing_without_claiming():
+    """A stopping processor flushes unsent outgoing rows and claims nothing."""
+    deps = _make_processor_deps(chat_id=42)
+    deps["once"] = False
+    deps["get_unsent_outgoing_fn"] = AsyncMock(return_value=[{"id": 5, "text": "queued"}])
+    stop_event = asyncio.Event()
+    stop_event.set()
+
+    await run_message_processor(
+        stop_event=stop_event, **{k: v for k, v in deps.items() if k != "_bot"}
+    )
+
+    deps["claim_next_fn"].assert_not_awaited()
+    deps["send_message_fn"].assert_awaited_once_with(deps["_bot"], 42, "queued")
+    deps["mark_outgoing_sent_fn"].assert_awaited_once_with(5, 999, db_path=None)
+
+
+async def test_heartbeat_returns_when_stopped():
+    """The heartbeat runner returns without firing once stop is requested."""
+    deps = _make_heartbeat_deps()
+    deps["once"] = False
+    stop_event = asyncio.Event()
+    stop_event.set()
+
+    await run_heartbeat_runner(stop_event=stop_event, **deps)
+
+    deps["claude"].send_heartbeat.assert_not_awaited()
+
+
+async def test_sleep_or_stop_returns_early_on_wake():
+    """A wake event cuts the processor's poll sleep short and is cleared."""
+    wake = asyncio.Event()
+    wake.set()
+
+    stopped = await asyncio.wait_for(_sleep_or_stop(10, None, wake), timeout=1)
+
+    assert stopped is False
+    assert not wake.is_set()
+
+
+# --- Control State Tests ---
+
+
+async def test_processor_applies_requested_reset():
+    """A reset requested via the control socket is applied by the processor."""
+    deps = _make_processor_deps(chat_id=42)
+    state = DaemonState()
+    state.reset_requested = True
+    state.turn_count = 12
+
+    await run_message_processor(
+        state=state, **{k: v for k, v in deps.items() if k != "_bot"}
+    )
+
+    deps["claude"].reset.assert_called_once()
+    assert state.reset_requested is False
+    assert state.turn_count == 0
+
+
+async def test_processor_keeps_typing_while_claude_works():
+    """The typing indicator repeats for as long as the reply takes, then stops."""
+    message = {
+        "id": 3,
+        "text": "hello",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+
+    async def stream(user_text):
+        await asyncio.sleep(0.05)
+        yield "hi"
+
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(return_value=message)
+    deps["claude"].stream = stream
+    deps["typing_interval"] = 0.01
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    typing = deps["send_typing_fn"]
+    assert typing.await_count >= 2
+    typing.assert_awaited_with(deps["_bot"], 42)
+    count = typing.await_count
+    await asyncio.sleep(0.03)
+    assert typing.await_count == count
+
+
+async def test_processor_typing_failures_do_not_affect_reply():
+    """A failing typing indicator never stops the reply."""
+    message = {
+        "id": 3,
+        "text": "hello",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(return_value=message)
+    deps["send_typing_fn"] = AsyncMock(side_effect=RuntimeError("flood"))
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["mark_processed_fn"].assert_awaited_once_with(3, "test-worker", db_path=None)
+
+
+async def test_processor_does_not_type_for_commands():
+    """Commands answered locally do not show the typing indicator."""
+    message = {
+        "id": 3,
+        "text": "/cancel",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(return_value=message)
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["send_typing_fn"].assert_not_awaited()
+
+
+async def test_processor_records_progress_in_state():
+    """The processor counts turns and clears its in-flight markers."""
+    message = {
+        "id": 3,
+        "text": "hello",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    seen = {}
+    state = DaemonState()
+
+    async def stream(user_text):
+        seen["holder"] = state.lock_holder
+        seen["message_id"] = state.current_message_id
+        yield "hi"
+
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = stream
+
+    await run_message_processor(
+        state=state, **{k: v for k, v in deps.items() if k != "_bot"}
+    )
+
+    assert seen == {"holder": "processor", "message_id": 3}
+    assert state.lock_holder is None
+    assert state.current_message_id is None
+    assert state.turn_count == 1
+    assert state.counters["messages_processed"] == 1
+
+
+async def test_heartbeat_skips_while_paused():
+    """A paused heartbeat does not call Claude."""
+    deps = _make_heartbeat_deps()
+    state = DaemonState()
+    state.heartbeat_paused = True
+
+    await run_heartbeat_runner(state=state, **deps)
+
+    deps["claude"].send_heartbeat.assert_not_awaited()
+    assert state.counters["heartbeats_paused"] == 1
+
+
+# --- Retrieval Tests ---
+
+
+async def test_processor_prepends_retrieved_context():
+    """With retrieval on, Claude receives past exchanges ahead of the message."""
+    message = {
+        "id": 8,
+        "text": "that restaurant again?",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    prompts = []
+
+    async def stream(user_text):
+        prompts.append(user_text)
+        yield "Taberna"
+
+    retriever = MagicMock()
+    retriever.context_for = AsyncMock(return_value="[2024-06-01] user: Lisbon restaurant")
+    state = DaemonState()
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = stream
+    deps["get_retrieval_fn"] = MagicMock(return_value=True)
+
+    await run_message_processor(
+        retriever=retriever,
+        state=state,
+        **{k: v for k, v in deps.items() if k != "_bot"},
+    )
+
+    retriever.context_for.assert_awaited_once_with("that restaurant again?", before_id=8)
+    assert "Lisbon restaurant" in prompts[0]
+    assert prompts[0].endswith("that restaurant again?")
+    assert state.timings["retrieval_ms"]["count"] == 1
+
+
+async def test_processor_retrieval_after_reset_includes_earlier_exchanges():
+    """A chat /reset starts a new session, so retrieval covers what came before it."""
+    def make_message(i, text):
+        return {"id": i, "text": text, "telegram_update_id": i,
+                "telegram_message_id": i * 10, "created_at": "2024-01-01T00:00:00Z"}
+
+    messages = [make_message(3, "hello"), make_message(4, "/reset"), make_message(5, "again?")]
+    retriever = MagicMock()
+    retriever.context_for = AsyncMock(return_value="")
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=messages + [None])
+    deps["get_retrieval_fn"] = MagicMock(return_value=True)
+    deps["once"] = False
+
+    with patch(
+        "corphish.daemon.asyncio.sleep",
+        new=AsyncMock(side_effect=[None, None, None, StopAsyncIteration()]),
+    ):
+        with pytest.raises(StopAsyncIteration):
+            await run_message_processor(
+                retriever=retriever, **{k: v for k, v in deps.items() if k != "_bot"}
+            )
+
+    assert [c.kwargs["before_id"] for c in retriever.context_for.await_args_list] == [3, 5]
+
+
+async def test_processor_continues_when_retrieval_fails():
+    """A retrieval error falls back to the plain message."""
+    message = {
+        "id": 8,
+        "text": "hello",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    prompts = []
+
+    async def stream(user_text):
+        prompts.append(user_text)
+        yield "hi"
+
+    retriever = MagicMock()
+    retriever.context_for = AsyncMock(side_effect=RuntimeError("no fts"))
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = stream
+    deps["get_retrieval_fn"] = MagicMock(return_value=True)
+
+    await run_message_processor(
+        retriever=retriever, **{k: v for k, v in deps.items() if k != "_bot"}
+    )
+
+    assert prompts == ["hello"]
+    deps["mark_processed_fn"].assert_awaited_once_with(8, "test-worker", db_path=None)
+
+
+# --- Attachment Tests ---
+
+
+async def test_processor_lists_attachments_in_prompt():
+    """Files stored for a message are listed after its prompt."""
+    message = {
+        "id": 8,
+        "text": "what is this?",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    prompts = []
+
+    async def stream(user_text):
+        prompts.append(user_text)
+        yield "a cat"
+
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = stream
+    deps["get_attachments_fn"] = AsyncMock(
+        return_value=[
+            {
+                "kind": "photo",
+                "path": "/media/ab/abc.jpg",
+                "size": 2048,
+                "mime_type": "image/jpeg",
+                "file_name": None,
+            }
+        ]
+    )
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    deps["get_attachments_fn"].assert_awaited_once_with(10, db_path=None)
+    assert prompts[0].startswith("what is this?")
+    assert "- photo: /media/ab/abc.jpg (image/jpeg, 2 KB)" in prompts[0]
+
+
+async def test_processor_continues_when_attachments_fail():
+    """An error loading attachments falls back to the plain message."""
+    message = {
+        "id": 8,
+        "text": "hello",
+        "telegram_update_id": 1,
+        "telegram_message_id": 10,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+    prompts = []
+
+    async def stream(user_text):
+        prompts.append(user_text)
+        yield "hi"
+
+    deps = _make_processor_deps(chat_id=42)
+    deps["claim_next_fn"] = AsyncMock(side_effect=[message, None])
+    deps["claude"].stream = stream
+    deps["get_attachments_fn"] = AsyncMock(side_effect=RuntimeError("locked"))
+
+    await run_message_processor(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    assert prompts == ["hello"]
+    deps["mark_processed_fn"].assert_awaited_once_with(8, "test-worker", db_path=None)
+
+
+# --- Throughput Tests ---
+
+
+class _StopLoop(Exception):
+    pass
+
+
+async def test_consumer_polls_again_immediately_after_updates():
+    """The consumer only pauses between polls when a poll returned nothing."""
+    deps = _make_consumer_deps(chat_id=42)
+    deps["once"] = False
+    deps["poll_fn"] = AsyncMock(
+        side_effect=[[_make_update(1, 42, "a")], [_make_update(2, 42, "b")], []]
+    )
+    sleep = AsyncMock(side_effect=_StopLoop)
+
+    with patch("corphish.daemon.asyncio.sleep", sleep), pytest.raises(_StopLoop):
+        await run_message_consumer(**{k: v for k, v in deps.items() if k != "_bot"})
+
+    assert deps["poll_fn"].await_count == 3
+    sleep.assert_awaited_once_with(1)
+
+
+async def test_processor_claims_next_message_without_sleeping():
+    """Queued messages are processed back to back; the idle wait comes after."""
+    messages = [
+        {
+            "id": i,
+            "text": f"m{i}",
+            "telegram_update_id": i,
+            "telegram_message_id": i,
+            "created_at": "2024-01-01T00:00:00Z",
+        }
+        for i in (1, 2)
+    ]
+    deps = _make_processor_deps(chat_id=42)
+    deps["once"] = False
+    deps["claim_next_fn"] = AsyncMock(side_effect=messages + [None])
+    stop_event = asyncio.Event()
+
+    async def idle(seconds, stop, wake=None):
+        stop.set()
+        return True
+
+    sleep = AsyncMock(side_effect=idle)
+    with patch("corphish.daemon._sleep_or_stop", sleep):
+        await run_message_processor(
+            stop_event=stop_event, **{k: v for k, v in deps.items() if k != "_bot"}
+        )
+
+    assert deps["claim_next_fn"].await_count == 3
+    sleep.assert_awaited_once()
@@ -7,18 +7,48 @@ from unittest.mock import MagicMock, patch
 import pytest
 
 from corphish.db import (
+    cancel_reminder,
+    claim_next_message,
+    deliver_reminder,
+    extend_message_lease,
+    get_conversation_activity,
     get_db_path,
+    get_exchange,
+    get_dead_letter_messages,
+    get_heartbeat_decision_summary,
     get_latest_outgoing_id,
     get_model_usage_summary,
     get_next_unprocessed_message,
     get_outgoing_messages_after,
+    get_queue_depths,
+    get_stored_update_ids,
+    get_pending_reminders,
     get_unsent_outgoing_messages,
+    get_usage_timeseries,
+    has_waiting_messages,
+    get_outgoing_parts,
+    save_outgoing_parts,
+    mark_outgoing_part_sent,
+    record_send_failure,
+    get_outbox,
+    retry_outgoing_messages,
+    drop_outgoing_messages,
+    get_attachments,
+    insert_attachment,
     init_db,
     insert_incoming_message,
     insert_outgoing_message,
+    insert_sent_outgoing_message,
+    insert_reminder,
+    iter_messages,
+    log_heartbeat_decision,
     log_model_usage,
     mark_message_processed,
     mark_outgoing_message_sent,
+    record_message_error,
+    release_message,
+    search_messages,
+    take_cancel_request,
 )
 
 
@@ -140,7 +170,8 @@ async def test_get_next_unprocessed_message_returns_oldest(temp_db):
 async def test_get_next_unprocessed_message_skips_processed(temp_db):
     """get_next_unprocessed_message() should skip processed messages."""
     id1 = await insert_incoming_message("First", 1, 10, db_path=temp_db)
-    await mark_message_processed(id1, db_path=temp_db)
+    await claim_next_message("w1", db_path=temp_db)
+    await mark_message_processed(id1, "w1", db_path=temp_db)
     await asyncio.sleep(0.01)
     id2 = await insert_incoming_message("Second", 2, 20, db_path=temp_db)
 
@@ -163,8 +194,9 @@ async def test_get_next_unprocessed_message_ignores_outgoing(temp_db):
 async def test_mark_message_processed(temp_db):
     """mark_message_processed() should mark a message as processed."""
     message_id = await insert_incoming_message("Test", 1, 10, db_path=temp_db)
+    await claim_next_message("w1", db_path=temp_db)
 
-    await mark_message_processed(message_id, db_path=temp_db)
+    await mark_message_processed(message_id, "w1", db_path=temp_db)
 
     import aiosqlite
 
@@ -236,6 +268,22 @@ async def test_mark_outgoing_message_sent(temp_db):
         assert row["telegram_message_id"] == 999
 
 
+async def test_insert_sent_outgoing_message(temp_db):
+    """insert_sent_outgoing_message() records a reply that is already sent."""
+    message_id = await insert_sent_outgoing_message("Sent", 999, db_path=temp_db)
+
+    import aiosqlite
+
+    async with aiosqlite.connect(temp_db) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("SELECT * FROM messages WHERE id = ?", (message_id,))
+        row = await cursor.fetchone()
+    assert row["direction"] == "outgoing"
+    assert row["processed"] == 1
+    assert row["telegram_message_id"] == 999
+    assert await get_unsent_outgoing_messages(db_path=temp_db) == []
+
+
 async def test_get_latest_outgoing_id_empty(temp_db):
     """get_latest_outgoing_id() returns 0 when no outgoing messages exist."""
     result = await get_latest_outgoing_id(db_path=temp_db)
@@ -402,3 +450,697 @@ async def test_get_model_usage_summary(temp_db):
     assert opus_heartbeat is not None
     assert opus_heartbeat["count"] == 1
     assert opus_heartbeat["escalated_count"] == 1
+
+
+# --- Heartbeat Decision Tests ---
+
+
+async def test_get_conversation_activity_counts_incoming_since(temp_db):
+    """get_conversation_activity() counts incoming messages after *since*."""
+    await insert_incoming_message("old", 1, 10, db_path=temp_db)
+    await asyncio.sleep(0.01)
+    from datetime import datetime, timezone
+
+    since = datetime.now(timezone.utc).isoformat()
+    await asyncio.sleep(0.01)
+    await insert_incoming_message("new", 2, 20, db_path=temp_db)
+    await insert_outgoing_message("Anything else?", db_path=temp_db)
+
+    activity = await get_conversation_activity(since, db_path=temp_db)
+
+    assert activity == {"incoming_count": 1, "last_outgoing_text": "Anything else?"}
+
+
+async def test_get_conversation_activity_empty(temp_db):
+    """get_conversation_activity() reports no activity on an empty database."""
+    activity = await get_conversation_activity("1970-01-01T00:00:00", db_path=temp_db)
+    assert activity == {"incoming_count": 0, "last_outgoing_text": None}
+
+
+async def test_heartbeat_decision_summary(temp_db):
+    """get_heartbeat_decision_summary() aggregates decisions by reason."""
+    await log_heartbeat_decision("skip", "no_activity", 7200, db_path=temp_db)
+    await log_heartbeat_decision("skip", "no_activity", 14400, db_path=temp_db)
+    await log_heartbeat_decision("fire", "activity", 3600, db_path=temp_db)
+
+    summary = await get_heartbeat_decision_summary(db_path=temp_db)
+
+    assert summary == [
+        {"decision": "skip", "reason": "no_activity", "count": 2},
+        {"decision": "fire", "reason": "activity", "count": 1},
+    ]
+
+
+# --- Reminder Tests ---
+
+
+async def test_get_pending_reminders_ordered_by_due(temp_db):
+    """get_pending_reminders() returns reminders soonest first."""
+    late = await insert_reminder("late", "2024-01-02T00:00:00+00:00", db_path=temp_db)
+    early = await insert_reminder("early", "2024-01-01T00:00:00+00:00", db_path=temp_db)
+
+    pending = await get_pending_reminders(db_path=temp_db)
+
+    assert [r["id"] for r in pending] == [early, late]
+
+
+async def test_deliver_reminder_inserts_outgoing_once(temp_db):
+    """deliver_reminder() creates one outgoing message and is idempotent."""
+    rid = await insert_reminder("stretch", "2024-01-01T00:00:00+00:00", db_path=temp_db)
+
+    outgoing_id = await deliver_reminder(rid, db_path=temp_db)
+    again = await deliver_reminder(rid, db_path=temp_db)
+
+    assert outgoing_id is not None
+    assert again is None
+    unsent = await get_unsent_outgoing_messages(db_path=temp_db)
+    assert [m["text"] for m in unsent] == ["stretch"]
+    assert await get_pending_reminders(db_path=temp_db) == []
+
+
+async def test_cancel_reminder_prevents_delivery(temp_db):
+    """A cancelled reminder is not delivered."""
+    rid = await insert_reminder("nope", "2024-01-01T00:00:00+00:00", db_path=temp_db)
+
+    assert await cancel_reminder(rid, db_path=temp_db) is True
+    assert await cancel_reminder(rid, db_path=temp_db) is False
+    assert await deliver_reminder(rid, db_path=temp_db) is None
+
+
+async def test_log_model_usage_records_outcome(temp_db):
+    """log_model_usage() stores the call outcome, defaulting to completed."""
+    done_id = await log_model_usage("haiku", "heartbeat", db_path=temp_db)
+    cancelled_id = await log_model_usage(
+        "opus", "heartbeat", True, outcome="cancelled", db_path=temp_db
+    )
+
+    import aiosqlite
+
+    async with aiosqlite.connect(temp_db) as db:
+        cursor = await db.execute(
+            "SELECT id, outcome FROM model_usage ORDER BY id"
+        )
+        rows = await cursor.fetchall()
+    assert rows == [(done_id, "completed"), (cancelled_id, "cancelled")]
+
+
+async def test_log_model_usage_records_reason(temp_db):
+    """log_model_usage() stores an optional routing reason."""
+    usage_id = await log_model_usage(
+        "haiku", "processor", reason="acknowledgement", db_path=temp_db
+    )
+
+    import aiosqlite
+
+    async with aiosqlite.connect(temp_db) as db:
+        cursor = await db.execute(
+            "SELECT reason FROM model_usage WHERE id = ?", (usage_id,)
+        )
+        row = await cursor.fetchone()
+    assert row == ("acknowledgement",)
+
+
+async def test_claim_next_message_returns_none_when_empty(temp_db):
+    """claim_next_message() returns None when nothing is queued."""
+    assert await claim_next_message("w1", db_path=temp_db) is None
+
+
+async def test_claim_next_message_claims_oldest_and_counts_attempt(temp_db):
+    """claim_next_message() returns the oldest message with attempts=1."""
+    first = await insert_incoming_message("first", 1, 10, db_path=temp_db)
+    await insert_incoming_message("second", 2, 20, db_path=temp_db)
+
+    message = await claim_next_message("w1", db_path=temp_db)
+
+    assert message["id"] == first
+    assert message["text"] == "first"
+    assert message["attempts"] == 1
+
+
+async def test_claim_next_message_hides_leased_rows(temp_db):
+    """A claimed message is not handed to a second worker while leased."""
+    first = await insert_incoming_message("first", 1, 10, db_path=temp_db)
+    second = await insert_incoming_message("second", 2, 20, db_path=temp_db)
+
+    a = await claim_next_message("w1", db_path=temp_db)
+    b = await claim_next_message("w2", db_path=temp_db)
+    c = await claim_next_message("w3", db_path=temp_db)
+
+    assert a["id"] == first
+    assert b["id"] == second
+    assert c is None
+
+
+async def test_claim_next_message_concurrent_workers_get_distinct_rows(temp_db):
+    """Concurrent claims never return the same message twice."""
+    for i in range(5):
+        await insert_incoming_message(f"m{i}", i, i, db_path=temp_db)
+
+    results = await asyncio.gather(
+        *(claim_next_message(f"w{i}", db_path=temp_db) for i in range(8))
+    )
+
+    ids = [r["id"] for r in results if r]
+    assert len(ids) == 5
+    assert len(set(ids)) == 5
+
+
+async def test_claim_next_message_reclaims_expired_lease(temp_db):
+    """A message whose lease expired is claimed again by another worker."""
+    msg_id = await insert_incoming_message("hello", 1, 10, db_path=temp_db)
+    await claim_next_message("crashed", lease_seconds=0, db_path=temp_db)
+
+    message = await claim_next_message("w2", db_path=temp_db)
+
+    assert message["id"] == msg_id
+    assert message["attempts"] == 2
+
+
+async def test_mark_message_processed_acks_claim(temp_db):
+    """An acknowledged message is never claimed again."""
+    msg_id = await insert_incoming_message("hello", 1, 10, db_path=temp_db)
+    await claim_next_message("w1", lease_seconds=0, db_path=temp_db)
+    await mark_message_processed(msg_id, "w1", db_path=temp_db)
+
+    assert await claim_next_message("w2", db_path=temp_db) is None
+
+
+async def test_mark_message_processed_requires_claim(temp_db):
+    """A worker whose lease expired cannot ack a message reclaimed by another."""
+    msg_id = await insert_incoming_message("hello", 1, 10, db_path=temp_db)
+    await claim_next_message("w1", lease_seconds=0, db_path=temp_db)
+    await claim_next_message("w2", db_path=temp_db)
+
+    await mark_message_processed(msg_id, "w1", db_path=temp_db)
+    assert await has_waiting_messages(db_path=temp_db) is True
+
+    await mark_message_processed(msg_id, "w2", db_path=temp_db)
+    assert await has_waiting_messages(db_path=temp_db) is False
+
+
+async def test_release_message_makes_it_claimable(temp_db):
+    """release_message() lets the message be retried immediately."""
+    msg_id = await insert_incoming_message("hello", 1, 10, db_path=temp_db)
+    await claim_next_message("w1", db_path=temp_db)
+
+    await release_message(msg_id, "w1", db_path=temp_db)
+    message = await claim_next_message("w1", db_path=temp_db)
+
+    assert message["id"] == msg_id
+    assert message["attempts"] == 2
+
+
+async def test_record_message_error(temp_db):
+    """record_message_error() stores the reason on the message."""
+    import aiosqlite
+
+    msg_id = await insert_incoming_message("hello", 1, 10, db_path=temp_db)
+
+    await record_message_error(msg_id, "timeout: no reply within 5s", db_path=temp_db)
+
+    async with aiosqlite.connect(temp_db) as conn:
+        cursor = await conn.execute("SELECT last_error FROM messages WHERE id = ?", (msg_id,))
+        assert (await cursor.fetchone())[0] == "timeout: no reply within 5s"
+
+
+async def test_take_cancel_request_only_takes_later_cancels(temp_db):
+    """take_cancel_request() acknowledges a /cancel queued after the message."""
+    early = await insert_incoming_message("/cancel", 1, 10, db_path=temp_db)
+    current = await insert_incoming_message("long task", 2, 20, db_path=temp_db)
+    await insert_incoming_message("next question", 3, 30, db_path=temp_db)
+
+    assert await take_cancel_request(current, db_path=temp_db) is None
+
+    cancel = await insert_incoming_message(" /Cancel ", 4, 40, db_path=temp_db)
+    assert await take_cancel_request(current, db_path=temp_db) == cancel
+    assert await take_cancel_request(current, db_path=temp_db) is None
+
+    # The earlier /cancel is left for the queue
+    message = await claim_next_message("w1", db_path=temp_db)
+    assert message["id"] == early
+
+
+async def test_release_message_requires_claim(temp_db):
+    """A worker whose lease expired cannot release a message reclaimed by another."""
+    msg_id = await insert_incoming_message("hello", 1, 10, db_path=temp_db)
+    await claim_next_message("w1", lease_seconds=0, db_path=temp_db)
+    await claim_next_message("w2", db_path=temp_db)
+
+    await release_message(msg_id, "w1", db_path=temp_db)
+
+    assert await claim_next_message("w3", db_path=temp_db) is None
+    assert await extend_message_lease(msg_id, "w2", db_path=temp_db) is True
+
+
+async def test_release_message_can_refund_attempt(temp_db):
+    """release_message(refund_attempt=True) does not count the claim."""
+    msg_id = await insert_incoming_message("hello", 1, 10, db_path=temp_db)
+    await claim_next_message("w1", db_path=temp_db)
+
+    await release_message(msg_id, "w1", refund_attempt=True, db_path=temp_db)
+    message = await claim_next_message("w1", db_path=temp_db)
+
+    assert message["attempts"] == 1
+
+
+async def test_claim_next_message_dead_letters_after_max_attempts(temp_db):
+    """Messages that exhaust their attempts are dead-lettered, not claimed."""
+    msg_id = await insert_incoming_message("poison", 1, 10, db_path=temp_db)
+    other = await insert_incoming_message("fine", 2, 20, db_path=temp_db)
+    for _ in range(2):
+        await claim_next_message("w1", max_attempts=2, db_path=temp_db)
+        await release_message(msg_id, "w1", db_path=temp_db)
+
+    message = await claim_next_message("w1", max_attempts=2, db_path=temp_db)
+
+    dead = await get_dead_letter_messages(db_path=temp_db)
+    assert [d["id"] for d in dead] == [msg_id]
+    assert dead[0]["attempts"] == 2
+    assert dead[0]["last_error"] is None
+    assert message["id"] == other
+
+
+async def test_extend_message_lease_requires_holder(temp_db):
+    """Only the worker holding a claim can extend its lease."""
+    msg_id = await insert_incoming_message("hello", 1, 10, db_path=temp_db)
+    await claim_next_message("w1", db_path=temp_db)
+
+    assert await extend_message_lease(msg_id, "w1", db_path=temp_db) is True
+    assert await extend_message_lease(msg_id, "w2", db_path=temp_db) is False
+
+
+async def test_outgoing_parts_round_trip(temp_db):
+    """Parts are stored once, in order, and marked sent individually."""
+    message_id = await insert_outgoing_message("long reply", db_path=temp_db)
+    assert await get_outgoing_parts(message_id, db_path=temp_db) == []
+
+    parts = await save_outgoing_parts(
+        message_id,
+        [{"text": "first", "html": "<b>first</b>"}, {"text": "second", "html": None}],
+        db_path=temp_db,
+    )
+    assert [(p["part_index"], p["text"], p["html"]) for p in parts] == [
+        (0, "first", "<b>first</b>"),
+        (1, "second", None),
+    ]
+
+    await mark_outgoing_part_sent(parts[0]["id"], 77, db_path=temp_db)
+    again = await save_outgoing_parts(
+        message_id, [{"text": "other", "html": None}], db_path=temp_db
+    )
+    assert [(p["text"], p["telegram_message_id"]) for p in again] == [
+        ("first", 77),
+        ("second", None),
+    ]
+
+
+async def test_record_send_failure_backs_off_then_fails(temp_db):
+    """Failed sends are rescheduled until the last attempt marks the row failed."""
+    message_id = await insert_outgoing_message("reply", db_path=temp_db)
+
+    assert await record_send_failure(message_id, "boom", 2, db_path=temp_db) is False
+    # Waiting out the backoff, so not due yet
+    assert await get_unsent_outgoing_messages(db_path=temp_db) == []
+    [row] = await get_outbox(db_path=temp_db)
+    assert row["send_attempts"] == 1
+    assert row["next_attempt_at"] is not None
+    assert row["failed_at"] is None
+
+    assert await record_send_failure(message_id, "boom again", 2, db_path=temp_db) is True
+    [row] = await get_outbox(db_path=temp_db)
+    assert row["failed_at"] is not None
+    assert row["last_error"] == "boom again"
+    depths = await get_queue_depths(db_path=temp_db)
+    assert depths["outgoing_unsent"] == 0
+    assert depths["outgoing_failed"] == 1
+
+
+async def test_retry_and_drop_outgoing_messages(temp_db):
+    """Failed rows can be queued again or deleted; sent rows are untouched."""
+    failed = await insert_outgoing_message("failed", db_path=temp_db)
+    await record_send_failure(failed, "boom", 1, db_path=temp_db)
+    dropped = await insert_outgoing_message("dropped", db_path=temp_db)
+    sent = await insert_outgoing_message("sent", db_path=temp_db)
+    await mark_outgoing_message_sent(sent, 1, db_path=temp_db)
+
+    assert await retry_outgoing_messages([failed, sent], db_path=temp_db) == 1
+    assert [m["id"] for m in await get_unsent_outgoing_messages(db_path=temp_db)] == [
+        failed,
+        dropped,
+    ]
+
+    assert await drop_outgoing_messages([dropped, sent], db_path=temp_db) == 1
+    assert [m["id"] for m in await get_outbox(db_path=temp_db)] == [failed]
+
+
+async def test_attachments_round_trip(temp_db):
+    """Attachments are returned per Telegram message, in order."""
+    assert await get_attachments(10, db_path=temp_db) == []
+    await insert_attachment(
+        10, "photo", "ab" * 32, "/m/ab/x.jpg", 100, "image/jpeg", db_path=temp_db
+    )
+    await insert_attachment(
+        10, "document", "cd" * 32, "/m/cd/y.pdf", 200, file_name="y.pdf", db_path=temp_db
+    )
+    await insert_attachment(11, "voice", "ef" * 32, "/m/ef/z.oga", 300, db_path=temp_db)
+
+    rows = await get_attachments(10, db_path=temp_db)
+    assert [(r["kind"], r["path"], r["size"], r["mime_type"], r["file_name"]) for r in rows] == [
+        ("photo", "/m/ab/x.jpg", 100, "image/jpeg", None),
+        ("document", "/m/cd/y.pdf", 200, None, "y.pdf"),
+    ]
+
+
+async def test_has_waiting_messages(temp_db):
+    """has_waiting_messages() is True until every incoming message is processed."""
+    assert await has_waiting_messages(db_path=temp_db) is False
+    await insert_outgoing_message("hello", db_path=temp_db)
+    assert await has_waiting_messages(db_path=temp_db) is False
+    message_id = await insert_incoming_message("hi", 1, 1, db_path=temp_db)
+    assert await has_waiting_messages(db_path=temp_db) is True
+    await claim_next_message("w1", db_path=temp_db)
+    await mark_message_processed(message_id, "w1", db_path=temp_db)
+    assert await has_waiting_messages(db_path=temp_db) is False
+
+
+async def test_get_queue_depths(temp_db):
+    """get_queue_depths() counts pending, claimed, unsent and dead messages."""
+    await insert_incoming_message("a", 1, 10, db_path=temp_db)
+    await insert_incoming_message("b", 2, 20, db_path=temp_db)
+    await insert_outgoing_message("reply", db_path=temp_db)
+    await claim_next_message("w1", db_path=temp_db)
+
+    depths = await get_queue_depths(db_path=temp_db)
+
+    assert depths == {
+        "incoming_pending": 1,
+        "incoming_claimed": 1,
+        "outgoing_unsent": 1,
+        "outgoing_failed": 0,
+        "dead_lettered": 0,
+    }
+
+
+async def test_search_messages_ranks_and_snippets(temp_db):
+    """search_messages() finds matches via FTS5 with highlighted snippets."""
+    await insert_incoming_message("what is the capital of France?", 1, 10, db_path=temp_db)
+    best = await insert_outgoing_message(
+        "Paris is the capital of France. Paris is lovely.", db_path=temp_db
+    )
+    await insert_incoming_message("unrelated chatter", 2, 20, db_path=temp_db)
+
+    results = await search_messages("paris", db_path=temp_db)
+
+    assert [r["id"] for r in results] == [best]
+    assert "[Paris]" in results[0]["snippet"]
+    assert results[0]["direction"] == "outgoing"
+
+
+async def test_search_messages_requires_all_words_and_stems(temp_db):
+    """All words must match, with porter stemming applied."""
+    match = await insert_incoming_message("we were running late", 1, 10, db_path=temp_db)
+    await insert_incoming_message("late again", 2, 20, db_path=temp_db)
+
+    results = await search_messages("run late", db_path=temp_db)
+
+    assert [r["id"] for r in results] == [match]
+
+
+async def test_search_messages_tolerates_punctuation(temp_db):
+    """User punctuation never raises an FTS5 syntax error."""
+    await insert_incoming_message("what's the plan: NOT sure", 1, 10, db_path=temp_db)
+
+    results = await search_messages('what\'s "plan: NOT', db_path=temp_db)
+
+    assert len(results) == 1
+
+
+async def test_search_messages_prefix_and_since(temp_db):
+    """A trailing * matches prefixes; since excludes older messages."""
+    await insert_incoming_message("database migration", 1, 10, db_path=temp_db)
+
+    assert len(await search_messages("migra*", db_path=temp_db)) == 1
+    assert await search_messages("migra*", since="2999-01-01", db_path=temp_db) == []
+
+
+async def test_search_index_tracks_updates_and_deletes(temp_db):
+    """Triggers keep the index in sync with edits and deletions."""
+    import aiosqlite
+
+    msg_id = await insert_incoming_message("old words", 1, 10, db_path=temp_db)
+    async with aiosqlite.connect(temp_db) as conn:
+        await conn.execute("UPDATE messages SET text = 'new words' WHERE id = ?", (msg_id,))
+        await conn.commit()
+
+    assert await search_messages("old", db_path=temp_db) == []
+    assert len(await search_messages("new", db_path=temp_db)) == 1
+
+    async with aiosqlite.connect(temp_db) as conn:
+        await conn.execute("DELETE FROM messages WHERE id = ?", (msg_id,))
+        await conn.commit()
+
+    assert await search_messages("new", db_path=temp_db) == []
+
+
+async def _rewind_message_columns(conn):
+    """Drops the messages columns added after schema v10, so they can be re-added."""
+    await conn.execute("DROP INDEX idx_messages_failed")
+    for column in ("last_error", "send_attempts", "next_attempt_at", "failed_at"):
+        await conn.execute(f"ALTER TABLE messages DROP COLUMN {column}")
+
+
+async def test_search_migration_backfills_existing_rows(temp_db):
+    """Upgrading to schema v9 indexes history written before the upgrade."""
+    import aiosqlite
+
+    await insert_incoming_message("remember the milk", 1, 10, db_path=temp_db)
+    async with aiosqlite.connect(temp_db) as conn:
+        await conn.execute("DROP TABLE messages_fts")
+        for trigger in ("insert", "delete", "update"):
+            await conn.execute(f"DROP TRIGGER messages_fts_{trigger}")
+        await conn.execute("DELETE FROM schema_version WHERE version >= 9")
+        await _rewind_message_columns(conn)
+        await conn.commit()
+
+    await init_db(temp_db)
+
+    assert len(await search_messages("milk", db_path=temp_db)) == 1
+
+
+async def test_search_messages_match_any_and_before_id(temp_db):
+    """match_any ORs the words; before_id limits the search to older rows."""
+    a = await insert_incoming_message("apples", 1, 10, db_path=temp_db)
+    b = await insert_incoming_message("pears", 2, 20, db_path=temp_db)
+
+    assert await search_messages("apples pears", db_path=temp_db) == []
+    both = await search_messages("apples pears", match_any=True, db_path=temp_db)
+    assert {r["id"] for r in both} == {a, b}
+    older = await search_messages("apples pears", match_any=True, before_id=b, db_path=temp_db)
+    assert [r["id"] for r in older] == [a]
+    assert older[0]["text"] == "apples"
+
+
+async def test_get_exchange_from_either_side(temp_db):
+    """get_exchange() pairs a question with its reply from either message."""
+    question = await insert_incoming_message("question", 1, 10, db_path=temp_db)
+    answer = await insert_outgoing_message("answer", db_path=temp_db)
+    await insert_outgoing_message("later", db_path=temp_db)
+
+    from_question = await get_exchange(question, db_path=temp_db)
+    from_answer = await get_exchange(answer, db_path=temp_db)
+
+    assert [m["id"] for m in from_question] == [question, answer]
+    assert [m["id"] for m in from_answer] == [question, answer]
+    assert await get_exchange(999, db_path=temp_db) == []
+
+
+async def test_iter_messages_pages_through_history(temp_db):
+    """iter_messages() yields every row in id order across batches."""
+    ids = []
+    for i in range(5):
+        ids.append(await insert_incoming_message(f"m{i}", i, i, db_path=temp_db))
+
+    rows = [row async for row in iter_messages(batch_size=2, db_path=temp_db)]
+
+    assert [row["id"] for row in rows] == ids
+    assert rows[0]["text"] == "m0"
+    assert rows[0]["direction"] == "incoming"
+
+
+async def test_iter_messages_since_id(temp_db):
+    """Only messages after since_id are yielded."""
+    first = await insert_incoming_message("old", 1, 1, db_path=temp_db)
+    await insert_outgoing_message("new", db_path=temp_db)
+
+    rows = [row async for row in iter_messages(since_id=first, db_path=temp_db)]
+
+    assert [row["text"] for row in rows] == ["new"]
+
+
+async def test_iter_messages_empty(temp_db):
+    assert [row async for row in iter_messages(db_path=temp_db)] == []
+
+
+async def _log_usage_at(db_path, created_at, model="haiku", source="heartbeat", **kwargs):
+    """Inserts a model_usage row with a fixed timestamp."""
+    import aiosqlite
+
+    async with aiosqlite.connect(db_path) as conn:
+        await conn.execute(
+            "INSERT INTO model_usage (model, source, escalated, outcome, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                model,
+                source,
+                kwargs.get("escalated", 0),
+                kwargs.get("outcome", "completed"),
+                created_at,
+            ),
+        )
+        await conn.commit()
+
+
+async def test_usage_rollups_maintained_on_insert(temp_db):
+    """Every model_usage insert updates the hourly and daily rollups."""
+    await _log_usage_at(temp_db, "2024-06-01T09:10:00+00:00")
+    await _log_usage_at(temp_db, "2024-06-01T09:50:00+00:00", escalated=1)
+    await _log_usage_at(temp_db, "2024-06-01T11:00:00+00:00", outcome="cancelled")
+    await _log_usage_at(temp_db, "2024-06-01T23:30:00-02:00")  # June 2nd in UTC
+
+    hourly = await get_usage_timeseries("hour", db_path=temp_db)
+    daily = await get_usage_timeseries("day", db_path=temp_db)
+
+    assert [(r["bucket"], r["count"]) for r in hourly] == [
+        ("2024-06-01T09:00:00+00:00", 2),
+        ("2024-06-01T11:00:00+00:00", 0),
+        ("2024-06-02T01:00:00+00:00", 1),
+    ]
+    assert hourly[0]["escalated_count"] == 1
+    assert hourly[1]["cancelled_count"] == 1
+    assert [(r["bucket"], r["count"]) for r in daily] == [
+        ("2024-06-01T00:00:00+00:00", 2),
+        ("2024-06-02T00:00:00+00:00", 1),
+    ]
+
+
+async def test_cancelled_calls_are_not_counted_as_usage(temp_db):
+    """Cancelled calls only count as cancelled, even if flagged escalated."""
+    await log_model_usage("opus", "heartbeat", True, db_path=temp_db)
+    await log_model_usage("opus", "heartbeat", True, outcome="cancelled", db_path=temp_db)
+    await log_model_usage("opus", "heartbeat", outcome="cancelled", db_path=temp_db)
+
+    [summary] = await get_model_usage_summary(db_path=temp_db)
+    assert (summary["count"], summary["escalated_count"]) == (1, 1)
+    [day] = await get_usage_timeseries("day", db_path=temp_db)
+    assert (day["count"], day["escalated_count"], day["cancelled_count"]) == (1, 1, 2)
+
+
+async def test_usage_rollup_migration_excludes_cancelled_history(temp_db):
+    """Upgrading to schema v15 rebuilds the rollups without cancelled calls."""
+    import aiosqlite
+
+    async with aiosqlite.connect(temp_db) as conn:
+        await conn.execute("DELETE FROM schema_version WHERE version >= 15")
+        await conn.commit()
+    await _log_usage_at(temp_db, "2024-06-01T09:00:00+00:00", escalated=1)
+    await _log_usage_at(temp_db, "2024-06-01T09:30:00+00:00", escalated=1, outcome="cancelled")
+
+    await init_db(temp_db)
+
+    [row] = await get_usage_timeseries("hour", db_path=temp_db)
+    assert (row["count"], row["escalated_count"], row["cancelled_count"]) == (1, 1, 1)
+
+
+async def test_insert_incoming_message_ignores_stored_update(temp_db):
+    """An update stored twice is kept once; local input (update 0) is not deduplicated."""
+    first = await insert_incoming_message("hello", 5, 50, db_path=temp_db)
+
+    assert await insert_incoming_message("hello", 5, 50, db_path=temp_db) is None
+    assert await insert_incoming_message("typed", 0, 0, db_path=temp_db) is not None
+    assert await insert_incoming_message("typed", 0, 0, db_path=temp_db) is not None
+    assert await get_stored_update_ids([4, 5, 0], db_path=temp_db) == {0, 5}
+    assert first is not None
+
+
+async def test_insert_attachment_ignores_recorded_file(temp_db):
+    """The same file recorded twice for a message is kept once."""
+    args = dict(telegram_message_id=50, kind="photo", sha256="ab", path="/m/ab", size=1)
+
+    assert await insert_attachment(**args, db_path=temp_db) is not None
+    assert await insert_attachment(**args, db_path=temp_db) is None
+    assert len(await get_attachments(50, db_path=temp_db)) == 1
+
+
+async def test_unique_update_migration_keeps_history(temp_db):
+    """Upgrading to schema v16 unlinks duplicate updates instead of deleting them."""
+    import aiosqlite
+
+    async with aiosqlite.connect(temp_db) as conn:
+        await conn.execute("DELETE FROM schema_version WHERE version >= 16")
+        await conn.execute("DROP INDEX idx_messages_update")
+        await conn.execute("DROP INDEX idx_attachments_file")
+        await conn.commit()
+    await insert_incoming_message("hello", 5, 50, db_path=temp_db)
+    await insert_incoming_message("hello", 5, 50, db_path=temp_db)
+    for _ in range(2):
+        await insert_attachment(50, "photo", "ab", "/m/ab", 1, db_path=temp_db)
+
+    await init_db(temp_db)
+
+    async with aiosqlite.connect(temp_db) as conn:
+        cursor = await conn.execute("SELECT telegram_update_id FROM messages ORDER BY id")
+        assert await cursor.fetchall() == [(5,), (None,)]
+    assert len(await get_attachments(50, db_path=temp_db)) == 1
+    assert await insert_incoming_message("hello", 5, 50, db_path=temp_db) is None
+
+
+async def test_usage_timeseries_since_until(temp_db):
+    """since is inclusive and until exclusive on bucket start."""
+    for day in ("01", "02", "03"):
+        await _log_usage_at(temp_db, f"2024-06-{day}T12:00:00+00:00")
+
+    rows = await get_usage_timeseries(
+        "day",
+        since="2024-06-02T00:00:00+00:00",
+        until="2024-06-03T00:00:00+00:00",
+        db_path=temp_db,
+    )
+
+    assert [r["bucket"] for r in rows] == ["2024-06-02T00:00:00+00:00"]
+
+
+async def test_usage_timeseries_rejects_unknown_granularity(temp_db):
+    with pytest.raises(ValueError):
+        await get_usage_timeseries("week", db_path=temp_db)
+
+
+async def test_usage_summary_reads_rollup(temp_db):
+    """The all-time summary adds up the daily buckets."""
+    await _log_usage_at(temp_db, "2024-06-01T09:00:00+00:00", escalated=1)
+    await _log_usage_at(temp_db, "2024-06-02T09:00:00+00:00")
+
+    summary = await get_model_usage_summary(db_path=temp_db)
+
+    assert summary == [
+        {"model": "haiku", "source": "heartbeat", "count": 2, "escalated_count": 1}
+    ]
+
+
+async def test_usage_rollup_migration_backfills_existing_rows(temp_db):
+    """Upgrading to schema v10 rolls up usage logged before the upgrade."""
+    import aiosqlite
+
+    async with aiosqlite.connect(temp_db) as conn:
+        for table in ("model_usage_hourly", "model_usage_daily"):
+            await conn.execute(f"DROP TRIGGER {table}_insert")
+            await conn.execute(f"DROP TABLE {table}")
+        await conn.execute("DELETE FROM schema_version WHERE version >= 10")
+        await _rewind_message_columns(conn)
+        await conn.commit()
+    await _log_usage_at(temp_db, "2024-06-01T09:00:00+00:00")
+    await _log_usage_at(temp_db, "2024-06-01T09:30:00+00:00")
+
+    await init_db(temp_db)
+
+    rows = await get_usage_timeseries("hour", db_path=temp_db)
+    assert [(r["bucket"], r["count"]) for r in rows] == [("2024-06-01T09:00:00+00:00", 2)]
@@ -0,0 +1,61 @@
+"""Tests for corphish.export."""
+
+import io
+import json
+import sys
+
+import pytest
+
+from corphish.db import init_db, insert_incoming_message, insert_outgoing_message
+from corphish.export import export_jsonl, export_parquet
+
+
+@pytest.fixture
+async def temp_db(tmp_path):
+    """Creates a temporary database with a short conversation."""
+    db_path = tmp_path / "test.db"
+    await init_db(db_path)
+    await insert_incoming_message("bonjour", 1, 10, db_path=db_path)
+    await insert_outgoing_message("hello", db_path=db_path)
+    await insert_incoming_message("ça va?", 2, 20, db_path=db_path)
+    return db_path
+
+
+async def test_export_jsonl_writes_one_line_per_message(temp_db):
+    out = io.StringIO()
+
+    count = await export_jsonl(out, batch_size=2, db_path=temp_db)
+
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert count == 3
+    assert [row["text"] for row in rows] == ["bonjour", "hello", "ça va?"]
+    assert rows[1]["direction"] == "outgoing"
+    assert "ça va?" in out.getvalue()  # not ASCII-escaped
+
+
+async def test_export_jsonl_since_id(temp_db):
+    out = io.StringIO()
+
+    count = await export_jsonl(out, since_id=2, db_path=temp_db)
+
+    assert count == 1
+    assert json.loads(out.getvalue())["text"] == "ça va?"
+
+
+async def test_export_parquet_round_trip(temp_db, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    target = tmp_path / "history.parquet"
+
+    count = await export_parquet(target, batch_size=2, db_path=temp_db)
+
+    table = pq.read_table(target)
+    assert count == 3
+    assert table.column("text").to_pylist() == ["bonjour", "hello", "ça va?"]
+    assert pq.ParquetFile(target).num_row_groups == 2
+
+
+async def test_export_parquet_without_pyarrow(temp_db, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+
+    with pytest.raises(RuntimeError, match="pyarrow"):
+        await export_parquet(tmp_path / "h.parquet", db_path=temp_db)
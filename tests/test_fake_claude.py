@@ -0,0 +1,158 @@
+"""Tests for corphish.fake_claude."""
+
+import asyncio
+import io
+from unittest.mock import AsyncMock
+
+import pytest
+from claude_agent_sdk import (
+    AssistantMessage,
+    ResultMessage,
+    TextBlock,
+    ToolUseBlock,
+    UserMessage,
+)
+
+from corphish.claude_client import ClaudeClient
+from corphish.fake_claude import (
+    FakeBackendError,
+    FakeClaudeBackend,
+    LatencyProfile,
+    decode_message,
+    encode_message,
+    read_streams,
+    write_event,
+)
+
+
+async def _collect(backend, options=None):
+    return [message async for message in backend.query(prompt="hi", options=options)]
+
+
+# --- Encoding ---
+
+
+def test_encode_decode_round_trip():
+    message = AssistantMessage(
+        content=[TextBlock(text="hello"), ToolUseBlock(id="t1", name="Bash", input={"a": 1})],
+        model="m",
+    )
+
+    encoded = encode_message(message)
+
+    assert encoded["__type__"] == "AssistantMessage"
+    assert "parent_tool_use_id" not in encoded  # defaults are omitted
+    assert decode_message(encoded) == message
+
+
+def test_decode_unknown_type_returns_none():
+    assert decode_message({"__type__": "FutureMessage", "x": 1}) is None
+
+
+def test_streams_round_trip_through_files(tmp_path):
+    path = tmp_path / "capture.jsonl"
+    buffer = io.StringIO()
+    write_event(buffer, 1, 0.5, AssistantMessage(content=[TextBlock(text="a")], model="m"))
+    write_event(buffer, 2, 0.1, AssistantMessage(content=[TextBlock(text="b")], model="m"))
+    write_event(buffer, 1, 0.9, AssistantMessage(content=[TextBlock(text="c")], model="m"))
+    path.write_text(buffer.getvalue())
+
+    streams = read_streams([path])
+
+    assert [[(t, m.content[0].text) for t, m in s] for s in streams] == [
+        [(0.5, "a"), (0.9, "c")],
+        [(0.1, "b")],
+    ]
+
+
+# --- Synthetic streams ---
+
+
+async def test_synthetic_stream_follows_profile():
+    sleep = AsyncMock()
+    profile = LatencyProfile(first_chunk=1.0, inter_chunk=0.25, chunks=3, spread=0)
+    backend = FakeClaudeBackend(profile, sleep_fn=sleep)
+
+    messages = await _collect(backend)
+
+    assert [type(m) for m in messages] == [AssistantMessage] * 3 + [ResultMessage]
+    assert [c.args[0] for c in sleep.await_args_list] == [1.0, 0.25, 0.25]
+    assert backend.calls == 1
+
+
+async def test_same_seed_gives_same_stream():
+    first = await _collect(FakeClaudeBackend("sonnet", seed=7, sleep_fn=AsyncMock()))
+    second = await _collect(FakeClaudeBackend("sonnet", seed=7, sleep_fn=AsyncMock()))
+
+    assert first == second
+
+
+async def test_tool_calls_pause_between_tool_use_and_result():
+    sleep = AsyncMock()
+    profile = LatencyProfile(
+        first_chunk=0, chunks=1, tool_call_rate=1.0, tool_pause=2.0, spread=0
+    )
+
+    messages = await _collect(FakeClaudeBackend(profile, sleep_fn=sleep))
+
+    assert isinstance(messages[0].content[0], ToolUseBlock)
+    assert isinstance(messages[1], UserMessage)
+    assert sleep.await_args_list[-1].args == (2.0,)
+
+
+async def test_failures_and_cancellations():
+    failing = FakeClaudeBackend(LatencyProfile(failure_rate=1.0), sleep_fn=AsyncMock())
+    with pytest.raises(FakeBackendError):
+        await _collect(failing)
+    assert failing.failures == 1
+
+    cancelling = FakeClaudeBackend(LatencyProfile(cancel_rate=1.0), sleep_fn=AsyncMock())
+    with pytest.raises(asyncio.CancelledError):
+        await _collect(cancelling)
+    assert cancelling.cancellations == 1
+
+
+async def test_drives_claude_client_streaming():
+    backend = FakeClaudeBackend(
+        LatencyProfile(chunks=2, words_per_chunk=3, spread=0), sleep_fn=AsyncMock(), seed=1
+    )
+    client = ClaudeClient(query_fn=backend.query, system_prompt="test")
+
+    chunks = [chunk async for chunk in client.stream("hi")]
+    partial = [kind async for kind, _ in client.stream_partial("hi")]
+
+    assert len(chunks) == 2
+    assert all(len(chunk.split()) == 3 for chunk in chunks)
+    assert partial.count("delta") == 6
+    assert partial.count("message") == 2
+
+
+# --- Replay ---
+
+
+async def test_replay_scales_recorded_timing():
+    stream = [
+        (0.5, AssistantMessage(content=[TextBlock(text="a")], model="m")),
+        (1.5, AssistantMessage(content=[TextBlock(text="b")], model="m")),
+    ]
+    sleep = AsyncMock()
+    backend = FakeClaudeBackend(streams=[stream], speed=2.0, sleep_fn=sleep)
+
+    messages = await _collect(backend)
+
+    assert [m.content[0].text for m in messages] == ["a", "b"]
+    assert [c.args[0] for c in sleep.await_args_list] == [0.25, 0.5]
+
+
+async def test_replay_cycles_streams_and_can_skip_waiting():
+    streams = [
+        [(1.0, AssistantMessage(content=[TextBlock(text=text)], model="m"))]
+        for text in ("one", "two")
+    ]
+    sleep = AsyncMock()
+    backend = FakeClaudeBackend(streams=streams, speed=0, sleep_fn=sleep)
+
+    texts = [(await _collect(backend))[0].content[0].text for _ in range(3)]
+
+    assert texts == ["one", "two", "one"]
+    sleep.assert_not_awaited()
@@ -0,0 +1,93 @@
+"""Tests for corphish.fake_telegram."""
+
+import asyncio
+
+import pytest
+from telegram import Bot
+from telegram.error import BadRequest, RetryAfter
+
+from corphish.fake_telegram import FakeTelegramServer
+
+
+@pytest.fixture
+async def server():
+    """A running fake Bot API server."""
+    server = FakeTelegramServer(chat_id=42)
+    await server.start()
+    yield server
+    await server.close()
+
+
+@pytest.fixture
+async def bot(server):
+    """A telegram.Bot pointed at the fake server."""
+    bot = Bot("123:test", base_url=server.base_url)
+    yield bot
+    await bot.shutdown()
+
+
+async def test_get_updates_returns_pushed_messages(server, bot):
+    server.push_message("hello")
+
+    updates = await bot.get_updates(offset=0, timeout=1)
+
+    assert len(updates) == 1
+    assert updates[0].message.text == "hello"
+    assert updates[0].message.chat.id == 42
+
+
+async def test_offset_confirms_earlier_updates(server, bot):
+    first = server.push_message("one")
+    server.push_message("two")
+
+    updates = await bot.get_updates(offset=first["update_id"] + 1, timeout=0)
+
+    assert [u.message.text for u in updates] == ["two"]
+
+
+async def test_long_poll_returns_when_a_message_arrives(server, bot):
+    poll = asyncio.create_task(bot.get_updates(offset=0, timeout=5))
+    await asyncio.sleep(0.05)
+    assert not poll.done()
+
+    server.push_message("late")
+    updates = await asyncio.wait_for(poll, 2)
+
+    assert [u.message.text for u in updates] == ["late"]
+
+
+async def test_send_and_edit_are_recorded(server, bot):
+    sent = await bot.send_message(chat_id=42, text="hi")
+    await bot.edit_message_text(text="hi there", chat_id=42, message_id=sent.message_id)
+
+    assert [m["text"] for m in server.sent] == ["hi"]
+    assert server.edits[0]["message_id"] == sent.message_id
+    assert server.edits[0]["text"] == "hi there"
+
+
+async def test_chat_actions_are_counted(server, bot):
+    assert await bot.send_chat_action(chat_id=42, action="typing") is True
+
+    assert server.chat_actions == 1
+
+
+async def test_send_rate_limit_answers_429():
+    server = FakeTelegramServer(send_rate_limit=1, retry_after=3)
+    await server.start()
+    bot = Bot("123:test", base_url=server.base_url)
+    try:
+        await bot.send_message(chat_id=1000, text="first")
+        with pytest.raises(RetryAfter) as exc_info:
+            await bot.send_message(chat_id=1000, text="second")
+    finally:
+        await bot.shutdown()
+        await server.close()
+
+    assert "Retry in 3 seconds" in str(exc_info.value)
+    assert server.rate_limited == 1
+    assert len(server.sent) == 1
+
+
+async def test_empty_text_is_rejected(server, bot):
+    with pytest.raises(BadRequest):
+        await bot.send_message(chat_id=42, text="")
@@ -0,0 +1,93 @@
+"""Tests for corphish.formatting."""
+
+from corphish.formatting import MAX_LENGTH, render, split_text, to_html
+
+
+def test_short_text_is_unchanged():
+    text = "Line one\n\n\n  indented line"
+    assert split_text(text) == [text]
+
+
+def test_blank_text_has_no_parts():
+    assert split_text("") == []
+    assert split_text("  \n ") == []
+
+
+def test_splits_on_paragraph_boundaries():
+    paragraphs = [f"Paragraph {i} " + "word " * 15 for i in range(10)]
+    parts = split_text("\n\n".join(p.strip() for p in paragraphs), limit=200)
+
+    assert len(parts) > 1
+    assert all(len(part) <= 200 for part in parts)
+    for part in parts:
+        for paragraph in part.split("\n\n"):
+            assert paragraph.startswith("Paragraph ")
+
+
+def test_keeps_code_block_together_when_it_fits():
+    code = "```python\nprint(1)\nprint(2)\n```"
+    text = "a" * 60 + "\n\n" + code + "\n\n" + "b" * 60
+    parts = split_text(text, limit=100)
+
+    assert any(code in part for part in parts)
+    assert all(part.count("```") % 2 == 0 for part in parts)
+
+
+def test_refences_code_block_that_is_too_long():
+    code = "```python\n" + "\n".join(f"x = {i}" for i in range(40)) + "\n```"
+    parts = split_text(code, limit=100)
+
+    assert len(parts) > 1
+    for part in parts:
+        assert len(part) <= 100
+        assert part.startswith("```python\n")
+        assert part.endswith("\n```")
+    lines = [line for part in parts for line in part.split("\n")[1:-1]]
+    assert lines == [f"x = {i}" for i in range(40)]
+
+
+def test_cuts_overlong_lines_at_spaces():
+    text = " ".join(["word"] * 100)
+    parts = split_text(text, limit=50)
+
+    assert all(len(part) <= 50 for part in parts)
+    assert " ".join(parts).split() == text.split()
+
+
+def test_cuts_lines_without_spaces():
+    parts = split_text("x" * 250, limit=100)
+    assert [len(part) for part in parts] == [100, 100, 50]
+
+
+def test_to_html_escapes_and_formats():
+    html = to_html("Use **bold** & `a<b` or [docs](https://example.com/?a=1&b=2) <tag>")
+    assert html == (
+        "Use <b>bold</b> &amp; <code>a&lt;b</code> or "
+        '<a href="https://example.com/?a=1&amp;b=2">docs</a> &lt;tag&gt;'
+    )
+
+
+def test_to_html_code_block():
+    assert to_html("See:\n```py\nif a < b:\n    pass\n```") == (
+        'See:\n<pre><code class="language-py">if a &lt; b:\n    pass</code></pre>'
+    )
+
+
+def test_render_sends_plain_text_without_formatting():
+    assert render("Hello <world> & friends") == [
+        {"text": "Hello <world> & friends", "html": None}
+    ]
+
+
+def test_render_drops_html_that_would_be_too_long():
+    text = "`" + "<" * 50 + "`"
+    assert render(text, limit=100) == [{"text": text, "html": None}]
+
+
+def test_render_long_reply_fits_telegram():
+    text = "\n\n".join("**Point** " + "detail " * 100 for _ in range(20))
+    parts = render(text)
+
+    assert len(parts) > 1
+    assert all(len(part["text"]) <= MAX_LENGTH for part in parts)
+    assert all(part["html"] and len(part["html"]) <= MAX_LENGTH for part in parts)
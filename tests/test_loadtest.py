@@ -0,0 +1,40 @@
+"""Tests for corphish.loadtest."""
+
+import io
+
+from claude_agent_sdk import AssistantMessage, TextBlock
+
+from corphish.fake_claude import write_event
+from corphish.loadtest import _percentiles, run_load_test
+
+
+async def test_load_test_drives_daemon_end_to_end(tmp_path, monkeypatch):
+    """Every pushed message is ingested, answered and acknowledged."""
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+
+    report = await run_load_test(rate=20, duration=0.25, settle_timeout=10)
+
+    assert report["pushed"] == 5
+    assert report["ingested"] == 5
+    assert report["processed"] == 5
+    assert report["replies"] == 5
+    assert report["reply_latency"]["p50_ms"] is not None
+
+
+async def test_load_test_replays_capture(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    buffer = io.StringIO()
+    write_event(buffer, 1, 5.0, AssistantMessage(content=[TextBlock(text="Replayed")], model="m"))
+    capture = tmp_path / "capture.jsonl"
+    capture.write_text(buffer.getvalue())
+
+    report = await run_load_test(rate=20, duration=0.1, replay=capture, speed=0, settle_timeout=10)
+
+    assert report["processed"] == 2
+    assert report["claude_calls"] == 2
+
+
+def test_percentiles():
+    stats = _percentiles([0.001 * i for i in range(1, 101)])
+    assert stats == {"p50_ms": 50.5, "p95_ms": 96.0, "max_ms": 100.0}
+    assert _percentiles([])["p50_ms"] is None
@@ -0,0 +1,179 @@
+"""Tests for corphish.media."""
+
+import hashlib
+import os
+import stat
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from corphish import media
+from corphish.media import MediaStore, MediaTooLargeError, describe_attachments, media_of
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def _store_files(store_dir):
+    return sorted(p for p in store_dir.rglob("*") if p.is_file())
+
+
+def _message(**attributes):
+    message = MagicMock()
+    message.photo = ()
+    for kind in ("document", "voice", "audio", "video", "video_note", "animation"):
+        setattr(message, kind, None)
+    for name, value in attributes.items():
+        setattr(message, name, value)
+    return message
+
+
+def test_get_media_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    assert media.get_media_dir() == tmp_path / "corphish" / "media"
+
+
+def test_media_of_picks_largest_photo():
+    small = MagicMock(file_id="small", file_size=10)
+    large = MagicMock(file_id="large", file_size=1000)
+    assert media_of(_message(photo=(small, large))) == {
+        "kind": "photo",
+        "file_id": "large",
+        "file_size": 1000,
+        "mime_type": "image/jpeg",
+        "file_name": None,
+    }
+
+
+def test_media_of_document_and_text():
+    document = MagicMock(file_id="d", file_size=5, mime_type="application/pdf", file_name="a.pdf")
+    assert media_of(_message(document=document))["file_name"] == "a.pdf"
+    assert media_of(_message(voice=MagicMock(file_id="v")))["kind"] == "voice"
+    assert media_of(_message(text="hi")) is None
+
+
+async def test_save_stores_by_content_hash(tmp_path):
+    store = MediaStore(tmp_path)
+    stored = await store.save(_chunks(b"hello ", b"world"), ".txt")
+
+    sha256 = hashlib.sha256(b"hello world").hexdigest()
+    assert stored == {
+        "sha256": sha256,
+        "path": str(tmp_path / sha256[:2] / f"{sha256}.txt"),
+        "size": 11,
+    }
+    assert open(stored["path"], "rb").read() == b"hello world"
+    assert stat.S_IMODE(os.stat(stored["path"]).st_mode) == 0o600
+
+
+async def test_save_deduplicates_identical_content(tmp_path):
+    store = MediaStore(tmp_path)
+    first = await store.save(_chunks(b"same"), ".jpg")
+    second = await store.save(_chunks(b"sa", b"me"), ".jpg")
+
+    assert first == second
+    assert _store_files(tmp_path) == [tmp_path / first["sha256"][:2] / f"{first['sha256']}.jpg"]
+
+
+async def test_save_over_limit_leaves_nothing_behind(tmp_path):
+    closed = []
+
+    async def chunks():
+        try:
+            for _ in range(10):
+                yield b"x" * 10
+        finally:
+            closed.append(True)
+
+    store = MediaStore(tmp_path, max_bytes=25)
+    with pytest.raises(MediaTooLargeError):
+        await store.save(chunks())
+
+    assert closed == [True]
+    assert _store_files(tmp_path) == []
+
+
+async def test_download_checks_reported_size_first(tmp_path):
+    bot = MagicMock()
+    bot.get_file = AsyncMock()
+    store = MediaStore(tmp_path, max_bytes=100)
+
+    with pytest.raises(MediaTooLargeError):
+        await store.download(bot, {"file_id": "f", "file_size": 101, "file_name": None})
+
+    bot.get_file.assert_not_awaited()
+
+
+async def test_download_streams_file_in_chunks(tmp_path):
+    requests = []
+
+    async def fetch(location, chunk_size):
+        requests.append((location, chunk_size))
+        yield b"abc"
+        yield b"def"
+
+    bot = MagicMock()
+    bot.get_file = AsyncMock(
+        return_value=MagicMock(file_path="https://api.telegram.org/file/botT/voice/file_3.OGA")
+    )
+    store = MediaStore(tmp_path, chunk_size=3, fetch_fn=fetch)
+
+    stored = await store.download(bot, {"file_id": "f", "file_size": None, "file_name": None})
+
+    bot.get_file.assert_awaited_once_with("f")
+    assert requests == [("https://api.telegram.org/file/botT/voice/file_3.OGA", 3)]
+    assert stored["size"] == 6
+    assert stored["path"].endswith(".oga")
+
+
+async def test_fetch_chunks_reads_local_file(tmp_path):
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"0123456789")
+
+    chunks = [chunk async for chunk in media._fetch_chunks(str(path), 4)]
+
+    assert chunks == [b"0123", b"4567", b"89"]
+
+
+def test_suffix_ignores_unsafe_names():
+    assert media._suffix(None, "photos/file_1.JPG") == ".jpg"
+    assert media._suffix("report.pdf", "documents/file_2") == ".pdf"
+    assert media._suffix("weird.name with spaces", None) == ""
+
+
+def test_describe_attachments():
+    prompt = describe_attachments(
+        "what is this?",
+        [
+            {
+                "kind": "document",
+                "path": "/m/ab/x.pdf",
+                "size": 4096,
+                "mime_type": "application/pdf",
+                "file_name": "x.pdf",
+            },
+            {
+                "kind": "photo",
+                "path": "/m/cd/y.jpg",
+                "size": 512,
+                "mime_type": None,
+                "file_name": None,
+            },
+        ],
+    )
+
+    assert prompt == (
+        "what is this?\n\n"
+        "[Files sent with this message, saved on disk]\n"
+        "- document: /m/ab/x.pdf (x.pdf, application/pdf, 4 KB)\n"
+        "- photo: /m/cd/y.jpg (1 KB)"
+    )
+
+
+def test_store_from_config(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    store = media.store_from_config()
+    expected = tmp_path / "corphish" / "media" / "ab" / "abcd.jpg"
+    assert store.path_for("abcd", ".jpg") == expected
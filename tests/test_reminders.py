@@ -0,0 +1,174 @@
+"""Tests for corphish.reminders."""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+
+from corphish.db import get_pending_reminders, init_db, insert_reminder
+from corphish.reminders import ReminderScheduler, parse_cancel, parse_reminder
+
+
+NOW = datetime(2024, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+# --- parse_reminder tests ---
+
+
+def test_parse_relative_duration():
+    due, text = parse_reminder("in 10m call mom", now=NOW)
+    assert due == NOW + timedelta(minutes=10)
+    assert text == "call mom"
+
+
+def test_parse_compound_duration_without_in():
+    due, text = parse_reminder("1h30m stretch", now=NOW)
+    assert due == NOW + timedelta(hours=1, minutes=30)
+    assert text == "stretch"
+
+
+def test_parse_spelled_out_units():
+    due, text = parse_reminder("in 2 days 3 hours renew passport", now=NOW)
+    assert due == NOW + timedelta(days=2, hours=3)
+    assert text == "renew passport"
+
+
+def test_parse_clock_time_rolls_over_to_tomorrow():
+    local_now = NOW.astimezone()
+    past = local_now - timedelta(hours=1)
+    due, text = parse_reminder(f"at {past:%H:%M} standup", now=NOW)
+    assert due > NOW
+    assert due - NOW <= timedelta(days=1)
+    assert text == "standup"
+
+
+def test_parse_iso_timestamp():
+    due, text = parse_reminder("2024-06-01T09:00+00:00 dentist", now=NOW)
+    assert due == datetime(2024, 6, 1, 9, 0, tzinfo=timezone.utc)
+    assert text == "dentist"
+
+
+def test_parse_rejects_missing_text():
+    with pytest.raises(ValueError):
+        parse_reminder("in 10m", now=NOW)
+
+
+def test_parse_rejects_unknown_time():
+    with pytest.raises(ValueError):
+        parse_reminder("whenever feed the cat", now=NOW)
+
+
+def test_parse_rejects_invalid_clock_time():
+    with pytest.raises(ValueError):
+        parse_reminder("at 25:00 nope", now=NOW)
+
+
+def test_parse_cancel():
+    assert parse_cancel("cancel 12") == 12
+    assert parse_cancel(" Cancel #3 ") == 3
+    assert parse_cancel("in 10m cancel dentist") is None
+    with pytest.raises(ValueError):
+        parse_cancel("cancel dentist")
+
+
+# --- ReminderScheduler tests ---
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+async def test_scheduler_delivers_due_reminders_in_order():
+    """Due reminders are delivered earliest first; future ones stay queued."""
+    deliver = AsyncMock(return_value=1)
+    scheduler = ReminderScheduler(
+        get_pending_fn=AsyncMock(return_value=[]),
+        deliver_fn=deliver,
+        clock=lambda: 1000.0,
+    )
+    scheduler.add(2, _iso(990))
+    scheduler.add(1, _iso(980))
+    scheduler.add(3, _iso(2000))
+
+    await scheduler.run(once=True)
+
+    assert [c.args[0] for c in deliver.await_args_list] == [1, 2]
+    assert len(scheduler) == 1
+
+
+async def test_scheduler_ignores_duplicate_adds():
+    """Adding the same reminder twice schedules it once."""
+    scheduler = ReminderScheduler(clock=lambda: 0.0)
+    scheduler.add(1, _iso(10))
+    scheduler.add(1, _iso(10))
+    assert len(scheduler) == 1
+
+
+async def test_scheduler_discard_drops_reminder():
+    """A discarded reminder is removed from the heap and never delivered."""
+    deliver = AsyncMock(return_value=1)
+    scheduler = ReminderScheduler(
+        get_pending_fn=AsyncMock(return_value=[]),
+        deliver_fn=deliver,
+        clock=lambda: 1000.0,
+    )
+    scheduler.add(1, _iso(980))
+    scheduler.add(2, _iso(990))
+    scheduler.add(3, _iso(2000))
+
+    scheduler.discard(1)
+    scheduler.discard(4)
+
+    assert len(scheduler) == 2
+    await scheduler.run(once=True)
+    assert [c.args[0] for c in deliver.await_args_list] == [2]
+
+
+async def test_scheduler_reloads_pending_on_start():
+    """Pending reminders are reloaded from the database on start-up."""
+    deliver = AsyncMock(return_value=7)
+    scheduler = ReminderScheduler(
+        get_pending_fn=AsyncMock(return_value=[{"id": 5, "text": "x", "due_at": _iso(0)}]),
+        deliver_fn=deliver,
+        clock=lambda: 100.0,
+    )
+
+    await scheduler.run(once=True)
+
+    deliver.assert_awaited_once_with(5, db_path=None)
+
+
+async def test_scheduler_survives_delivery_failure():
+    """A failing delivery does not stop later reminders."""
+    deliver = AsyncMock(side_effect=[RuntimeError("disk full"), 2])
+    scheduler = ReminderScheduler(
+        get_pending_fn=AsyncMock(return_value=[]),
+        deliver_fn=deliver,
+        clock=lambda: 100.0,
+    )
+    scheduler.add(1, _iso(1))
+    scheduler.add(2, _iso(2))
+
+    assert await scheduler.deliver_due() == 2
+    assert deliver.await_count == 2
+
+
+async def test_scheduler_end_to_end_with_database(tmp_path):
+    """A due reminder becomes an outgoing message and is no longer pending."""
+    db_path = tmp_path / "test.db"
+    await init_db(db_path)
+    past = (datetime.now(timezone.utc) - timedelta(seconds=1)).isoformat()
+    await insert_reminder("water plants", past, db_path=db_path)
+
+    scheduler = ReminderScheduler(db_path=db_path)
+    await scheduler.run(once=True)
+
+    assert await get_pending_reminders(db_path=db_path) == []
+    import aiosqlite
+
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute(
+            "SELECT text FROM messages WHERE direction = 'outgoing'"
+        )
+        rows = await cursor.fetchall()
+    assert rows == [("water plants",)]
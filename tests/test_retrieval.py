@@ -0,0 +1,106 @@
+"""Tests for corphish.retrieval."""
+
+from unittest.mock import AsyncMock
+
+import pytest
+
+from corphish.db import init_db, insert_incoming_message, insert_outgoing_message
+from corphish.retrieval import Retriever, augment_prompt, estimate_tokens, extract_terms
+
+
+@pytest.fixture
+async def temp_db(tmp_path):
+    """Creates a temporary database for testing."""
+    db_path = tmp_path / "test.db"
+    await init_db(db_path)
+    return db_path
+
+
+def test_extract_terms_drops_stopwords_and_short_words():
+    terms = extract_terms("What was the name of that Italian restaurant in Lisbon?")
+    assert "restaurant" in terms
+    assert "lisbon" in terms
+    assert "the" not in terms
+    assert "of" not in terms
+    assert terms[0] == "restaurant"  # longest first
+
+
+def test_extract_terms_empty_for_small_talk():
+    assert extract_terms("ok thanks") == []
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("a" * 400) == 100
+    assert estimate_tokens("") == 1
+
+
+def test_augment_prompt_wraps_context():
+    prompt = augment_prompt("where was it?", "[2024-06-01] user: pizza place")
+    assert prompt.startswith("<relevant_history>")
+    assert "pizza place" in prompt
+    assert prompt.endswith("where was it?")
+
+
+def test_augment_prompt_without_context_is_unchanged():
+    assert augment_prompt("hello", "") == "hello"
+
+
+async def test_context_for_returns_whole_exchange(temp_db):
+    """A matching question is returned together with its answer."""
+    await insert_incoming_message("recommend a restaurant in Lisbon", 1, 10, db_path=temp_db)
+    await insert_outgoing_message("Try Taberna da Rua das Flores.", db_path=temp_db)
+    await insert_incoming_message("what about the weather", 2, 20, db_path=temp_db)
+    current = await insert_incoming_message("that Lisbon restaurant again?", 3, 30, db_path=temp_db)
+
+    retriever = Retriever(db_path=temp_db)
+    context = await retriever.context_for("that Lisbon restaurant again?", before_id=current)
+
+    assert "user: recommend a restaurant in Lisbon" in context
+    assert "assistant: Try Taberna da Rua das Flores." in context
+    assert "weather" not in context
+    assert "again" not in context
+
+
+async def test_context_for_excludes_current_session(temp_db):
+    """Messages at or after before_id are never returned."""
+    first = await insert_incoming_message("lisbon restaurant", 1, 10, db_path=temp_db)
+
+    retriever = Retriever(db_path=temp_db)
+
+    assert await retriever.context_for("lisbon restaurant", before_id=first) == ""
+
+
+async def test_context_for_respects_top_k_and_budget(temp_db):
+    """At most top_k exchanges fit, and long messages are truncated."""
+    for i in range(5):
+        await insert_incoming_message(f"garden question {i} " + "tomato " * 200, i, i, db_path=temp_db)
+        await insert_outgoing_message(f"garden answer {i}", db_path=temp_db)
+
+    retriever = Retriever(db_path=temp_db, top_k=2, token_budget=200)
+    context = await retriever.context_for("garden tomato")
+
+    assert context.count("user:") == 2
+    assert estimate_tokens(context) <= 200
+
+
+async def test_context_for_caches_results():
+    """Repeated lookups with the same terms are served from the LRU cache."""
+    search = AsyncMock(return_value=[])
+    retriever = Retriever(search_fn=search, get_exchange_fn=AsyncMock(), cache_size=1)
+
+    await retriever.context_for("python packaging question")
+    await retriever.context_for("question about python packaging")
+    assert search.await_count == 1
+    assert (retriever.hits, retriever.misses) == (1, 1)
+
+    await retriever.context_for("rust lifetimes")
+    await retriever.context_for("python packaging question")
+    assert search.await_count == 3  # evicted by the cache size of one
+
+
+async def test_context_for_small_talk_skips_search():
+    search = AsyncMock()
+    retriever = Retriever(search_fn=search, get_exchange_fn=AsyncMock())
+
+    assert await retriever.context_for("ok thanks") == ""
+    search.assert_not_awaited()
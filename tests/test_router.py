@@ -0,0 +1,56 @@
+"""Tests for corphish.router."""
+
+from corphish.router import route_message
+
+
+def test_acknowledgements_go_to_haiku():
+    assert route_message("thanks") == ("haiku", "acknowledgement")
+    assert route_message("Ok!") == ("haiku", "acknowledgement")
+    assert route_message("👍") == ("haiku", "acknowledgement")
+
+
+def test_short_question_goes_to_haiku():
+    assert route_message("What time is it in Tokyo?") == ("haiku", "short_message")
+
+
+def test_tool_keywords_go_to_sonnet():
+    assert route_message("Can you search for flights?") == ("sonnet", "tool_keywords")
+    assert route_message("```\nprint(1)\n```") == ("sonnet", "tool_keywords")
+
+
+def test_commands_go_to_sonnet():
+    assert route_message("/summarise today") == ("sonnet", "command")
+
+
+def test_complex_keywords_go_to_opus():
+    assert route_message("Help me debug this crash") == ("opus", "complex_keywords")
+
+
+def test_long_messages_go_to_opus():
+    assert route_message("word " * 400) == ("opus", "long_message")
+
+
+def test_medium_messages_default_to_sonnet():
+    text = (
+        "I have been thinking about whether to take the new job offer or stay "
+        "where I am for another year, what would you weigh most?"
+    )
+    assert route_message(text) == ("sonnet", "default")
+
+
+def test_recent_escalations_bump_tier():
+    assert route_message("What time is it in Tokyo?", recent_escalations=2) == (
+        "sonnet",
+        "short_message+recent_escalations",
+    )
+
+
+def test_recent_escalations_do_not_bump_acknowledgements():
+    assert route_message("thanks", recent_escalations=5) == ("haiku", "acknowledgement")
+
+
+def test_recent_escalations_cap_at_opus():
+    assert route_message("Help me debug this", recent_escalations=5) == (
+        "opus",
+        "complex_keywords",
+    )
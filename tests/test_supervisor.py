@@ -0,0 +1,148 @@
+"""Tests for corphish.supervisor."""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from corphish import supervisor
+from corphish.supervisor import run_supervisor, supervise_role
+
+
+def _make_process(returncode=0, wait=None):
+    process = MagicMock()
+    process.pid = 1234
+    process.returncode = None
+    process.wait = wait or AsyncMock(return_value=returncode)
+    return process
+
+
+async def test_supervise_role_restarts_exited_child():
+    """A child that exits should be started again."""
+    spawn = AsyncMock(side_effect=lambda role: _make_process(returncode=1))
+
+    await supervise_role(
+        "consumer", spawn_fn=spawn, restart_delay_fn=lambda failures: 0, max_restarts=2
+    )
+
+    assert spawn.await_count == 3
+    spawn.assert_awaited_with("consumer")
+
+
+async def test_supervise_role_backs_off_between_restarts():
+    """Restarts of a child that keeps exiting should wait longer each time."""
+    spawn = AsyncMock(side_effect=lambda role: _make_process(returncode=1))
+
+    with patch("corphish.supervisor.asyncio.sleep", new=AsyncMock()) as sleep:
+        await supervise_role("consumer", spawn_fn=spawn, max_restarts=4)
+
+    assert [call.args[0] for call in sleep.await_args_list] == [1, 2, 4, 8]
+
+
+async def test_supervise_role_terminates_child_on_cancel():
+    """Cancelling supervision should terminate the running child."""
+    exited = asyncio.Event()
+
+    async def wait():
+        await exited.wait()
+        return -15
+
+    process = _make_process(wait=wait)
+    process.terminate = MagicMock(side_effect=exited.set)
+    spawn = AsyncMock(return_value=process)
+
+    task = asyncio.create_task(supervise_role("processor", spawn_fn=spawn))
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    process.terminate.assert_called_once()
+
+
+async def test_run_supervisor_inits_db_and_spawns_each_role():
+    """run_supervisor should init the database once and spawn every role."""
+    init_db = AsyncMock()
+    spawn = AsyncMock(side_effect=lambda role: _make_process())
+
+    await run_supervisor(
+        ("consumer", "processor", "heartbeat"),
+        init_db_fn=init_db,
+        spawn_fn=spawn,
+        restart_delay_fn=lambda failures: 0,
+        max_restarts=0,
+        stop_event=asyncio.Event(),
+    )
+
+    init_db.assert_awaited_once()
+    assert sorted(call.args[0] for call in spawn.await_args_list) == [
+        "consumer",
+        "heartbeat",
+        "processor",
+    ]
+
+
+def _make_running_process(exit_on_terminate=True):
+    """Returns a process that runs until terminated (or killed)."""
+    exited = asyncio.Event()
+
+    async def wait():
+        await exited.wait()
+        return -15
+
+    process = _make_process(wait=wait)
+    process.terminate = MagicMock(side_effect=exited.set if exit_on_terminate else None)
+    process.kill = MagicMock(side_effect=exited.set)
+    return process
+
+
+async def test_run_supervisor_terminates_children_on_stop():
+    """Setting the stop event should terminate every child and return."""
+    processes = []
+
+    async def spawn(role):
+        processes.append(_make_running_process())
+        return processes[-1]
+
+    stop_event = asyncio.Event()
+    task = asyncio.create_task(
+        run_supervisor(
+            ("consumer", "processor"),
+            init_db_fn=AsyncMock(),
+            spawn_fn=spawn,
+            stop_event=stop_event,
+        )
+    )
+    while len(processes) < 2:
+        await asyncio.sleep(0)
+    stop_event.set()
+    await asyncio.wait_for(task, timeout=1)
+
+    for process in processes:
+        process.terminate.assert_called_once()
+        process.kill.assert_not_called()
+
+
+async def test_run_supervisor_kills_child_that_ignores_sigterm():
+    """A child still running after the terminate timeout should be killed."""
+    process = _make_running_process(exit_on_terminate=False)
+    spawn = AsyncMock(return_value=process)
+    stop_event = asyncio.Event()
+
+    with patch.object(supervisor, "_TERMINATE_TIMEOUT", 0.01):
+        task = asyncio.create_task(
+            run_supervisor(
+                ("consumer",),
+                init_db_fn=AsyncMock(),
+                spawn_fn=spawn,
+                stop_event=stop_event,
+            )
+        )
+        while not spawn.await_count:
+            await asyncio.sleep(0)
+        stop_event.set()
+        await asyncio.wait_for(task, timeout=1)
+
+    process.terminate.assert_called_once()
+    process.kill.assert_called_once()
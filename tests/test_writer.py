@@ -0,0 +1,130 @@
+"""Tests for corphish.writer."""
+
+import asyncio
+import sqlite3
+
+import aiosqlite
+import pytest
+
+from corphish.db import (
+    claim_next_message,
+    get_attachments,
+    get_model_usage_summary,
+    get_unsent_outgoing_messages,
+    init_db,
+    insert_incoming_statement,
+)
+from corphish.writer import DbWriter
+
+
+@pytest.fixture
+async def temp_db(tmp_path):
+    """Creates a temporary database for testing."""
+    db_path = tmp_path / "test.db"
+    await init_db(db_path)
+    return db_path
+
+
+@pytest.fixture
+async def writer(temp_db):
+    """A running DbWriter on the temporary database."""
+    writer = DbWriter(temp_db)
+    await writer.start()
+    yield writer
+    await writer.close()
+
+
+async def _rows(db_path, sql):
+    async with aiosqlite.connect(db_path) as conn:
+        cursor = await conn.execute(sql)
+        return await cursor.fetchall()
+
+
+async def test_concurrent_writes_share_one_commit(writer, temp_db):
+    """Writes queued together are committed in a single transaction."""
+    ids = await asyncio.gather(
+        *(writer.insert_incoming_message(f"m{i}", i, i) for i in range(10))
+    )
+
+    assert ids == sorted(ids)
+    assert len(set(ids)) == 10
+    assert writer.commits == 1
+    rows = await _rows(temp_db, "SELECT text FROM messages ORDER BY id")
+    assert [r[0] for r in rows] == [f"m{i}" for i in range(10)]
+
+
+async def test_batches_are_capped(temp_db):
+    """No transaction holds more than max_batch writes."""
+    writer = DbWriter(temp_db, max_batch=3)
+    await writer.start()
+    try:
+        await asyncio.gather(*(writer.insert_outgoing_message(f"m{i}") for i in range(7)))
+    finally:
+        await writer.close()
+
+    assert writer.commits == 3
+
+
+async def test_failed_write_does_not_affect_batch(writer, temp_db):
+    """A failing statement rejects only its own future."""
+    good = writer.submit(*insert_incoming_statement("kept", 1, 1))
+    bad = writer.submit("INSERT INTO no_such_table VALUES (1)")
+
+    results = await asyncio.gather(good, bad, return_exceptions=True)
+
+    assert isinstance(results[0], int)
+    assert isinstance(results[1], sqlite3.OperationalError)
+    assert await _rows(temp_db, "SELECT text FROM messages") == [("kept",)]
+
+
+async def test_deferred_writes_commit_before_later_awaited_write(writer, temp_db):
+    """Bookkeeping writes are durable once a later awaited write returns."""
+    outgoing_id = await writer.insert_outgoing_message("reply")
+    await writer.mark_outgoing_message_sent(outgoing_id, 555)
+    await writer.log_model_usage(model="haiku", source="processor")
+    incoming_id = await writer.insert_incoming_message("next", 2, 2)
+
+    await claim_next_message("w1", db_path=temp_db)
+    await writer.mark_message_processed(incoming_id, "w1")
+
+    assert await get_unsent_outgoing_messages(db_path=temp_db) == []
+    summary = await get_model_usage_summary(db_path=temp_db)
+    assert summary[0]["count"] == 1
+
+
+async def test_sent_reply_commits_with_acknowledgement(writer, temp_db):
+    """A reply recorded after sending shares the acknowledgement's commit."""
+    incoming_id = await writer.insert_incoming_message("hello", 1, 1)
+    await claim_next_message("w1", db_path=temp_db)
+    commits = writer.commits
+
+    await writer.insert_sent_outgoing_message("part one", 501)
+    await writer.insert_sent_outgoing_message("part two", 502)
+    await writer.mark_message_processed(incoming_id, "w1")
+
+    assert writer.commits == commits + 1
+    rows = await _rows(
+        temp_db, "SELECT text, telegram_message_id FROM messages WHERE direction = 'outgoing'"
+    )
+    assert rows == [("part one", 501), ("part two", 502)]
+
+
+async def test_close_flushes_deferred_writes(temp_db):
+    writer = DbWriter(temp_db)
+    await writer.start()
+    await writer.log_heartbeat_decision("skip", "no_activity", 3600)
+
+    await writer.close()
+
+    assert await _rows(temp_db, "SELECT decision FROM heartbeat_decisions") == [("skip",)]
+
+
+async def test_insert_attachment_commits_before_returning(writer, temp_db):
+    await writer.insert_attachment(10, "photo", "ab" * 32, "/m/ab/x.jpg", 100)
+    [row] = await get_attachments(10, db_path=temp_db)
+    assert row["kind"] == "photo"
+
+
+async def test_submit_requires_start(temp_db):
+    with pytest.raises(RuntimeError):
+        await DbWriter(temp_db).insert_outgoing_message("x")